@@ -6,6 +6,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Count
+from apps.shared.services import ResponseCache
 from ..models import Location, TransportAgency, DeliveryAgency
 from .serializers import (
     LocationSerializer,
@@ -26,6 +27,14 @@ class LocationViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     search_fields = ['city', 'province']
     ordering = ['province', 'city']
+    
+    @ResponseCache.cached(ResponseCache.CATALOG)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @ResponseCache.cached(ResponseCache.CATALOG)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class TransportAgencyViewSet(viewsets.ModelViewSet):
@@ -48,6 +57,15 @@ class TransportAgencyViewSet(viewsets.ModelViewSet):
             return TransportAgencyCreateSerializer
         return TransportAgencySerializer
     
+    # Los totales de paquetes, sacas y lotes dependen también de PACKAGES
+    @ResponseCache.cached(ResponseCache.CATALOG, ResponseCache.PACKAGES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @ResponseCache.cached(ResponseCache.CATALOG, ResponseCache.PACKAGES)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
         """Filtrar queryset según parámetros"""
         queryset = TransportAgency.objects.all()
@@ -241,6 +259,14 @@ class DeliveryAgencyViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'location__city']
     ordering = ['location__city', 'name']
     
+    @ResponseCache.cached(ResponseCache.CATALOG)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @ResponseCache.cached(ResponseCache.CATALOG)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
         """Filtrar por ubicación o activas si se solicita"""
         queryset = DeliveryAgency.objects.all()
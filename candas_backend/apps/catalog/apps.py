@@ -8,4 +8,7 @@ class CatalogConfig(AppConfig):
     
     def ready(self):
         """Import signals if any"""
-        pass
+        try:
+            import apps.catalog.signals
+        except ImportError:
+            pass
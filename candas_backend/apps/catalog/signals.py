@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.shared.services import ResponseCache
+from .models import DeliveryAgency, Location, TransportAgency
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=TransportAgency)
+@receiver(post_delete, sender=TransportAgency)
+@receiver(post_save, sender=DeliveryAgency)
+@receiver(post_delete, sender=DeliveryAgency)
+def invalidate_catalog_responses(sender, **kwargs):
+    """Invalida las respuestas cacheadas de los catálogos."""
+    ResponseCache.invalidate(ResponseCache.CATALOG)
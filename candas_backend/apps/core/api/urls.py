@@ -15,5 +15,15 @@ urlpatterns = [
     path('auth/login/', views.login_view, name='login'),
     path('auth/logout/', views.logout_view, name='logout'),
     path('auth/user/', views.user_view, name='user'),
+    path('renders/', views.render_create, name='render_create'),
+    path('renders/<str:job_id>/', views.render_status, name='render_status'),
+    path('renders/<str:job_id>/download/', views.render_download, name='render_download'),
+    path('print-jobs/', views.print_job_create, name='print_job_create'),
+    path('print-jobs/<str:job_id>/', views.render_status, name='print_job_status'),
+    path('print-jobs/<str:job_id>/download/', views.render_download, name='print_job_download'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/tasks/', views.profile_tasks, name='profile_tasks'),
+    path('profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
+    path('profiles/<str:profile_id>/download/', views.profile_download, name='profile_download'),
     path('', include(router.urls)),
 ]
@@ -2,12 +2,17 @@
 API Views para autenticación y utilidades
 """
 from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status, viewsets
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
+from django.http import FileResponse, HttpResponse
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_GET
+from apps.shared.services import Metrics, RenderCache, RenderService, PrintJobService, ProfilerService
+import hmac
 from ..models import UserPreferences
 from .serializers import UserPreferencesSerializer
 
@@ -94,6 +99,347 @@ def user_view(request):
     })
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def render_create(request):
+    """
+    Generar un documento en los workers de render
+    POST /api/v1/renders/
+    Body: {"kind": "batch_manifest", "object_id": "...", "mode": "sync" | "async", "timeout": 30}
+    
+    - sync: espera hasta `timeout` segundos y retorna el archivo; si no
+      terminó a tiempo responde 202 con el job_id para seguir consultando.
+    - async: responde 202 con el job_id de inmediato.
+    """
+    kind = request.data.get('kind', '')
+    object_id = request.data.get('object_id')
+    mode = request.data.get('mode', 'sync')
+    
+    if mode not in ('sync', 'async'):
+        return Response(
+            {'error': 'mode debe ser sync o async'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not object_id:
+        return Response(
+            {'error': 'El campo object_id es requerido'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Validar el tiempo de espera antes de encolar nada
+    timeout, error = _parse_timeout(request)
+    if error:
+        return error
+    
+    try:
+        document = RenderService.resolve(kind, object_id)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception:
+        return Response(
+            {'error': 'Objeto no encontrado'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    # Si la versión actual ya está generada no hace falta encolar nada
+    obj_id = document['obj'].pk
+    if mode == 'sync':
+        content = RenderCache.get(kind, obj_id, document['version'], document['extension'])
+        if content is not None:
+            return RenderCache.file_response(
+                content, document['extension'], document['filename'],
+                RenderCache.make_etag(kind, document['version'])
+            )
+    
+    result = RenderService.submit(kind, obj_id)
+    
+    if mode == 'sync':
+        try:
+            data = RenderService.wait(result, timeout)
+        except Exception as e:
+            return Response(
+                {'error': f'Error al generar documento: {str(e)}', 'job_id': result.id},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        if data is not None:
+            return _render_file_response(data)
+    
+    return Response(
+        {
+            'job_id': result.id,
+            'status': result.state,
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def render_status(request, job_id):
+    """
+    Consultar el estado de un trabajo de render
+    GET /api/v1/renders/{job_id}/
+    GET /api/v1/print-jobs/{job_id}/
+    """
+    from celery.result import AsyncResult
+    
+    result = AsyncResult(job_id)
+    data = {
+        'job_id': job_id,
+        'status': result.state,
+        'ready': result.ready(),
+    }
+    if result.state == 'PROGRESS' and isinstance(result.info, dict):
+        data['progress'] = result.info
+    if result.failed():
+        data['error'] = str(result.result)
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def render_download(request, job_id):
+    """
+    Descargar el documento de un trabajo de render terminado
+    GET /api/v1/renders/{job_id}/download/
+    GET /api/v1/print-jobs/{job_id}/download/
+    """
+    from celery.result import AsyncResult
+    
+    result = AsyncResult(job_id)
+    
+    if not result.ready():
+        return Response(
+            {'job_id': job_id, 'status': result.state},
+            status=status.HTTP_202_ACCEPTED
+        )
+    if result.failed():
+        return Response(
+            {'error': f'Error al generar documento: {result.result}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    return _render_file_response(result.result)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def print_job_create(request):
+    """
+    Imprimir etiquetas, guías o manifiestos de varios objetos en un solo documento
+    POST /api/v1/print-jobs/
+    Body: {
+        "document": "labels" | "shipping_labels" | "manifests",
+        "format": "pdf" | "zpl",
+        "package_ids": [...], "pull_ids": [...], "batch_ids": [...],
+        "mode": "sync" | "async", "timeout": 30
+    }
+    
+    Igual que /renders/: en modo sync espera hasta `timeout` segundos y
+    retorna el archivo; si no, responde 202 con el job_id. El avance se
+    consulta en /print-jobs/{job_id}/ y el archivo en /print-jobs/{job_id}/download/.
+    """
+    document = request.data.get('document', '')
+    fmt = request.data.get('format', 'pdf')
+    mode = request.data.get('mode', 'sync')
+    
+    if mode not in ('sync', 'async'):
+        return Response(
+            {'error': 'mode debe ser sync o async'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    timeout, error = _parse_timeout(request)
+    if error:
+        return error
+    
+    try:
+        job = PrintJobService.describe(
+            document, fmt,
+            request.data.get('package_ids'),
+            request.data.get('pull_ids'),
+            request.data.get('batch_ids'),
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Mismos objetos sin cambios: el documento ya está generado
+    if mode == 'sync':
+        content = RenderCache.get(job['kind'], job['object_id'], job['version'], job['extension'])
+        if content is not None:
+            return RenderCache.file_response(
+                content, job['extension'], job['filename'],
+                RenderCache.make_etag(job['kind'], job['version'])
+            )
+    
+    result = PrintJobService.submit(
+        document, fmt, job['package_ids'], job['pull_ids'], job['batch_ids']
+    )
+    
+    if mode == 'sync':
+        try:
+            data = RenderService.wait(result, timeout)
+        except ValueError as e:
+            return Response(
+                {'error': str(e), 'job_id': result.id},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {'error': f'Error al generar documento: {str(e)}', 'job_id': result.id},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        if data is not None:
+            return _render_file_response(data)
+    
+    return Response(
+        {
+            'job_id': result.id,
+            'status': result.state,
+            'items': len(job['package_ids']) + len(job['pull_ids']) + len(job['batch_ids']),
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+def _parse_timeout(request):
+    """
+    Lee el tiempo de espera del modo sync (segundos, como máximo 120).
+    
+    Returns:
+        tuple: (timeout o None para el valor por defecto, Response 400 o None)
+    """
+    timeout = request.data.get('timeout')
+    if timeout in (None, ''):
+        return None, None
+    
+    try:
+        timeout = float(timeout)
+    except (TypeError, ValueError):
+        timeout = 0
+    if not 0 < timeout <= 120:
+        return None, Response(
+            {'error': 'timeout debe ser un número de segundos mayor que 0 y hasta 120'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return timeout, None
+
+
+def _render_file_response(data):
+    """Sirve desde la caché el documento generado por un trabajo de render."""
+    content = RenderCache.get(data['kind'], data['object_id'], data['version'], data['extension'])
+    if content is None:
+        return Response(
+            {'error': 'El documento ya no está disponible, solicítalo nuevamente'},
+            status=status.HTTP_410_GONE
+        )
+    return RenderCache.file_response(
+        content, data['extension'], data['filename'],
+        RenderCache.make_etag(data['kind'], data['version'])
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """
+    Perfiles guardados, más recientes primero (solo is_staff)
+    GET /api/v1/profiles/?limit=50
+    
+    Se generan con el header X-Profile: 1 o ?_profile=1 en cualquier
+    petición, o armando una tarea en /api/v1/profiles/tasks/.
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', 50)), 500)
+    except ValueError:
+        return Response({'error': 'limit debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(ProfilerService.list_summaries(limit))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_detail(request, profile_id):
+    """
+    Resumen de un perfil: duración, pico de memoria y funciones más costosas
+    GET /api/v1/profiles/{id}/
+    """
+    summary = ProfilerService.get_summary(profile_id)
+    if summary is None:
+        return Response({'error': 'Perfil no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(summary)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_download(request, profile_id):
+    """
+    Descargar la salida de cProfile
+    GET /api/v1/profiles/{id}/download/            -> .prof (pstats, snakeviz)
+    GET /api/v1/profiles/{id}/download/?as=text    -> reporte pstats en texto
+    """
+    if request.query_params.get('as') == 'text':
+        report = ProfilerService.render_text(profile_id, sort=request.query_params.get('sort', 'cumulative'))
+        if report is None:
+            return Response({'error': 'Perfil no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(report, content_type='text/plain; charset=utf-8')
+    
+    path = ProfilerService.profile_path(profile_id)
+    try:
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
+    except (TypeError, FileNotFoundError):
+        return Response({'error': 'Perfil no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def profile_tasks(request):
+    """
+    Perfilar las próximas ejecuciones de una tarea de Celery
+    GET  /api/v1/profiles/tasks/   -> tareas que se pueden perfilar
+    POST /api/v1/profiles/tasks/
+    Body: {"task": "apps.report.tasks.generate_report_files", "runs": 1}
+    """
+    if request.method == 'GET':
+        return Response({'tasks': sorted(ProfilerService.profiled_tasks())})
+    
+    task_name = request.data.get('task', '')
+    try:
+        runs = int(request.data.get('runs', 1))
+        ProfilerService.arm_task(task_name, runs)
+    except (TypeError, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'task': task_name, 'runs': max(runs, 1)}, status=status.HTTP_201_CREATED)
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Métricas en formato de texto de Prometheus
+    GET /metrics
+    
+    Vista de Django sin DRF (el scraper no tiene sesión). Exige
+    `Authorization: Bearer <METRICS_TOKEN>` o una sesión is_staff; sin
+    METRICS_TOKEN solo responde a staff, salvo METRICS_PUBLIC = True.
+    """
+    if not Metrics.is_enabled():
+        return HttpResponse('Métricas desactivadas o prometheus-client no instalado', status=503)
+    
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    user = getattr(request, 'user', None)
+    authorized = (
+        getattr(settings, 'METRICS_PUBLIC', False)
+        or (token and hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', '').encode(), f'Bearer {token}'.encode()
+        ))
+        or (user is not None and user.is_authenticated and user.is_staff)
+    )
+    if not authorized:
+        return HttpResponse('No autorizado', status=401)
+    
+    content, content_type = Metrics.render()
+    return HttpResponse(content, content_type=content_type)
+
+
 class UserPreferencesViewSet(viewsets.ModelViewSet):
     """ViewSet para gestionar preferencias de usuario"""
     permission_classes = [IsAuthenticated]
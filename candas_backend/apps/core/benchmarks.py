@@ -0,0 +1,192 @@
+"""
+Casos de benchmark de las rutas críticas del sistema
+
+Se ejecutan contra la base de datos actual, que debe tener volumen
+(ver generate_synthetic_data). Las peticiones pasan por el stack completo
+(middleware, DRF, serializers) con un usuario autenticado en memoria; los
+manifiestos y etiquetas se generan directamente, sin RenderCache, para
+medir el render y no la caché.
+"""
+import csv
+import io
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.logistics.models import Pull, Batch
+from apps.logistics.services import BatchLabelsGenerator, BatchManifestGenerator, PDFService
+from apps.packages.models import Package, PackageImport
+from apps.packages.services import PackageImporter, PackageLabelsGenerator, PackageManifestGenerator
+from apps.shared.services import BenchmarkCase
+
+
+class HotPathBenchmarks:
+    """Rutas críticas: listados, búsqueda, cambios masivos, importación, exportación y reportes."""
+    
+    # Paquetes por batch_update
+    BATCH_UPDATE_SIZE = 200
+    
+    # Filas de las importaciones medidas
+    DEFAULT_IMPORT_SIZES = (10000, 50000)
+    
+    # Días de los reportes por rango
+    REPORT_DAYS = 30
+    
+    def __init__(self, import_sizes=None):
+        """
+        Raises:
+            ValueError: Si la base de datos no tiene datos para medir
+        """
+        self.import_sizes = self.DEFAULT_IMPORT_SIZES if import_sizes is None else import_sizes
+        
+        self.pull = Pull.objects.filter(batch__isnull=True).order_by('-packages_count', 'id').first()
+        self.batch = Batch.objects.order_by('-packages_count', 'id').first()
+        self.package = Package.objects.filter(pull=self.pull).order_by('guide_number').first() if self.pull else None
+        if self.pull is None or self.batch is None or self.package is None:
+            raise ValueError(
+                'La base de datos no tiene sacas, lotes y paquetes para medir. '
+                'Ejecute primero generate_synthetic_data.'
+            )
+        
+        self.package_ids = [
+            str(package_id) for package_id in Package.objects.order_by('-created_at', 'id').values_list(
+                'id', flat=True
+            )[:self.BATCH_UPDATE_SIZE]
+        ]
+        self.date_to = timezone.localdate()
+        self.date_from = self.date_to - timedelta(days=self.REPORT_DAYS)
+        
+        # Usuario en memoria: no se guarda en la base de datos
+        self.client = APIClient()
+        self.client.force_authenticate(user=User(username='benchmark', is_staff=True, is_superuser=True))
+    
+    def metadata(self):
+        """Volumen de datos contra el que se midió."""
+        return {
+            'packages': Package.objects.count(),
+            'pulls': Pull.objects.count(),
+            'batches': Batch.objects.count(),
+        }
+    
+    def _request(self, method, url, data=None):
+        response = getattr(self.client, method)(url, data, format='json' if method == 'post' else None)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method.upper()} {url} respondió {response.status_code}: {response.content[:300]!r}')
+        # Consumir el cuerpo completo (también en respuestas en streaming)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        else:
+            response.content
+        return response
+    
+    def _get(self, url):
+        return lambda: self._request('get', url)
+    
+    def _post(self, url, data):
+        return lambda: self._request('post', url, data)
+    
+    @staticmethod
+    def build_import_file(rows):
+        """CSV con las columnas obligatorias de la plantilla de importación."""
+        fields = PackageImporter.REQUIRED_FIELDS
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow([PackageImporter.FIELD_LABELS[field] for field in fields])
+        for number in range(rows):
+            writer.writerow([
+                f'BENCH{rows}-{number:07d}', f'CLIENTE {number}', f'AV. AMAZONAS N{number % 99}-{number % 200}',
+                f'09{number:08d}', 'QUITO', 'PICHINCHA',
+            ])
+        return output.getvalue().encode('utf-8')
+    
+    def _import(self, content):
+        def run():
+            # Registro sin archivo guardado: se mide la importación, no el almacenamiento
+            record = PackageImport.objects.create(file='package_imports/benchmark.csv', status='PROCESANDO')
+            result = PackageImporter.import_packages(
+                SimpleUploadedFile('benchmark.csv', content, content_type='text/csv'),
+                [],
+                record.id
+            )
+            if not result.get('success') or result.get('failed'):
+                raise RuntimeError(f"Importación fallida: {result.get('error') or result.get('errors', [])[:3]}")
+        return run
+    
+    def cases(self):
+        """
+        Returns:
+            list: Instancias de BenchmarkCase
+        """
+        date_range = {'date_from': self.date_from.isoformat(), 'date_to': self.date_to.isoformat()}
+        cases = [
+            # Listados y búsqueda
+            BenchmarkCase('packages.list', self._get('/api/v1/packages/')),
+            BenchmarkCase('packages.list.status', self._get('/api/v1/packages/?status=EN_BODEGA')),
+            BenchmarkCase(
+                'packages.list.city_shipment',
+                self._get(f'/api/v1/packages/?city={self.package.city}&shipment_type=saca')
+            ),
+            BenchmarkCase(
+                'packages.list.search',
+                self._get(f'/api/v1/packages/?search={self.package.name.split()[0]}')
+            ),
+            BenchmarkCase(
+                'packages.search_by_barcode',
+                self._get(f'/api/v1/packages/search_by_barcode/?barcode={self.package.guide_number}')
+            ),
+            
+            # Cambios masivos (se revierten en cada ronda)
+            BenchmarkCase('packages.batch_update', self._post('/api/v1/packages/batch-update/', {
+                'package_ids': self.package_ids,
+                'attribute': 'status',
+                'value': 'EN_BODEGA',
+            }), rollback=True),
+            BenchmarkCase(
+                'pulls.change_packages_status',
+                self._post(f'/api/v1/pulls/{self.pull.id}/change-packages-status/', {'status': 'EN_BODEGA'}),
+                rollback=True
+            ),
+            BenchmarkCase(
+                'batches.change_packages_status',
+                self._post(f'/api/v1/batches/{self.batch.id}/change-packages-status/', {'status': 'EN_BODEGA'}),
+                rollback=True
+            ),
+            
+            # Exportaciones
+            BenchmarkCase('packages.export.excel', self._post('/api/v1/packages/export/', {
+                'format': 'excel',
+                'columns': ['guide_number', 'name', 'city', 'province', 'status', 'shipment_type_display'],
+                'filters': {'city': self.package.city},
+            })),
+            BenchmarkCase('packages.export.pdf', self._post('/api/v1/packages/export/', {
+                'format': 'pdf',
+                'columns': ['guide_number', 'name', 'city', 'status', 'shipment_type_display'],
+                'filters': {'city': self.package.city},
+            })),
+            BenchmarkCase('reports.packages.csv', self._post('/api/v1/reports/packages_report/', {
+                'format': 'csv',
+                'filters': date_range,
+            })),
+            
+            # Manifiestos y etiquetas (render directo, sin caché)
+            BenchmarkCase('manifests.package.pdf', lambda: PackageManifestGenerator.generate_pdf(self.package)),
+            BenchmarkCase('manifests.pull.pdf', lambda: PDFService.generate_pull_manifest(self.pull)),
+            BenchmarkCase('manifests.batch.pdf', lambda: BatchManifestGenerator.generate_pdf(self.batch)),
+            BenchmarkCase('labels.package.pdf', lambda: PackageLabelsGenerator.generate_pdf(self.package)),
+            BenchmarkCase('labels.batch.pdf', lambda: BatchLabelsGenerator.generate_pdf(self.batch)),
+            
+            # Reportes
+            BenchmarkCase('reports.chart_data', self._get(f'/api/v1/reports/chart_data/?days={self.REPORT_DAYS}')),
+            BenchmarkCase('reports.statistics_report', self._post('/api/v1/reports/statistics_report/', date_range)),
+        ]
+        
+        # Importaciones: una sola ronda, se revierte
+        cases.extend(
+            BenchmarkCase(f'packages.import.{rows}', self._import(self.build_import_file(rows)), rounds=1, rollback=True)
+            for rows in self.import_sizes
+        )
+        return cases
@@ -0,0 +1,98 @@
+"""
+Management command para comparar resultados de benchmarks
+
+Compara dos archivos generados por run_benchmarks caso por caso y marca
+las regresiones: mediana más lenta que el umbral o más consultas SQL.
+
+Uso:
+    python manage.py compare_benchmarks benchmarks/baseline.json benchmarks/benchmark_20250101_120000.json
+    python manage.py compare_benchmarks base.json nuevo.json --threshold 0.1 --fail-on-regression
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.shared.services import BenchmarkRunner
+
+
+class Command(BaseCommand):
+    help = 'Compara resultados de benchmarks contra una línea base'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', help='Resultados de referencia (JSON)')
+        parser.add_argument('current', help='Resultados nuevos (JSON)')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=BenchmarkRunner.DEFAULT_THRESHOLD,
+            help='Empeoramiento relativo tolerado (default: 0.2 = 20%%)'
+        )
+        parser.add_argument(
+            '--min-delta-ms',
+            type=float,
+            default=BenchmarkRunner.DEFAULT_MIN_DELTA_MS,
+            help='Diferencia mínima en ms para marcar un cambio (default: 5)'
+        )
+        parser.add_argument(
+            '--metric',
+            default='median_ms',
+            choices=['min_ms', 'median_ms', 'mean_ms', 'p95_ms'],
+            help='Métrica de tiempo a comparar (default: median_ms)'
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Termina con error si hay regresiones (útil en CI)'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            baseline = BenchmarkRunner.load(options['baseline'])
+            current = BenchmarkRunner.load(options['current'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        rows = BenchmarkRunner.compare(
+            baseline, current,
+            threshold=options['threshold'],
+            min_delta_ms=options['min_delta_ms'],
+            metric=options['metric'],
+        )
+        
+        self.stdout.write(self.style.SUCCESS('📊 COMPARACIÓN DE BENCHMARKS'))
+        self.stdout.write('=' * 60)
+        
+        # Los resultados solo son comparables con el mismo volumen de datos
+        for key in ('packages', 'pulls', 'batches', 'database'):
+            before = baseline['environment'].get(key)
+            after = current['environment'].get(key)
+            if before != after:
+                self.stdout.write(self.style.WARNING(f"⚠️  {key} distinto: {before} -> {after}"))
+        
+        styles = {
+            BenchmarkRunner.REGRESSION: self.style.ERROR,
+            BenchmarkRunner.IMPROVEMENT: self.style.SUCCESS,
+            BenchmarkRunner.NEW: self.style.WARNING,
+            BenchmarkRunner.MISSING: self.style.WARNING,
+        }
+        for row in rows:
+            if row['change'] is None:
+                detail = f"{row['baseline'] if row['current'] is None else row['current']:.2f} ms"
+            else:
+                detail = (
+                    f"{row['baseline']:.2f} -> {row['current']:.2f} ms ({row['change']:+.1%}), "
+                    f"consultas {row['baseline_queries']} -> {row['current_queries']}"
+                )
+            line = f"{row['status']:<10} {row['name']:<34} {detail}"
+            self.stdout.write(styles.get(row['status'], str)(line))
+        
+        regressions = [row for row in rows if row['status'] == BenchmarkRunner.REGRESSION]
+        
+        self.stdout.write('=' * 60)
+        self.stdout.write(f"Regresiones: {len(regressions)}")
+        self.stdout.write(
+            f"Mejoras:     {sum(1 for row in rows if row['status'] == BenchmarkRunner.IMPROVEMENT)}"
+        )
+        
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('✅ Sin regresiones'))
+        elif options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regresiones de rendimiento')
@@ -0,0 +1,131 @@
+"""
+Management command para medir las rutas críticas (benchmarks)
+
+Mide listados, búsqueda por código de barras, cambios masivos de estado,
+importaciones, exportaciones, manifiestos, etiquetas y reportes contra la
+base de datos actual, y guarda el resultado como JSON. Con --baseline
+compara contra una línea base anterior (ver compare_benchmarks).
+
+Uso:
+    python manage.py generate_synthetic_data --packages 200000 --seed 1
+    python manage.py run_benchmarks --output benchmarks/baseline.json
+    python manage.py run_benchmarks --baseline benchmarks/baseline.json --fail-on-regression
+    python manage.py run_benchmarks --only packages.list,reports --skip-import
+"""
+
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.core.benchmarks import HotPathBenchmarks
+from apps.shared.services import BenchmarkRunner
+
+
+class Command(BaseCommand):
+    help = 'Mide las rutas críticas y guarda los resultados como JSON'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Archivo JSON de resultados (default: benchmarks/benchmark_<fecha>.json)'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Línea base contra la que comparar al terminar'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=5,
+            help='Rondas medidas por caso (default: 5)'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=1,
+            help='Rondas de calentamiento sin medir (default: 1)'
+        )
+        parser.add_argument(
+            '--only',
+            help='Casos a medir: nombres o prefijos separados por coma (p. ej. packages.list,reports)'
+        )
+        parser.add_argument(
+            '--import-sizes',
+            default=','.join(str(rows) for rows in HotPathBenchmarks.DEFAULT_IMPORT_SIZES),
+            help='Filas de las importaciones medidas (default: 10000,50000)'
+        )
+        parser.add_argument(
+            '--skip-import',
+            action='store_true',
+            help='No mide las importaciones (las más lentas)'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=BenchmarkRunner.DEFAULT_THRESHOLD,
+            help='Con --baseline: empeoramiento relativo tolerado (default: 0.2 = 20%%)'
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Con --baseline: termina con error si hay regresiones (útil en CI)'
+        )
+    
+    def handle(self, *args, **options):
+        if options['rounds'] < 1 or options['warmup'] < 0:
+            raise CommandError('--rounds debe ser >= 1 y --warmup >= 0')
+        
+        try:
+            import_sizes = () if options['skip_import'] else tuple(
+                int(rows) for rows in options['import_sizes'].split(',') if rows.strip()
+            )
+        except ValueError:
+            raise CommandError('--import-sizes debe ser una lista de enteros separados por coma')
+        
+        try:
+            benchmarks = HotPathBenchmarks(import_sizes=import_sizes)
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        cases = benchmarks.cases()
+        if options['only']:
+            prefixes = [prefix.strip() for prefix in options['only'].split(',') if prefix.strip()]
+            cases = [
+                case for case in cases
+                if any(case.name == prefix or case.name.startswith(f'{prefix}.') for prefix in prefixes)
+            ]
+            if not cases:
+                raise CommandError(f"Ningún caso coincide con --only {options['only']}")
+        
+        self.stdout.write(self.style.SUCCESS('⏱️  BENCHMARKS DE RUTAS CRÍTICAS'))
+        self.stdout.write('=' * 60)
+        metadata = benchmarks.metadata()
+        self.stdout.write(
+            f"Datos: {metadata['packages']} paquetes, {metadata['pulls']} sacas, {metadata['batches']} lotes"
+        )
+        self.stdout.write(f"{len(cases)} casos, {options['rounds']} rondas, {options['warmup']} de calentamiento")
+        
+        runner = BenchmarkRunner(rounds=options['rounds'], warmup=options['warmup'], stdout=self.stdout)
+        try:
+            results = runner.run(cases, metadata=metadata)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"benchmark_{timezone.localtime():%Y%m%d_%H%M%S}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        BenchmarkRunner.save(results, output)
+        
+        self.stdout.write('=' * 60)
+        self.stdout.write(self.style.SUCCESS(f'✅ Resultados guardados en {output}'))
+        
+        if options['baseline']:
+            call_command(
+                'compare_benchmarks', options['baseline'], output,
+                threshold=options['threshold'],
+                fail_on_regression=options['fail_on_regression'],
+                stdout=self.stdout,
+            )
@@ -0,0 +1,79 @@
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(
+    name='apps.core.tasks.render_document_task',
+    soft_time_limit=getattr(settings, 'RENDER_SOFT_TIME_LIMIT', 120),
+    time_limit=getattr(settings, 'RENDER_TIME_LIMIT', 150),
+)
+def render_document_task(kind, object_id):
+    """
+    Genera un manifiesto, etiqueta o informe en un worker de la cola 'render'.
+    
+    El documento queda en RenderCache; el resultado solo lleva los datos para
+    recuperarlo. Si se excede el tiempo o la memoria del trabajo, la tarea
+    falla y el error queda disponible para quien consulta el trabajo.
+    
+    Args:
+        kind (str): Tipo de documento (ver RenderService.get_documents)
+        object_id: ID del objeto
+    
+    Returns:
+        dict: kind, object_id, version, extension y filename
+    """
+    from apps.shared.services import RenderService
+    
+    try:
+        with RenderService.memory_limit():
+            return RenderService.render(kind, object_id)
+    except SoftTimeLimitExceeded:
+        logger.error(f"Render {kind} {object_id} excedió el tiempo límite")
+        raise
+    except MemoryError:
+        logger.error(f"Render {kind} {object_id} excedió el límite de memoria")
+        raise
+
+
+@shared_task(
+    bind=True,
+    name='apps.core.tasks.print_job_task',
+    soft_time_limit=getattr(settings, 'PRINT_JOB_SOFT_TIME_LIMIT', 600),
+    time_limit=getattr(settings, 'PRINT_JOB_TIME_LIMIT', 660),
+)
+def print_job_task(self, document, fmt, package_ids, pull_ids, batch_ids):
+    """
+    Genera un trabajo de impresión en bloque en un worker de la cola 'render'.
+    
+    Mientras genera, publica el avance como estado PROGRESS con
+    {'current': n, 'total': m} (consultable en /api/v1/print-jobs/{job_id}/).
+    
+    Args:
+        document (str): 'labels', 'shipping_labels' o 'manifests'
+        fmt (str): 'pdf' o 'zpl'
+        package_ids, pull_ids, batch_ids (list): IDs a incluir
+    
+    Returns:
+        dict: kind, object_id, version, extension y filename
+    """
+    from apps.shared.services import PrintJobService, RenderService
+    
+    def progress(current, total):
+        # Publicar como máximo ~50 actualizaciones por trabajo
+        step = max(1, total // 50)
+        if current == total or current % step == 0:
+            self.update_state(state='PROGRESS', meta={'current': current, 'total': total})
+    
+    try:
+        with RenderService.memory_limit():
+            return PrintJobService.render(document, fmt, package_ids, pull_ids, batch_ids, progress=progress)
+    except SoftTimeLimitExceeded:
+        logger.error(f"Trabajo de impresión {self.request.id} excedió el tiempo límite")
+        raise
+    except MemoryError:
+        logger.error(f"Trabajo de impresión {self.request.id} excedió el límite de memoria")
+        raise
@@ -1,3 +1,800 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import skipIf
+from unittest.mock import PropertyMock, patch
 
-# Create your tests here.
+from celery.backends.cache import CacheBackend
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table
+from rest_framework.test import APIClient
+import qrcode
+
+from apps.logistics.models import Batch, Pull
+from apps.logistics.services import BatchLabelsGenerator, PDFService
+from apps.packages.models import Package
+from apps.packages.services import PackageExportService
+from apps.shared.services import (
+    BenchmarkCase, BenchmarkRunner, Metrics, PrintJobService, ProfilerService, RenderCache, RenderService
+)
+from apps.shared.services.label_template import BaseLabelGenerator, _qr_runs
+from apps.shared.services.manifest_template import BaseManifestGenerator
+from apps.shared.services.streaming_table import StreamingTable
+from config.celery import app as celery_app
+
+from .tasks import print_job_task, render_document_task
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def create_package(guide_number, **kwargs):
+    """Crea un paquete con los campos obligatorios."""
+    data = {
+        'guide_number': guide_number,
+        'name': f'CLIENTE {guide_number}',
+        'address': 'AV. AMAZONAS',
+        'phone_number': '0999999999',
+        'city': 'QUITO',
+        'province': 'PICHINCHA',
+    }
+    data.update(kwargs)
+    return Package.objects.create(**data)
+
+
+class MediaRootMixin:
+    """MEDIA_ROOT temporal para que los archivos generados no queden en disco."""
+    
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class APITestMixin:
+    """Cliente autenticado como staff."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+
+class RenderCacheTests(MediaRootMixin, TestCase):
+    """Caché de documentos versionada por contenido."""
+    
+    def setUp(self):
+        super().setUp()
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO')
+        self.package = create_package('GUIA0001', pull=self.pull)
+        self.renders = 0
+    
+    def render(self):
+        self.renders += 1
+        return BytesIO(b'%PDF documento')
+    
+    def test_get_or_render_renders_once_per_version(self):
+        version = RenderCache.pull_version(self.pull)
+        
+        first = RenderCache.get_or_render('pull_manifest', self.pull.id, version, self.render, 'pdf')
+        second = RenderCache.get_or_render('pull_manifest', self.pull.id, version, self.render, 'pdf')
+        
+        self.assertEqual(first, b'%PDF documento')
+        self.assertEqual(second, first)
+        self.assertEqual(self.renders, 1)
+    
+    def test_pull_version_follows_contents(self):
+        version = RenderCache.pull_version(self.pull)
+        self.assertEqual(RenderCache.pull_version(self.pull), version)
+        
+        self.package.name = 'OTRO CLIENTE'
+        self.package.save()
+        changed = RenderCache.pull_version(self.pull)
+        self.assertNotEqual(changed, version)
+        
+        create_package('GUIA0002', pull=self.pull)
+        self.assertNotEqual(RenderCache.pull_version(self.pull), changed)
+    
+    def test_put_replaces_previous_versions(self):
+        RenderCache.put('pull_manifest', self.pull.id, 'v1', 'pdf', b'uno')
+        RenderCache.put('pull_manifest', self.pull.id, 'v2', 'pdf', b'dos')
+        
+        self.assertIsNone(RenderCache.get('pull_manifest', self.pull.id, 'v1', 'pdf'))
+        self.assertEqual(RenderCache.get('pull_manifest', self.pull.id, 'v2', 'pdf'), b'dos')
+        directory = os.path.join(RenderCache.get_root(), 'pull_manifest')
+        self.assertEqual(len(os.listdir(directory)), 1)
+    
+    def test_evict_removes_least_recently_used(self):
+        for number in range(3):
+            RenderCache.put('pull_label', f'saca{number}', 'v', 'pdf', b'x' * 100)
+            path = RenderCache._path('pull_label', f'saca{number}', 'v', 'pdf')
+            os.utime(path, (1000 + number, 1000 + number))
+        
+        removed = RenderCache.evict(max_bytes=150)
+        
+        self.assertEqual(removed, 2)
+        self.assertIsNone(RenderCache.get('pull_label', 'saca0', 'v', 'pdf'))
+        self.assertIsNone(RenderCache.get('pull_label', 'saca1', 'v', 'pdf'))
+        self.assertIsNotNone(RenderCache.get('pull_label', 'saca2', 'v', 'pdf'))
+    
+    def test_response_revalidates_with_etag(self):
+        factory = RequestFactory()
+        version = RenderCache.pull_version(self.pull)
+        
+        response = RenderCache.response(
+            factory.get('/'), 'pull_manifest', self.pull.id, version, self.render, 'pdf', 'saca.pdf'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        
+        request = factory.get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        response = RenderCache.response(
+            request, 'pull_manifest', self.pull.id, version, self.render, 'pdf', 'saca.pdf'
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.renders, 1)
+
+
+class RenderCacheEndpointTests(MediaRootMixin, APITestMixin, TestCase):
+    """Descarga de manifiestos a través de la caché."""
+    
+    def setUp(self):
+        super().setUp()
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO')
+        self.package = create_package('GUIA0001', pull=self.pull)
+    
+    def test_pull_manifest_not_modified_until_contents_change(self):
+        url = f'/api/v1/pulls/{self.pull.id}/generate_manifest/'
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        etag = response['ETag']
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        self.package.name = 'OTRO CLIENTE'
+        self.package.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class RenderServiceTests(MediaRootMixin, APITestMixin, TestCase):
+    """Renders en la cola 'render' y endpoint /api/v1/renders/."""
+    
+    def setUp(self):
+        super().setUp()
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO')
+        create_package('GUIA0001', pull=self.pull)
+    
+    def test_pdf_tasks_use_render_queue(self):
+        for task_name in (
+            'apps.core.tasks.render_document_task',
+            'apps.core.tasks.print_job_task',
+            'apps.logistics.tasks.render_dispatch_document',
+            'apps.report.tasks.generate_report_artefact',
+        ):
+            with self.subTest(task=task_name):
+                route = celery_app.amqp.router.route({}, task_name)
+                self.assertEqual(route['queue'].name, 'render')
+    
+    def test_render_document_task_fills_cache(self):
+        data = render_document_task.apply(args=['pull_label', str(self.pull.id)]).get()
+        
+        self.assertEqual(data['kind'], 'pull_label')
+        self.assertEqual(data['version'], RenderCache.pull_version(self.pull))
+        content = RenderCache.get('pull_label', self.pull.id, data['version'], 'pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+    
+    @skipIf(resource is None, 'resource no disponible')
+    @override_settings(RENDER_MEMORY_LIMIT_MB=1024 * 1024)
+    def test_memory_limit_is_restored(self):
+        previous = resource.getrlimit(resource.RLIMIT_AS)
+        
+        with RenderService.memory_limit():
+            soft, _ = resource.getrlimit(resource.RLIMIT_AS)
+            self.assertLessEqual(soft, 1024 ** 4)
+        
+        self.assertEqual(resource.getrlimit(resource.RLIMIT_AS), previous)
+    
+    @skipIf(resource is None, 'resource no disponible')
+    @override_settings(RENDER_MEMORY_LIMIT_MB=1024 * 1024)
+    def test_memory_limit_is_restored_on_error(self):
+        previous = resource.getrlimit(resource.RLIMIT_AS)
+        
+        with self.assertRaises(MemoryError):
+            with RenderService.memory_limit():
+                raise MemoryError()
+        
+        self.assertEqual(resource.getrlimit(resource.RLIMIT_AS), previous)
+    
+    def test_invalid_timeout_is_rejected_before_enqueueing(self):
+        with patch.object(RenderService, 'submit') as submit:
+            for timeout in ('abc', -1, 0, 500):
+                response = self.client.post('/api/v1/renders/', {
+                    'kind': 'pull_label', 'object_id': str(self.pull.id), 'timeout': timeout,
+                }, format='json')
+                self.assertEqual(response.status_code, 400, timeout)
+        submit.assert_not_called()
+    
+    def test_unknown_kind_and_object(self):
+        response = self.client.post('/api/v1/renders/', {
+            'kind': 'otro', 'object_id': str(self.pull.id),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post('/api/v1/renders/', {
+            'kind': 'pull_label', 'object_id': '00000000-0000-0000-0000-000000000000',
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+    
+    def test_async_mode_returns_job(self):
+        with patch.object(RenderService, 'submit') as submit:
+            submit.return_value.id = 'job-1'
+            submit.return_value.state = 'PENDING'
+            response = self.client.post('/api/v1/renders/', {
+                'kind': 'pull_label', 'object_id': str(self.pull.id), 'mode': 'async',
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'job_id': 'job-1', 'status': 'PENDING'})
+        submit.assert_called_once_with('pull_label', self.pull.id)
+    
+    def test_sync_mode_serves_cached_version_without_enqueueing(self):
+        RenderService.render('pull_label', self.pull.id)
+        
+        with patch.object(RenderService, 'submit') as submit:
+            response = self.client.post('/api/v1/renders/', {
+                'kind': 'pull_label', 'object_id': str(self.pull.id), 'timeout': 5,
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        submit.assert_not_called()
+    
+    def test_sync_mode_waits_for_job(self):
+        with patch.object(RenderService, 'submit') as submit:
+            submit.return_value = render_document_task.apply(args=['pull_label', str(self.pull.id)])
+            response = self.client.post('/api/v1/renders/', {
+                'kind': 'pull_label', 'object_id': str(self.pull.id), 'timeout': 5,
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+class LabelAssetTests(TestCase):
+    """QR y Code128 vectoriales y recursos raster cacheados."""
+    
+    def test_qr_runs_match_qr_matrix(self):
+        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_M, border=1)
+        qr.add_data('GUIA-0001')
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        
+        count, runs = _qr_runs('GUIA-0001', 1, 'M')
+        
+        rebuilt = [[False] * count for _ in range(count)]
+        for row, col, length in runs:
+            for offset in range(length):
+                rebuilt[row][col + offset] = True
+        self.assertEqual(count, len(matrix))
+        self.assertEqual(rebuilt, [list(modules) for modules in matrix])
+    
+    def test_raster_assets_are_cached(self):
+        first = BaseLabelGenerator.get_qr_png('SACA-CACHE', size=(120, 120))
+        self.assertIs(BaseLabelGenerator.get_qr_png('SACA-CACHE', size=(120, 120)), first)
+        self.assertIsNot(BaseLabelGenerator.get_qr_png('SACA-CACHE', size=(80, 80)), first)
+        self.assertTrue(first.startswith(b'\x89PNG'))
+        
+        barcode = BaseLabelGenerator.get_code128_png('SACA-CACHE')
+        self.assertIs(BaseLabelGenerator.get_code128_png('SACA-CACHE'), barcode)
+        self.assertIs(BaseLabelGenerator.get_font(12), BaseLabelGenerator.get_font(12))
+    
+    def test_draw_qr_code_is_vector(self):
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer)
+        BaseLabelGenerator.draw_qr_code(pdf, 'GUIA-0001', 10, 10, 100)
+        BaseLabelGenerator.draw_code128(pdf, 'GUIA-0001', 10, 200, 200, 40)
+        pdf.save()
+        
+        self.assertNotIn(b'/Subtype /Image', buffer.getvalue())
+    
+    def test_label_sheets_embed_no_raster_codes(self):
+        batch = Batch.objects.create(destiny='QUITO')
+        pulls = [Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=batch) for _ in range(3)]
+        create_package('GUIA0001', pull=pulls[0])
+        
+        batch_labels = BatchLabelsGenerator.generate_pdf(batch).getvalue()
+        pull_label = PDFService.generate_pull_label(pulls[0]).getvalue()
+        
+        for content in (batch_labels, pull_label):
+            self.assertTrue(content.startswith(b'%PDF'))
+            self.assertNotIn(b'/Subtype /Image', content)
+
+
+class PrintJobTests(MediaRootMixin, APITestMixin, TestCase):
+    """Trabajos de impresión en bloque."""
+    
+    def setUp(self):
+        super().setUp()
+        self.batch = Batch.objects.create(destiny='QUITO')
+        self.batch_pulls = [
+            Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=self.batch)
+            for _ in range(2)
+        ]
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        self.packages = [create_package(f'GUIA{number:04d}', pull=self.pull) for number in range(3)]
+        self.package_ids = [str(package.id) for package in self.packages]
+    
+    def test_describe_validates_parameters(self):
+        invalid = [
+            ('otro', 'pdf', self.package_ids, [], []),
+            ('manifests', 'zpl', self.package_ids, [], []),
+            ('shipping_labels', 'pdf', [], [str(self.pull.id)], []),
+            ('labels', 'pdf', [], [], []),
+            ('labels', 'pdf', ['no-es-uuid'], [], []),
+        ]
+        for document, fmt, package_ids, pull_ids, batch_ids in invalid:
+            with self.assertRaises(ValueError):
+                PrintJobService.describe(document, fmt, package_ids, pull_ids, batch_ids)
+        
+        with override_settings(PRINT_JOB_MAX_ITEMS=2):
+            with self.assertRaises(ValueError):
+                PrintJobService.describe('labels', 'pdf', self.package_ids)
+    
+    def test_same_objects_share_key_and_version(self):
+        job = PrintJobService.describe('labels', 'pdf', self.package_ids)
+        same = PrintJobService.describe(
+            'labels', 'pdf', ','.join(pk.upper() for pk in self.package_ids + self.package_ids[:1])
+        )
+        self.assertEqual(same['package_ids'], self.package_ids)
+        self.assertEqual(same['object_id'], job['object_id'])
+        self.assertEqual(same['version'], job['version'])
+        
+        self.packages[0].name = 'OTRO CLIENTE'
+        self.packages[0].save()
+        changed = PrintJobService.describe('labels', 'pdf', self.package_ids)
+        self.assertEqual(changed['object_id'], job['object_id'])
+        self.assertNotEqual(changed['version'], job['version'])
+    
+    def test_labels_zpl_cover_every_object(self):
+        data = PrintJobService.render(
+            'labels', 'zpl', self.package_ids, [str(self.pull.id)], [str(self.batch.id)]
+        )
+        
+        content = RenderCache.get(data['kind'], data['object_id'], data['version'], 'zpl')
+        # 2 sacas del lote + 1 saca + 3 paquetes
+        self.assertEqual(content.count(b'^XA'), 6)
+    
+    def test_manifests_pdf_and_progress(self):
+        calls = []
+        data = PrintJobService.render(
+            'manifests', 'pdf', self.package_ids[:1], [str(self.pull.id)], [str(self.batch.id)],
+            progress=lambda current, total: calls.append((current, total)),
+        )
+        
+        content = RenderCache.get(data['kind'], data['object_id'], data['version'], 'pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(calls, [(1, 3), (2, 3), (3, 3)])
+    
+    def test_missing_objects_fail(self):
+        with self.assertRaises(ValueError):
+            PrintJobService.render('labels', 'pdf', ['00000000-0000-0000-0000-000000000000'])
+    
+    def test_print_job_task_renders_labels(self):
+        # El avance (update_state) se publica en el backend de resultados; en tests, en memoria
+        memory_backend = CacheBackend(app=celery_app, url='memory://')
+        with patch.object(type(celery_app), 'backend', new_callable=PropertyMock, return_value=memory_backend):
+            result = print_job_task.apply(args=['shipping_labels', 'pdf', self.package_ids, [], []])
+            data = result.get()
+            self.assertEqual(memory_backend.get_task_meta(result.id)['result'], {'current': 3, 'total': 3})
+        
+        content = RenderCache.get(data['kind'], data['object_id'], data['version'], 'pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+    
+    def test_endpoint_validates_before_enqueueing(self):
+        with patch.object(PrintJobService, 'submit') as submit:
+            response = self.client.post('/api/v1/print-jobs/', {
+                'document': 'labels', 'package_ids': self.package_ids, 'timeout': 'x',
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+            
+            response = self.client.post('/api/v1/print-jobs/', {
+                'document': 'manifests', 'format': 'zpl', 'package_ids': self.package_ids,
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+        submit.assert_not_called()
+    
+    def test_endpoint_async_returns_job(self):
+        with patch.object(PrintJobService, 'submit') as submit:
+            submit.return_value.id = 'job-1'
+            submit.return_value.state = 'PENDING'
+            response = self.client.post('/api/v1/print-jobs/', {
+                'document': 'labels', 'format': 'zpl', 'mode': 'async',
+                'package_ids': self.package_ids, 'batch_ids': [str(self.batch.id)],
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['items'], 4)
+        submit.assert_called_once_with('labels', 'zpl', self.package_ids, [], [str(self.batch.id)])
+
+
+class StreamingTableTests(TestCase):
+    """Tabla de documentos grandes dividida por páginas en tiempo lineal."""
+    
+    def make_table(self, count, **style):
+        rows = [[f'GUIA{number:05d}', f'CLIENTE {number}', 'QUITO'] for number in range(count)]
+        return StreamingTable(['Guía', 'Destinatario', 'Ciudad'], rows, [80, 200, 80], **style)
+    
+    def test_split_covers_every_row_once(self):
+        table = self.make_table(200)
+        table.wrap(360, 500)
+        
+        chunks = []
+        remaining = table
+        while True:
+            parts = remaining.split(360, 500)
+            chunks.append(parts[0])
+            if len(parts) == 1:
+                break
+            remaining = parts[1]
+        
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0]._start, 0)
+        self.assertEqual(chunks[-1]._end, 200)
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(previous._end, chunk._start)
+        for chunk in chunks:
+            # Los trozos comparten los datos medidos, sin copiarlos
+            self.assertIs(chunk._data, table._data)
+            self.assertLessEqual(chunk.wrap(360, 500)[1], 500)
+    
+    def test_split_without_room_for_a_row(self):
+        table = self.make_table(10)
+        self.assertEqual(table.split(360, 20), [])
+    
+    def test_only_overflowing_cells_are_wrapped(self):
+        table = self.make_table(3)
+        table._data.rows[1][1] = 'DIRECCIÓN MUY LARGA ' * 10
+        table.wrap(360, 500)
+        
+        data = table._data
+        self.assertEqual(list(data.row_lines), [1])
+        self.assertGreater(data.offsets[2] - data.offsets[1], data.offsets[1] - data.offsets[0])
+    
+    def test_create_data_table_switches_on_size(self):
+        small = BaseManifestGenerator.create_data_table(['A', 'B'], [['1', '2']] * 10)
+        large = BaseManifestGenerator.create_data_table(
+            ['A', 'B'], [['1', None]] * (BaseManifestGenerator.LARGE_TABLE_ROWS + 1)
+        )
+        
+        self.assertIsInstance(small, Table)
+        self.assertIsInstance(large, StreamingTable)
+        self.assertEqual(large._data.rows[0], ['1', '-'])
+    
+    def test_large_document_builds(self):
+        doc, buffer = BaseManifestGenerator.create_document()
+        doc.build([self.make_table(3000)])
+        
+        self.assertTrue(buffer.getvalue().startswith(b'%PDF'))
+        self.assertGreater(doc.page, 10)
+
+
+class PackageExportTests(TestCase):
+    """Exportación de paquetes a PDF sin consultas por fila."""
+    
+    COLUMNS = ['guide_number', 'transport_agency_name', 'effective_guide_number', 'pull_name', 'batch_name']
+    
+    def create_packages(self, count):
+        batch = Batch.objects.create(destiny='QUITO')
+        pull = Pull.objects.create(common_destiny='QUITO', size='GRANDE', batch=batch)
+        for number in range(count):
+            create_package(f'{count}-{number:04d}', pull=pull)
+    
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = PackageExportService.generate_pdf(Package.objects.all(), self.COLUMNS)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        return len(queries)
+    
+    def test_queries_do_not_grow_with_rows(self):
+        self.create_packages(5)
+        few = self.count_queries()
+        
+        self.create_packages(40)
+        self.assertEqual(self.count_queries(), few)
+    
+    def test_large_export_uses_streaming_table(self):
+        self.create_packages(BaseManifestGenerator.LARGE_TABLE_ROWS + 1)
+        
+        with patch('apps.packages.services.export_service.StreamingTable', wraps=StreamingTable) as table:
+            response = PackageExportService.generate_pdf(Package.objects.all(), self.COLUMNS)
+        
+        self.assertEqual(response.status_code, 200)
+        table.assert_called_once()
+
+
+class BenchmarkRunnerTests(TestCase):
+    """Medición de casos, línea base JSON y detección de regresiones."""
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+    
+    @staticmethod
+    def results(**cases):
+        """Resultados con la mediana y las consultas de cada caso."""
+        return {
+            'version': BenchmarkRunner.FORMAT_VERSION,
+            'environment': {'packages': 10},
+            'benchmarks': {
+                name: {'median_ms': median, 'queries': queries}
+                for name, (median, queries) in cases.items()
+            },
+        }
+    
+    def test_run_case_counts_queries(self):
+        def read():
+            Package.objects.count()
+            Pull.objects.count()
+        
+        result = BenchmarkRunner(rounds=3, warmup=1).run_case(BenchmarkCase('read', read))
+        
+        self.assertEqual(result['rounds'], 3)
+        self.assertEqual(result['queries'], 2)
+        self.assertLessEqual(result['min_ms'], result['median_ms'])
+        self.assertLessEqual(result['median_ms'], result['max_ms'])
+    
+    def test_rollback_case_leaves_no_rows(self):
+        runner = BenchmarkRunner(rounds=2, warmup=1)
+        
+        runner.run_case(BenchmarkCase('write', lambda: create_package('BENCH1'), rollback=True))
+        
+        self.assertFalse(Package.objects.exists())
+    
+    def test_compare_statuses(self):
+        baseline = self.results(
+            slower=(100, 5), faster=(100, 5), noise=(10, 5), more_queries=(10, 5), removed=(10, 5)
+        )
+        current = self.results(
+            slower=(130, 5), faster=(60, 5), noise=(13, 5), more_queries=(10, 6), added=(10, 5)
+        )
+        
+        statuses = {row['name']: row['status'] for row in BenchmarkRunner.compare(baseline, current)}
+        
+        self.assertEqual(statuses, {
+            'slower': BenchmarkRunner.REGRESSION,
+            'faster': BenchmarkRunner.IMPROVEMENT,
+            # +30% pero menos de 5 ms
+            'noise': BenchmarkRunner.UNCHANGED,
+            'more_queries': BenchmarkRunner.REGRESSION,
+            'removed': BenchmarkRunner.MISSING,
+            'added': BenchmarkRunner.NEW,
+        })
+    
+    def test_save_and_load(self):
+        path = os.path.join(self.folder, 'baseline.json')
+        BenchmarkRunner.save(self.results(list=(10, 5)), path)
+        
+        self.assertEqual(BenchmarkRunner.load(path), self.results(list=(10, 5)))
+        
+        with open(path, 'w') as output:
+            json.dump({'benchmarks': {}}, output)
+        with self.assertRaises(ValueError):
+            BenchmarkRunner.load(path)
+    
+    def test_compare_command_fails_on_regression(self):
+        baseline = os.path.join(self.folder, 'baseline.json')
+        current = os.path.join(self.folder, 'current.json')
+        BenchmarkRunner.save(self.results(list=(100, 5)), baseline)
+        BenchmarkRunner.save(self.results(list=(200, 5)), current)
+        
+        output = StringIO()
+        call_command('compare_benchmarks', baseline, current, stdout=output)
+        self.assertIn('Regresiones: 1', output.getvalue())
+        
+        with self.assertRaises(CommandError):
+            call_command('compare_benchmarks', baseline, current, '--fail-on-regression', stdout=StringIO())
+
+
+class RunBenchmarksCommandTests(MediaRootMixin, TestCase):
+    """run_benchmarks mide todos los casos contra datos sintéticos."""
+    
+    def test_requires_data(self):
+        with self.assertRaises(CommandError):
+            call_command('run_benchmarks', '--output', os.path.join(self.media_root, 'out.json'), stdout=StringIO())
+    
+    def test_runs_every_case(self):
+        call_command(
+            'generate_synthetic_data', '--packages', '300', '--months', '1', '--force', stdout=StringIO()
+        )
+        # Con tan pocos paquetes por día no se forman lotes: se arma uno
+        batch = Batch.objects.create(destiny='QUITO')
+        for pull in Pull.objects.order_by('-packages_count')[:2]:
+            pull.batch = batch
+            pull.save()
+        statuses = dict(Package.objects.values_list('id', 'status'))
+        output = os.path.join(self.media_root, 'benchmark.json')
+        
+        call_command(
+            'run_benchmarks', '--output', output, '--rounds', '1', '--warmup', '0',
+            '--import-sizes', '20', stdout=StringIO()
+        )
+        
+        results = BenchmarkRunner.load(output)
+        self.assertIn('packages.list', results['benchmarks'])
+        self.assertIn('packages.import.20', results['benchmarks'])
+        self.assertGreaterEqual(results['environment']['packages'], 300)
+        # Los casos que escriben se revierten
+        self.assertEqual(dict(Package.objects.values_list('id', 'status')), statuses)
+
+
+class ProfilerTests(MediaRootMixin, TestCase):
+    """Perfiles bajo demanda (X-Profile) y sus endpoints."""
+    
+    TASK = 'apps.report.tasks.generate_report_files'
+    
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('admin', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_login(self.staff)
+    
+    def profile_request(self):
+        response = self.client.get('/api/v1/profiles/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        return response['X-Profile-Id']
+    
+    def test_staff_request_is_profiled(self):
+        profile_id = self.profile_request()
+        
+        summary = ProfilerService.get_summary(profile_id)
+        self.assertEqual(summary['kind'], 'request')
+        self.assertEqual(summary['path'], '/api/v1/profiles/')
+        self.assertEqual(summary['status'], 200)
+        self.assertTrue(summary['functions'])
+        self.assertTrue(os.path.exists(ProfilerService.profile_path(profile_id)))
+    
+    def test_query_param_activates_profile(self):
+        response = self.client.get('/api/v1/profiles/?_profile=1')
+        self.assertIn('X-Profile-Id', response)
+    
+    def test_non_staff_flag_is_ignored(self):
+        user = User.objects.create_user('operador', password='clave')
+        client = APIClient()
+        client.force_login(user)
+        
+        response = client.get('/api/v1/packages/', HTTP_X_PROFILE='1')
+        
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(ProfilerService.list_summaries(), [])
+    
+    @override_settings(PROFILER_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get('/api/v1/profiles/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+    
+    def test_list_and_detail(self):
+        profile_id = self.profile_request()
+        
+        listing = self.client.get('/api/v1/profiles/').json()
+        self.assertEqual([item['id'] for item in listing], [profile_id])
+        self.assertNotIn('functions', listing[0])
+        
+        detail = self.client.get(f'/api/v1/profiles/{profile_id}/')
+        self.assertEqual(detail.status_code, 200)
+        self.assertIn('functions', detail.json())
+        
+        self.assertEqual(self.client.get('/api/v1/profiles/?limit=x').status_code, 400)
+    
+    def test_download(self):
+        profile_id = self.profile_request()
+        
+        response = self.client.get(f'/api/v1/profiles/{profile_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'{profile_id}.prof', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content))
+        
+        text = self.client.get(f'/api/v1/profiles/{profile_id}/download/?as=text')
+        self.assertEqual(text.status_code, 200)
+        self.assertTrue(text['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'function calls', text.content)
+    
+    def test_unknown_profile(self):
+        unknown = '0' * 32
+        self.assertEqual(self.client.get(f'/api/v1/profiles/{unknown}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/profiles/{unknown}/download/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/profiles/{unknown}/download/?as=text').status_code, 404)
+        # Ids que no son hex no llegan al disco
+        self.assertEqual(self.client.get('/api/v1/profiles/..%2Fsettings/download/').status_code, 404)
+    
+    def test_requires_staff(self):
+        user = User.objects.create_user('operador', password='clave')
+        client = APIClient()
+        client.force_login(user)
+        self.assertEqual(client.get('/api/v1/profiles/').status_code, 403)
+        self.assertEqual(client.post('/api/v1/profiles/tasks/', {'task': self.TASK}).status_code, 403)
+    
+    def test_arm_task(self):
+        response = self.client.post('/api/v1/profiles/tasks/', {'task': self.TASK, 'runs': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'task': self.TASK, 'runs': 2})
+        
+        self.assertTrue(ProfilerService.consume_armed(self.TASK))
+        self.assertTrue(ProfilerService.consume_armed(self.TASK))
+        self.assertFalse(ProfilerService.consume_armed(self.TASK))
+    
+    def test_arm_unknown_task(self):
+        response = self.client.post('/api/v1/profiles/tasks/', {'task': 'os.system'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(self.TASK, self.client.get('/api/v1/profiles/tasks/').json()['tasks'])
+    
+    def test_busy_profiler_skips(self):
+        with ProfilerService.profile('externo') as outer:
+            with ProfilerService.profile('interno') as inner:
+                self.assertIsNotNone(outer)
+                self.assertIsNone(inner)
+        self.assertIsNone(ProfilerService.current_id())
+    
+    @override_settings(PROFILER_MAX_PROFILES=2)
+    def test_prune_keeps_latest(self):
+        ids = []
+        for index in range(3):
+            with ProfilerService.profile(f'bloque {index}') as session:
+                pass
+            path = os.path.join(ProfilerService.directory(), f'{session.id}.json')
+            os.utime(path, (index, index))
+            ids.append(session.id)
+        ProfilerService.prune()
+        
+        self.assertIsNone(ProfilerService.get_summary(ids[0]))
+        self.assertFalse(os.path.exists(ProfilerService.profile_path(ids[0])))
+        self.assertEqual({item['id'] for item in ProfilerService.list_summaries()}, set(ids[1:]))
+
+
+@skipIf(not Metrics.is_enabled(), 'prometheus-client no instalado')
+class MetricsEndpointTests(TestCase):
+    """/metrics no queda abierto por omisión."""
+    
+    @override_settings(METRICS_TOKEN='', METRICS_PUBLIC=False)
+    def test_closed_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+    
+    @override_settings(METRICS_TOKEN='secreto', METRICS_PUBLIC=False)
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer otro').status_code, 401)
+        
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'candas_http_request_duration_seconds', response.content)
+    
+    @override_settings(METRICS_TOKEN='', METRICS_PUBLIC=False)
+    def test_staff_session(self):
+        user = User.objects.create_user('operador', password='clave')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+    
+    @override_settings(METRICS_TOKEN='secreto', METRICS_PUBLIC=True)
+    def test_public(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
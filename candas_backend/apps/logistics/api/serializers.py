@@ -33,7 +33,7 @@ class PullListSerializer(serializers.ModelSerializer):
     
     def get_packages_count(self, obj):
         """Contar paquetes en el Pull"""
-        return obj.packages.count()
+        return obj.packages_count
 
 
 class PullDetailSerializer(serializers.ModelSerializer):
@@ -82,7 +82,7 @@ class PullDetailSerializer(serializers.ModelSerializer):
         ]
     
     def get_packages_count(self, obj):
-        return obj.packages.count()
+        return obj.packages_count
     
     def get_packages(self, obj):
         """Lista de paquetes en el Pull"""
@@ -199,7 +199,10 @@ class PullCreateSerializer(serializers.ModelSerializer):
             packages = Package.objects.filter(id__in=package_ids, pull__isnull=True)
             
             # Asignar el pull a cada paquete
-            packages.update(pull=pull)
+            from django.utils import timezone
+            from ..services import CounterService
+            assigned = packages.update(pull=pull, updated_at=timezone.now())
+            CounterService.adjust_packages({pull.pk: assigned})
             
             # Actualizar el pull para reflejar los cambios
             pull.refresh_from_db()
@@ -232,7 +235,7 @@ class BatchListSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_pulls_count(self, obj):
-        return obj.pulls.count()
+        return obj.pulls_count
     
     def get_total_packages(self, obj):
         return obj.get_total_packages()
@@ -264,7 +267,7 @@ class BatchDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_pulls_count(self, obj):
-        return obj.pulls.count()
+        return obj.pulls_count
     
     def get_total_packages(self, obj):
         return obj.get_total_packages()
@@ -362,7 +365,11 @@ class BatchCreateSerializer(serializers.ModelSerializer):
         # Asociar sacas
         if pull_ids:
             from ..models import Pull
-            Pull.objects.filter(id__in=pull_ids).update(batch=batch)
+            from django.utils import timezone
+            from ..services import CounterService
+            Pull.objects.filter(id__in=pull_ids).update(batch=batch, updated_at=timezone.now())
+            CounterService.attach_pulls(batch.pk, pull_ids)
+            batch.refresh_from_db(fields=['packages_count', 'pulls_count'])
         
         return batch
 
@@ -390,15 +397,15 @@ class DispatchSerializer(serializers.ModelSerializer):
     
     def get_packages_count(self, obj):
         """Retorna la cantidad de paquetes individuales (sin pull)"""
-        return obj.packages.count()
+        return obj.get_summary()['individual_packages']
     
     def get_pulls_count(self, obj):
         """Retorna la cantidad de sacas"""
-        return obj.pulls.count()
+        return obj.get_summary()['total_pulls']
     
     def get_total_packages(self, obj):
         """Retorna el total de paquetes (en sacas + individuales)"""
-        return obj.get_total_packages()
+        return obj.get_summary()['total_packages']
 
 
 class PullItemSerializer(serializers.Serializer):
@@ -443,7 +450,7 @@ class PullBulkCreateSerializer(serializers.Serializer):
     
     def validate(self, data):
         """Validaciones globales"""
-        from apps.packages.models import Package
+        from ..services import PullService
         
         # Recopilar todos los package_ids
         all_package_ids = []
@@ -451,26 +458,10 @@ class PullBulkCreateSerializer(serializers.Serializer):
             package_ids = pull_data.get('package_ids', [])
             all_package_ids.extend(package_ids)
         
-        # Validar que no haya paquetes duplicados
-        if len(all_package_ids) != len(set(all_package_ids)):
-            raise serializers.ValidationError({
-                'pulls': 'No se pueden asignar los mismos paquetes a múltiples sacas'
-            })
-        
-        # Validar que todos los paquetes existan y estén disponibles
-        if all_package_ids:
-            packages = Package.objects.filter(id__in=all_package_ids)
-            if packages.count() != len(all_package_ids):
-                raise serializers.ValidationError({
-                    'pulls': 'Algunos paquetes no existen'
-                })
-            
-            # Verificar que no tengan pull asignado
-            packages_with_pull = packages.filter(pull__isnull=False)
-            if packages_with_pull.exists():
-                raise serializers.ValidationError({
-                    'pulls': f'{packages_with_pull.count()} paquete(s) ya están asignados a otra saca'
-                })
+        # Validar duplicados, existencia y disponibilidad en una sola consulta
+        error = PullService.validate_available_packages(all_package_ids)
+        if error:
+            raise serializers.ValidationError({'pulls': error})
         
         # Validar agencia de transporte si se proporciona
         if data.get('transport_agency'):
@@ -484,9 +475,8 @@ class PullBulkCreateSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         """Crear múltiples sacas"""
-        from apps.packages.models import Package
         from apps.catalog.models import TransportAgency
-        from django.db import transaction
+        from ..services import PullService
         
         common_destiny = validated_data['common_destiny']
         transport_agency_id = validated_data.get('transport_agency')
@@ -497,27 +487,13 @@ class PullBulkCreateSerializer(serializers.Serializer):
         if transport_agency_id:
             transport_agency = TransportAgency.objects.get(id=transport_agency_id)
         
-        created_pulls = []
-        
-        with transaction.atomic():
-            for pull_data in pulls_data:
-                # Crear el Pull
-                pull = Pull.objects.create(
-                    common_destiny=common_destiny,
-                    size=pull_data['size'],
-                    transport_agency=transport_agency,
-                    guide_number=guide_number
-                )
-                
-                # Asociar paquetes
-                package_ids = pull_data.get('package_ids', [])
-                if package_ids:
-                    packages = Package.objects.filter(id__in=package_ids)
-                    packages.update(pull=pull)
-                
-                created_pulls.append(pull)
-        
-        return created_pulls
+        # Un INSERT para todas las sacas y un UPDATE para todos los paquetes
+        return PullService.bulk_create_pulls(
+            pulls_data,
+            common_destiny=common_destiny,
+            transport_agency=transport_agency,
+            guide_number=guide_number,
+        )
 
 
 class BatchWithPullsCreateSerializer(serializers.Serializer):
@@ -551,7 +527,7 @@ class BatchWithPullsCreateSerializer(serializers.Serializer):
     
     def validate(self, data):
         """Validaciones globales"""
-        from apps.packages.models import Package
+        from ..services import PullService
         
         # Recopilar todos los package_ids
         all_package_ids = []
@@ -559,26 +535,10 @@ class BatchWithPullsCreateSerializer(serializers.Serializer):
             package_ids = pull_data.get('package_ids', [])
             all_package_ids.extend(package_ids)
         
-        # Validar que no haya paquetes duplicados
-        if len(all_package_ids) != len(set(all_package_ids)):
-            raise serializers.ValidationError({
-                'pulls': 'No se pueden asignar los mismos paquetes a múltiples sacas'
-            })
-        
-        # Validar que todos los paquetes existan y estén disponibles
-        if all_package_ids:
-            packages = Package.objects.filter(id__in=all_package_ids)
-            if packages.count() != len(all_package_ids):
-                raise serializers.ValidationError({
-                    'pulls': 'Algunos paquetes no existen'
-                })
-            
-            # Verificar que no tengan pull asignado
-            packages_with_pull = packages.filter(pull__isnull=False)
-            if packages_with_pull.exists():
-                raise serializers.ValidationError({
-                    'pulls': f'{packages_with_pull.count()} paquete(s) ya están asignados a otra saca'
-                })
+        # Validar duplicados, existencia y disponibilidad en una sola consulta
+        error = PullService.validate_available_packages(all_package_ids)
+        if error:
+            raise serializers.ValidationError({'pulls': error})
         
         # Validar agencia de transporte si se proporciona
         if data.get('transport_agency'):
@@ -592,9 +552,9 @@ class BatchWithPullsCreateSerializer(serializers.Serializer):
     
     def create(self, validated_data):
         """Crear lote y múltiples sacas en una transacción atómica"""
-        from apps.packages.models import Package
         from apps.catalog.models import TransportAgency
         from django.db import transaction
+        from ..services import PullService
         
         destiny = validated_data['destiny']
         transport_agency_id = validated_data.get('transport_agency')
@@ -613,25 +573,14 @@ class BatchWithPullsCreateSerializer(serializers.Serializer):
                 guide_number=guide_number
             )
             
-            # Crear las Pulls y asociarlas al Batch
-            created_pulls = []
-            for pull_data in pulls_data:
-                # Crear el Pull asociado al batch
-                pull = Pull.objects.create(
-                    common_destiny=destiny,  # Mismo destino que el batch
-                    size=pull_data['size'],
-                    transport_agency=transport_agency,
-                    guide_number=guide_number,  # Heredar guide_number del lote
-                    batch=batch
-                )
-                
-                # Asociar paquetes
-                package_ids = pull_data.get('package_ids', [])
-                if package_ids:
-                    packages = Package.objects.filter(id__in=package_ids)
-                    packages.update(pull=pull)
-                
-                created_pulls.append(pull)
+            # Crear las Pulls del lote (mismo destino, guía heredada) en bloque
+            created_pulls = PullService.bulk_create_pulls(
+                pulls_data,
+                common_destiny=destiny,
+                transport_agency=transport_agency,
+                guide_number=guide_number,
+                batch=batch,
+            )
         
         # Retornar el batch creado con sus pulls
         batch.created_pulls = created_pulls
@@ -677,7 +626,7 @@ class BatchAutoDistributeSerializer(serializers.Serializer):
     
     def validate(self, data):
         """Validaciones globales"""
-        from apps.packages.models import Package
+        from ..services import PullService, AutoDistributionService
         
         package_ids = data.get('package_ids', [])
         
@@ -687,19 +636,10 @@ class BatchAutoDistributeSerializer(serializers.Serializer):
                 'package_ids': 'No se pueden incluir paquetes duplicados'
             })
         
-        # Validar que todos los paquetes existan y estén disponibles
-        packages = Package.objects.filter(id__in=package_ids)
-        if packages.count() != len(package_ids):
-            raise serializers.ValidationError({
-                'package_ids': 'Algunos paquetes no existen'
-            })
-        
-        # Verificar que no tengan pull asignado
-        packages_with_pull = packages.filter(pull__isnull=False)
-        if packages_with_pull.exists():
-            raise serializers.ValidationError({
-                'package_ids': f'{packages_with_pull.count()} paquete(s) ya están asignados a otra saca'
-            })
+        # Validar existencia y disponibilidad en una sola consulta
+        error = PullService.validate_available_packages(package_ids)
+        if error:
+            raise serializers.ValidationError({'package_ids': error})
         
         # Validar agencia de transporte si se proporciona
         if data.get('transport_agency'):
@@ -717,64 +657,27 @@ class BatchAutoDistributeSerializer(serializers.Serializer):
                 'pulls_config': f'Capacidad total ({total_capacity}) insuficiente para {len(package_ids)} paquetes'
             })
         
+        # Planificar la distribución (en memoria, sin escribir)
+        try:
+            data['plan'] = AutoDistributionService.plan(package_ids, pulls_config)
+        except ValueError as e:
+            raise serializers.ValidationError({'pulls_config': str(e)})
+        
         return data
     
     def create(self, validated_data):
-        """Crear lote y distribuir paquetes automáticamente"""
-        from apps.packages.models import Package
+        """Crear lote y materializar el plan de distribución con escrituras en bloque"""
         from apps.catalog.models import TransportAgency
-        from django.db import transaction
-        
-        destiny = validated_data['destiny']
-        transport_agency_id = validated_data.get('transport_agency')
-        guide_number = validated_data.get('guide_number', '')
-        package_ids = validated_data['package_ids']
-        pulls_config = validated_data['pulls_config']
+        from ..services import AutoDistributionService
         
         transport_agency = None
-        if transport_agency_id:
-            transport_agency = TransportAgency.objects.get(id=transport_agency_id)
-        
-        with transaction.atomic():
-            # Crear el Batch
-            batch = Batch.objects.create(
-                destiny=destiny,
-                transport_agency=transport_agency,
-                guide_number=guide_number
-            )
-            
-            # Obtener paquetes ordenados
-            packages = list(Package.objects.filter(id__in=package_ids))
-            package_index = 0
-            created_pulls = []
-            
-            # Distribuir paquetes según configuración
-            for config in pulls_config:
-                if package_index >= len(packages):
-                    break
-                
-                # Crear Pull
-                pull = Pull.objects.create(
-                    common_destiny=destiny,
-                    size=config['size'],
-                    transport_agency=transport_agency,
-                    guide_number=guide_number,
-                    batch=batch
-                )
-                
-                # Asignar paquetes hasta el máximo configurado
-                max_packages = config['max_packages']
-                packages_for_pull = packages[package_index:package_index + max_packages]
-                package_ids_for_pull = [pkg.id for pkg in packages_for_pull]
-                
-                if package_ids_for_pull:
-                    Package.objects.filter(id__in=package_ids_for_pull).update(pull=pull)
-                    package_index += len(packages_for_pull)
-                
-                created_pulls.append(pull)
+        if validated_data.get('transport_agency'):
+            transport_agency = TransportAgency.objects.get(id=validated_data['transport_agency'])
         
         # Retornar el batch creado con información de distribución
-        batch.created_pulls = created_pulls
-        batch.distributed_packages = package_index
-        return batch
-
+        return AutoDistributionService.commit(
+            validated_data['plan'],
+            destiny=validated_data['destiny'],
+            transport_agency=transport_agency,
+            guide_number=validated_data.get('guide_number', ''),
+        )
@@ -5,11 +5,14 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
 from django.shortcuts import get_object_or_404
 from django.http import FileResponse, HttpResponse
+from django.utils import timezone
 from datetime import datetime
 from ..models import Pull, Batch, Dispatch
-from ..services import PullService, PDFService, QRService, BatchManifestGenerator, BatchLabelsGenerator
+from ..services import PackagesUnavailableError, PullService, CounterService, DispatchService, PDFService, QRService, BatchManifestGenerator, BatchLabelsGenerator
+from apps.shared.services import ETagService, RenderCache, BaseZPLGenerator, ZPLRenderer
 from .serializers import (
     PullListSerializer,
     PullDetailSerializer,
@@ -37,6 +40,11 @@ class PullViewSet(viewsets.ModelViewSet):
     search_fields = ['common_destiny', 'guide_number']
     ordering_fields = ['created_at', 'updated_at', 'common_destiny']
     ordering = ['-created_at']
+    # Máximo de consultas SQL por acción (QueryBudgetMiddleware)
+    query_budget = {
+        'list': 8,
+        'retrieve': 10,
+    }
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -47,7 +55,10 @@ class PullViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filtrar queryset"""
-        queryset = Pull.objects.all()
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # El listado usa el contador packages_count, no los paquetes
+            queryset = queryset.prefetch_related(None)
         
         # Filtro por batch
         batch_id = self.request.query_params.get('batch', None)
@@ -61,6 +72,14 @@ class PullViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Listado con ETag por página (304 sin serializar si no cambió)."""
+        return ETagService.list_response(self, request, ETagService.PULL_LIST_FIELDS)
+    
+    @ETagService.conditional(ETagService.pull_etag)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=True, methods=['post'])
     def add_packages(self, request, pk=None):
         """
@@ -78,17 +97,23 @@ class PullViewSet(viewsets.ModelViewSet):
             )
         
         try:
+            from django.db import transaction
             from apps.packages.models import Package
-            packages = Package.objects.filter(id__in=package_ids, pull__isnull=True)
             
-            if packages.count() != len(package_ids):
-                return Response(
-                    {'error': 'Algunos paquetes no están disponibles'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Asignar paquetes
-            packages.update(pull=pull)
+            # Asignar en un único UPDATE; si no se asignaron todos, revertir
+            with transaction.atomic():
+                updated = Package.objects.filter(
+                    id__in=package_ids, pull__isnull=True
+                ).update(pull=pull, updated_at=timezone.now())
+                
+                if updated != len(package_ids):
+                    transaction.set_rollback(True)
+                    return Response(
+                        {'error': 'Algunos paquetes no están disponibles'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                
+                CounterService.adjust_packages({pull.pk: updated})
             
             pull.refresh_from_db()
             serializer = PullDetailSerializer(pull, context={'request': request})
@@ -115,9 +140,14 @@ class PullViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        from django.db import transaction
         from apps.packages.models import Package
-        packages = Package.objects.filter(id__in=package_ids, pull=pull)
-        packages.update(pull=None)
+        
+        with transaction.atomic():
+            removed = Package.objects.filter(id__in=package_ids, pull=pull).update(
+                pull=None, updated_at=timezone.now()
+            )
+            CounterService.adjust_packages({pull.pk: -removed})
         
         pull.refresh_from_db()
         serializer = PullDetailSerializer(pull, context={'request': request})
@@ -264,16 +294,14 @@ class PullViewSet(viewsets.ModelViewSet):
         pull = self.get_object()
         
         try:
-            # Generar PDF
-            pdf_buffer = PDFService.generate_pull_manifest(pull)
-            
             # Nombre del archivo
             filename = f"manifiesto_saca_{pull.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             
-            # Retornar PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'pull_manifest', pull.id, RenderCache.pull_version(pull),
+                lambda: PDFService.generate_pull_manifest(pull), 'pdf', filename
+            )
             
         except Exception as e:
             return Response(
@@ -290,19 +318,14 @@ class PullViewSet(viewsets.ModelViewSet):
         pull = self.get_object()
         
         try:
-            # Generar Excel
-            excel_buffer = PDFService.generate_pull_manifest_excel(pull)
-            
             # Nombre del archivo
             filename = f"manifiesto_saca_{pull.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
             
-            # Retornar Excel
-            response = HttpResponse(
-                excel_buffer.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'pull_manifest_excel', pull.id, RenderCache.pull_version(pull),
+                lambda: PDFService.generate_pull_manifest_excel(pull), 'xlsx', filename
             )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
             
         except Exception as e:
             return Response(
@@ -310,25 +333,34 @@ class PullViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ZPLRenderer])
     def generate_label(self, request, pk=None):
         """
         Generar PDF con etiqueta de saca (1/3 de hoja A4)
         GET /api/v1/pulls/{id}/generate_label/
+        
+        Con ?format=zpl retorna la etiqueta en ZPL para impresoras térmicas;
+        con ?include_packages=true agrega las etiquetas de sus paquetes al
+        mismo stream.
         """
         pull = self.get_object()
         
         try:
-            # Generar PDF
-            pdf_buffer = PDFService.generate_pull_label(pull)
+            if request.query_params.get('format') == 'zpl':
+                include_packages = request.query_params.get('include_packages', '').lower() in ('true', '1', 'yes')
+                return BaseZPLGenerator.response(
+                    PDFService.generate_pull_label_zpl(pull, include_packages=include_packages),
+                    f"etiqueta_saca_{pull.id}.zpl"
+                )
             
             # Nombre del archivo
             filename = f"etiqueta_saca_{pull.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             
-            # Retornar PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'pull_label', pull.id, RenderCache.pull_version(pull),
+                lambda: PDFService.generate_pull_label(pull), 'pdf', filename
+            )
             
         except Exception as e:
             return Response(
@@ -370,6 +402,11 @@ class BatchViewSet(viewsets.ModelViewSet):
     search_fields = ['destiny', 'guide_number']
     ordering_fields = ['created_at', 'destiny']
     ordering = ['-created_at']
+    # Máximo de consultas SQL por acción (QueryBudgetMiddleware)
+    query_budget = {
+        'list': 9,
+        'retrieve': 20,
+    }
     
     def get_serializer_class(self):
         """Usar serializer diferente según la acción"""
@@ -406,6 +443,14 @@ class BatchViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Listado con ETag por página (304 sin serializar si no cambió)."""
+        return ETagService.list_response(self, request, ETagService.BATCH_LIST_FIELDS)
+    
+    @ETagService.conditional(ETagService.batch_etag)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['post'])
     def create_with_pulls(self, request):
         """
@@ -501,12 +546,35 @@ class BatchViewSet(viewsets.ModelViewSet):
                 'total_packages': len(request.data.get('package_ids', []))
             }, status=status.HTTP_201_CREATED)
             
+        except PackagesUnavailableError as e:
+            # Otra petición tomó paquetes del plan: volver a previsualizar
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_409_CONFLICT
+            )
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=False, methods=['post'], url_path='auto_distribute/preview')
+    def auto_distribute_preview(self, request):
+        """
+        Previsualizar la distribución automática sin crear el lote
+        POST /api/v1/batches/auto_distribute/preview/
+        Body: mismo formato que auto_distribute
+        """
+        serializer = BatchAutoDistributeSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(serializer.validated_data['plan'], status=status.HTTP_200_OK)
+    
     @action(detail=True, methods=['get'])
     def packages_summary(self, request, pk=None):
         """
@@ -751,16 +819,14 @@ class BatchViewSet(viewsets.ModelViewSet):
         batch = self.get_object()
         
         try:
-            # Generar PDF
-            pdf_buffer = BatchManifestGenerator.generate_pdf(batch)
-            
             # Nombre del archivo
             filename = f"manifiesto_lote_{str(batch.id)[:8]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             
-            # Retornar PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'batch_manifest', batch.id, RenderCache.batch_version(batch),
+                lambda: BatchManifestGenerator.generate_pdf(batch), 'pdf', filename
+            )
             
         except Exception as e:
             return Response(
@@ -779,19 +845,14 @@ class BatchViewSet(viewsets.ModelViewSet):
         batch = self.get_object()
         
         try:
-            # Generar Excel
-            excel_buffer = BatchManifestGenerator.generate_excel(batch)
-            
             # Nombre del archivo
             filename = f"manifiesto_lote_{str(batch.id)[:8]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
             
-            # Retornar Excel
-            response = HttpResponse(
-                excel_buffer.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'batch_manifest_excel', batch.id, RenderCache.batch_version(batch),
+                lambda: BatchManifestGenerator.generate_excel(batch), 'xlsx', filename
             )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
             
         except Exception as e:
             return Response(
@@ -799,7 +860,7 @@ class BatchViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ZPLRenderer])
     def generate_labels(self, request, pk=None):
         """
         Generar PDF con etiquetas de todas las sacas del lote.
@@ -808,20 +869,28 @@ class BatchViewSet(viewsets.ModelViewSet):
         guía, cantidad de paquetes y código QR.
         
         GET /api/v1/batches/{id}/generate_labels/
+        
+        Con ?format=zpl retorna todas las etiquetas en un solo stream ZPL;
+        con ?include_packages=true cada saca va seguida de sus paquetes.
         """
         batch = self.get_object()
         
         try:
-            # Generar PDF con etiquetas
-            pdf_buffer = BatchLabelsGenerator.generate_pdf(batch)
+            if request.query_params.get('format') == 'zpl':
+                include_packages = request.query_params.get('include_packages', '').lower() in ('true', '1', 'yes')
+                return BaseZPLGenerator.response(
+                    BatchLabelsGenerator.generate_zpl(batch, include_packages=include_packages),
+                    f"etiquetas_lote_{str(batch.id)[:8]}.zpl"
+                )
             
             # Nombre del archivo
             filename = f"etiquetas_lote_{str(batch.id)[:8]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             
-            # Retornar PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'batch_labels', batch.id, RenderCache.batch_version(batch),
+                lambda: BatchLabelsGenerator.generate_pdf(batch), 'pdf', filename
+            )
             
         except Exception as e:
             return Response(
@@ -839,5 +908,107 @@ class DispatchViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Retorna el queryset de despachos ordenado"""
-        return Dispatch.objects.prefetch_related('pulls', 'packages').order_by('-dispatch_date', '-created_at')
+        # Los conteos salen de Dispatch.summary_cache: no hace falta prefetch de sacas/paquetes
+        return Dispatch.objects.order_by('-dispatch_date', '-created_at')
+    
+    @action(detail=True, methods=['get'])
+    def statistics(self, request, pk=None):
+        """
+        Obtener estadísticas del despacho con desglose por agencia
+        GET /api/v1/dispatches/{id}/statistics/
+        """
+        dispatch = self.get_object()
+        stats = DispatchService.get_dispatch_statistics(dispatch)
+        return Response(stats)
 
+    
+    @action(detail=True, methods=['post'])
+    def close(self, request, pk=None):
+        """
+        Cerrar el día de despacho en segundo plano
+        POST /api/v1/dispatches/{id}/close/
+        Body (opcional): {"pull_ids": [...], "package_ids": [...]}
+        
+        Asocia los elementos indicados, pasa todos los paquetes a EN_TRANSITO
+        y genera un ZIP con los manifiestos y etiquetas de sacas y lotes.
+        """
+        from ..tasks import close_dispatch_task
+        
+        dispatch = self.get_object()
+        
+        if dispatch.status in ('COMPLETADO', 'CANCELADO'):
+            return Response(
+                {'error': f'No se puede cerrar un despacho {dispatch.get_status_display().lower()}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        pull_ids = request.data.get('pull_ids') or []
+        package_ids = request.data.get('package_ids') or []
+        if not isinstance(pull_ids, list) or not isinstance(package_ids, list):
+            return Response(
+                {'error': 'pull_ids y package_ids deben ser listas'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        task = close_dispatch_task.delay(
+            str(dispatch.id),
+            pull_ids=[str(pull_id) for pull_id in pull_ids],
+            package_ids=[str(package_id) for package_id in package_ids],
+            user_id=request.user.pk
+        )
+        
+        return Response(
+            {
+                'message': 'Cierre de despacho iniciado',
+                'task_id': task.id
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+    
+    @action(detail=True, methods=['get'], url_path='close/status')
+    def close_status(self, request, pk=None):
+        """
+        Consultar el estado del cierre de despacho
+        GET /api/v1/dispatches/{id}/close/status/?task_id=...
+        """
+        from celery.result import AsyncResult
+        
+        dispatch = self.get_object()
+        task_id = request.query_params.get('task_id')
+        
+        if not task_id:
+            return Response(
+                {'error': 'El parámetro task_id es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        result = AsyncResult(task_id)
+        data = {
+            'task_id': task_id,
+            'state': result.state,
+            'has_bundle': bool(dispatch.bundle_file),
+        }
+        if result.ready():
+            data['result'] = result.result if result.successful() else str(result.result)
+        return Response(data)
+    
+    @action(detail=True, methods=['get'])
+    def bundle(self, request, pk=None):
+        """
+        Descargar el ZIP de documentos generado al cerrar el despacho
+        GET /api/v1/dispatches/{id}/bundle/
+        """
+        dispatch = self.get_object()
+        
+        if not dispatch.bundle_file:
+            return Response(
+                {'error': 'El despacho no tiene paquete de documentos generado'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return FileResponse(
+            dispatch.bundle_file.open('rb'),
+            as_attachment=True,
+            filename=dispatch.bundle_file.name.rsplit('/', 1)[-1],
+            content_type='application/zip'
+        )
@@ -0,0 +1,65 @@
+"""
+Management command para verificar los contadores cacheados de sacas y lotes
+
+Compara Pull.packages_count, Batch.packages_count y Batch.pulls_count con
+los conteos reales y, opcionalmente, corrige los desalineados.
+
+Uso:
+    python manage.py verify_counters
+    python manage.py verify_counters --fix
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.logistics.services import CounterService
+
+
+class Command(BaseCommand):
+    help = 'Verifica (y opcionalmente corrige) los contadores cacheados de sacas y lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Corrige los contadores desalineados'
+        )
+        parser.add_argument(
+            '--fail-on-mismatch',
+            action='store_true',
+            help='Termina con error si encuentra contadores desalineados (útil en CI/cron)'
+        )
+
+    def handle(self, *args, **options):
+        fix = options['fix']
+
+        self.stdout.write(self.style.SUCCESS('🔎 VERIFICACIÓN DE CONTADORES'))
+        self.stdout.write('=' * 60)
+
+        result = CounterService.verify(fix=fix)
+
+        for row in result['pulls']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  Saca {row['id']}: packages_count={row['packages_count']} "
+                f"(real: {row['actual_packages']})"
+            ))
+
+        for row in result['batches']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  Lote {row['id']}: packages_count={row['packages_count']} "
+                f"(real: {row['actual_packages']}), pulls_count={row['pulls_count']} "
+                f"(real: {row['actual_pulls']})"
+            ))
+
+        mismatches = len(result['pulls']) + len(result['batches'])
+
+        self.stdout.write('=' * 60)
+        self.stdout.write(f"Sacas desalineadas:  {len(result['pulls'])}")
+        self.stdout.write(f"Lotes desalineados:  {len(result['batches'])}")
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('✅ Todos los contadores son correctos'))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f'🔄 {mismatches} registro(s) corregido(s)'))
+        elif options['fail_on_mismatch']:
+            raise CommandError(f'{mismatches} contador(es) desalineado(s)')
+        else:
+            self.stdout.write(self.style.WARNING('Ejecuta con --fix para corregirlos'))
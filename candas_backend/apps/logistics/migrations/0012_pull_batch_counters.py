@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    """Calcula los contadores iniciales a partir de los datos existentes."""
+    Batch = apps.get_model('logistics', 'Batch')
+    Pull = apps.get_model('logistics', 'Pull')
+    Package = apps.get_model('packages', 'Package')
+
+    Pull.objects.update(packages_count=Coalesce(Subquery(
+        Package.objects.filter(pull=OuterRef('pk'))
+        .order_by().values('pull').annotate(total=Count('id')).values('total')
+    ), 0))
+    Batch.objects.update(
+        packages_count=Coalesce(Subquery(
+            Package.objects.filter(pull__batch=OuterRef('pk'))
+            .order_by().values('pull__batch').annotate(total=Count('id')).values('total')
+        ), 0),
+        pulls_count=Coalesce(Subquery(
+            Pull.objects.filter(batch=OuterRef('pk'))
+            .order_by().values('batch').annotate(total=Count('id')).values('total')
+        ), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0011_remove_guide_base'),
+        ('packages', '0006_packagestatushistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='packages_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Cantidad de Paquetes'),
+        ),
+        migrations.AddField(
+            model_name='batch',
+            name='pulls_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Cantidad de Sacas'),
+        ),
+        migrations.AddField(
+            model_name='pull',
+            name='packages_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Cantidad de Paquetes'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
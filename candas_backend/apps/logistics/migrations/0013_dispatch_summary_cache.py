@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0012_pull_batch_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispatch',
+            name='summary_cache',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Resumen Cacheado'),
+        ),
+    ]
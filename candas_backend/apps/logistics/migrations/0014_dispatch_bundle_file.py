@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0013_dispatch_summary_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispatch',
+            name='bundle_file',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='dispatch_bundles/%Y/%m/%d/', verbose_name='Paquete de Documentos'),
+        ),
+    ]
@@ -3,7 +3,28 @@ import uuid
 from .managers import PullManager
 
 
-class Batch(models.Model):
+class CachedFieldsMixin:
+    """
+    Evita que save() sobrescriba columnas derivadas mantenidas aparte.
+    
+    Los contadores se mantienen con incrementos F() desde CounterService y
+    los resúmenes cacheados desde sus servicios; un save() completo con una
+    instancia desactualizada los pisaría, así que en las actualizaciones se
+    excluyen de update_fields.
+    """
+    cached_fields = ()
+    
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.cached_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Batch(CachedFieldsMixin, models.Model):
     """
     Lote - Agrupa múltiples sacas (Pulls) con características comunes.
     """
@@ -26,9 +47,25 @@ class Batch(models.Model):
         verbose_name='Número de Guía del Lote',
         help_text='Número de guía común para todas las sacas del lote'
     )
+    
+    # Contadores cacheados (mantenidos por CounterService)
+    packages_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Cantidad de Paquetes'
+    )
+    pulls_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Cantidad de Sacas'
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Contadores (CounterService)
+    cached_fields = ('packages_count', 'pulls_count')
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Lote'
@@ -45,15 +82,11 @@ class Batch(models.Model):
     
     def get_total_packages(self):
         """Retorna el total de paquetes en todas las sacas del lote."""
-        from apps.packages.models import Package
-        return sum(
-            Package.objects.filter(pull=pull).count()
-            for pull in self.pulls.all()
-        )
+        return self.packages_count
     
     def get_pull_count(self):
         """Retorna el número de sacas en el lote."""
-        return self.pulls.count()
+        return self.pulls_count
     
     def clean(self):
         """Validación para asegurar consistencia del lote."""
@@ -71,7 +104,7 @@ class Batch(models.Model):
                 })
 
 
-class Pull(models.Model):
+class Pull(CachedFieldsMixin, models.Model):
     """
     Saca - Agrupación de paquetes con destino común.
     """
@@ -120,7 +153,17 @@ class Pull(models.Model):
         verbose_name='Número de Guía'
     )
     
+    # Contador cacheado (mantenido por CounterService)
+    packages_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Cantidad de Paquetes'
+    )
+    
     objects = PullManager()
+    
+    # Contador (CounterService)
+    cached_fields = ('packages_count',)
 
     class Meta:
         ordering = ['-created_at']
@@ -131,11 +174,37 @@ class Pull(models.Model):
     def __str__(self):
         return f"Pull {self.id} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lote con el que se cargó, para detectar cambios en save()
+        if 'batch_id' in instance.__dict__:
+            instance._loaded_batch_id = instance.batch_id
+        return instance
+    
     def save(self, *args, **kwargs):
-        """Sincroniza el guide_number con el Batch si pertenece a uno."""
+        """
+        Sincroniza el guide_number con el Batch si pertenece a uno y
+        actualiza los contadores de lote si la saca cambia de lote.
+        """
+        from .services.counter_service import CounterService
+        
         if self.batch and self.batch.guide_number:
             self.guide_number = self.batch.guide_number
+        
+        if self._state.adding:
+            old_batch_id = None
+        elif hasattr(self, '_loaded_batch_id'):
+            old_batch_id = self._loaded_batch_id
+        else:
+            old_batch_id = Pull.objects.filter(pk=self.pk).values_list('batch_id', flat=True).first()
+        
         super().save(*args, **kwargs)
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'batch', 'batch_id'} & set(update_fields):
+            CounterService.move_pull(self.pk, old_batch_id, self.batch_id)
+            self._loaded_batch_id = self.batch_id
     
     def clean(self):
         """Validación para asegurar consistencia entre Pull y Batch."""
@@ -197,7 +266,7 @@ class Pull(models.Model):
         }
 
 
-class Dispatch(models.Model):
+class Dispatch(CachedFieldsMixin, models.Model):
     """
     Día de Despacho - agrupa Pulls y Paquetes para un envío específico por fecha.
     """
@@ -236,6 +305,28 @@ class Dispatch(models.Model):
         verbose_name='Paquetes Individuales'
     )
     
+    # Resumen cacheado (totales y desglose por agencia). Se invalida (None)
+    # cuando cambian las sacas/paquetes del despacho o la agencia efectiva de
+    # sus paquetes; ver DispatchService.invalidate_summaries y signals.py.
+    summary_cache = models.JSONField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Resumen Cacheado'
+    )
+    
+    # Paquete ZIP con manifiestos y etiquetas generado al cerrar el despacho
+    bundle_file = models.FileField(
+        upload_to='dispatch_bundles/%Y/%m/%d/',
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Paquete de Documentos'
+    )
+    
+    # Resumen por agencia (DispatchService), no es un contador
+    cached_fields = ('summary_cache',)
+    
     class Meta:
         ordering = ['-dispatch_date', '-created_at']
         verbose_name = 'Despacho'
@@ -248,13 +339,20 @@ class Dispatch(models.Model):
     def __str__(self):
         return f"Despacho {self.dispatch_date.strftime('%d/%m/%Y')} - {self.get_status_display()}"
     
+    def get_summary(self):
+        """
+        Retorna el resumen del despacho (totales y desglose por agencia).
+        Se calcula una sola vez y queda cacheado hasta que cambie su contenido.
+        """
+        if self.summary_cache is None:
+            from .services.dispatch_service import DispatchService
+            self.summary_cache = DispatchService.compute_summary(self)
+            Dispatch.objects.filter(pk=self.pk).update(summary_cache=self.summary_cache)
+        return self.summary_cache
+    
     def get_total_packages(self):
         """Retorna el total de paquetes en pulls + paquetes individuales."""
-        from apps.packages.models import Package
-        return sum(
-            Package.objects.filter(pull=pull).count()
-            for pull in self.pulls.all()
-        ) + self.packages.count()
+        return self.get_summary()['total_packages']
     
     def get_packages_by_agency(self):
         """Retorna diccionario {TransportAgency: [packages]} incluyendo pulls y paquetes individuales."""
@@ -263,15 +361,16 @@ class Dispatch(models.Model):
         
         agency_packages = defaultdict(list)
         
-        # Paquetes de pulls - usar agencia efectiva
-        for pull in self.pulls.select_related('transport_agency', 'batch__transport_agency').all():
-            packages = Package.objects.filter(pull=pull).select_related('transport_agency')
-            for pkg in packages:
-                agency = pkg.get_shipping_agency()
-                agency_packages[agency].append(pkg)
-        
-        # Paquetes individuales
-        for pkg in self.packages.select_related('transport_agency'):
+        # Paquetes de las sacas y paquetes individuales en una sola consulta;
+        # select_related permite resolver la agencia efectiva sin consultas extra
+        packages = Package.objects.filter(
+            models.Q(pull__dispatches=self) | models.Q(dispatches=self)
+        ).distinct().select_related(
+            'transport_agency',
+            'pull__transport_agency',
+            'pull__batch__transport_agency',
+        )
+        for pkg in packages:
             agency = pkg.get_shipping_agency()
             agency_packages[agency].append(pkg)
         
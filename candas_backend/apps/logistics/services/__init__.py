@@ -1,13 +1,18 @@
-from .pull_service import PullService
+from .pull_service import PackagesUnavailableError, PullService
 from .dispatch_service import DispatchService
+from .auto_distribution_service import AutoDistributionService
+from .counter_service import CounterService
 from .pdf_service import PDFService
 from .qr_service import QRService
 from .batch_manifest_generator import BatchManifestGenerator
 from .batch_labels_generator import BatchLabelsGenerator
 
 __all__ = [
+    'PackagesUnavailableError',
     'PullService',
     'DispatchService',
+    'AutoDistributionService',
+    'CounterService',
     'PDFService',
     'QRService',
     'BatchManifestGenerator',
@@ -0,0 +1,197 @@
+import heapq
+
+from django.db import transaction
+
+
+class AutoDistributionService:
+    """
+    Motor de distribución automática de paquetes en sacas.
+    
+    Trabaja en dos fases: `plan` calcula en memoria la asignación de paquetes
+    a sacas (sin escribir en la base de datos) y `commit` la materializa con
+    escrituras en bloque. Así el plan puede mostrarse como vista previa antes
+    de crear el lote.
+    """
+    
+    @staticmethod
+    def build_groups(package_ids):
+        """
+        Agrupa los paquetes para que padres e hijos viajen en la misma saca.
+        
+        Usa union-find sobre la relación parent_id; los hermanos cuyo padre no
+        está en la selección también se mantienen juntos.
+        
+        Args:
+            package_ids (list): IDs de paquetes a distribuir
+        
+        Returns:
+            list: Grupos (listas de IDs) en el orden de aparición de package_ids
+        """
+        from apps.packages.models import Package
+        
+        parent_by_id = dict(
+            Package.objects.filter(id__in=package_ids).values_list('id', 'parent_id')
+        )
+        
+        root = {}
+        
+        def find(node):
+            root.setdefault(node, node)
+            while root[node] != node:
+                root[node] = root[root[node]]
+                node = root[node]
+            return node
+        
+        for package_id, parent_id in parent_by_id.items():
+            if parent_id is not None:
+                root[find(package_id)] = find(parent_id)
+        
+        groups = {}
+        for package_id in package_ids:
+            key = find(package_id) if package_id in parent_by_id else package_id
+            groups.setdefault(key, []).append(package_id)
+        return list(groups.values())
+    
+    @staticmethod
+    def plan(package_ids, pulls_config):
+        """
+        Calcula la distribución balanceada de paquetes en sacas.
+        
+        Selecciona el menor número de sacas (las de mayor capacidad primero)
+        que alcanzan para todos los paquetes y reparte los grupos con la
+        heurística LPT: del grupo más grande al más pequeño, cada uno va a la
+        saca con menor ocupación relativa donde quepa. Si la fragmentación
+        impide ubicar un grupo, se habilita la siguiente saca configurada.
+        
+        Args:
+            package_ids (list): IDs de paquetes a distribuir
+            pulls_config (list): Dicts con 'size' y 'max_packages'
+        
+        Returns:
+            dict: Plan con 'pulls' (size, max_packages, package_ids,
+                  packages_count), 'total_packages' y 'pulls_count'
+        
+        Raises:
+            ValueError: Si la capacidad no alcanza o un grupo no cabe en ninguna saca
+        """
+        groups = AutoDistributionService.build_groups(package_ids)
+        groups.sort(key=len, reverse=True)
+        total = sum(len(group) for group in groups)
+        
+        # Sacas disponibles ordenadas por capacidad, conservando el orden original en empates
+        available = sorted(
+            enumerate(pulls_config),
+            key=lambda item: (-item[1]['max_packages'], item[0])
+        )
+        
+        if groups and len(groups[0]) > available[0][1]['max_packages']:
+            raise ValueError(
+                f'Un grupo padre/hijos de {len(groups[0])} paquetes no cabe en ninguna saca'
+            )
+        
+        # Abrir el mínimo de sacas cuya capacidad cubre el total
+        bins = []
+        capacity = 0
+        while available and capacity < total:
+            order, config = available.pop(0)
+            bins.append({'order': order, 'config': config, 'package_ids': []})
+            capacity += config['max_packages']
+        
+        if capacity < total:
+            raise ValueError(f'Capacidad total ({capacity}) insuficiente para {total} paquetes')
+        
+        def push(heap, index):
+            pull = bins[index]
+            ratio = len(pull['package_ids']) / pull['config']['max_packages']
+            heapq.heappush(heap, (ratio, index))
+        
+        heap = []
+        for index in range(len(bins)):
+            push(heap, index)
+        
+        for group in groups:
+            skipped = []
+            while True:
+                if not heap:
+                    if not available:
+                        raise ValueError(
+                            'No es posible ubicar todos los grupos padre/hijos con la configuración dada'
+                        )
+                    order, config = available.pop(0)
+                    bins.append({'order': order, 'config': config, 'package_ids': []})
+                    push(heap, len(bins) - 1)
+                ratio, index = heapq.heappop(heap)
+                pull = bins[index]
+                if len(pull['package_ids']) + len(group) <= pull['config']['max_packages']:
+                    pull['package_ids'].extend(group)
+                    push(heap, index)
+                    break
+                skipped.append((ratio, index))
+            for item in skipped:
+                heapq.heappush(heap, item)
+        
+        pulls = [
+            {
+                'size': pull['config']['size'],
+                'max_packages': pull['config']['max_packages'],
+                'package_ids': pull['package_ids'],
+                'packages_count': len(pull['package_ids']),
+            }
+            for pull in sorted(bins, key=lambda item: item['order'])
+            if pull['package_ids']
+        ]
+        
+        return {
+            'pulls': pulls,
+            'pulls_count': len(pulls),
+            'total_packages': total,
+        }
+    
+    @staticmethod
+    @transaction.atomic
+    def commit(plan, destiny, transport_agency=None, guide_number=''):
+        """
+        Materializa un plan: crea el lote y sus sacas con escrituras en bloque.
+        
+        El plan se calculó al validar (o en una vista previa): antes de
+        escribir se vuelve a comprobar, con las filas bloqueadas, que sus
+        paquetes sigan sin saca.
+        
+        Args:
+            plan (dict): Resultado de plan()
+            destiny (str): Destino del lote y sus sacas
+            transport_agency (TransportAgency): Agencia del lote (opcional)
+            guide_number (str): Número de guía del lote (opcional)
+        
+        Returns:
+            Batch: Lote creado con los atributos created_pulls y distributed_packages
+        
+        Raises:
+            PackagesUnavailableError: Si el plan quedó desactualizado (algún
+                paquete fue asignado a otra saca o eliminado)
+        """
+        from apps.logistics.models import Batch
+        from .pull_service import PackagesUnavailableError, PullService
+        
+        error = PullService.validate_available_packages(
+            [package_id for pull in plan['pulls'] for package_id in pull['package_ids']],
+            lock=True,
+        )
+        if error:
+            raise PackagesUnavailableError(f'La distribución ya no es válida: {error}')
+        
+        batch = Batch.objects.create(
+            destiny=destiny,
+            transport_agency=transport_agency,
+            guide_number=guide_number
+        )
+        
+        batch.created_pulls = PullService.bulk_create_pulls(
+            plan['pulls'],
+            common_destiny=destiny,
+            transport_agency=transport_agency,
+            guide_number=guide_number,
+            batch=batch,
+        )
+        batch.distributed_packages = plan['total_packages']
+        return batch
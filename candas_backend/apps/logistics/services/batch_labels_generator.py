@@ -6,9 +6,8 @@ from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
-import qrcode
-from PIL import Image
+from apps.shared.services.label_template import BaseLabelGenerator
+from apps.shared.services.zpl_template import BaseZPLGenerator
 
 
 class BatchLabelsGenerator:
@@ -138,7 +137,7 @@ class BatchLabelsGenerator:
         canvas_obj.setFont("Helvetica-Bold", 9)
         canvas_obj.drawString(content_x, current_y, "PAQUETES:")
         canvas_obj.setFont("Helvetica-Bold", 14)
-        packages_count = pull.packages.count()
+        packages_count = pull.packages_count
         canvas_obj.drawString(content_x + 0.8*inch, current_y - 0.05*inch, str(packages_count))
         current_y -= 0.4*inch
         
@@ -196,38 +195,11 @@ class BatchLabelsGenerator:
             # Restaurar el estado del canvas
             canvas_obj.restoreState()
         
-        # Generar código QR (solo ID de la saca)
-        qr_data = str(pull.id)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=1,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        # Convertir QR a imagen
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-        
-        # Dibujar QR (centrado en la parte inferior)
+        # Dibujar QR vectorial (solo ID de la saca), centrado en la parte inferior
         qr_size = 1.3 * inch
         qr_x = x + (BatchLabelsGenerator.LABEL_WIDTH - qr_size) / 2
         qr_y = y + 0.3 * inch
-        
-        # Usar ImageReader para leer el BytesIO
-        img_reader = ImageReader(qr_buffer)
-        canvas_obj.drawImage(
-            img_reader,
-            qr_x,
-            qr_y,
-            width=qr_size,
-            height=qr_size,
-            preserveAspectRatio=True
-        )
+        BaseLabelGenerator.draw_qr_code(canvas_obj, str(pull.id), qr_x, qr_y, qr_size)
         
         # Texto bajo el QR
         canvas_obj.setFont("Helvetica", 7)
@@ -236,3 +208,50 @@ class BatchLabelsGenerator:
             y + 0.15*inch,
             f"ID: {str(pull.id)[:8].upper()}"
         )
+    
+    @staticmethod
+    def generate_zpl(batch, include_packages=False):
+        """
+        Genera en un solo stream ZPL las etiquetas de todas las sacas del lote,
+        con el mismo contenido y numeración que el PDF.
+        
+        Args:
+            batch: Instancia del modelo Batch
+            include_packages (bool): Si es True, cada etiqueta de saca va
+                seguida de las etiquetas de sus paquetes
+        
+        Returns:
+            str: Stream ZPL (vacío si el lote no tiene sacas)
+        """
+        pulls = list(
+            batch.pulls.select_related('transport_agency').order_by('created_at')
+        )
+        total_pulls = len(pulls)
+        
+        labels = []
+        for idx, pull in enumerate(pulls):
+            if batch.transport_agency:
+                agency_name = batch.transport_agency.name
+            else:
+                agency_name = pull.transport_agency.name if pull.transport_agency else None
+            
+            labels.append(BaseZPLGenerator.standard_label(
+                f"{idx + 1}/{total_pulls}",
+                pull.common_destiny,
+                agency_name,
+                batch.guide_number or pull.guide_number,
+                str(pull.id),
+                packages_count=pull.packages_count,
+                size=pull.get_size_display(),
+                manifest_notice=idx + 1 == total_pulls,
+            ))
+            
+            if include_packages:
+                from apps.packages.services import PackageLabelsGenerator
+                
+                # La saca ya trae su lote: get_shipping_* no hace consultas extra
+                pull.batch = batch
+                packages = pull.packages.order_by('created_at')
+                labels.append(PackageLabelsGenerator.generate_packages_zpl(packages))
+        
+        return ''.join(labels)
@@ -24,6 +24,17 @@ class BatchManifestGenerator:
         Estructura: Información del lote, luego cada saca con sus paquetes debajo.
         """
         doc, buffer = BaseManifestGenerator.create_document()
+        doc.build(BatchManifestGenerator.build_elements(batch))
+        buffer.seek(0)
+        
+        return buffer
+    
+    @staticmethod
+    def build_elements(batch):
+        """
+        Elementos (flowables) del manifiesto del lote; permite combinar
+        varios manifiestos en un mismo documento.
+        """
         elements = []
         styles = getSampleStyleSheet()
         
@@ -87,7 +98,7 @@ class BatchManifestGenerator:
                 normal_style = BaseManifestGenerator.get_normal_style()
                 saca_info_lines = [
                     f"Tamaño: {pull.get_size_display()}",
-                    f"Cantidad de Paquetes: {str(pull.packages.count())}",
+                    f"Cantidad de Paquetes: {str(pull.packages_count)}",
                 ]
                 
                 # Agregar cada línea como un párrafo usando map
@@ -125,13 +136,10 @@ class BatchManifestGenerator:
                     wrapped_headers = [BaseManifestGenerator._wrap_text(h, bold_style) for h in pkg_headers]
                     table_data.append(wrapped_headers)
                     
+                    # Estilo de datos compartido por todas las filas
+                    data_style = BaseManifestGenerator.get_data_style()
                     for pkg_idx, package in enumerate(packages, 1):
                         # Fila de datos del paquete
-                        data_style = ParagraphStyle(
-                            'FormalData',
-                            parent=normal_style,
-                            fontSize=7
-                        )
                         pkg_row = [
                             BaseManifestGenerator._wrap_text(str(pkg_idx), data_style),
                             BaseManifestGenerator._wrap_text(package.guide_number, data_style),
@@ -233,11 +241,7 @@ class BatchManifestGenerator:
             normal_style = BaseManifestGenerator.get_normal_style()
             elements.append(Paragraph("No hay sacas en este lote", normal_style))
         
-        # Construir PDF
-        doc.build(elements)
-        buffer.seek(0)
-        
-        return buffer
+        return elements
     
     @staticmethod
     def generate_excel(batch):
@@ -309,7 +313,7 @@ class BatchManifestGenerator:
             row += 1
             saca_info = [
                 ('Tamaño:', pull.get_size_display()),
-                ('Cantidad de Paquetes:', str(pull.packages.count())),
+                ('Cantidad de Paquetes:', str(pull.packages_count)),
             ]
             
             # Usar zip para iteración paralela
@@ -0,0 +1,170 @@
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from apps.logistics.models import Batch, Pull
+from apps.shared.services import ResponseCache
+from .dispatch_service import DispatchService
+
+
+class CounterService:
+    """
+    Mantenimiento de los contadores cacheados Pull.packages_count,
+    Batch.packages_count y Batch.pulls_count.
+    
+    Todas las escrituras son incrementos atómicos con F(), de modo que
+    operaciones concurrentes no se pisan entre sí.
+    """
+    
+    @staticmethod
+    def _case(deltas):
+        """Construye un CASE pk -> delta para un UPDATE en bloque."""
+        return Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    
+    @staticmethod
+    def adjust_packages(deltas):
+        """
+        Aplica variaciones de paquetes por saca y las propaga a sus lotes.
+        
+        Args:
+            deltas (dict): {pull_id: variación}; se ignoran claves None y ceros
+        """
+        deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+        if not deltas:
+            return
+        
+        Pull.objects.filter(pk__in=deltas).update(
+            packages_count=F('packages_count') + CounterService._case(deltas)
+        )
+        DispatchService.invalidate_summaries(pull_ids=deltas.keys())
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
+        
+        batch_deltas = defaultdict(int)
+        pulls_in_batches = Pull.objects.filter(
+            pk__in=deltas, batch__isnull=False
+        ).values_list('id', 'batch_id')
+        for pull_id, batch_id in pulls_in_batches:
+            batch_deltas[batch_id] += deltas[pull_id]
+        
+        batch_deltas = {pk: delta for pk, delta in batch_deltas.items() if delta}
+        if batch_deltas:
+            Batch.objects.filter(pk__in=batch_deltas).update(
+                packages_count=F('packages_count') + CounterService._case(batch_deltas)
+            )
+    
+    @staticmethod
+    def move_pull(pull_id, old_batch_id, new_batch_id):
+        """
+        Actualiza los contadores de lote cuando una saca cambia de lote.
+        
+        Args:
+            pull_id: ID de la saca
+            old_batch_id: Lote anterior (o None)
+            new_batch_id: Lote nuevo (o None)
+        """
+        if old_batch_id == new_batch_id:
+            return
+        
+        # La agencia efectiva de los paquetes puede cambiar con el lote
+        DispatchService.invalidate_summaries(pull_ids=[pull_id])
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
+        
+        # Si la saca ya no existe (eliminación) sus paquetes ya fueron descontados
+        packages = Coalesce(
+            Subquery(Pull.objects.filter(pk=pull_id).values('packages_count')[:1]), 0
+        )
+        
+        if old_batch_id is not None:
+            Batch.objects.filter(pk=old_batch_id).update(
+                pulls_count=F('pulls_count') - 1,
+                packages_count=F('packages_count') - packages,
+            )
+        if new_batch_id is not None:
+            Batch.objects.filter(pk=new_batch_id).update(
+                pulls_count=F('pulls_count') + 1,
+                packages_count=F('packages_count') + packages,
+            )
+    
+    @staticmethod
+    def attach_pulls(batch_id, pull_ids):
+        """
+        Suma al lote los contadores de varias sacas recién asociadas.
+        
+        Args:
+            batch_id: ID del lote
+            pull_ids (list): IDs de sacas que antes no tenían lote
+        """
+        if not pull_ids:
+            return
+        
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
+        totals = Pull.objects.filter(pk__in=pull_ids).aggregate(
+            pulls=Count('id'),
+            packages=Coalesce(Sum('packages_count'), 0),
+        )
+        Batch.objects.filter(pk=batch_id).update(
+            pulls_count=F('pulls_count') + totals['pulls'],
+            packages_count=F('packages_count') + totals['packages'],
+        )
+    
+    @staticmethod
+    def _actual_counts():
+        """Subconsultas con los conteos reales para sacas y lotes."""
+        from apps.packages.models import Package
+        
+        pull_packages = Coalesce(Subquery(
+            Package.objects.filter(pull=OuterRef('pk'))
+            .order_by().values('pull').annotate(total=Count('id')).values('total')
+        ), 0)
+        batch_packages = Coalesce(Subquery(
+            Package.objects.filter(pull__batch=OuterRef('pk'))
+            .order_by().values('pull__batch').annotate(total=Count('id')).values('total')
+        ), 0)
+        batch_pulls = Coalesce(Subquery(
+            Pull.objects.filter(batch=OuterRef('pk'))
+            .order_by().values('batch').annotate(total=Count('id')).values('total')
+        ), 0)
+        return pull_packages, batch_packages, batch_pulls
+    
+    @staticmethod
+    def verify(fix=False):
+        """
+        Compara los contadores cacheados con los conteos reales.
+        
+        Args:
+            fix (bool): Si es True, corrige los registros desalineados
+        
+        Returns:
+            dict: {'pulls': [...], 'batches': [...]} con los desalineados
+                  (id, valor cacheado y valor real)
+        """
+        pull_packages, batch_packages, batch_pulls = CounterService._actual_counts()
+        
+        pulls = list(
+            Pull.objects.annotate(actual_packages=pull_packages)
+            .exclude(packages_count=F('actual_packages'))
+            .values('id', 'packages_count', 'actual_packages')
+        )
+        batches = list(
+            Batch.objects.annotate(actual_packages=batch_packages, actual_pulls=batch_pulls)
+            .exclude(packages_count=F('actual_packages'), pulls_count=F('actual_pulls'))
+            .values('id', 'packages_count', 'actual_packages', 'pulls_count', 'actual_pulls')
+        )
+        
+        if fix:
+            if pulls:
+                Pull.objects.filter(pk__in=[row['id'] for row in pulls]).update(
+                    packages_count=pull_packages
+                )
+            if batches:
+                Batch.objects.filter(pk__in=[row['id'] for row in batches]).update(
+                    packages_count=batch_packages,
+                    pulls_count=batch_pulls,
+                )
+        
+        return {'pulls': pulls, 'batches': batches}
@@ -1,5 +1,6 @@
 from django.db import transaction
 from apps.logistics.models import Dispatch
+from apps.shared.services import ResponseCache
 
 
 class DispatchService:
@@ -25,17 +26,244 @@ class DispatchService:
             notes=notes
         )
         
+        DispatchService.attach_items(dispatch, pull_ids=pull_ids, package_ids=package_ids)
+        
+        return dispatch
+    
+    @staticmethod
+    def attach_items(dispatch, pull_ids=None, package_ids=None):
+        """
+        Asocia sacas y paquetes a un Despacho con inserciones en bloque.
+        
+        Escribe directamente en las tablas intermedias de las relaciones M2M
+        (un INSERT por cada 1000 filas); los elementos ya asociados se ignoran.
+        Como bulk_create no dispara m2m_changed, el resumen del despacho se
+        invalida aquí.
+        
+        Args:
+            dispatch (Dispatch): Instancia del despacho
+            pull_ids (list): IDs de sacas a asociar
+            package_ids (list): IDs de paquetes individuales a asociar
+        
+        Returns:
+            dict: Cantidad de sacas y paquetes que se insertaron (los
+                inexistentes y los ya asociados no cuentan)
+        """
+        from apps.logistics.models import Pull
+        from apps.packages.models import Package
+        
+        attached = {'pulls': 0, 'packages': 0}
+        
         if pull_ids:
-            from apps.logistics.models import Pull
-            pulls = Pull.objects.filter(id__in=pull_ids)
-            dispatch.pulls.set(pulls)
+            attached['pulls'] = DispatchService._insert_links(
+                dispatch, Dispatch.pulls.through, 'pull_id',
+                Pull.objects.filter(id__in=pull_ids).exclude(dispatches=dispatch)
+            )
         
         if package_ids:
-            from apps.packages.models import Package
-            packages = Package.objects.filter(id__in=package_ids)
-            dispatch.packages.set(packages)
+            attached['packages'] = DispatchService._insert_links(
+                dispatch, Dispatch.packages.through, 'package_id',
+                Package.objects.filter(id__in=package_ids).exclude(dispatches=dispatch)
+            )
         
-        return dispatch
+        if attached['pulls'] or attached['packages']:
+            DispatchService.invalidate_summaries(dispatch_ids=[dispatch.pk])
+            dispatch.summary_cache = None
+        
+        return attached
+    
+    @staticmethod
+    def _insert_links(dispatch, through, column, queryset):
+        """
+        Inserta en la tabla intermedia las filas que faltan.
+        
+        ignore_conflicts solo cubre asociaciones concurrentes (otra petición
+        que insertó la misma fila entre la consulta y el INSERT); las filas
+        ignoradas se descuentan comparando el total antes y después.
+        
+        Returns:
+            int: Filas insertadas
+        """
+        ids = list(queryset.values_list('id', flat=True))
+        if not ids:
+            return 0
+        
+        links = through.objects.filter(dispatch_id=dispatch.pk)
+        before = links.count()
+        through.objects.bulk_create(
+            [through(dispatch_id=dispatch.pk, **{column: pk}) for pk in ids],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+        return links.count() - before
+    
+    @staticmethod
+    def transition_packages(dispatch, new_status='EN_TRANSITO', user=None):
+        """
+        Cambia el estado de todos los paquetes del Despacho en bloque.
+        
+        Incluye los paquetes de sus sacas y los individuales. Equivale a
+        guardar cada paquete (historial de texto y PackageStatusHistory) pero
+        con un UPDATE y un bulk_create en lugar de una escritura por paquete.
+        
+        Args:
+            dispatch (Dispatch): Instancia del despacho
+            new_status (str): Estado destino
+            user (User): Usuario que realiza el cambio (opcional)
+        
+        Returns:
+            int: Cantidad de paquetes que cambiaron de estado
+        
+        Raises:
+            ValueError: Si el estado no es válido
+        """
+        from django.db.models import Q, TextField, Value
+        from django.db.models.functions import Concat
+        from django.utils import timezone
+        from apps.packages.models import Package, PackageStatusHistory
+        
+        valid_statuses = [choice[0] for choice in Package.STATUS_CHOICES]
+        if new_status not in valid_statuses:
+            raise ValueError(f"Estado inválido: {new_status}")
+        
+        changes = dict(
+            Package.objects.filter(Q(pull__dispatches=dispatch) | Q(dispatches=dispatch))
+            .exclude(status=new_status)
+            .order_by()
+            .distinct()
+            .values_list('id', 'status')
+        )
+        if not changes:
+            return 0
+        
+        # Mismo formato que el signal log_status_change
+        entry = f"[{timezone.now().strftime('%d/%m/%Y %H:%M')}] {dict(Package.STATUS_CHOICES)[new_status]}\n"
+        
+        PackageStatusHistory.objects.bulk_create(
+            [
+                PackageStatusHistory(
+                    package_id=package_id,
+                    old_status=old_status,
+                    new_status=new_status,
+                    changed_by=user
+                )
+                for package_id, old_status in changes.items()
+            ],
+            batch_size=1000
+        )
+        Package.objects.filter(id__in=list(changes)).update(
+            status=new_status,
+            status_history=Concat('status_history', Value(entry), output_field=TextField()),
+            updated_at=timezone.now()
+        )
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
+        
+        return len(changes)
+    
+    @staticmethod
+    def get_render_targets(dispatch):
+        """
+        Lista los documentos a pre-generar al cerrar un Despacho.
+        
+        Las sacas que pertenecen a un lote se cubren con el manifiesto y las
+        etiquetas del lote; las sacas sueltas generan los suyos propios.
+        
+        Args:
+            dispatch (Dispatch): Instancia del despacho
+        
+        Returns:
+            list: Tuplas (tipo de documento, ID) para render_document
+        """
+        targets = []
+        batch_ids = []
+        
+        for pull_id, batch_id in dispatch.pulls.order_by('created_at').values_list('id', 'batch_id'):
+            if batch_id is None:
+                targets.append(('pull_manifest', str(pull_id)))
+                targets.append(('pull_label', str(pull_id)))
+            elif batch_id not in batch_ids:
+                batch_ids.append(batch_id)
+        
+        for batch_id in batch_ids:
+            targets.append(('batch_manifest', str(batch_id)))
+            targets.append(('batch_labels', str(batch_id)))
+        
+        return targets
+    
+    @staticmethod
+    def render_document(kind, object_id):
+        """
+        Genera un documento de cierre de despacho.
+        
+        Usa el registro de RenderService, así que el documento queda también
+        en la caché de renders para las descargas individuales.
+        
+        Args:
+            kind (str): pull_manifest, pull_label, batch_manifest o batch_labels
+            object_id: ID de la saca o lote
+        
+        Returns:
+            tuple: (ruta dentro del paquete ZIP, bytes del PDF)
+        
+        Raises:
+            ValueError: Si el tipo de documento no es válido
+        """
+        from apps.shared.services import RenderCache, RenderService
+        
+        folders = {
+            'pull_manifest': 'sacas',
+            'pull_label': 'sacas',
+            'batch_manifest': 'lotes',
+            'batch_labels': 'lotes',
+        }
+        if kind not in folders:
+            raise ValueError(f"Tipo de documento inválido: {kind}")
+        
+        document = RenderService.resolve(kind, object_id)
+        obj = document['obj']
+        content = RenderCache.get_or_render(
+            kind, obj.pk, document['version'],
+            lambda: document['generator'](obj), document['extension']
+        )
+        return f"{folders[kind]}/{document['filename']}", content
+    
+    @staticmethod
+    def build_bundle(dispatch, documents, errors=None):
+        """
+        Empaqueta los documentos generados en un ZIP y lo guarda en el Despacho.
+        
+        Args:
+            dispatch (Dispatch): Instancia del despacho
+            documents (list): Tuplas (ruta dentro del ZIP, ruta en el storage)
+            errors (list): Mensajes de documentos que no se pudieron generar
+        
+        Returns:
+            str: Nombre del archivo guardado en Dispatch.bundle_file
+        """
+        import zipfile
+        from io import BytesIO
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for arcname, storage_path in documents:
+                with default_storage.open(storage_path, 'rb') as document:
+                    bundle.writestr(arcname, document.read())
+            if errors:
+                bundle.writestr('errores.txt', '\n'.join(errors))
+        
+        if dispatch.bundle_file:
+            dispatch.bundle_file.delete(save=False)
+        
+        filename = f"despacho_{dispatch.dispatch_date.strftime('%Y%m%d')}_{str(dispatch.id)[:8]}.zip"
+        dispatch.bundle_file.save(filename, ContentFile(buffer.getvalue()), save=False)
+        Dispatch.objects.filter(pk=dispatch.pk).update(bundle_file=dispatch.bundle_file.name)
+        
+        for _, storage_path in documents:
+            default_storage.delete(storage_path)
+        
+        return dispatch.bundle_file.name
     
     @staticmethod
     def update_status(dispatch, new_status):
@@ -60,6 +288,111 @@ class DispatchService:
         dispatch.save(update_fields=['status', 'updated_at'])
         return dispatch
     
+    @staticmethod
+    def compute_summary(dispatch):
+        """
+        Calcula totales y desglose por agencia efectiva de un Despacho.
+        
+        Los paquetes de las sacas y los individuales se agrupan en una sola
+        consulta; la agencia efectiva se resuelve en SQL con la misma
+        prioridad que Package.get_shipping_agency
+        (batch.transport_agency > pull.transport_agency > transport_agency).
+        
+        Args:
+            dispatch (Dispatch): Instancia del despacho
+        
+        Returns:
+            dict: Resumen serializable a JSON
+        """
+        from django.db.models import Case, Count, F, Q, When
+        from django.db.models.functions import Coalesce
+        from apps.packages.models import Package
+        
+        individual = Q(dispatches=dispatch)
+        
+        rows = Package.objects.filter(
+            Q(pull__dispatches=dispatch) | individual
+        ).order_by().values(
+            agency_id=Case(
+                When(pull__isnull=False, then=Coalesce(
+                    'pull__batch__transport_agency', 'pull__transport_agency'
+                )),
+                default=F('transport_agency'),
+            ),
+            agency_name=Case(
+                When(pull__isnull=False, then=Coalesce(
+                    'pull__batch__transport_agency__name', 'pull__transport_agency__name'
+                )),
+                default=F('transport_agency__name'),
+            ),
+        ).annotate(
+            packages_count=Count('id', distinct=True),
+            individual_packages=Count('id', filter=individual, distinct=True),
+        )
+        
+        by_agency = sorted(
+            (
+                {
+                    'agency_id': str(row['agency_id']) if row['agency_id'] else None,
+                    'agency_name': row['agency_name'] or 'Sin Agencia',
+                    'packages_count': row['packages_count'],
+                    'individual_packages': row['individual_packages'],
+                }
+                for row in rows
+            ),
+            key=lambda item: item['packages_count'],
+            reverse=True
+        )
+        
+        total_packages = sum(item['packages_count'] for item in by_agency)
+        individual_packages = sum(item['individual_packages'] for item in by_agency)
+        
+        return {
+            'total_pulls': dispatch.pulls.count(),
+            'total_packages': total_packages,
+            'individual_packages': individual_packages,
+            'packages_in_pulls': total_packages - individual_packages,
+            'by_agency': by_agency,
+        }
+    
+    @staticmethod
+    def invalidate_summaries(dispatch_ids=None, pull_ids=None, package_ids=None,
+                             batch_ids=None, agency_ids=None):
+        """
+        Invalida el resumen cacheado de los despachos afectados por un cambio.
+        
+        Args:
+            dispatch_ids (iterable): Despachos cuya membresía cambió
+            pull_ids (iterable): Sacas cuyo contenido o agencia cambió
+            package_ids (iterable): Paquetes modificados (individuales o en sacas)
+            batch_ids (iterable): Lotes modificados (agencia de sus sacas)
+            agency_ids (iterable): Agencias de transporte modificadas (nombre)
+        """
+        from django.db.models import Q
+        
+        conditions = Q()
+        if dispatch_ids:
+            conditions |= Q(pk__in=list(dispatch_ids))
+        if pull_ids:
+            conditions |= Q(pulls__in=list(pull_ids))
+        if package_ids:
+            package_ids = list(package_ids)
+            conditions |= Q(packages__in=package_ids) | Q(pulls__packages__in=package_ids)
+        if batch_ids:
+            conditions |= Q(pulls__batch__in=list(batch_ids))
+        if agency_ids:
+            agency_ids = list(agency_ids)
+            conditions |= (
+                Q(packages__transport_agency__in=agency_ids)
+                | Q(pulls__transport_agency__in=agency_ids)
+                | Q(pulls__batch__transport_agency__in=agency_ids)
+            )
+        if not conditions:
+            return
+        
+        affected = Dispatch.objects.filter(conditions, summary_cache__isnull=False).values('pk')
+        Dispatch.objects.filter(pk__in=affected).update(summary_cache=None)
+    
     @staticmethod
     def get_dispatch_statistics(dispatch):
         """
@@ -71,10 +404,13 @@ class DispatchService:
         Returns:
             dict: Estadísticas del despacho
         """
+        summary = dispatch.get_summary()
         return {
-            'total_pulls': dispatch.pulls.count(),
-            'total_packages': dispatch.get_total_packages(),
-            'individual_packages': dispatch.packages.count(),
+            'total_pulls': summary['total_pulls'],
+            'total_packages': summary['total_packages'],
+            'individual_packages': summary['individual_packages'],
+            'packages_in_pulls': summary['packages_in_pulls'],
+            'by_agency': summary['by_agency'],
             'dispatch_date': dispatch.dispatch_date,
             'status': dispatch.get_status_display(),
         }
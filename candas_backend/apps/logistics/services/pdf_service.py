@@ -10,10 +10,10 @@ from reportlab.pdfgen import canvas
 from datetime import datetime
 from PIL import Image as PILImage
 import io
-import qrcode
-from reportlab.lib.utils import ImageReader
 from .qr_service import QRService
 from apps.shared.services.manifest_template import BaseManifestGenerator
+from apps.shared.services.label_template import BaseLabelGenerator
+from apps.shared.services.zpl_template import BaseZPLGenerator
 
 
 class PDFService:
@@ -32,6 +32,23 @@ class PDFService:
             BytesIO con el PDF generado
         """
         doc, buffer = BaseManifestGenerator.create_document()
+        doc.build(PDFService.build_pull_manifest_elements(pull))
+        buffer.seek(0)
+        
+        return buffer
+    
+    @staticmethod
+    def build_pull_manifest_elements(pull):
+        """
+        Elementos (flowables) del manifiesto de una saca; permite combinar
+        varios manifiestos en un mismo documento.
+        
+        Args:
+            pull: Instancia del modelo Pull
+        
+        Returns:
+            list: Flowables de ReportLab
+        """
         elements = []
         
         # Header de la empresa
@@ -63,7 +80,7 @@ class PDFService:
             f"Número de Guía de Transporte: {effective_guide or 'Sin guía'}",
             f"Tamaño: {pull.get_size_display()}",
             f"Fecha: {BaseManifestGenerator.format_datetime_now()}",
-            f"Cantidad de Paquetes: {str(pull.packages.count())}",
+            f"Cantidad de Paquetes: {str(pull.packages_count)}",
         ]
         
         # Agregar información del lote si existe
@@ -125,13 +142,10 @@ class PDFService:
             wrapped_headers = [BaseManifestGenerator._wrap_text(h, bold_style) for h in pkg_headers]
             table_data.append(wrapped_headers)
             
+            # Estilo de datos compartido por todas las filas
+            data_style = BaseManifestGenerator.get_data_style()
             for idx, package in enumerate(packages, 1):
                 # Fila de datos del paquete
-                data_style = ParagraphStyle(
-                    'FormalData',
-                    parent=normal_style,
-                    fontSize=7
-                )
                 pkg_row = [
                     BaseManifestGenerator._wrap_text(str(idx), data_style),
                     BaseManifestGenerator._wrap_text(package.guide_number, data_style),
@@ -224,10 +238,7 @@ class PDFService:
             normal_style = BaseManifestGenerator.get_normal_style()
             elements.append(Paragraph("No hay paquetes en esta saca", normal_style))
         
-        # Generar PDF
-        doc.build(elements)
-        buffer.seek(0)
-        return buffer
+        return elements
     
     @staticmethod
     def generate_pull_manifest_excel(pull):
@@ -278,7 +289,7 @@ class PDFService:
             ('Número de Guía de Transporte:', effective_guide or 'Sin guía'),
             ('Tamaño:', pull.get_size_display()),
             ('Fecha:', datetime.now().strftime('%d/%m/%Y %H:%M')),
-            ('Cantidad de Paquetes:', str(pull.packages.count())),
+            ('Cantidad de Paquetes:', str(pull.packages_count)),
         ]
         
         # Agregar información del lote si existe
@@ -459,7 +470,7 @@ class PDFService:
         canvas_obj.setFont("Helvetica-Bold", 9)
         canvas_obj.drawString(content_x, current_y, "PAQUETES:")
         canvas_obj.setFont("Helvetica-Bold", 14)
-        packages_count = pull.packages.count()
+        packages_count = pull.packages_count
         canvas_obj.drawString(content_x + 0.8*inch, current_y - 0.05*inch, str(packages_count))
         current_y -= 0.4*inch
         
@@ -469,38 +480,11 @@ class PDFService:
         canvas_obj.setFont("Helvetica", 9)
         canvas_obj.drawString(content_x + 0.6*inch, current_y, pull.get_size_display())
         
-        # Generar código QR (solo ID de la saca)
-        qr_data = str(pull.id)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=1,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        # Convertir QR a imagen
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = io.BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-        
-        # Dibujar QR (centrado en la parte inferior)
+        # Dibujar QR vectorial (solo ID de la saca), centrado en la parte inferior
         qr_size = 1.3 * inch
         qr_x = x + (label_width - qr_size) / 2
         qr_y = y + 0.3 * inch
-        
-        # Usar ImageReader para leer el BytesIO
-        img_reader = ImageReader(qr_buffer)
-        canvas_obj.drawImage(
-            img_reader,
-            qr_x,
-            qr_y,
-            width=qr_size,
-            height=qr_size,
-            preserveAspectRatio=True
-        )
+        BaseLabelGenerator.draw_qr_code(canvas_obj, str(pull.id), qr_x, qr_y, qr_size)
         
         # Texto bajo el QR
         canvas_obj.setFont("Helvetica", 7)
@@ -509,3 +493,35 @@ class PDFService:
             y + 0.15*inch,
             f"ID: {str(pull.id)[:8].upper()}"
         )
+    
+    @staticmethod
+    def generate_pull_label_zpl(pull, include_packages=False):
+        """
+        Genera la etiqueta de saca en ZPL para impresoras térmicas.
+        
+        Args:
+            pull: Instancia del modelo Pull
+            include_packages (bool): Si es True, agrega a continuación las
+                etiquetas de todos sus paquetes en el mismo stream
+        
+        Returns:
+            str: Stream ZPL (una etiqueta ^XA...^XZ por saca/paquete)
+        """
+        effective_agency = pull.get_effective_agency()
+        zpl = BaseZPLGenerator.standard_label(
+            "1/1",
+            pull.get_effective_destiny(),
+            effective_agency.name if effective_agency else None,
+            pull.get_effective_guide_number(),
+            str(pull.id),
+            packages_count=pull.packages_count,
+            size=pull.get_size_display(),
+        )
+        
+        if include_packages:
+            from apps.packages.services import PackageLabelsGenerator
+            
+            packages = pull.packages.select_related('transport_agency').order_by('created_at')
+            zpl += PackageLabelsGenerator.generate_packages_zpl(packages)
+        
+        return zpl
@@ -1,12 +1,15 @@
 from io import BytesIO
-import barcode
-from barcode.writer import ImageWriter
 from django.core.files.base import ContentFile
 from django.db import transaction
 from apps.logistics.models import Pull
+from apps.shared.services import ResponseCache
 import uuid
 
 
+class PackagesUnavailableError(ValueError):
+    """Algunos paquetes ya no están disponibles (otra petición los asignó)."""
+
+
 class PullService:
     """Servicio para operaciones de negocio sobre Pull"""
     
@@ -23,17 +26,12 @@ class PullService:
         Returns:
             bytes: Contenido de la imagen PNG
         """
-        from PIL import Image, ImageDraw, ImageFont
+        from PIL import Image, ImageDraw
+        from apps.shared.services.label_template import BaseLabelGenerator
         
-        # Generar código de barras
-        barcode_format = barcode.get_barcode_class('code128')
+        # Código de barras base, cacheado por contenido
         barcode_string = str(pull.id).replace('-', '')[:20]
-        barcode_instance = barcode_format(barcode_string, writer=ImageWriter())
-        
-        # Crear código de barras base
-        buffer = BytesIO()
-        barcode_instance.write(buffer)
-        buffer.seek(0)
+        buffer = BytesIO(BaseLabelGenerator.get_code128_png(barcode_string))
         
         # Si no hay información adicional, retornar código básico
         if pull_number is None or total_pulls is None:
@@ -51,15 +49,12 @@ class PullService:
         
         # Preparar texto
         draw = ImageDraw.Draw(new_img)
-        try:
-            font_large = ImageFont.truetype("arial.ttf", 24)
-            font_small = ImageFont.truetype("arial.ttf", 16)
-        except:
-            font_large = ImageFont.load_default()
-            font_small = ImageFont.load_default()
+        # Fuentes cargadas una sola vez por proceso
+        font_large = BaseLabelGenerator.get_font(24)
+        font_small = BaseLabelGenerator.get_font(16)
         
         # Obtener número de paquetes
-        num_packages = pull.packages.count()
+        num_packages = pull.packages_count
         
         # Texto superior: Número de saca
         pull_text = f"SACA {pull_number}/{total_pulls}"
@@ -202,6 +197,156 @@ class PullService:
         
         return pull
     
+    @staticmethod
+    def validate_available_packages(package_ids, lock=False):
+        """
+        Valida en una sola consulta que los paquetes existan y no tengan saca.
+        
+        Args:
+            package_ids (list): IDs de paquetes a validar
+            lock (bool): Bloquear antes las filas (select_for_update) hasta el
+                fin de la transacción en curso, para que nadie los asigne entre
+                la validación y el UPDATE
+        
+        Returns:
+            str | None: Mensaje de error o None si todos están disponibles
+        """
+        from django.db.models import Count, Q
+        from apps.packages.models import Package
+        
+        if not package_ids:
+            return None
+        
+        if len(package_ids) != len(set(package_ids)):
+            return 'No se pueden asignar los mismos paquetes a múltiples sacas'
+        
+        if lock:
+            # FOR UPDATE no admite agregados: se bloquea primero, en orden fijo
+            list(Package.objects.select_for_update().filter(id__in=package_ids).order_by('pk').values_list('pk'))
+        
+        result = Package.objects.filter(id__in=package_ids).aggregate(
+            found=Count('id'),
+            assigned=Count('id', filter=Q(pull__isnull=False)),
+        )
+        
+        if result['found'] != len(package_ids):
+            return 'Algunos paquetes no existen'
+        if result['assigned']:
+            return f"{result['assigned']} paquete(s) ya están asignados a otra saca"
+        return None
+    
+    @staticmethod
+    def assign_packages(assignments):
+        """
+        Asigna paquetes a varias sacas con un único UPDATE ... CASE.
+        
+        Solo toma paquetes sin saca: si alguno ya fue asignado (por otra
+        petición) no se mueve de su saca y se lanza un error para que la
+        transacción del llamador revierta el resto.
+        
+        Args:
+            assignments (list): Pares (pull, package_ids)
+        
+        Returns:
+            int: Cantidad de paquetes actualizados
+        
+        Raises:
+            PackagesUnavailableError: Si no se pudieron asignar todos
+        """
+        from django.db.models import Case, When, Value, UUIDField
+        from django.utils import timezone
+        from apps.packages.models import Package
+        
+        whens = []
+        all_ids = []
+        for pull, package_ids in assignments:
+            if package_ids:
+                whens.append(When(id__in=package_ids, then=Value(pull.id)))
+                all_ids.extend(package_ids)
+        
+        if not all_ids:
+            return 0
+        
+        count = Package.objects.filter(id__in=all_ids, pull__isnull=True).update(
+            pull_id=Case(*whens, output_field=UUIDField()),
+            updated_at=timezone.now(),
+        )
+        if count != len(all_ids):
+            raise PackagesUnavailableError(
+                f'{len(all_ids) - count} paquete(s) no existen o ya están asignados a otra saca'
+            )
+        # update() no emite post_save
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
+        return count
+    
+    @staticmethod
+    @transaction.atomic
+    def bulk_create_pulls(pulls_data, common_destiny, transport_agency=None,
+                          guide_number='', batch=None):
+        """
+        Crea varias sacas con bulk_create y asigna sus paquetes en un solo UPDATE.
+        
+        Args:
+            pulls_data (list): Dicts con 'size' y 'package_ids' opcional
+            common_destiny (str): Destino común de las sacas
+            transport_agency (TransportAgency): Agencia común (opcional)
+            guide_number (str): Número de guía común (opcional)
+            batch (Batch): Lote al que pertenecen las sacas (opcional)
+        
+        Returns:
+            list: Sacas creadas, en el mismo orden que pulls_data
+        
+        Raises:
+            PackagesUnavailableError: Si algún paquete no existe o ya tiene
+                saca (nada queda creado)
+        """
+        from django.db.models import F
+        from apps.logistics.models import Batch
+        
+        # El serializer valida fuera de la transacción: revalidar con las filas bloqueadas
+        error = PullService.validate_available_packages(
+            [package_id for pull_data in pulls_data for package_id in pull_data.get('package_ids', [])],
+            lock=True,
+        )
+        if error:
+            raise PackagesUnavailableError(error)
+        
+        # bulk_create no llama a Pull.save(): replicar la herencia de guía del lote
+        if batch is not None and batch.guide_number:
+            guide_number = batch.guide_number
+        
+        pulls = Pull.objects.bulk_create([
+            Pull(
+                common_destiny=common_destiny,
+                size=pull_data['size'],
+                transport_agency=transport_agency,
+                guide_number=guide_number or '',
+                batch=batch,
+                packages_count=len(pull_data.get('package_ids', [])),
+            )
+            for pull_data in pulls_data
+        ])
+        
+        assigned = PullService.assign_packages([
+            (pull, pull_data.get('package_ids', []))
+            for pull, pull_data in zip(pulls, pulls_data)
+        ])
+        
+        # Las sacas nacen con el conteo pedido: solo vale si se asignó todo
+        # (assign_packages ya falla si no); todos los contadores salen de aquí
+        if assigned != sum(pull.packages_count for pull in pulls):
+            raise PackagesUnavailableError('No se pudieron asignar todos los paquetes')
+        
+        if batch is not None:
+            Batch.objects.filter(pk=batch.pk).update(
+                pulls_count=F('pulls_count') + len(pulls),
+                packages_count=F('packages_count') + assigned,
+            )
+        
+        # bulk_create y update() no emiten post_save (también sin paquetes)
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
+        return pulls
+    
     @staticmethod
     def update_status(pull, new_status):
         """
@@ -237,13 +382,15 @@ class PullService:
         Returns:
             Pull: Pull actualizado
         """
+        from django.utils import timezone
         from apps.packages.models import Package
         
         pull.status = 'COMPLETADO'
         pull.save(update_fields=['status', 'updated_at'])
         
         # Actualizar paquetes asociados
-        pull.packages.all().update(status='ENTREGADO')
+        pull.packages.all().update(status='ENTREGADO', updated_at=timezone.now())
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
         
         return pull
     
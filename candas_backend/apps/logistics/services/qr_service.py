@@ -5,7 +5,7 @@ import qrcode
 import json
 import io
 import base64
-from PIL import Image
+from apps.shared.services.label_template import BaseLabelGenerator
 
 
 class QRService:
@@ -25,23 +25,8 @@ class QRService:
         # QR solo con ID de la saca
         qr_content = str(pull.id)
         
-        # Crear QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        
-        # Generar imagen
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convertir a BytesIO
-        img_io = io.BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
+        # PNG cacheado por contenido (LRU acotado, compartido con las etiquetas)
+        img_io = io.BytesIO(BaseLabelGenerator.get_qr_png(qr_content, border=4))
         
         return img_io
     
@@ -78,25 +63,12 @@ class QRService:
         else:
             qr_content = str(data)
         
-        # Crear QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
+        # PNG cacheado por contenido y tamaño (LRU acotado)
+        img_io = io.BytesIO(BaseLabelGenerator.get_qr_png(
+            qr_content,
+            size=size,
             border=2,
-        )
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        
-        # Generar imagen
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Redimensionar si es necesario
-        img = img.resize(size, Image.Resampling.LANCZOS)
-        
-        # Convertir a BytesIO
-        img_io = io.BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
+            error_correction=qrcode.constants.ERROR_CORRECT_H
+        ))
         
         return img_io
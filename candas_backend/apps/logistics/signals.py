@@ -0,0 +1,113 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.catalog.models import TransportAgency
+from apps.packages.models import Package
+from apps.shared.services import ResponseCache
+from .models import Batch, Dispatch, Pull
+from .services import CounterService, DispatchService
+
+
+@receiver(post_delete, sender=Package)
+def decrement_pull_counters(sender, instance, **kwargs):
+    """Descuenta el paquete eliminado de su saca y lote."""
+    if instance.pull_id:
+        CounterService.adjust_packages({instance.pull_id: -1})
+
+
+@receiver(pre_delete, sender=Pull)
+def detach_pull_counters(sender, instance, **kwargs):
+    """
+    Descuenta la saca (y sus paquetes) de su lote antes de eliminarla.
+    
+    El orden en que Django borra la saca y sus paquetes en cascada no está
+    garantizado, así que la saca se desvincula del lote aquí: los post_delete
+    de sus paquetes ya no afectan al lote.
+    """
+    DispatchService.invalidate_summaries(pull_ids=[instance.pk])
+    
+    batch_id = Pull.objects.filter(pk=instance.pk).values_list('batch_id', flat=True).first()
+    if batch_id:
+        CounterService.move_pull(instance.pk, batch_id, None)
+        Pull.objects.filter(pk=instance.pk).update(batch=None)
+
+
+@receiver(m2m_changed, sender=Dispatch.pulls.through)
+@receiver(m2m_changed, sender=Dispatch.packages.through)
+def invalidate_dispatch_summary(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalida el resumen cacheado cuando cambian las sacas o paquetes de un despacho."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    
+    if not reverse:
+        DispatchService.invalidate_summaries(dispatch_ids=[instance.pk])
+    elif pk_set:
+        DispatchService.invalidate_summaries(dispatch_ids=pk_set)
+    else:
+        # clear() desde la saca/paquete: invalidar todos sus despachos
+        DispatchService.invalidate_summaries(
+            dispatch_ids=instance.dispatches.values_list('pk', flat=True)
+        )
+
+
+# Campos de los que depende el resumen de un despacho (agencia efectiva de
+# cada paquete y nombre de la agencia)
+DISPATCH_SUMMARY_FIELDS = {
+    'pull', 'pull_id', 'batch', 'batch_id',
+    'transport_agency', 'transport_agency_id', 'name',
+}
+
+
+def _summary_kwargs(instance):
+    """Argumento de DispatchService.invalidate_summaries según el modelo."""
+    if isinstance(instance, Package):
+        return {'package_ids': [instance.pk]}
+    if isinstance(instance, Pull):
+        return {'pull_ids': [instance.pk]}
+    if isinstance(instance, Batch):
+        return {'batch_ids': [instance.pk]}
+    return {'agency_ids': [instance.pk]}
+
+
+@receiver(post_save, sender=Package)
+@receiver(post_save, sender=Pull)
+@receiver(post_save, sender=Batch)
+@receiver(post_save, sender=TransportAgency)
+def invalidate_dispatch_summaries_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Invalida el resumen de los despachos cuando cambia la agencia efectiva
+    de sus paquetes (agencia del paquete, saca o lote) o el nombre de una
+    agencia.
+    
+    Un objeto recién creado aún no pertenece a ningún despacho; los cambios
+    de saca o lote los cubre además CounterService.
+    """
+    if created or (update_fields is not None and not DISPATCH_SUMMARY_FIELDS & set(update_fields)):
+        return
+    DispatchService.invalidate_summaries(**_summary_kwargs(instance))
+
+
+@receiver(pre_delete, sender=Package)
+@receiver(pre_delete, sender=Batch)
+@receiver(pre_delete, sender=TransportAgency)
+def invalidate_dispatch_summaries_on_delete(sender, instance, **kwargs):
+    """
+    Invalida el resumen de los despachos afectados por una eliminación.
+    
+    Se hace en pre_delete: la cascada borra las filas de las tablas
+    intermedias (sin m2m_changed) y SET_NULL desvincula sacas y paquetes
+    antes de post_delete, así que después ya no se puede saber qué
+    despachos los contenían. Las sacas se invalidan en detach_pull_counters.
+    """
+    DispatchService.invalidate_summaries(**_summary_kwargs(instance))
+
+
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Package)
+@receiver(post_save, sender=Pull)
+@receiver(post_delete, sender=Pull)
+@receiver(post_save, sender=Batch)
+@receiver(post_delete, sender=Batch)
+def invalidate_package_responses(sender, **kwargs):
+    """Invalida las respuestas cacheadas que dependen de paquetes, sacas y lotes."""
+    ResponseCache.invalidate(ResponseCache.PACKAGES)
@@ -0,0 +1,131 @@
+from celery import chord, group, shared_task
+from django.db import transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, name='apps.logistics.tasks.close_dispatch_task')
+def close_dispatch_task(self, dispatch_id, pull_ids=None, package_ids=None, user_id=None):
+    """
+    Cierra un día de despacho como un único flujo de Celery.
+    
+    1. Asocia las sacas/paquetes indicados con inserciones en bloque.
+    2. Pasa todos los paquetes contenidos a EN_TRANSITO en bloque.
+    3. Pre-genera en paralelo manifiestos y etiquetas de sacas y lotes
+       (un subtask por documento) y, al terminar todos, arma el ZIP.
+    
+    La tarea se reemplaza por el chord de generación, así que su resultado
+    final (consultable con el task_id original) es el de build_dispatch_bundle.
+    
+    Args:
+        dispatch_id: UUID del despacho
+        pull_ids (list): IDs de sacas a agregar antes de cerrar (opcional)
+        package_ids (list): IDs de paquetes individuales a agregar (opcional)
+        user_id: ID del usuario que solicita el cierre (opcional)
+    """
+    from django.contrib.auth import get_user_model
+    from apps.logistics.models import Dispatch
+    from apps.logistics.services import DispatchService
+    
+    user = get_user_model().objects.filter(pk=user_id).first() if user_id else None
+    
+    with transaction.atomic():
+        dispatch = Dispatch.objects.select_for_update().get(pk=dispatch_id)
+        attached = DispatchService.attach_items(dispatch, pull_ids=pull_ids, package_ids=package_ids)
+        updated = DispatchService.transition_packages(dispatch, 'EN_TRANSITO', user=user)
+        DispatchService.update_status(dispatch, 'EN_CURSO')
+    
+    logger.info(
+        f"Despacho {dispatch_id}: {attached['pulls']} sacas y {attached['packages']} paquetes asociados, "
+        f"{updated} paquetes pasados a EN_TRANSITO"
+    )
+    
+    targets = DispatchService.get_render_targets(dispatch)
+    if not targets:
+        return build_dispatch_bundle([], dispatch_id)
+    
+    # replace() lanza Ignore en el worker; en modo eager retorna el resultado del chord
+    return self.replace(chord(
+        group(render_dispatch_document.s(dispatch_id, kind, object_id) for kind, object_id in targets),
+        build_dispatch_bundle.s(dispatch_id)
+    ))
+
+
+@shared_task(
+    name='apps.logistics.tasks.render_dispatch_document',
+    autoretry_for=(OSError,),
+    retry_backoff=True,
+    max_retries=3,
+)
+def render_dispatch_document(dispatch_id, kind, object_id):
+    """
+    Genera un documento del cierre de despacho y lo deja en el storage.
+    
+    Los PDFs no viajan por el backend de resultados: se guardan en una carpeta
+    temporal del despacho y build_dispatch_bundle los recoge.
+    
+    Args:
+        dispatch_id: UUID del despacho
+        kind (str): Tipo de documento (ver DispatchService.render_document)
+        object_id: ID de la saca o lote
+    
+    Returns:
+        dict: Ruta dentro del ZIP y ruta en el storage, o el error producido
+    """
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from apps.logistics.services import DispatchService
+    
+    try:
+        arcname, content = DispatchService.render_document(kind, object_id)
+    except OSError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generando {kind} {object_id} del despacho {dispatch_id}: {str(e)}")
+        return {'error': f"{kind} {object_id}: {str(e)}"}
+    
+    storage_path = default_storage.save(
+        f"dispatch_bundles/tmp/{dispatch_id}/{arcname.replace('/', '_')}",
+        ContentFile(content)
+    )
+    return {'arcname': arcname, 'path': storage_path}
+
+
+@shared_task(name='apps.logistics.tasks.build_dispatch_bundle')
+def build_dispatch_bundle(results, dispatch_id):
+    """
+    Une los documentos generados en el ZIP del despacho.
+    
+    Args:
+        results (list): Resultados de render_dispatch_document
+        dispatch_id: UUID del despacho
+    
+    Returns:
+        dict: Resultado del cierre con la ruta del paquete generado
+    """
+    from apps.logistics.models import Dispatch
+    from apps.logistics.services import DispatchService
+    
+    documents = [(result['arcname'], result['path']) for result in results if 'path' in result]
+    errors = [result['error'] for result in results if 'error' in result]
+    
+    try:
+        dispatch = Dispatch.objects.get(pk=dispatch_id)
+        bundle = DispatchService.build_bundle(dispatch, documents, errors)
+        logger.info(f"Paquete de documentos del despacho {dispatch_id} generado: {bundle}")
+        return {
+            'success': True,
+            'dispatch_id': dispatch_id,
+            'bundle': bundle,
+            'documents': len(documents),
+            'errors': errors
+        }
+    
+    except Exception as e:
+        logger.error(f"Error armando el paquete del despacho {dispatch_id}: {str(e)}")
+        return {
+            'success': False,
+            'dispatch_id': dispatch_id,
+            'error': str(e)
+        }
@@ -1,3 +1,861 @@
-from django.test import TestCase
+import uuid
+import zipfile
+from datetime import date
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import PropertyMock, patch
 
-# Create your tests here.
+from celery.backends.cache import CacheBackend
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.catalog.models import TransportAgency
+from apps.packages.models import Package, PackageStatusHistory
+from apps.shared.services import BaseZPLGenerator, ResponseCache
+from apps.shared.services.query_budget import assert_within_budget
+from config.celery import app as celery_app
+from .models import Batch, Dispatch, Pull
+from .api.serializers import PullBulkCreateSerializer
+from .services import (
+    AutoDistributionService,
+    BatchLabelsGenerator,
+    CounterService,
+    DispatchService,
+    PackagesUnavailableError,
+    PDFService,
+    PullService,
+)
+from .tasks import close_dispatch_task
+
+
+def create_package(guide_number, **kwargs):
+    """Crea un paquete con los campos obligatorios."""
+    data = {
+        'guide_number': guide_number,
+        'name': f'CLIENTE {guide_number}',
+        'address': 'AV. AMAZONAS',
+        'phone_number': '0999999999',
+        'city': 'QUITO',
+        'province': 'PICHINCHA',
+    }
+    data.update(kwargs)
+    return Package.objects.create(**data)
+
+
+def create_packages(count, prefix='GUIA', **kwargs):
+    return [create_package(f'{prefix}{number:04d}', **kwargs) for number in range(count)]
+
+
+class APITestMixin:
+    """Cliente autenticado como staff."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+
+class PullBulkCreateTests(APITestMixin, TestCase):
+    """Creación de sacas en bloque y asignación de paquetes por conjunto."""
+    
+    def setUp(self):
+        super().setUp()
+        self.agency = TransportAgency.objects.create(name='SERVIENTREGA', phone_number='022222222')
+        self.packages = create_packages(6)
+    
+    def test_validate_available_packages(self):
+        ids = [package.id for package in self.packages[:2]]
+        self.assertIsNone(PullService.validate_available_packages(ids))
+        self.assertIn('múltiples sacas', PullService.validate_available_packages(ids + ids[:1]))
+        
+        self.packages[0].delete()
+        self.assertEqual(PullService.validate_available_packages(ids), 'Algunos paquetes no existen')
+    
+    def test_validate_available_packages_rejects_assigned(self):
+        pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        Package.objects.filter(pk=self.packages[0].pk).update(pull=pull)
+        
+        error = PullService.validate_available_packages([self.packages[0].id, self.packages[1].id])
+        self.assertIn('1 paquete(s)', error)
+    
+    def test_bulk_create_pulls_assigns_packages_and_batch_counters(self):
+        batch = Batch.objects.create(destiny='QUITO', guide_number='LOTE-1')
+        pulls = PullService.bulk_create_pulls(
+            [
+                {'size': 'PEQUENO', 'package_ids': [p.id for p in self.packages[:2]]},
+                {'size': 'GRANDE', 'package_ids': [p.id for p in self.packages[2:5]]},
+                {'size': 'MEDIANO'},
+            ],
+            common_destiny='QUITO',
+            transport_agency=self.agency,
+            batch=batch,
+        )
+        
+        self.assertEqual([pull.size for pull in pulls], ['PEQUENO', 'GRANDE', 'MEDIANO'])
+        self.assertEqual([pull.packages.count() for pull in pulls], [2, 3, 0])
+        self.assertEqual([pull.packages_count for pull in pulls], [2, 3, 0])
+        # bulk_create no pasa por Pull.save(): la guía del lote se hereda igual
+        self.assertEqual({pull.guide_number for pull in pulls}, {'LOTE-1'})
+        
+        batch.refresh_from_db()
+        self.assertEqual((batch.pulls_count, batch.packages_count), (3, 5))
+        self.assertFalse(Package.objects.filter(pk=self.packages[5].pk, pull__isnull=False).exists())
+    
+    def test_bulk_create_endpoint(self):
+        response = self.client.post('/api/v1/pulls/bulk_create/', {
+            'common_destiny': 'QUITO',
+            'transport_agency': str(self.agency.id),
+            'pulls': [
+                {'size': 'PEQUENO', 'package_ids': [str(p.id) for p in self.packages[:3]]},
+                {'size': 'MEDIANO', 'package_ids': [str(p.id) for p in self.packages[3:]]},
+            ],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(Package.objects.filter(pull__isnull=False).count(), 6)
+    
+    def test_bulk_create_endpoint_rejects_duplicates(self):
+        package_id = str(self.packages[0].id)
+        response = self.client.post('/api/v1/pulls/bulk_create/', {
+            'common_destiny': 'QUITO',
+            'pulls': [
+                {'size': 'PEQUENO', 'package_ids': [package_id]},
+                {'size': 'PEQUENO', 'package_ids': [package_id]},
+            ],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Pull.objects.exists())
+    
+    def test_add_packages_is_all_or_nothing(self):
+        pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        other = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        Package.objects.filter(pk=self.packages[0].pk).update(pull=other)
+        
+        response = self.client.post(f'/api/v1/pulls/{pull.id}/add_packages/', {
+            'package_ids': [str(p.id) for p in self.packages[:3]],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Package.objects.filter(pull=pull).exists())
+        
+        response = self.client.post(f'/api/v1/pulls/{pull.id}/add_packages/', {
+            'package_ids': [str(p.id) for p in self.packages[1:3]],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Package.objects.filter(pull=pull).count(), 2)
+    
+    def test_bulk_create_pulls_does_not_take_assigned_packages(self):
+        other = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        Package.objects.filter(pk=self.packages[0].pk).update(pull=other)
+        
+        with self.assertRaises(PackagesUnavailableError):
+            PullService.bulk_create_pulls(
+                [{'size': 'PEQUENO', 'package_ids': [p.id for p in self.packages[:3]]}],
+                common_destiny='QUITO',
+            )
+        
+        self.assertEqual(Pull.objects.count(), 1)
+        self.assertEqual(list(Package.objects.filter(pull__isnull=False).values_list('pull', flat=True)), [other.pk])
+    
+    def test_partial_assignment_leaves_counters_untouched(self):
+        batch = Batch.objects.create(destiny='QUITO')
+        PullService.bulk_create_pulls(
+            [{'size': 'PEQUENO', 'package_ids': [self.packages[0].id]}], common_destiny='QUITO', batch=batch
+        )
+        
+        with self.assertRaises(PackagesUnavailableError):
+            PullService.bulk_create_pulls(
+                [
+                    {'size': 'PEQUENO', 'package_ids': [p.id for p in self.packages[1:3]]},
+                    {'size': 'GRANDE', 'package_ids': [p.id for p in self.packages[:1]]},
+                ],
+                common_destiny='QUITO',
+                batch=batch,
+            )
+        
+        batch.refresh_from_db()
+        self.assertEqual((batch.pulls_count, batch.packages_count), (1, 1))
+        self.assertEqual(list(Pull.objects.values_list('packages_count', flat=True)), [1])
+        self.assertEqual(CounterService.verify(), {'pulls': [], 'batches': []})
+    
+    def test_assign_packages_rejects_assigned(self):
+        pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        other = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        Package.objects.filter(pk=self.packages[0].pk).update(pull=other)
+        
+        with self.assertRaises(PackagesUnavailableError):
+            PullService.assign_packages([(pull, [self.packages[0].id, self.packages[1].id])])
+        
+        self.assertEqual(Package.objects.get(pk=self.packages[0].pk).pull_id, other.pk)
+    
+    def test_packages_taken_after_validation(self):
+        serializer = PullBulkCreateSerializer(data={
+            'common_destiny': 'QUITO',
+            'pulls': [{'size': 'PEQUENO', 'package_ids': [str(p.id) for p in self.packages[:3]]}],
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        
+        # Otra petición asigna un paquete entre validate() y create()
+        other = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        Package.objects.filter(pk=self.packages[1].pk).update(pull=other)
+        
+        with self.assertRaises(PackagesUnavailableError):
+            serializer.save()
+        
+        self.assertEqual(Pull.objects.count(), 1)
+        self.assertEqual(Package.objects.get(pk=self.packages[1].pk).pull_id, other.pk)
+        self.assertFalse(Package.objects.filter(pk__in=[self.packages[0].pk, self.packages[2].pk], pull__isnull=False).exists())
+    
+    def test_remove_packages(self):
+        pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        Package.objects.filter(pk__in=[p.pk for p in self.packages[:3]]).update(pull=pull)
+        
+        response = self.client.post(f'/api/v1/pulls/{pull.id}/remove_packages/', {
+            'package_ids': [str(self.packages[0].id), str(self.packages[5].id)],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Package.objects.filter(pull=pull).count(), 2)
+
+
+class AutoDistributionTests(APITestMixin, TestCase):
+    """Plan balanceado de distribución en sacas y su materialización."""
+    
+    def setUp(self):
+        super().setUp()
+        self.packages = create_packages(10)
+        self.ids = [package.id for package in self.packages]
+    
+    def test_plan_uses_fewest_pulls_and_balances_load(self):
+        plan = AutoDistributionService.plan(self.ids, [
+            {'size': 'PEQUENO', 'max_packages': 3},
+            {'size': 'GRANDE', 'max_packages': 8},
+            {'size': 'MEDIANO', 'max_packages': 5},
+        ])
+        
+        self.assertEqual(plan['pulls_count'], 2)
+        self.assertEqual(plan['total_packages'], 10)
+        # Se conserva el orden de la configuración y la ocupación queda pareja
+        self.assertEqual([pull['size'] for pull in plan['pulls']], ['GRANDE', 'MEDIANO'])
+        self.assertEqual([pull['packages_count'] for pull in plan['pulls']], [6, 4])
+        planned = [package_id for pull in plan['pulls'] for package_id in pull['package_ids']]
+        self.assertCountEqual(planned, self.ids)
+    
+    def test_plan_keeps_parent_and_children_together(self):
+        parent = self.packages[0]
+        Package.objects.filter(pk__in=self.ids[1:4]).update(parent=parent)
+        
+        plan = AutoDistributionService.plan(self.ids, [
+            {'size': 'MEDIANO', 'max_packages': 5},
+            {'size': 'MEDIANO', 'max_packages': 5},
+        ])
+        
+        family = set(self.ids[:4])
+        pulls_with_family = [pull for pull in plan['pulls'] if family & set(pull['package_ids'])]
+        self.assertEqual(len(pulls_with_family), 1)
+        self.assertTrue(family <= set(pulls_with_family[0]['package_ids']))
+    
+    def test_plan_rejects_group_larger_than_any_pull(self):
+        Package.objects.filter(pk__in=self.ids[1:5]).update(parent=self.packages[0])
+        
+        with self.assertRaisesMessage(ValueError, 'no cabe en ninguna saca'):
+            AutoDistributionService.plan(self.ids, [
+                {'size': 'PEQUENO', 'max_packages': 4},
+                {'size': 'PEQUENO', 'max_packages': 4},
+                {'size': 'PEQUENO', 'max_packages': 4},
+            ])
+    
+    def test_preview_does_not_write(self):
+        response = self.client.post('/api/v1/batches/auto_distribute/preview/', {
+            'destiny': 'QUITO',
+            'package_ids': [str(package_id) for package_id in self.ids],
+            'pulls_config': [{'size': 'GRANDE', 'max_packages': 10}],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['pulls_count'], 1)
+        self.assertFalse(Batch.objects.exists())
+        self.assertFalse(Pull.objects.exists())
+    
+    def test_auto_distribute_creates_batch_and_pulls(self):
+        response = self.client.post('/api/v1/batches/auto_distribute/', {
+            'destiny': 'QUITO',
+            'guide_number': 'LOTE-7',
+            'package_ids': [str(package_id) for package_id in self.ids],
+            'pulls_config': [
+                {'size': 'MEDIANO', 'max_packages': 6},
+                {'size': 'MEDIANO', 'max_packages': 6},
+            ],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['distributed_packages'], 10)
+        batch = Batch.objects.get()
+        self.assertEqual((batch.pulls_count, batch.packages_count), (2, 10))
+        self.assertEqual(
+            sorted(Pull.objects.filter(batch=batch).values_list('packages_count', flat=True)), [5, 5]
+        )
+        self.assertEqual(set(Pull.objects.values_list('guide_number', flat=True)), {'LOTE-7'})
+    
+    def test_auto_distribute_rejects_insufficient_capacity(self):
+        response = self.client.post('/api/v1/batches/auto_distribute/', {
+            'destiny': 'QUITO',
+            'package_ids': [str(package_id) for package_id in self.ids],
+            'pulls_config': [{'size': 'PEQUENO', 'max_packages': 4}],
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pulls_config', response.data)
+        self.assertFalse(Batch.objects.exists())
+    
+    def test_commit_rejects_stale_plan(self):
+        config = [{'size': 'GRANDE', 'max_packages': 10}]
+        plan = AutoDistributionService.plan(self.ids, config)
+        other = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        Package.objects.filter(pk=self.ids[3]).update(pull=other)
+        
+        with self.assertRaisesMessage(PackagesUnavailableError, 'ya no es válida'):
+            AutoDistributionService.commit(plan, destiny='QUITO')
+        
+        self.assertFalse(Batch.objects.exists())
+        self.assertEqual(Package.objects.filter(pull__isnull=False).count(), 1)
+    
+    def test_auto_distribute_conflict_when_packages_taken(self):
+        other = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        original_plan = AutoDistributionService.plan
+        
+        def plan_then_race(package_ids, pulls_config):
+            # Otra petición asigna un paquete entre la validación y commit()
+            plan = original_plan(package_ids, pulls_config)
+            Package.objects.filter(pk=self.ids[0]).update(pull=other)
+            return plan
+        
+        with patch.object(AutoDistributionService, 'plan', side_effect=plan_then_race):
+            response = self.client.post('/api/v1/batches/auto_distribute/', {
+                'destiny': 'QUITO',
+                'package_ids': [str(package_id) for package_id in self.ids],
+                'pulls_config': [{'size': 'GRANDE', 'max_packages': 10}],
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Batch.objects.exists())
+        self.assertEqual(Package.objects.get(pk=self.ids[0]).pull_id, other.pk)
+        self.assertEqual(Package.objects.filter(pull__isnull=False).count(), 1)
+
+
+class CounterCacheTests(TestCase):
+    """Contadores cacheados de sacas y lotes."""
+    
+    def setUp(self):
+        self.batch = Batch.objects.create(destiny='QUITO')
+        self.other_batch = Batch.objects.create(destiny='QUITO')
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=self.batch)
+        create_packages(3, pull=self.pull)
+    
+    def test_pull_moves_between_batches(self):
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.pulls_count, self.batch.packages_count), (1, 3))
+        
+        pull = Pull.objects.get(pk=self.pull.pk)
+        pull.batch = self.other_batch
+        pull.save()
+        
+        self.batch.refresh_from_db()
+        self.other_batch.refresh_from_db()
+        self.assertEqual((self.batch.pulls_count, self.batch.packages_count), (0, 0))
+        self.assertEqual((self.other_batch.pulls_count, self.other_batch.packages_count), (1, 3))
+    
+    def test_pull_moves_with_update_fields_attname(self):
+        pull = Pull.objects.get(pk=self.pull.pk)
+        pull.batch_id = self.other_batch.pk
+        pull.save(update_fields=['batch_id'])
+        
+        self.other_batch.refresh_from_db()
+        self.assertEqual((self.other_batch.pulls_count, self.other_batch.packages_count), (1, 3))
+    
+    def test_stale_instance_save_keeps_counters(self):
+        stale = Pull.objects.get(pk=self.pull.pk)
+        create_package('EXTRA', pull=self.pull)
+        
+        stale.guide_number = 'G-1'
+        stale.save()
+        
+        self.pull.refresh_from_db()
+        self.assertEqual(self.pull.packages_count, 4)
+    
+    def test_pull_delete_detaches_from_batch(self):
+        self.pull.delete()
+        
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.pulls_count, self.batch.packages_count), (0, 0))
+    
+    def test_verify_and_fix(self):
+        Pull.objects.filter(pk=self.pull.pk).update(packages_count=10)
+        Batch.objects.filter(pk=self.batch.pk).update(pulls_count=5)
+        
+        result = CounterService.verify()
+        self.assertEqual([row['actual_packages'] for row in result['pulls']], [3])
+        self.assertEqual([row['actual_pulls'] for row in result['batches']], [1])
+        
+        CounterService.verify(fix=True)
+        self.assertEqual(CounterService.verify(), {'pulls': [], 'batches': []})
+    
+    def test_verify_counters_command_fails_on_mismatch(self):
+        Pull.objects.filter(pk=self.pull.pk).update(packages_count=0)
+        
+        with self.assertRaises(CommandError):
+            call_command('verify_counters', '--fail-on-mismatch', stdout=StringIO())
+        call_command('verify_counters', '--fix', stdout=StringIO())
+        call_command('verify_counters', '--fail-on-mismatch', stdout=StringIO())
+
+
+class DispatchSummaryTests(APITestMixin, TestCase):
+    """Resumen por agencia de un despacho y su invalidación."""
+    
+    def setUp(self):
+        super().setUp()
+        self.tame = TransportAgency.objects.create(name='TAME', phone_number='1')
+        self.servientrega = TransportAgency.objects.create(name='SERVIENTREGA', phone_number='2')
+        self.batch = Batch.objects.create(destiny='QUITO', transport_agency=self.tame)
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=self.batch)
+        self.loose_pull = Pull.objects.create(
+            common_destiny='QUITO', size='MEDIANO', transport_agency=self.servientrega
+        )
+        create_packages(3, prefix='LOTE', pull=self.pull)
+        create_packages(2, prefix='SACA', pull=self.loose_pull)
+        self.individual = create_package('IND', transport_agency=self.servientrega)
+        
+        self.dispatch = Dispatch.objects.create(dispatch_date=date(2026, 1, 15))
+        DispatchService.attach_items(
+            self.dispatch,
+            pull_ids=[self.pull.id, self.loose_pull.id],
+            package_ids=[self.individual.id],
+        )
+    
+    def by_agency(self):
+        dispatch = Dispatch.objects.get(pk=self.dispatch.pk)
+        return {item['agency_name']: item['packages_count'] for item in dispatch.get_summary()['by_agency']}
+    
+    def assertInvalidated(self):
+        self.assertIsNone(Dispatch.objects.get(pk=self.dispatch.pk).summary_cache)
+    
+    def test_summary_groups_by_effective_agency(self):
+        summary = Dispatch.objects.get(pk=self.dispatch.pk).get_summary()
+        
+        self.assertEqual(summary['total_pulls'], 2)
+        self.assertEqual(summary['total_packages'], 6)
+        self.assertEqual(summary['individual_packages'], 1)
+        self.assertEqual(summary['packages_in_pulls'], 5)
+        self.assertEqual(self.by_agency(), {'TAME': 3, 'SERVIENTREGA': 3})
+    
+    def test_summary_is_cached(self):
+        self.by_agency()
+        dispatch = Dispatch.objects.get(pk=self.dispatch.pk)
+        self.assertIsNotNone(dispatch.summary_cache)
+        
+        with self.assertNumQueries(0):
+            dispatch.get_summary()
+    
+    def test_statistics_endpoint(self):
+        response = self.client.get(f'/api/v1/dispatches/{self.dispatch.id}/statistics/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_packages'], 6)
+    
+    def test_package_agency_change_invalidates(self):
+        self.by_agency()
+        package = Package.objects.get(pk=self.individual.pk)
+        package.transport_agency = self.tame
+        package.save()
+        
+        self.assertInvalidated()
+        self.assertEqual(self.by_agency(), {'TAME': 4, 'SERVIENTREGA': 2})
+    
+    def test_full_save_keeps_cache(self):
+        stale = Dispatch.objects.get(pk=self.dispatch.pk)
+        self.by_agency()
+        
+        # La instancia no tiene el resumen: save() completo no lo pisa
+        stale.notes = 'Salida temprana'
+        stale.save()
+        
+        dispatch = Dispatch.objects.get(pk=self.dispatch.pk)
+        self.assertEqual(dispatch.notes, 'Salida temprana')
+        self.assertIsNotNone(dispatch.summary_cache)
+    
+    def test_unrelated_update_fields_keep_cache(self):
+        self.by_agency()
+        package = Package.objects.get(pk=self.individual.pk)
+        package.status = 'EN_TRANSITO'
+        package.save(update_fields=['status'])
+        
+        self.assertIsNotNone(Dispatch.objects.get(pk=self.dispatch.pk).summary_cache)
+    
+    def test_pull_agency_change_invalidates(self):
+        self.by_agency()
+        pull = Pull.objects.get(pk=self.loose_pull.pk)
+        pull.transport_agency = self.tame
+        pull.save()
+        
+        self.assertEqual(self.by_agency(), {'TAME': 5, 'SERVIENTREGA': 1})
+    
+    def test_batch_agency_change_invalidates(self):
+        self.by_agency()
+        batch = Batch.objects.get(pk=self.batch.pk)
+        batch.transport_agency = self.servientrega
+        batch.save()
+        
+        self.assertEqual(self.by_agency(), {'SERVIENTREGA': 6})
+    
+    def test_agency_rename_invalidates(self):
+        self.by_agency()
+        self.tame.name = 'TAME EP'
+        self.tame.save()
+        
+        self.assertEqual(self.by_agency(), {'TAME EP': 3, 'SERVIENTREGA': 3})
+    
+    def test_package_delete_invalidates(self):
+        self.by_agency()
+        Package.objects.get(pk=self.individual.pk).delete()
+        
+        self.assertEqual(self.by_agency(), {'TAME': 3, 'SERVIENTREGA': 2})
+    
+    def test_pull_delete_invalidates(self):
+        self.by_agency()
+        Pull.objects.get(pk=self.loose_pull.pk).delete()
+        
+        self.assertEqual(self.by_agency(), {'TAME': 3, 'SERVIENTREGA': 1})
+    
+    def test_batch_delete_invalidates(self):
+        self.by_agency()
+        Batch.objects.get(pk=self.batch.pk).delete()
+        
+        self.assertEqual(self.by_agency(), {'Sin Agencia': 3, 'SERVIENTREGA': 3})
+    
+    def test_agency_delete_invalidates(self):
+        self.by_agency()
+        self.servientrega.delete()
+        
+        self.assertEqual(self.by_agency(), {'TAME': 3, 'Sin Agencia': 3})
+    
+    def test_m2m_remove_invalidates(self):
+        self.by_agency()
+        self.dispatch.pulls.remove(self.pull)
+        
+        self.assertEqual(self.by_agency(), {'SERVIENTREGA': 3})
+
+
+class DispatchAssemblyTests(APITestMixin, TestCase):
+    """Asociación en bloque y cierre del día de despacho."""
+    
+    def setUp(self):
+        super().setUp()
+        self.batch = Batch.objects.create(destiny='QUITO')
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=self.batch)
+        self.loose_pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        create_packages(2, prefix='LOTE', pull=self.pull)
+        create_packages(2, prefix='SACA', pull=self.loose_pull)
+        self.individual = create_package('IND')
+        self.dispatch = Dispatch.objects.create(dispatch_date=date(2026, 1, 15))
+    
+    def test_attach_items_counts_only_inserted_rows(self):
+        attached = DispatchService.attach_items(
+            self.dispatch,
+            pull_ids=[self.pull.id, self.pull.id, uuid.uuid4()],
+            package_ids=[self.individual.id],
+        )
+        self.assertEqual(attached, {'pulls': 1, 'packages': 1})
+        
+        attached = DispatchService.attach_items(
+            self.dispatch,
+            pull_ids=[self.pull.id, self.loose_pull.id],
+            package_ids=[self.individual.id],
+        )
+        self.assertEqual(attached, {'pulls': 1, 'packages': 0})
+        self.assertEqual(self.dispatch.pulls.count(), 2)
+        self.assertEqual(self.dispatch.packages.count(), 1)
+    
+    def test_attach_items_without_changes_keeps_summary(self):
+        DispatchService.attach_items(self.dispatch, pull_ids=[self.pull.id])
+        Dispatch.objects.get(pk=self.dispatch.pk).get_summary()
+        
+        DispatchService.attach_items(self.dispatch, pull_ids=[self.pull.id])
+        self.assertIsNotNone(Dispatch.objects.get(pk=self.dispatch.pk).summary_cache)
+    
+    def test_transition_packages_writes_history_in_bulk(self):
+        DispatchService.attach_items(
+            self.dispatch, pull_ids=[self.pull.id], package_ids=[self.individual.id]
+        )
+        Package.objects.filter(pk=self.individual.pk).update(status='EN_TRANSITO')
+        
+        updated = DispatchService.transition_packages(self.dispatch, 'EN_TRANSITO', user=self.user)
+        
+        self.assertEqual(updated, 2)
+        self.assertEqual(Package.objects.filter(status='EN_TRANSITO').count(), 3)
+        self.assertEqual(PackageStatusHistory.objects.filter(changed_by=self.user).count(), 2)
+        package = Package.objects.filter(pull=self.pull).first()
+        self.assertIn('En Tránsito', package.status_history)
+    
+    def test_render_targets_group_pulls_by_batch(self):
+        other = Pull.objects.create(common_destiny='QUITO', size='GRANDE', batch=self.batch)
+        DispatchService.attach_items(self.dispatch, pull_ids=[self.pull.id, other.id, self.loose_pull.id])
+        
+        targets = DispatchService.get_render_targets(self.dispatch)
+        
+        self.assertCountEqual(targets, [
+            ('pull_manifest', str(self.loose_pull.id)),
+            ('pull_label', str(self.loose_pull.id)),
+            ('batch_manifest', str(self.batch.id)),
+            ('batch_labels', str(self.batch.id)),
+        ])
+    
+    def test_close_endpoint_enqueues_task(self):
+        with patch('apps.logistics.tasks.close_dispatch_task.delay') as delay:
+            delay.return_value.id = 'task-1'
+            response = self.client.post(f'/api/v1/dispatches/{self.dispatch.id}/close/', {
+                'pull_ids': [str(self.pull.id)],
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['task_id'], 'task-1')
+        delay.assert_called_once_with(
+            str(self.dispatch.id), pull_ids=[str(self.pull.id)], package_ids=[], user_id=self.user.pk
+        )
+    
+    def test_close_rejects_completed_dispatch(self):
+        Dispatch.objects.filter(pk=self.dispatch.pk).update(status='COMPLETADO')
+        
+        response = self.client.post(f'/api/v1/dispatches/{self.dispatch.id}/close/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_close_dispatch_task_builds_bundle(self):
+        # El chord se congela contra el backend de resultados; en tests se usa uno en memoria
+        memory_backend = CacheBackend(app=celery_app, url='memory://')
+        with TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                patch.object(type(celery_app), 'backend', new_callable=PropertyMock, return_value=memory_backend):
+            result = close_dispatch_task.apply(
+                args=[str(self.dispatch.id)],
+                kwargs={'pull_ids': [str(self.pull.id), str(self.loose_pull.id)], 'user_id': self.user.pk},
+            ).get()
+            
+            self.assertTrue(result['success'], result)
+            self.assertEqual(result['documents'], 4)
+            dispatch = Dispatch.objects.get(pk=self.dispatch.pk)
+            self.assertEqual(dispatch.status, 'EN_CURSO')
+            self.assertEqual(Package.objects.filter(status='EN_TRANSITO').count(), 4)
+            with dispatch.bundle_file.open('rb') as bundle, zipfile.ZipFile(bundle) as archive:
+                names = archive.namelist()
+            self.assertEqual(len(names), 4)
+            self.assertEqual({name.split('/')[0] for name in names}, {'sacas', 'lotes'})
+
+
+class ZPLLabelTests(APITestMixin, TestCase):
+    """Etiquetas ZPL para impresoras térmicas."""
+    
+    def setUp(self):
+        super().setUp()
+        self.agency = TransportAgency.objects.create(name='SERVIENTREGA', phone_number='022222222')
+        self.batch = Batch.objects.create(destiny='QUITO', transport_agency=self.agency, guide_number='LOTE-1')
+        self.pulls = [
+            Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=self.batch)
+            for _ in range(3)
+        ]
+        create_packages(2, pull=self.pulls[0])
+    
+    def test_escape_control_characters(self):
+        self.assertEqual(BaseZPLGenerator.escape('A^B~C_D\nE'), 'A_5EB_7EC_5FD E')
+    
+    def test_batch_stream_has_one_label_per_pull(self):
+        zpl = BatchLabelsGenerator.generate_zpl(self.batch)
+        
+        self.assertEqual(zpl.count('^XA'), 3)
+        self.assertEqual(zpl.count('^XZ'), 3)
+        labels = zpl.strip().split('\n')
+        self.assertIn('^FD1/3^FS', labels[0])
+        self.assertIn('^FD3/3^FS', labels[2])
+        self.assertIn('SERVIENTREGA', labels[0])
+        self.assertIn('LOTE-1', labels[0])
+        self.assertIn(f'^FDLA,{self.pulls[0].id}^FS', labels[0])
+        # El aviso de manifiesto solo va en la última saca
+        self.assertNotIn('MANIFIESTO', labels[0])
+        self.assertIn('MANIFIESTO', labels[2])
+    
+    def test_include_packages_appends_package_labels(self):
+        zpl = BatchLabelsGenerator.generate_zpl(self.batch, include_packages=True)
+        self.assertEqual(zpl.count('^XA'), 5)
+        
+        zpl = PDFService.generate_pull_label_zpl(self.pulls[0], include_packages=True)
+        self.assertEqual(zpl.count('^XA'), 3)
+    
+    def test_label_endpoints_return_zpl(self):
+        for url in (
+            f'/api/v1/pulls/{self.pulls[0].id}/generate_label/?format=zpl',
+            f'/api/v1/batches/{self.batch.id}/generate_labels/?format=zpl&include_packages=true',
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response['Content-Type'], BaseZPLGenerator.CONTENT_TYPE)
+            self.assertTrue(response.content.startswith(b'^XA^CI28'))
+            self.assertIn('.zpl', response['Content-Disposition'])
+    
+    def test_package_label_endpoint_returns_zpl(self):
+        package = Package.objects.filter(pull=self.pulls[0]).first()
+        
+        response = self.client.get(f'/api/v1/packages/{package.id}/generate_label/?format=zpl')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.count(b'^XA'), 1)
+        self.assertIn(str(package.id).encode(), response.content)
+
+
+class QueryBudgetTests(TestCase):
+    """PullViewSet y BatchViewSet respetan su query_budget sin importar el volumen."""
+    
+    def setUp(self):
+        # Sesión real: el presupuesto incluye las consultas de la sesión
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+    
+    def add_batches(self, prefix, count):
+        """Lotes con una saca de varios paquetes y sacas sueltas."""
+        for number in range(count):
+            agency = TransportAgency.objects.create(name=f'AGENCIA {prefix}{number}', phone_number='022222222')
+            batch = Batch.objects.create(destiny='QUITO', transport_agency=agency, guide_number=f'L{prefix}{number}')
+            pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=batch)
+            loose_pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO', transport_agency=agency)
+            for package in range(count):
+                create_package(f'P{prefix}{number}-{package}', pull=pull)
+            create_package(f'S{prefix}{number}', pull=loose_pull)
+    
+    def get_within_budget(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.query_budget)
+        assert_within_budget(response)
+        return response.query_stats.count
+    
+    def assertConstantQueries(self, url_for):
+        """Mismas consultas con pocos y con muchos datos (sin N+1)."""
+        self.add_batches('A', 2)
+        queries = self.get_within_budget(url_for())
+        
+        self.add_batches('B', 5)
+        self.assertEqual(self.get_within_budget(url_for()), queries)
+    
+    def test_pull_list(self):
+        self.assertConstantQueries(lambda: '/api/v1/pulls/')
+    
+    def test_pull_retrieve(self):
+        self.assertConstantQueries(
+            lambda: f'/api/v1/pulls/{Pull.objects.filter(batch__isnull=False).latest("created_at").pk}/'
+        )
+    
+    def test_batch_list(self):
+        self.assertConstantQueries(lambda: '/api/v1/batches/')
+    
+    def test_batch_retrieve(self):
+        self.assertConstantQueries(lambda: f'/api/v1/batches/{Batch.objects.latest("created_at").pk}/')
+
+
+class ResponseCacheInvalidationTests(TestCase):
+    """Las escrituras en bloque de sacas invalidan las respuestas de PACKAGES."""
+    
+    def setUp(self):
+        self.packages = create_packages(3)
+        # Generación conocida: cualquier invalidación la reemplaza
+        ResponseCache.get_cache().set(ResponseCache._generation_key(ResponseCache.PACKAGES), 0, timeout=None)
+    
+    def generation(self):
+        return ResponseCache.get_generations([ResponseCache.PACKAGES])[ResponseCache.PACKAGES]
+    
+    def test_assign_packages(self):
+        pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            PullService.assign_packages([(pull, [package.id for package in self.packages])])
+        
+        self.assertNotEqual(self.generation(), 0)
+    
+    def test_assign_without_packages_keeps_cache(self):
+        pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            PullService.assign_packages([(pull, [])])
+        
+        self.assertEqual(self.generation(), 0)
+    
+    def test_bulk_create_pulls(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PullService.bulk_create_pulls([{'size': 'MEDIANO'}], common_destiny='QUITO')
+        
+        self.assertNotEqual(self.generation(), 0)
+    
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_cached_statistics_follow_bulk_create(self):
+        user = User.objects.create_user('operador', password='clave', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        
+        before = client.get('/api/v1/packages/statistics/').json()
+        with self.captureOnCommitCallbacks(execute=True):
+            PullService.bulk_create_pulls(
+                [{'size': 'PEQUENO', 'package_ids': [package.id for package in self.packages]}],
+                common_destiny='QUITO',
+            )
+            # Este update() no invalida: la respuesta nueva depende de bulk_create_pulls
+            Package.objects.filter(pull__isnull=False).update(status='EN_TRANSITO')
+        after = client.get('/api/v1/packages/statistics/').json()
+        
+        self.assertEqual(before['by_status']['EN_TRANSITO']['count'], 0)
+        self.assertEqual(after['by_status']['EN_TRANSITO']['count'], 3)
+
+
+# El ETag del detalle de un lote usa la generación PACKAGES de ResponseCache
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ETagTests(APITestMixin, TestCase):
+    """GET condicional de sacas y lotes."""
+    
+    def setUp(self):
+        super().setUp()
+        self.batch = Batch.objects.create(destiny='QUITO')
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=self.batch)
+        self.packages = create_packages(3)
+    
+    def get_etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+    
+    def test_pull_list_and_detail_change_after_assignment(self):
+        urls = ['/api/v1/pulls/', f'/api/v1/pulls/{self.pull.pk}/', f'/api/v1/batches/{self.batch.pk}/']
+        etags = {url: self.get_etag(url) for url in urls}
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            PullService.bulk_create_pulls(
+                [{'size': 'PEQUENO', 'package_ids': [package.id for package in self.packages[1:]]}],
+                common_destiny='QUITO', batch=self.batch,
+            )
+            PullService.assign_packages([(self.pull, [self.packages[0].id])])
+        
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+    
+    def test_batch_list_not_modified(self):
+        self.get_etag('/api/v1/batches/')
+    
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_batch_detail_without_response_cache(self):
+        response = self.client.get(f'/api/v1/batches/{self.batch.pk}/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
@@ -5,6 +5,7 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 from django.db import transaction
@@ -19,6 +20,7 @@ from ..services import (
     PackageManifestGenerator,
     PackageLabelsGenerator
 )
+from apps.shared.services import ETagService, RenderCache, ResponseCache, BaseZPLGenerator, ZPLRenderer
 from .serializers import (
     PackageListSerializer,
     PackageDetailSerializer,
@@ -44,6 +46,12 @@ class PackageViewSet(viewsets.ModelViewSet):
     search_fields = ['guide_number', 'nro_master', 'name', 'address', 'city']
     ordering_fields = ['created_at', 'updated_at', 'guide_number', 'status']
     ordering = ['-created_at']
+    # Máximo de consultas SQL por acción (QueryBudgetMiddleware)
+    query_budget = {
+        'list': 9,
+        'retrieve': 9,
+        'statistics': 7,
+    }
     
     def get_serializer_class(self):
         """Usar serializer diferente según la acción"""
@@ -143,6 +151,14 @@ class PackageViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Listado con ETag por página (304 sin serializar si no cambió)."""
+        return ETagService.list_response(self, request, ETagService.PACKAGE_LIST_FIELDS)
+    
+    @ETagService.conditional(ETagService.package_etag)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'])
     def available_for_pull(self, request):
         """
@@ -284,10 +300,13 @@ class PackageViewSet(viewsets.ModelViewSet):
             )
     
     @action(detail=False, methods=['get'])
+    @ResponseCache.cached(ResponseCache.PACKAGES)
     def statistics(self, request):
         """
         Obtener estadísticas de packages
         GET /api/v1/packages/statistics/
+        
+        Cacheada hasta que cambie un paquete, saca o lote (ResponseCache).
         """
         from collections import Counter
         
@@ -767,16 +786,14 @@ class PackageViewSet(viewsets.ModelViewSet):
         package = self.get_object()
         
         try:
-            # Generar PDF
-            pdf_buffer = PackageManifestGenerator.generate_pdf(package)
-            
             # Nombre del archivo
             filename = f"manifiesto_paquete_{package.guide_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             
-            # Retornar PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'package_manifest', package.id, RenderCache.package_version(package),
+                lambda: PackageManifestGenerator.generate_pdf(package), 'pdf', filename
+            )
             
         except Exception as e:
             return Response(
@@ -795,19 +812,14 @@ class PackageViewSet(viewsets.ModelViewSet):
         package = self.get_object()
         
         try:
-            # Generar Excel
-            excel_buffer = PackageManifestGenerator.generate_excel(package)
-            
             # Nombre del archivo
             filename = f"manifiesto_paquete_{package.guide_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
             
-            # Retornar Excel
-            response = HttpResponse(
-                excel_buffer.getvalue(),
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'package_manifest_excel', package.id, RenderCache.package_version(package),
+                lambda: PackageManifestGenerator.generate_excel(package), 'xlsx', filename
             )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
             
         except Exception as e:
             return Response(
@@ -815,27 +827,32 @@ class PackageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ZPLRenderer])
     def generate_label(self, request, pk=None):
         """
         Generar PDF con etiqueta del paquete individual.
         Incluye: guía, destinatario, dirección completa, ciudad/provincia, agencia, código QR.
         
         GET /api/v1/packages/{id}/generate_label/
+        Con ?format=zpl retorna la etiqueta en ZPL para impresoras térmicas.
         """
         package = self.get_object()
         
         try:
-            # Generar PDF con etiqueta
-            pdf_buffer = PackageLabelsGenerator.generate_pdf(package)
+            if request.query_params.get('format') == 'zpl':
+                return BaseZPLGenerator.response(
+                    PackageLabelsGenerator.generate_zpl(package),
+                    f"etiqueta_paquete_{package.guide_number}.zpl"
+                )
             
             # Nombre del archivo
             filename = f"etiqueta_paquete_{package.guide_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             
-            # Retornar PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'package_label', package.id, RenderCache.package_version(package),
+                lambda: PackageLabelsGenerator.generate_pdf(package), 'pdf', filename
+            )
             
         except Exception as e:
             return Response(
@@ -843,7 +860,8 @@ class PackageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    @action(detail=True, methods=['get'], url_path='generate-shipping-label')
+    @action(detail=True, methods=['get'], url_path='generate-shipping-label',
+            renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ZPLRenderer])
     def generate_shipping_label(self, request, pk=None):
         """
         Generar PDF con etiqueta de envío (formato de guía).
@@ -851,20 +869,25 @@ class PackageViewSet(viewsets.ModelViewSet):
         fecha, peso, dimensiones y datos del destinatario.
         
         GET /api/v1/packages/{id}/generate-shipping-label/
+        Con ?format=zpl retorna la etiqueta en ZPL para impresoras térmicas.
         """
         package = self.get_object()
         
         try:
-            # Generar PDF con etiqueta de envío
-            pdf_buffer = PackageLabelsGenerator.generate_shipping_label_pdf(package)
+            if request.query_params.get('format') == 'zpl':
+                return BaseZPLGenerator.response(
+                    PackageLabelsGenerator.generate_shipping_label_zpl(package),
+                    f"guia_{package.guide_number}.zpl"
+                )
             
             # Nombre del archivo
             filename = f"guia_{package.guide_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
             
-            # Retornar PDF
-            response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+            # Servir desde la caché de documentos (ETag / 304)
+            return RenderCache.response(
+                request, 'package_shipping_label', package.id, RenderCache.package_version(package),
+                lambda: PackageLabelsGenerator.generate_shipping_label_pdf(package), 'pdf', filename
+            )
             
         except Exception as e:
             return Response(
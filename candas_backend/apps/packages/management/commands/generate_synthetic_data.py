@@ -0,0 +1,122 @@
+"""
+Management command para poblar la base de datos con datos sintéticos a
+escala de producción (para medir rendimiento)
+
+Genera paquetes con ciudades y provincias de Ecuador, agencias de
+transporte, sacas, lotes, despachos, jerarquías padre/hijo y meses de
+historial de estados. Con la misma semilla y fecha final se obtienen
+exactamente los mismos datos.
+
+Uso:
+    python manage.py generate_synthetic_data --packages 1000000 --months 6
+    python manage.py generate_synthetic_data --packages 50000 --seed 7 --end-date 2025-06-30
+    python manage.py generate_synthetic_data --flush --packages 0
+"""
+
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.packages.services import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = 'Genera datos sintéticos reproducibles (paquetes, sacas, lotes, despachos e historial)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--packages',
+            type=int,
+            default=100000,
+            help='Cantidad aproximada de paquetes (default: 100000; los hijos se suman)'
+        )
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=6,
+            help='Meses de historia hasta la fecha final (default: 6)'
+        )
+        parser.add_argument(
+            '--end-date',
+            type=date.fromisoformat,
+            default=None,
+            help='Último día generado, YYYY-MM-DD (default: hoy)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Semilla del generador (default: 1)'
+        )
+        parser.add_argument(
+            '--agencies',
+            type=int,
+            default=8,
+            help='Agencias de transporte (default: 8)'
+        )
+        parser.add_argument(
+            '--prefix',
+            default='SYN',
+            help='Prefijo de las guías generadas, para identificarlas y borrarlas (default: SYN)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50000,
+            help='Paquetes por carga COPY (default: 50000)'
+        )
+        parser.add_argument(
+            '--flush',
+            action='store_true',
+            help='Borra antes los datos generados con el mismo prefijo'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Permite ejecutar con DEBUG=False'
+        )
+    
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Con DEBUG=False se requiere --force (no ejecutar en producción)')
+        if options['packages'] < 0 or options['months'] < 1 or options['agencies'] < 1:
+            raise CommandError('--packages debe ser >= 0, --months y --agencies >= 1')
+        
+        self.stdout.write(self.style.SUCCESS('🏭 GENERADOR DE DATOS SINTÉTICOS'))
+        self.stdout.write('=' * 60)
+        
+        generator = SyntheticDataGenerator(
+            seed=options['seed'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout,
+        )
+        
+        if options['flush']:
+            deleted = generator.flush()
+            self.stdout.write(f"🗑️  {deleted} paquetes anteriores con prefijo {options['prefix']} borrados")
+        
+        if not options['packages']:
+            return
+        
+        self.stdout.write(
+            f"Generando ~{options['packages']} paquetes en {options['months']} meses "
+            f"(semilla {options['seed']})..."
+        )
+        try:
+            totals = generator.generate(
+                packages=options['packages'],
+                months=options['months'],
+                end_date=options['end_date'],
+                agencies=options['agencies'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write('=' * 60)
+        self.stdout.write(f"Paquetes:            {totals['packages']}")
+        self.stdout.write(f"Historial de estados: {totals['history']}")
+        self.stdout.write(f"Sacas:               {totals['pulls']}")
+        self.stdout.write(f"Lotes:               {totals['batches']}")
+        self.stdout.write(f"Despachos:           {totals['dispatches']}")
+        self.stdout.write(self.style.SUCCESS('✅ Datos generados'))
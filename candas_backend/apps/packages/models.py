@@ -431,9 +431,11 @@ class Package(models.Model):
     def save(self, *args, **kwargs):
         """Sobrescribe save para registrar cambios de estado"""
         # Detectar cambio de estado
+        old_pull_id = None
         if self.pk:
             try:
                 old_package = Package.objects.get(pk=self.pk)
+                old_pull_id = old_package.pull_id
                 if old_package.status != self.status:
                     # Registrar cambio en historial después de guardar
                     self._old_status = old_package.status
@@ -447,6 +449,14 @@ class Package(models.Model):
         
         super().save(*args, **kwargs)
         
+        # Mantener los contadores de saca/lote si el paquete cambió de saca
+        update_fields = kwargs.get('update_fields')
+        if old_pull_id != self.pull_id and (
+            update_fields is None or {'pull', 'pull_id'} & set(update_fields)
+        ):
+            from apps.logistics.services import CounterService
+            CounterService.adjust_packages({old_pull_id: -1, self.pull_id: 1})
+        
         # Crear registro de historial si hubo cambio
         if self._status_changed:
             # Importar aquí para evitar problemas de importación circular
@@ -6,6 +6,7 @@ from .normalizer import PackageDataNormalizer
 from .importer import PackageImporter
 from .package_manifest_generator import PackageManifestGenerator
 from .package_labels_generator import PackageLabelsGenerator
+from .synthetic_data_service import SyntheticDataGenerator
 
 __all__ = [
     'PackageService', 
@@ -15,5 +16,6 @@ __all__ = [
     'PackageDataNormalizer',
     'PackageImporter',
     'PackageManifestGenerator',
-    'PackageLabelsGenerator'
+    'PackageLabelsGenerator',
+    'SyntheticDataGenerator',
 ]
@@ -13,6 +13,9 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
 from io import BytesIO
 from datetime import datetime
+from apps.shared.services.manifest_template import BaseManifestGenerator
+from apps.shared.services.metrics import Metrics
+from apps.shared.services.streaming_table import StreamingTable
 
 if TYPE_CHECKING:
     from ..models import Package
@@ -102,6 +105,7 @@ class PackageExportService:
             return 'Error'
     
     @classmethod
+    @Metrics.timed_document('export', 'packages', 'xlsx')
     def generate_excel(cls, queryset: QuerySet["Package"], columns_config: list[str]) -> HttpResponse:
         """
         Genera un archivo Excel con los paquetes especificados
@@ -170,6 +174,7 @@ class PackageExportService:
         return response
     
     @classmethod
+    @Metrics.timed_document('export', 'packages', 'pdf')
     def generate_pdf(cls, queryset: QuerySet["Package"], columns_config: list[str]) -> HttpResponse:
         """
         Genera un archivo PDF con los paquetes especificados
@@ -221,8 +226,13 @@ class PackageExportService:
         headers = [cls.AVAILABLE_FIELDS.get(col, col) for col in columns_config]
         table_data.append(headers)
         
-        # Datos
-        for package in queryset:
+        # Datos: se recorren por bloques (iterator) con las relaciones que usan
+        # los campos efectivos, y solo se guardan los textos de cada fila
+        packages = queryset.select_related(
+            'transport_agency', 'delivery_agency',
+            'pull__transport_agency', 'pull__batch__transport_agency',
+        ).iterator(chunk_size=2000)
+        for package in packages:
             row_data = [
                 (str(value)[:27] + '...' if len(str(value)) > 30 else value)
                 if (value := cls.get_package_field_value(package, field_name)) else ''
@@ -235,7 +245,45 @@ class PackageExportService:
         col_width = page_width / len(columns_config)
         col_widths = [col_width] * len(columns_config)
         
-        # Crear tabla
+        # Documentos grandes: tabla dibujada directo en el canvas y dividida
+        # por páginas en tiempo lineal, con el mismo formato
+        if len(table_data) - 1 > BaseManifestGenerator.LARGE_TABLE_ROWS:
+            table = StreamingTable(
+                headers,
+                [[str(value) for value in row] for row in table_data[1:]],
+                col_widths,
+                font_size=8,
+                leading=10,
+                header_font_size=10,
+                header_align='CENTER',
+                header_background=colors.grey,
+                header_text_color=colors.whitesmoke,
+                header_line_width=0,
+                grid_color=colors.grey,
+                row_backgrounds=[colors.white, colors.lightgrey],
+                top_padding=3,
+                bottom_padding=3,
+            )
+        else:
+            table = cls._build_table(table_data, col_widths)
+        
+        elements.append(table)
+        
+        # Construir PDF
+        doc.build(elements)
+        
+        # Preparar respuesta HTTP
+        buffer.seek(0)
+        filename = f"paquetes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        
+        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        
+        return response
+    
+    @staticmethod
+    def _build_table(table_data, col_widths):
+        """Tabla platypus para exportaciones pequeñas."""
         table = Table(table_data, colWidths=col_widths, repeatRows=1)
         
         # Estilo de tabla
@@ -258,16 +306,4 @@ class PackageExportService:
             ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
         ]))
         
-        elements.append(table)
-        
-        # Construir PDF
-        doc.build(elements)
-        
-        # Preparar respuesta HTTP
-        buffer.seek(0)
-        filename = f"paquetes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
+        return table
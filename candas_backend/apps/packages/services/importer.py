@@ -12,6 +12,7 @@ import openpyxl
 import csv
 import io
 
+from apps.shared.services.metrics import Metrics
 from ..models import Package, PackageImport
 from .normalizer import PackageDataNormalizer
 
@@ -284,6 +285,7 @@ class PackageImporter:
             return False, f"Error al validar archivo: {str(e)}"
     
     @staticmethod
+    @Metrics.timed_import
     def import_packages(
         file: "UploadedFile",
         selected_fields: list[str],
@@ -8,12 +8,9 @@ from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.units import inch, mm
 from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 from datetime import datetime
-import qrcode
-import barcode
-from barcode.writer import ImageWriter
-from PIL import Image
+from apps.shared.services.label_template import BaseLabelGenerator
+from apps.shared.services.zpl_template import BaseZPLGenerator
 
 
 class PackageLabelsGenerator:
@@ -119,38 +116,11 @@ class PackageLabelsGenerator:
         canvas_obj.drawString(content_x, current_y - 0.15*inch, guide_display)
         current_y -= 0.35*inch
         
-        # Generar código QR (solo con ID del paquete)
-        qr_data = str(package.id)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=1,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        # Convertir QR a imagen
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
-        
-        # Dibujar QR (centrado en la parte inferior)
+        # Dibujar QR vectorial (solo con ID del paquete), centrado en la parte inferior
         qr_size = 1.3 * inch
         qr_x = x + (PackageLabelsGenerator.LABEL_WIDTH - qr_size) / 2
         qr_y = y + 0.3 * inch
-        
-        # Usar ImageReader para leer el BytesIO
-        img_reader = ImageReader(qr_buffer)
-        canvas_obj.drawImage(
-            img_reader,
-            qr_x,
-            qr_y,
-            width=qr_size,
-            height=qr_size,
-            preserveAspectRatio=True
-        )
+        BaseLabelGenerator.draw_qr_code(canvas_obj, str(package.id), qr_x, qr_y, qr_size)
         
         # Texto bajo el QR
         canvas_obj.setFont("Helvetica", 7)
@@ -174,6 +144,21 @@ class PackageLabelsGenerator:
         """
         buffer = BytesIO()
         c = canvas.Canvas(buffer, pagesize=A4)
+        
+        PackageLabelsGenerator._draw_shipping_label(c, package)
+        
+        # Finalizar página
+        c.showPage()
+        c.save()
+        buffer.seek(0)
+        
+        return buffer
+    
+    @staticmethod
+    def _draw_shipping_label(c, package):
+        """
+        Dibuja la etiqueta de envío de un paquete en la página A4 actual.
+        """
         page_width, page_height = A4
         
         # Configuración de márgenes (más compactos)
@@ -205,60 +190,24 @@ class PackageLabelsGenerator:
         
         # ===== CÓDIGO DE BARRAS =====
         
-        # Generar código de barras Code128 del número de guía usando python-barcode
+        # Código de barras Code128 vectorial del número de guía (sin imágenes intermedias)
         try:
-            # Crear código de barras Code128 usando python-barcode
-            barcode_class = barcode.get_barcode_class('code128')
-            barcode_instance = barcode_class(guide_number, writer=ImageWriter())
-            
-            # Generar imagen del código de barras con mejor proporción
-            barcode_buffer = BytesIO()
-            barcode_instance.write(barcode_buffer, options={
-                'module_width': 0.35,  # Ancho de las barras (más fino)
-                'module_height': 20.0,  # Altura de las barras (más alto)
-                'quiet_zone': 2.5,  # Zona silenciosa alrededor
-                'font_size': 12,  # Tamaño de fuente para el texto
-                'text_distance': 4.0,  # Distancia del texto al código
-            })
-            barcode_buffer.seek(0)
-            
-            # Cargar la imagen del código de barras
-            barcode_image = Image.open(barcode_buffer)
-            
-            # Convertir a RGB si es necesario
-            if barcode_image.mode != 'RGB':
-                barcode_image = barcode_image.convert('RGB')
-            
-            # Guardar en un nuevo buffer para ReportLab
-            img_buffer = BytesIO()
-            barcode_image.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            
-            # Calcular dimensiones para el código de barras en el PDF
-            # Ancho máximo más amplio para mejor proporción
-            max_width = 100 * mm
-            img_width, img_height = barcode_image.size
-            aspect_ratio = img_height / img_width
-            pdf_width = min(max_width, img_width * 0.264583)  # Convertir pixels a mm
-            pdf_height = pdf_width * aspect_ratio
-            
-            # Centrar el código de barras
-            barcode_x = margin_left + (content_width - pdf_width) / 2
-            
-            # Dibujar código de barras en el canvas
-            img_reader = ImageReader(img_buffer)
-            c.drawImage(
-                img_reader,
-                barcode_x,
-                y_position - pdf_height,
-                width=pdf_width,
-                height=pdf_height,
-                preserveAspectRatio=True
+            bar_height = 20 * mm
+            barcode_width, barcode_height = BaseLabelGenerator.draw_code128(
+                c,
+                guide_number,
+                margin_left,
+                y_position - bar_height,
+                max_width=100 * mm,
+                bar_height=bar_height,
+                bar_width=0.35 * mm,
+                human_readable=True,
+                font_size=12,
             )
             
             # El número de guía ya está incluido en el código de barras (humanReadable)
             # Solo ajustar posición para el siguiente elemento
-            y_position -= (pdf_height + 12 * mm)
+            y_position -= (barcode_height + 12 * mm)
             
         except Exception as e:
             # Si falla el código de barras, mostrar solo el número
@@ -295,10 +244,71 @@ class PackageLabelsGenerator:
         text_width = c.stringWidth(phone, "Helvetica", 13)
         x_center = margin_left + (content_width - text_width) / 2
         c.drawString(x_center, y_position, phone)
+    
+    @staticmethod
+    def generate_zpl(package, package_number=1, total_packages=1):
+        """
+        Genera la etiqueta del paquete en ZPL para impresoras térmicas.
+        Mismo contenido que generate_pdf: numeración, destino, agencia, guía, QR.
         
-        # Finalizar página
-        c.showPage()
-        c.save()
-        buffer.seek(0)
+        Returns:
+            str: Etiqueta ZPL
+        """
+        effective_agency = package.get_shipping_agency()
+        return BaseZPLGenerator.standard_label(
+            f"{package_number}/{total_packages}",
+            package.get_effective_destiny(),
+            effective_agency.name if effective_agency else None,
+            package.get_shipping_guide_number(),
+            str(package.id),
+        )
+    
+    @staticmethod
+    def generate_packages_zpl(packages):
+        """
+        Genera en un solo stream ZPL las etiquetas de varios paquetes,
+        numeradas 1/N ... N/N.
         
-        return buffer
+        Args:
+            packages: Iterable o queryset de paquetes
+        
+        Returns:
+            str: Stream ZPL
+        """
+        packages = list(packages)
+        total = len(packages)
+        return ''.join(
+            PackageLabelsGenerator.generate_zpl(package, idx + 1, total)
+            for idx, package in enumerate(packages)
+        )
+    
+    @staticmethod
+    def generate_shipping_label_zpl(package):
+        """
+        Genera la etiqueta de envío en ZPL, con el mismo contenido que
+        generate_shipping_label_pdf y el Code128 nativo de la impresora.
+        
+        Returns:
+            str: Etiqueta ZPL
+        """
+        zpl = BaseZPLGenerator
+        guide_number = package.guide_number or str(package.id)[:13].upper()
+        recipient_name = package.name.upper() if package.name else "SIN NOMBRE"
+        phone = package.phone_number if package.phone_number else "-"
+        
+        # Ancho aproximado del Code128 (11 módulos por carácter + inicio,
+        # control y parada) para centrarlo y reducir el módulo si no cabe
+        modules = 11 * (len(guide_number) + 3) + 2
+        usable_width = zpl.LABEL_WIDTH - 2 * zpl.PADDING
+        module_width = max(1, min(3, usable_width // modules))
+        barcode_x = (zpl.LABEL_WIDTH - modules * module_width) // 2
+        
+        commands = [
+            zpl.centered_text(60, "MV SERVICES COURIER INC", 44),
+            zpl.centered_text(150, guide_number, 52),
+            zpl.code128(max(0, barcode_x), 240, guide_number, 160, module_width),
+            zpl.centered_text(500, f"{package.city} - Ecuador - {package.province}", 34),
+            zpl.centered_text(590, recipient_name, 40),
+            zpl.centered_text(670, phone, 34),
+        ]
+        return zpl.label(commands)
@@ -24,6 +24,17 @@ class PackageManifestGenerator:
         La nota debe estar resaltada.
         """
         doc, buffer = BaseManifestGenerator.create_document()
+        doc.build(PackageManifestGenerator.build_elements(package))
+        buffer.seek(0)
+        
+        return buffer
+    
+    @staticmethod
+    def build_elements(package):
+        """
+        Elementos (flowables) del manifiesto del paquete; permite combinar
+        varios manifiestos en un mismo documento.
+        """
         elements = []
         
         # Header de la empresa
@@ -88,11 +99,7 @@ class PackageManifestGenerator:
             note_box = BaseManifestGenerator.create_highlighted_box(package.notes)
             elements.append(note_box)
         
-        # Construir PDF
-        doc.build(elements)
-        buffer.seek(0)
-        
-        return buffer
+        return elements
     
     @staticmethod
     def generate_excel(package):
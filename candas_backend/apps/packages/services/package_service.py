@@ -1,6 +1,7 @@
 from django.utils import timezone
 from django.db import transaction
 from apps.packages.models import Package
+from apps.shared.services import ResponseCache
 
 
 class PackageService:
@@ -261,7 +262,8 @@ _Este es un mensaje automático. Para más información, contáctanos._"""
         Returns:
             int: Cantidad de paquetes actualizados
         """
-        count = Package.objects.filter(id__in=package_ids).update(transport_agency=agency)
+        count = Package.objects.filter(id__in=package_ids).update(transport_agency=agency, updated_at=timezone.now())
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
         return count
     
     @staticmethod
@@ -284,7 +286,8 @@ _Este es un mensaje automático. Para más información, contáctanos._"""
         if new_status not in valid_statuses:
             raise ValueError(f"Estado inválido: {new_status}")
         
-        count = Package.objects.filter(id__in=package_ids).update(status=new_status)
+        count = Package.objects.filter(id__in=package_ids).update(status=new_status, updated_at=timezone.now())
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
         return count
     
     @staticmethod
@@ -318,7 +321,8 @@ _Este es un mensaje automático. Para más información, contáctanos._"""
         Returns:
             int: Cantidad de paquetes actualizados
         """
-        count = Package.objects.filter(id__in=child_ids).update(parent=parent_package)
+        count = Package.objects.filter(id__in=child_ids).update(parent=parent_package, updated_at=timezone.now())
+        ResponseCache.invalidate(ResponseCache.PACKAGES)
         return count
 
 
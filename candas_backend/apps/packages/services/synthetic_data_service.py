@@ -0,0 +1,531 @@
+"""
+Generador de datos sintéticos con volúmenes y formas de producción
+(paquetes, agencias, sacas, lotes, despachos, jerarquías e historial de estados)
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from io import StringIO
+import csv
+import random
+import uuid
+
+from apps.catalog.models import Location, TransportAgency
+from apps.logistics.models import Batch, Dispatch, Pull
+from apps.packages.models import Package, PackageStatusHistory
+from apps.shared.services import ResponseCache
+from .normalizer import PackageDataNormalizer
+
+
+class _CopyBuffer:
+    """Filas pendientes de un modelo, cargadas con COPY ... FROM STDIN."""
+    
+    NULL = r'\N'
+    
+    def __init__(self, model, fields):
+        self.model = model
+        self.table = model._meta.db_table
+        self.columns = [model._meta.get_field(name).column for name in fields]
+        self.buffer = StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+        self.total = 0
+    
+    def add(self, row):
+        self.writer.writerow([self.NULL if value is None else value for value in row])
+        self.pending += 1
+    
+    def flush(self, cursor):
+        if not self.pending:
+            return
+        self.buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {self.table} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv, NULL '{self.NULL}')",
+            self.buffer
+        )
+        self.total += self.pending
+        self.pending = 0
+        self.buffer = StringIO()
+        self.writer = csv.writer(self.buffer)
+
+
+class SyntheticDataGenerator:
+    """
+    Genera datos sintéticos reproducibles (misma semilla y fecha final,
+    mismos datos) para medir rendimiento con formas de datos reales.
+    
+    Los paquetes se reparten por provincia según su población, con más
+    envíos entre semana. Cada día sus paquetes se reciben en bodega, se
+    despachan al día siguiente (individuales o en sacas por ciudad y agencia,
+    parte de ellas agrupadas en lotes) y se entregan unos días después,
+    dejando el historial de estados correspondiente.
+    
+    Las tablas grandes se cargan con COPY (PostgreSQL), que además conserva
+    las fechas históricas de created_at y changed_at (bulk_create las
+    reemplazaría por la fecha actual); los catálogos, con bulk_create.
+    """
+    
+    # Ciudades principales por provincia (las provincias son los valores de
+    # PackageDataNormalizer.PROVINCE_MAP); la primera ciudad es la capital
+    CITIES_BY_PROVINCE = {
+        'PICHINCHA': ['QUITO', 'SANGOLQUI', 'CAYAMBE', 'MACHACHI'],
+        'GUAYAS': ['GUAYAQUIL', 'DURAN', 'MILAGRO', 'DAULE', 'SAMBORONDON'],
+        'AZUAY': ['CUENCA', 'GUALACEO', 'PAUTE'],
+        'MANABÍ': ['PORTOVIEJO', 'MANTA', 'CHONE', 'JIPIJAPA'],
+        'EL ORO': ['MACHALA', 'PASAJE', 'SANTA ROSA', 'HUAQUILLAS'],
+        'LOS RÍOS': ['BABAHOYO', 'QUEVEDO', 'VENTANAS'],
+        'IMBABURA': ['IBARRA', 'OTAVALO', 'ATUNTAQUI'],
+        'COTOPAXI': ['LATACUNGA', 'SALCEDO', 'PUJILI'],
+        'TUNGURAHUA': ['AMBATO', 'BAÑOS', 'PELILEO'],
+        'CHIMBORAZO': ['RIOBAMBA', 'GUANO', 'ALAUSI'],
+        'ESMERALDAS': ['ESMERALDAS', 'ATACAMES', 'QUININDE'],
+        'CARCHI': ['TULCAN', 'SAN GABRIEL'],
+        'CAÑAR': ['AZOGUES', 'LA TRONCAL', 'CAÑAR'],
+        'LOJA': ['LOJA', 'CATAMAYO', 'MACARA'],
+        'SANTO DOMINGO DE LOS TSÁCHILAS': ['SANTO DOMINGO', 'LA CONCORDIA'],
+        'SANTA ELENA': ['SANTA ELENA', 'LA LIBERTAD', 'SALINAS'],
+        'BOLÍVAR': ['GUARANDA', 'SAN MIGUEL'],
+        'PASTAZA': ['PUYO'],
+        'MORONA SANTIAGO': ['MACAS', 'SUCUA'],
+        'NAPO': ['TENA', 'ARCHIDONA'],
+        'ZAMORA CHINCHIPE': ['ZAMORA', 'YANTZAZA'],
+        'SUCUMBÍOS': ['NUEVA LOJA', 'SHUSHUFINDI'],
+        'ORELLANA': ['FRANCISCO DE ORELLANA', 'LA JOYA DE LOS SACHAS'],
+        'GALÁPAGOS': ['PUERTO AYORA', 'PUERTO BAQUERIZO MORENO'],
+    }
+    
+    # Población aproximada en miles: peso de cada provincia como destino
+    PROVINCE_WEIGHTS = {
+        'PICHINCHA': 3200, 'GUAYAS': 4400, 'AZUAY': 880, 'MANABÍ': 1560,
+        'EL ORO': 720, 'LOS RÍOS': 920, 'IMBABURA': 470, 'COTOPAXI': 490,
+        'TUNGURAHUA': 560, 'CHIMBORAZO': 470, 'ESMERALDAS': 550, 'CARCHI': 170,
+        'CAÑAR': 230, 'LOJA': 490, 'SANTO DOMINGO DE LOS TSÁCHILAS': 460,
+        'SANTA ELENA': 390, 'BOLÍVAR': 200, 'PASTAZA': 110, 'MORONA SANTIAGO': 190,
+        'NAPO': 130, 'ZAMORA CHINCHIPE': 110, 'SUCUMBÍOS': 200, 'ORELLANA': 160,
+        'GALÁPAGOS': 30,
+    }
+    
+    AGENCY_NAMES = [
+        'SERVIENTREGA', 'TRAMACOEXPRESS', 'LAAR COURIER', 'URBANO EXPRESS',
+        'GINTRACOM', 'CORREOS DEL ECUADOR', 'VELOCES', 'TRANSPORTES NORIEGA',
+        'COOPERATIVA FLOTA IMBABURA', 'TRANSPORTES ECUADOR',
+    ]
+    
+    FIRST_NAMES = [
+        'MARIA', 'JOSE', 'LUIS', 'ANA', 'CARLOS', 'ROSA', 'JUAN', 'CARMEN', 'JORGE',
+        'GLORIA', 'MIGUEL', 'DIANA', 'FRANCISCO', 'PATRICIA', 'DAVID', 'ANDREA',
+        'SEGUNDO', 'MERCEDES', 'EDISON', 'JESSICA', 'FERNANDO', 'KARINA', 'WILSON',
+    ]
+    LAST_NAMES = [
+        'ZAMBRANO', 'CEDEÑO', 'VERA', 'MOREIRA', 'SANCHEZ', 'TORRES', 'GARCIA',
+        'VELEZ', 'MENDOZA', 'CHAVEZ', 'LOPEZ', 'MACIAS', 'RODRIGUEZ', 'GUERRERO',
+        'ORTIZ', 'PINCAY', 'QUISHPE', 'CAIZA', 'YEPEZ', 'TOAPANTA', 'ANDRADE',
+    ]
+    STREETS = [
+        'AV. 10 DE AGOSTO', 'AV. AMAZONAS', 'CALLE BOLIVAR', 'AV. 9 DE OCTUBRE',
+        'CALLE SUCRE', 'AV. SIMON BOLIVAR', 'CALLE ROCAFUERTE', 'AV. DE LAS AMERICAS',
+        'CALLE OLMEDO', 'AV. ELOY ALFARO', 'CALLE GARCIA MORENO', 'AV. QUITO',
+    ]
+    HASHTAGS = ['#urgente', '#fragil', '#express', '#voluminoso']
+    
+    # Formas de los datos
+    SHIPMENT_MIX = (('sin_asignar', 0.12), ('individual', 0.38), ('saca', 0.50))
+    WEEKDAY_WEIGHTS = (1.0, 1.0, 1.0, 1.0, 1.1, 0.5, 0.15)
+    PULL_SIZE = (15, 60)
+    BATCH_PULLS = (2, 5)
+    BATCH_PROBABILITY = 0.6
+    PARENT_PROBABILITY = 0.02
+    MAX_CHILDREN = 3
+    
+    def __init__(self, seed=1, prefix='SYN', batch_size=50000, stdout=None):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.tz = timezone.get_current_timezone()
+        self.status_names = dict(Package.STATUS_CHOICES)
+        
+        provinces = sorted(set(PackageDataNormalizer.PROVINCE_MAP.values()))
+        self.destinations = [
+            (city, province)
+            for province in provinces
+            for city in self.CITIES_BY_PROVINCE[province]
+        ]
+        # Dentro de la provincia, la capital recibe más que el resto
+        weights = [
+            self.PROVINCE_WEIGHTS[province] / (index + 1)
+            for province in provinces
+            for index, _ in enumerate(self.CITIES_BY_PROVINCE[province])
+        ]
+        self.destination_cum_weights = self._cumulative(weights)
+        
+        self.package_seq = 0
+        self.pull_seq = 0
+        self.batch_seq = 0
+    
+    @staticmethod
+    def _cumulative(weights):
+        total = 0
+        cumulative = []
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        return cumulative
+    
+    def _uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+    
+    def _at(self, day, start_hour=7, end_hour=19):
+        """Momento aleatorio del día entre start_hour y end_hour (hora local)."""
+        seconds = self.rng.randrange((end_hour - start_hour) * 3600)
+        moment = datetime.combine(day, time(start_hour)) + timedelta(seconds=seconds)
+        return timezone.make_aware(moment, self.tz)
+    
+    def _log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+    
+    # Catálogos
+    
+    def ensure_catalogs(self, agencies_count):
+        """
+        Crea (si faltan) las ubicaciones y agencias de transporte.
+        
+        Returns:
+            list: Tuplas (id, código) de las agencias, con su cuota de mercado
+                  como peso acumulado en self.agency_cum_weights
+        """
+        Location.objects.bulk_create(
+            [Location(city=city, province=province) for city, province in self.destinations],
+            ignore_conflicts=True
+        )
+        
+        names = self.AGENCY_NAMES[:agencies_count]
+        names += [f'AGENCIA {index + 1}' for index in range(len(names), agencies_count)]
+        TransportAgency.objects.bulk_create(
+            [
+                TransportAgency(name=name, phone_number=f'0{self.rng.randrange(20000000, 99999999)}')
+                for name in names
+            ],
+            ignore_conflicts=True
+        )
+        ids = dict(TransportAgency.objects.filter(name__in=names).values_list('name', 'id'))
+        
+        self.agencies = [(ids[name], ''.join(word[0] for word in name.split())[:3]) for name in names]
+        # Pocas agencias concentran la mayoría de los envíos
+        self.agency_cum_weights = self._cumulative([1 / (index + 1) for index in range(len(names))])
+        return self.agencies
+    
+    # Limpieza
+    
+    def flush(self):
+        """
+        Borra los datos generados antes con el mismo prefijo (paquetes con
+        guía {prefijo}..., sacas y lotes con guía {prefijo}-..., despachos con
+        notas {prefijo}).
+        
+        Returns:
+            int: Paquetes borrados
+        """
+        package_table = Package._meta.db_table
+        pattern = f'{self.prefix}%'
+        packages = f'SELECT id FROM {package_table} WHERE guide_number LIKE %s'
+        dispatch_pulls = Dispatch.pulls.through._meta.db_table
+        dispatch_packages = Dispatch.packages.through._meta.db_table
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {PackageStatusHistory._meta.db_table} WHERE package_id IN ({packages})',
+                [pattern]
+            )
+            cursor.execute(f'DELETE FROM {dispatch_packages} WHERE package_id IN ({packages})', [pattern])
+            cursor.execute(
+                f'DELETE FROM {dispatch_pulls} WHERE pull_id IN '
+                f'(SELECT id FROM {Pull._meta.db_table} WHERE guide_number LIKE %s)',
+                [f'{self.prefix}-%']
+            )
+            # Hijos antes que padres
+            cursor.execute(
+                f'DELETE FROM {package_table} WHERE guide_number LIKE %s AND parent_id IS NOT NULL',
+                [pattern]
+            )
+            deleted = cursor.rowcount
+            cursor.execute(f'DELETE FROM {package_table} WHERE guide_number LIKE %s', [pattern])
+            deleted += cursor.rowcount
+            cursor.execute(f'DELETE FROM {Pull._meta.db_table} WHERE guide_number LIKE %s', [f'{self.prefix}-%'])
+            cursor.execute(f'DELETE FROM {Batch._meta.db_table} WHERE guide_number LIKE %s', [f'{self.prefix}-%'])
+            cursor.execute(f'DELETE FROM {Dispatch._meta.db_table} WHERE notes = %s', [self.prefix])
+            # Los DELETE en SQL no disparan señales
+            ResponseCache.invalidate(ResponseCache.CATALOG, ResponseCache.PACKAGES)
+        return deleted
+    
+    # Generación
+    
+    def generate(self, packages, months, end_date=None, agencies=8):
+        """
+        Genera aproximadamente `packages` paquetes repartidos en los últimos
+        `months` meses hasta end_date (los hijos se suman a esa cantidad).
+        
+        Args:
+            packages (int): Cantidad de paquetes
+            months (int): Meses de historia
+            end_date (date): Último día generado (por defecto hoy)
+            agencies (int): Agencias de transporte
+        
+        Returns:
+            dict: Filas creadas por modelo
+        """
+        if connection.vendor != 'postgresql':
+            raise ValueError('La generación de datos sintéticos requiere PostgreSQL (COPY)')
+        
+        end_date = end_date or timezone.localdate()
+        start_date = end_date - timedelta(days=months * 30 - 1)
+        self.end_at = timezone.make_aware(datetime.combine(end_date, time.max), self.tz)
+        self.ensure_catalogs(agencies)
+        
+        self.buffers = {
+            'batches': _CopyBuffer(Batch, [
+                'id', 'destiny', 'transport_agency', 'guide_number',
+                'packages_count', 'pulls_count', 'created_at', 'updated_at',
+            ]),
+            'pulls': _CopyBuffer(Pull, [
+                'id', 'created_at', 'updated_at', 'common_destiny', 'size', 'batch',
+                'transport_agency', 'guide_number', 'packages_count',
+            ]),
+            'packages': _CopyBuffer(Package, [
+                'id', 'pull', 'transport_agency', 'parent', 'nro_master', 'guide_number',
+                'agency_guide_number', 'guide_history', 'status_history', 'notes_history',
+                'status', 'notes', 'hashtags', 'name', 'address', 'phone_number',
+                'city', 'province', 'created_at', 'updated_at',
+            ]),
+            'history': _CopyBuffer(PackageStatusHistory, [
+                'id', 'package', 'old_status', 'new_status', 'changed_at', 'notes',
+            ]),
+            'dispatches': _CopyBuffer(Dispatch, [
+                'id', 'dispatch_date', 'status', 'notes', 'created_at', 'updated_at',
+            ]),
+            'dispatch_pulls': _CopyBuffer(Dispatch.pulls.through, ['dispatch', 'pull']),
+            'dispatch_packages': _CopyBuffer(Dispatch.packages.through, ['dispatch', 'package']),
+        }
+        
+        days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        day_weights = [self.WEEKDAY_WEIGHTS[day.weekday()] for day in days]
+        total_weight = sum(day_weights)
+        
+        with transaction.atomic(), connection.cursor() as cursor:
+            remaining = packages
+            for index, day in enumerate(days):
+                if index == len(days) - 1:
+                    count = remaining
+                else:
+                    expected = packages * day_weights[index] / total_weight
+                    count = min(remaining, max(int(self.rng.gauss(expected, expected * 0.1)), 0))
+                remaining -= count
+                self._generate_day(day, count, end_date)
+                
+                if self.buffers['packages'].pending >= self.batch_size:
+                    self._flush(cursor)
+                    self._log(f'  {day}: {self.buffers["packages"].total} paquetes')
+            self._flush(cursor)
+            
+            # Estadísticas del planificador para las tablas recién cargadas
+            for buffer in self.buffers.values():
+                cursor.execute(f'ANALYZE {buffer.table}')
+            
+            # COPY y bulk_create no disparan señales
+            ResponseCache.invalidate(ResponseCache.CATALOG, ResponseCache.PACKAGES)
+        
+        return {name: buffer.total for name, buffer in self.buffers.items()}
+    
+    def _flush(self, cursor):
+        for buffer in self.buffers.values():
+            buffer.flush(cursor)
+    
+    def _generate_day(self, day, count, end_date):
+        """Paquetes creados en `day`, y sacas, lotes y despacho del día siguiente."""
+        dispatch_day = day + timedelta(days=1)
+        dispatched = dispatch_day <= end_date
+        dispatch_id = None
+        if dispatched:
+            dispatch_id = self._uuid()
+            created = self._at(dispatch_day, 6, 7)
+            self.buffers['dispatches'].add([
+                dispatch_id, dispatch_day,
+                'COMPLETADO' if dispatch_day < end_date else 'EN_CURSO',
+                self.prefix, created, created,
+            ])
+        
+        # (ciudad, provincia) -> paquetes que van en saca
+        pull_groups = {}
+        shipment_types = [kind for kind, _ in self.SHIPMENT_MIX]
+        shipment_weights = self._cumulative([share for _, share in self.SHIPMENT_MIX])
+        
+        for _ in range(count):
+            city, province = self.rng.choices(self.destinations, cum_weights=self.destination_cum_weights)[0]
+            shipment = self.rng.choices(shipment_types, cum_weights=shipment_weights)[0]
+            agency_id, agency_code = self.rng.choices(self.agencies, cum_weights=self.agency_cum_weights)[0]
+            package = self._new_package(day, city, province)
+            
+            if shipment == 'individual':
+                package['transport_agency'] = agency_id
+                package['agency_guide_number'] = f'{agency_code}{self.rng.randrange(10 ** 8, 10 ** 9)}'
+            
+            if shipment == 'sin_asignar' or not dispatched:
+                self._finish_package(package, None, dispatched=False)
+            elif shipment == 'individual':
+                self._finish_package(package, dispatch_day, dispatched=True)
+                self.buffers['dispatch_packages'].add([dispatch_id, package['id']])
+            else:
+                pull_groups.setdefault((city, province), []).append(package)
+        
+        # Las sacas de un destino viajan con una sola agencia ese día
+        for (city, _), group in pull_groups.items():
+            agency_id = self.rng.choices(self.agencies, cum_weights=self.agency_cum_weights)[0][0]
+            self._generate_pulls(group, city, agency_id, dispatch_day, dispatch_id)
+    
+    def _new_package(self, day, city, province):
+        self.package_seq += 1
+        first_name = self.rng.choice(self.FIRST_NAMES)
+        last_names = f'{self.rng.choice(self.LAST_NAMES)} {self.rng.choice(self.LAST_NAMES)}'
+        return {
+            'id': self._uuid(),
+            'pull': None,
+            'transport_agency': None,
+            'parent': None,
+            'nro_master': f'MST{self.rng.randrange(10 ** 6, 10 ** 7)}' if self.rng.random() < 0.1 else '',
+            'guide_number': f'{self.prefix}{self.package_seq:010d}',
+            'agency_guide_number': '',
+            'status': 'NO_RECEPTADO',
+            'hashtags': self.rng.choice(self.HASHTAGS) if self.rng.random() < 0.05 else '',
+            'name': f'{first_name} {last_names}',
+            'address': f'{self.rng.choice(self.STREETS)} Y {self.rng.choice(self.STREETS)} N{self.rng.randrange(1, 99)}-{self.rng.randrange(1, 200)}',
+            'phone_number': f'09{self.rng.randrange(10 ** 7, 10 ** 8)}',
+            'city': city,
+            'province': province,
+            'created_at': self._at(day),
+        }
+    
+    def _timeline(self, created_at, dispatch_day, dispatched):
+        """Transiciones (anterior, nuevo, momento) hasta el final del período."""
+        transitions = []
+        if not dispatched and self.rng.random() < 0.3:
+            return transitions
+        
+        received_at = created_at + timedelta(minutes=self.rng.randrange(30, 12 * 60))
+        transitions.append(('NO_RECEPTADO', 'EN_BODEGA', received_at))
+        if dispatched:
+            dispatched_at = max(self._at(dispatch_day, 8, 18), received_at + timedelta(minutes=5))
+            transitions.append(('EN_BODEGA', 'EN_TRANSITO', dispatched_at))
+            
+            outcome = self.rng.random()
+            final_status = 'ENTREGADO' if outcome < 0.93 else 'DEVUELTO' if outcome < 0.97 else 'RETENIDO'
+            finished_at = dispatched_at + timedelta(hours=self.rng.randrange(18, 4 * 24))
+            transitions.append(('EN_TRANSITO', final_status, finished_at))
+        
+        # Nada posterior al final del período (p. ej. paquetes del último día)
+        return [transition for transition in transitions if transition[2] <= self.end_at]
+    
+    def _finish_package(self, package, dispatch_day, dispatched):
+        """
+        Aplica la línea de tiempo y agrega el paquete (y sus hijos, que
+        comparten saca y agencia) a los buffers.
+        
+        Returns:
+            int: Paquetes agregados
+        """
+        transitions = self._timeline(package['created_at'], dispatch_day, dispatched)
+        self._add_package(package, transitions)
+        
+        children = 0
+        if self.rng.random() < self.PARENT_PROBABILITY:
+            children = self.rng.randint(1, self.MAX_CHILDREN)
+            for number in range(1, children + 1):
+                child = dict(
+                    package,
+                    id=self._uuid(),
+                    parent=package['id'],
+                    guide_number=f"{package['guide_number']}-H{number}",
+                    created_at=package['created_at'] + timedelta(minutes=number),
+                )
+                self._add_package(child, [
+                    (old, new, moment + timedelta(minutes=number))
+                    for old, new, moment in transitions
+                    if moment + timedelta(minutes=number) <= self.end_at
+                ])
+        return 1 + children
+    
+    def _add_package(self, package, transitions):
+        status = transitions[-1][1] if transitions else 'NO_RECEPTADO'
+        updated_at = transitions[-1][2] if transitions else package['created_at']
+        
+        # Mismo formato que las señales de Package (status_history)
+        history = [f"[{package['created_at'].astimezone(self.tz):%d/%m/%Y %H:%M}] No Receptado"]
+        for old_status, new_status, changed_at in transitions:
+            history.append(f'[{changed_at.astimezone(self.tz):%d/%m/%Y %H:%M}] {self.status_names[new_status]}')
+            self.buffers['history'].add([self._uuid(), package['id'], old_status, new_status, changed_at, ''])
+        
+        self.buffers['packages'].add([
+            package['id'], package['pull'], package['transport_agency'], package['parent'],
+            package['nro_master'], package['guide_number'], package['agency_guide_number'],
+            '', '\n'.join(history) + '\n', '', status, '', package['hashtags'],
+            package['name'], package['address'], package['phone_number'],
+            package['city'], package['province'], package['created_at'], updated_at,
+        ])
+    
+    def _generate_pulls(self, packages, city, agency_id, dispatch_day, dispatch_id):
+        """Reparte los paquetes en sacas y agrupa parte de las sacas en lotes."""
+        pulls = []
+        start = 0
+        while start < len(packages):
+            size = self.rng.randint(*self.PULL_SIZE)
+            pulls.append(packages[start:start + size])
+            start += size
+        
+        batches = []
+        if len(pulls) >= self.BATCH_PULLS[0] and self.rng.random() < self.BATCH_PROBABILITY:
+            start = 0
+            while len(pulls) - start >= self.BATCH_PULLS[0]:
+                size = self.rng.randint(*self.BATCH_PULLS)
+                batches.append(pulls[start:start + size])
+                start += size
+            loose = pulls[start:]
+        else:
+            loose = pulls
+        
+        for batch_pulls in batches:
+            self.batch_seq += 1
+            batch_id = self._uuid()
+            guide_number = f'{self.prefix}-L{self.batch_seq:08d}'
+            # Las sacas de un lote toman la guía del lote (Pull.save)
+            batch_packages = sum(
+                self._add_pull(group, city, agency_id, dispatch_day, dispatch_id, batch_id, guide_number)
+                for group in batch_pulls
+            )
+            created = self._at(dispatch_day, 6, 8)
+            self.buffers['batches'].add([
+                batch_id, city, agency_id, guide_number,
+                batch_packages, len(batch_pulls), created, created,
+            ])
+        
+        for group in loose:
+            self.pull_seq += 1
+            self._add_pull(group, city, agency_id, dispatch_day, dispatch_id, None, f'{self.prefix}-S{self.pull_seq:08d}')
+    
+    def _add_pull(self, packages, city, agency_id, dispatch_day, dispatch_id, batch_id, guide_number):
+        """
+        Returns:
+            int: Paquetes de la saca (incluidos los hijos)
+        """
+        pull_id = self._uuid()
+        count = 0
+        for package in packages:
+            package['pull'] = pull_id
+            count += self._finish_package(package, dispatch_day, dispatched=True)
+        
+        created = self._at(dispatch_day, 6, 8)
+        size = 'PEQUENO' if count < 25 else 'MEDIANO' if count < 45 else 'GRANDE'
+        self.buffers['pulls'].add([
+            pull_id, created, created, city, size, batch_id, agency_id, guide_number, count,
+        ])
+        self.buffers['dispatch_pulls'].add([dispatch_id, pull_id])
+        return count
@@ -0,0 +1,75 @@
+from django.test import TestCase
+
+from apps.logistics.models import Batch, Pull
+from apps.packages.models import Package, PackageStatusHistory
+
+
+def create_package(guide_number, **kwargs):
+    """Crea un paquete con los campos obligatorios."""
+    data = {
+        'guide_number': guide_number,
+        'name': f'CLIENTE {guide_number}',
+        'address': 'AV. AMAZONAS',
+        'phone_number': '0999999999',
+        'city': 'QUITO',
+        'province': 'PICHINCHA',
+    }
+    data.update(kwargs)
+    return Package.objects.create(**data)
+
+
+class PackageCounterTests(TestCase):
+    """Package.save() mantiene los contadores de su saca y lote."""
+    
+    def setUp(self):
+        self.batch = Batch.objects.create(destiny='QUITO')
+        self.pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=self.batch)
+        self.other = Pull.objects.create(common_destiny='QUITO', size='MEDIANO')
+    
+    def assertCounts(self, pull_count, other_count, batch_count):
+        self.pull.refresh_from_db()
+        self.other.refresh_from_db()
+        self.batch.refresh_from_db()
+        self.assertEqual(
+            (self.pull.packages_count, self.other.packages_count, self.batch.packages_count),
+            (pull_count, other_count, batch_count)
+        )
+    
+    def test_create_and_move_between_pulls(self):
+        package = create_package('G1', pull=self.pull)
+        self.assertCounts(1, 0, 1)
+        
+        package.pull = self.other
+        package.save()
+        self.assertCounts(0, 1, 0)
+    
+    def test_update_fields_with_field_name(self):
+        package = create_package('G1')
+        package.pull = self.pull
+        package.save(update_fields=['pull', 'updated_at'])
+        self.assertCounts(1, 0, 1)
+    
+    def test_update_fields_with_attname(self):
+        package = create_package('G1')
+        package.pull_id = self.pull.pk
+        package.save(update_fields=['pull_id'])
+        self.assertCounts(1, 0, 1)
+    
+    def test_update_fields_without_pull_keeps_counters(self):
+        package = create_package('G1', pull=self.pull)
+        package.status = 'EN_BODEGA'
+        package.save(update_fields=['status'])
+        self.assertCounts(1, 0, 1)
+    
+    def test_delete_decrements_counters(self):
+        package = create_package('G1', pull=self.pull)
+        package.delete()
+        self.assertCounts(0, 0, 0)
+    
+    def test_status_change_is_recorded(self):
+        package = create_package('G1')
+        package.status = 'EN_BODEGA'
+        package.save()
+        
+        change = PackageStatusHistory.objects.get(package=package)
+        self.assertEqual((change.old_status, change.new_status), ('NO_RECEPTADO', 'EN_BODEGA'))
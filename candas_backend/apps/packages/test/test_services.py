@@ -0,0 +1,111 @@
+from datetime import date, datetime, time
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import Count
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.logistics.models import Batch, Dispatch, Pull
+from apps.packages.models import Package, PackageStatusHistory
+from apps.packages.services import PackageService, SyntheticDataGenerator
+from apps.shared.services import ResponseCache
+
+
+END_DATE = date(2026, 3, 31)
+
+
+def generate(*args):
+    """Ejecuta generate_synthetic_data con una muestra pequeña."""
+    call_command(
+        'generate_synthetic_data', '--packages', '400', '--months', '1',
+        '--end-date', END_DATE.isoformat(), '--force', *args, stdout=StringIO()
+    )
+
+
+class SyntheticDataTests(TestCase):
+    """Comando generate_synthetic_data y SyntheticDataGenerator."""
+    
+    def snapshot(self):
+        return list(
+            Package.objects.order_by('guide_number').values_list(
+                'id', 'guide_number', 'city', 'status', 'pull_id', 'created_at'
+            )
+        )
+    
+    def test_generates_consistent_data(self):
+        generate('--seed', '3')
+        
+        packages = Package.objects.all()
+        self.assertGreaterEqual(packages.count(), 400)
+        self.assertFalse(packages.exclude(guide_number__startswith='SYN').exists())
+        self.assertTrue(Pull.objects.exists())
+        self.assertTrue(Dispatch.objects.exists())
+        
+        # Ninguna fecha posterior a la fecha final
+        end_at = timezone.make_aware(datetime.combine(END_DATE, time.max))
+        self.assertFalse(packages.filter(created_at__gt=end_at).exists())
+        self.assertFalse(PackageStatusHistory.objects.filter(changed_at__gt=end_at).exists())
+        
+        # Los contadores desnormalizados coinciden con las filas
+        pulls = Pull.objects.annotate(real=Count('packages'))
+        self.assertEqual([pull.packages_count for pull in pulls], [pull.real for pull in pulls])
+        batches = Batch.objects.annotate(real_pulls=Count('pulls'))
+        self.assertEqual([batch.pulls_count for batch in batches], [batch.real_pulls for batch in batches])
+        
+        # El estado de cada paquete es el último de su historial
+        for package in packages.exclude(status='NO_RECEPTADO')[:50]:
+            last = package.state_changes.order_by('-changed_at').first()
+            self.assertEqual(last.new_status, package.status)
+    
+    def test_same_seed_same_data(self):
+        generate('--seed', '7')
+        first = self.snapshot()
+        
+        generate('--seed', '7', '--flush')
+        self.assertEqual(self.snapshot(), first)
+        
+        generate('--seed', '8', '--flush')
+        self.assertNotEqual(self.snapshot(), first)
+    
+    def test_flush_only_removes_prefixed_rows(self):
+        own = Package.objects.create(
+            guide_number='REAL1', name='CLIENTE', address='AV. AMAZONAS',
+            phone_number='0999999999', city='QUITO', province='PICHINCHA',
+        )
+        generate('--prefix', 'TST')
+        
+        deleted = SyntheticDataGenerator(prefix='TST').flush()
+        
+        self.assertGreaterEqual(deleted, 400)
+        self.assertEqual(list(Package.objects.values_list('pk', flat=True)), [own.pk])
+        self.assertFalse(Pull.objects.exists())
+        self.assertFalse(Batch.objects.exists())
+        self.assertFalse(Dispatch.objects.exists())
+    
+    def test_requires_force_without_debug(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_synthetic_data', '--packages', '10', stdout=StringIO())
+        self.assertFalse(Package.objects.exists())
+
+
+class PackageServiceCacheTests(TestCase):
+    """Las escrituras en bloque de paquetes invalidan las respuestas de PACKAGES."""
+    
+    def test_merge_child_packages_invalidates(self):
+        parent, *children = [
+            Package.objects.create(
+                guide_number=f'GUIA{number}', name='CLIENTE', address='AV. AMAZONAS',
+                phone_number='0999999999', city='QUITO', province='PICHINCHA'
+            )
+            for number in range(3)
+        ]
+        key = ResponseCache._generation_key(ResponseCache.PACKAGES)
+        ResponseCache.get_cache().set(key, 0, timeout=None)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            count = PackageService.merge_child_packages(parent, [child.id for child in children])
+        
+        self.assertEqual(count, 2)
+        self.assertEqual(parent.children.count(), 2)
+        self.assertNotEqual(ResponseCache.get_cache().get(key), 0)
@@ -0,0 +1,190 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.catalog.models import TransportAgency
+from apps.logistics.models import Batch, Pull
+from apps.packages.api.views import PackageViewSet
+from apps.packages.models import Package
+from apps.packages.services import PackageService
+from apps.shared.services import QueryBudgetExceeded, assert_max_queries, capture_queries
+from apps.shared.services.query_budget import assert_within_budget
+
+
+def create_package(guide_number, **kwargs):
+    """Crea un paquete con los campos obligatorios."""
+    data = {
+        'guide_number': guide_number,
+        'name': f'CLIENTE {guide_number}',
+        'address': 'AV. AMAZONAS',
+        'phone_number': '0999999999',
+        'city': 'QUITO',
+        'province': 'PICHINCHA',
+    }
+    data.update(kwargs)
+    return Package.objects.create(**data)
+
+
+class QueryBudgetTestMixin:
+    """Cliente con sesión real: el presupuesto incluye las consultas de la sesión."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+    
+    def get_within_budget(self, url):
+        """GET que falla si la vista supera su query_budget; retorna las consultas."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.query_budget)
+        assert_within_budget(response)
+        return response.query_stats.count
+
+
+class PackageQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """PackageViewSet respeta su query_budget sin importar el volumen."""
+    
+    def add_packages(self, prefix, count):
+        """Paquetes de cada tipo: en lote (con hijo), en saca e individuales."""
+        for number in range(count):
+            agency = TransportAgency.objects.create(name=f'AGENCIA {prefix}{number}', phone_number='022222222')
+            batch = Batch.objects.create(destiny='QUITO', transport_agency=agency, guide_number=f'L{prefix}{number}')
+            pull = Pull.objects.create(common_destiny='QUITO', size='MEDIANO', batch=batch)
+            loose_pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO', transport_agency=agency)
+            parent = create_package(f'P{prefix}{number}', pull=pull)
+            create_package(f'C{prefix}{number}', parent=parent, transport_agency=agency)
+            create_package(f'S{prefix}{number}', pull=loose_pull)
+            create_package(f'I{prefix}{number}', transport_agency=agency)
+    
+    def test_list_does_not_grow_with_packages(self):
+        self.add_packages('A', 2)
+        queries = self.get_within_budget('/api/v1/packages/')
+        
+        self.add_packages('B', 4)
+        self.assertEqual(self.get_within_budget('/api/v1/packages/'), queries)
+    
+    def test_retrieve_within_budget(self):
+        self.add_packages('A', 3)
+        for guide_number in ('PA0', 'CA0', 'SA0', 'IA0'):
+            with self.subTest(guide_number=guide_number):
+                package = Package.objects.get(guide_number=guide_number)
+                self.get_within_budget(f'/api/v1/packages/{package.pk}/')
+    
+    def test_statistics_within_budget(self):
+        self.add_packages('A', 3)
+        self.get_within_budget('/api/v1/packages/statistics/')
+
+
+class QueryBudgetMiddlewareTests(QueryBudgetTestMixin, TestCase):
+    """Server-Timing, QUERY_BUDGET_RAISE y los helpers de pruebas."""
+    
+    def test_server_timing_header(self):
+        response = self.client.get('/api/v1/packages/')
+        
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn(f'"{response.query_stats.count} queries"', response['Server-Timing'])
+        self.assertEqual(response.query_stats.label, 'PackageViewSet.list')
+    
+    def test_raise_when_over_budget(self):
+        with patch.object(PackageViewSet, 'query_budget', {'list': 1}), \
+                override_settings(QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/v1/packages/')
+    
+    def test_assert_max_queries(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_max_queries(1):
+                list(Package.objects.all())
+                list(Pull.objects.all())
+    
+    def test_repeated_queries_are_grouped(self):
+        packages = [create_package(f'IND{number}') for number in range(3)]
+        
+        with capture_queries('n+1') as stats:
+            for package in packages:
+                Package.objects.get(pk=package.pk)
+        
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.duplicates[0][1], 3)
+
+
+class PackageETagTests(TestCase):
+    """GET condicional del listado y el detalle de paquetes."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.packages = [create_package(f'GUIA{number}') for number in range(3)]
+    
+    def assert_revalidates(self, url):
+        """Primer GET con ETag y 304 al repetirlo sin cambios; retorna el ETag."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], etag)
+        return etag
+    
+    def test_list_not_modified(self):
+        self.assert_revalidates('/api/v1/packages/')
+    
+    def test_list_changes_after_bulk_update(self):
+        etag = self.assert_revalidates('/api/v1/packages/')
+        
+        PackageService.bulk_update_status([package.id for package in self.packages], 'EN_BODEGA')
+        response = self.client.get('/api/v1/packages/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual({item['status'] for item in response.json()['results']}, {'EN_BODEGA'})
+    
+    def test_unpaginated_list(self):
+        with patch.object(PackageViewSet, 'pagination_class', None):
+            etag = self.assert_revalidates('/api/v1/packages/')
+            
+            PackageService.bulk_update_status([self.packages[0].id], 'EN_BODEGA')
+            response = self.client.get('/api/v1/packages/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_detail_not_modified(self):
+        url = f'/api/v1/packages/{self.packages[0].pk}/'
+        etag = self.assert_revalidates(url)
+        
+        PackageService.bulk_assign_to_agency(
+            [self.packages[0].id], TransportAgency.objects.create(name='SERVIENTREGA', phone_number='022222222')
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_deeply_nested_detail(self):
+        # Cadena de cinco niveles: la raíz queda fuera de las uniones de la primera consulta
+        chain = [create_package('RAIZ')]
+        for level in range(4):
+            chain.append(create_package(f'NIVEL{level}', parent=chain[-1]))
+        url = f'/api/v1/packages/{chain[-1].pk}/'
+        etag = self.assert_revalidates(url)
+        
+        # Solo cambia la raíz (su nombre aparece en root_parent_info)
+        Package.objects.filter(pk=chain[0].pk).update(name='OTRO CLIENTE', updated_at=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['root_parent_info']['name'], 'OTRO CLIENTE')
+        etag = self.assert_revalidates(url)
+        
+        # Mover un ancestro intermedio a otra raíz
+        other_root = create_package('OTRA RAIZ')
+        PackageService.merge_child_packages(other_root, [chain[1].pk])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['root_parent_info']['guide_number'], 'OTRA RAIZ')
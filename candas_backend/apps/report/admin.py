@@ -67,6 +67,7 @@ class ReportAdmin(admin.ModelAdmin):
             'fields': (
                 'pdf_file',
                 'excel_file',
+                'json_file',
             )
         }),
         ('Metadata', {
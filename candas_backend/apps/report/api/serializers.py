@@ -178,6 +178,33 @@ class GenerateMonthlyReportSerializer(serializers.Serializer):
         return attrs
 
 
+def _validate_schedule_config(serializer, attrs):
+    """
+    Valida config de una programación con ScheduleService.validate_config.
+    
+    En actualizaciones parciales, los campos ausentes se toman de la instancia.
+    
+    Args:
+        serializer (Serializer): Serializer de la programación
+        attrs (dict): Datos validados
+    
+    Returns:
+        dict: attrs con config normalizado
+    """
+    from apps.report.services import ScheduleService
+    
+    instance = serializer.instance
+    frequency = attrs.get('frequency', getattr(instance, 'frequency', 'DAILY'))
+    report_type = attrs.get('report_type', getattr(instance, 'report_type', None))
+    config = attrs.get('config', getattr(instance, 'config', None))
+    
+    try:
+        attrs['config'] = ScheduleService.validate_config(frequency, config, report_type)
+    except ValueError as e:
+        raise serializers.ValidationError({'config': str(e)})
+    return attrs
+
+
 class ReportScheduleSerializer(serializers.ModelSerializer):
     """Serializer para reportes programados."""
     
@@ -201,10 +228,19 @@ class ReportScheduleSerializer(serializers.ModelSerializer):
             'last_run',
             'next_run',
             'recipients',
+            'last_file',
+            'last_error',
             'created_at',
             'updated_at',
         ]
-        read_only_fields = ['id', 'user', 'last_run', 'next_run', 'created_at', 'updated_at']
+        read_only_fields = [
+            'id', 'user', 'last_run', 'next_run', 'last_file', 'last_error',
+            'created_at', 'updated_at',
+        ]
+    
+    def validate(self, attrs):
+        """Valida config según la frecuencia y el tipo de reporte."""
+        return _validate_schedule_config(self, attrs)
     
     def create(self, validated_data):
         """Asigna el usuario actual al crear."""
@@ -237,6 +273,10 @@ class ReportScheduleCreateSerializer(serializers.ModelSerializer):
         
         return value
     
+    def validate(self, attrs):
+        """Valida config según la frecuencia y el tipo de reporte."""
+        return _validate_schedule_config(self, attrs)
+    
     def create(self, validated_data):
         """Asigna el usuario actual y calcula next_run."""
         from django.utils import timezone
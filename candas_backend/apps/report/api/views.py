@@ -19,6 +19,8 @@ from apps.report.services import ReportGenerator as ReportGeneratorService
 from apps.report.services.pdf_exporter import PDFExporter
 from apps.report.services.excel_exporter import ExcelExporter
 from apps.report.services.daily_report_service import DailyReportService
+from apps.report.services.period_report_service import PeriodReportService
+from apps.report.services.single_flight import ReportSingleFlight, ReportInProgress
 from apps.report.tasks import generate_report_files
 from django.core.files.base import ContentFile
 from datetime import datetime
@@ -47,13 +49,25 @@ class ReportViewSet(viewsets.ModelViewSet):
     - regenerate_files: Regenera los archivos PDF y Excel
     """
     
-    queryset = Report.objects.all()
+    queryset = Report.objects.select_related('generated_by')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
     filterset_fields = ['report_type', 'status', 'is_automatic']
     ordering_fields = ['report_date', 'created_at', 'updated_at']
     ordering = ['-report_date', '-created_at']
     search_fields = ['error_message']
+    # Máximo de consultas SQL por acción (QueryBudgetMiddleware)
+    query_budget = {
+        'list': 7,
+        'retrieve': 8,
+    }
+    
+    def get_queryset(self):
+        """El detalle incluye los ReportDetail con su agencia."""
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('details__transport_agency')
+        return queryset
     
     def get_serializer_class(self):
         """Retorna el serializer apropiado según la acción."""
@@ -106,12 +120,16 @@ class ReportViewSet(viewsets.ModelViewSet):
         generate_files_flag = serializer.validated_data.get('generate_files', True)
         
         try:
-            # Generar informe
-            generator = ReportGenerator(user=request.user)
-            report = generator.generate_daily_report(report_date)
+            # Informe diario de despachos (una sola generación a la vez por fecha)
+            with ReportSingleFlight.request_wait():
+                report, attached = ReportSingleFlight.generate(
+                    'DAILY_DISPATCH',
+                    report_date,
+                    lambda: DailyReportService.generate_dispatch_report(report_date, user=request.user)
+                )
             
             # Generar archivos si se solicita
-            if generate_files_flag and report.status == 'COMPLETED':
+            if generate_files_flag and report.status == 'COMPLETED' and not attached:
                 # Ejecutar generación de archivos de forma asíncrona
                 generate_report_files.delay(str(report.id))
             
@@ -126,6 +144,11 @@ class ReportViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_201_CREATED
             )
             
+        except ReportInProgress as e:
+            return Response(
+                {'detail': str(e)},
+                status=status.HTTP_409_CONFLICT
+            )
         except Exception as e:
             logger.error(f"Error generando informe diario: {str(e)}")
             return Response(
@@ -153,12 +176,17 @@ class ReportViewSet(viewsets.ModelViewSet):
         generate_files_flag = serializer.validated_data.get('generate_files', True)
         
         try:
-            # Generar informe
-            generator = ReportGenerator(user=request.user)
-            report = generator.generate_monthly_report(year, month)
+            # Generar informe a partir de los informes diarios del mes
+            # (una sola generación a la vez por mes)
+            with ReportSingleFlight.request_wait():
+                report, attached = ReportSingleFlight.generate(
+                    'MONTHLY',
+                    PeriodReportService.get_month_range(year, month)[0],
+                    lambda: PeriodReportService.generate_monthly_report(year, month, user=request.user)
+                )
             
             # Generar archivos si se solicita
-            if generate_files_flag and report.status == 'COMPLETED':
+            if generate_files_flag and report.status == 'COMPLETED' and not attached:
                 # Ejecutar generación de archivos de forma asíncrona
                 generate_report_files.delay(str(report.id))
             
@@ -173,6 +201,11 @@ class ReportViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_201_CREATED
             )
             
+        except ReportInProgress as e:
+            return Response(
+                {'detail': str(e)},
+                status=status.HTTP_409_CONFLICT
+            )
         except Exception as e:
             logger.error(f"Error generando informe mensual: {str(e)}")
             return Response(
@@ -236,22 +269,38 @@ class ReportViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def download_json(self, request, pk=None):
-        """Descarga los datos JSON del informe."""
+        """
+        Descarga los datos JSON del informe.
+        
+        Se transmiten desde el archivo guardado: comprimidos tal cual si el
+        cliente acepta gzip, o descomprimidos a medida que se envían.
+        """
+        import gzip
+        from django.http import StreamingHttpResponse
+        from django.utils.cache import patch_vary_headers
+        
         report = self.get_object()
         
-        if not report.json_data:
+        if not report.json_file:
             return Response(
                 {'detail': 'Este informe no tiene datos JSON generados.'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
         try:
-            import json
+            stored = report.json_file.open('rb')
             
-            response = HttpResponse(
-                json.dumps(report.json_data, indent=2, ensure_ascii=False),
-                content_type='application/json'
-            )
+            if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+                response = FileResponse(stored, content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                def chunks():
+                    with stored, gzip.GzipFile(fileobj=stored) as data:
+                        while chunk := data.read(FileResponse.block_size):
+                            yield chunk
+                
+                response = StreamingHttpResponse(chunks(), content_type='application/json')
+            patch_vary_headers(response, ('Accept-Encoding',))
             filename = f"{report.get_filename_base()}.json"
             response['Content-Disposition'] = f'attachment; filename="{filename}"'
             return response
@@ -265,7 +314,12 @@ class ReportViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def regenerate_files(self, request, pk=None):
-        """Regenera los archivos PDF y Excel del informe."""
+        """
+        Regenera los archivos PDF y Excel del informe.
+        
+        Si los archivos ya se están generando, las subtareas de este pedido
+        esperan a que terminen y reutilizan esos archivos.
+        """
         report = self.get_object()
         
         if report.status != 'COMPLETED':
@@ -306,13 +360,30 @@ class ReportViewSet(viewsets.ModelViewSet):
                 "transport_agency": "uuid",
                 "shipment_type": "individual|saca|lote"
             },
-            "format": "json|excel|pdf|csv"
+            "format": "json|ndjson|excel|pdf|csv",
+            "cursor": "next_cursor de la página anterior (opcional, solo json)",
+            "page_size": 500 (opcional, solo json)
         }
+        
+        Con cursor o page_size el JSON se pagina y la respuesta incluye
+        next_cursor (null en la última página). 'ndjson' transmite el reporte
+        completo, un paquete por línea.
         """
         from datetime import datetime
         
         filters = request.data.get('filters', {})
         export_format = request.data.get('format', 'json')
+        cursor = request.data.get('cursor')
+        page_size = request.data.get('page_size')
+        
+        if page_size is not None:
+            try:
+                page_size = int(page_size)
+            except (TypeError, ValueError):
+                return Response(
+                    {'detail': 'page_size debe ser un número entero'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         # Convertir fechas string a objetos date/datetime
         if filters.get('date_from'):
@@ -323,14 +394,21 @@ class ReportViewSet(viewsets.ModelViewSet):
         # No necesitamos convertirlo aquí porque el servicio lo maneja
         
         try:
-            result = ReportGeneratorService.generate_packages_report(filters, export_format)
+            result = ReportGeneratorService.generate_packages_report(
+                filters, export_format, cursor=cursor, page_size=page_size
+            )
             
             if export_format == 'json':
                 return Response(result, status=status.HTTP_200_OK)
             else:
-                # Para Excel, PDF, CSV devuelve HttpResponse directamente
+                # Para NDJSON, Excel, PDF, CSV devuelve HttpResponse directamente
                 return result
                 
+        except ValueError as e:
+            return Response(
+                {'detail': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             logger.error(f"Error generando reporte de paquetes: {str(e)}")
             return Response(
@@ -443,6 +521,82 @@ class ReportViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'], url_path='range-report')
+    def range_report(self, request):
+        """
+        Informe de un rango arbitrario (p. ej. lo que va del año) armado con
+        los informes diarios guardados; solo se recalculan los días faltantes
+        o desactualizados.
+        
+        Si faltan más de REPORT_RANGE_SYNC_MAX_DAYS días, se encolan (un
+        subtask por día) y se responde 202 con los días pendientes; al
+        repetir la petición cuando terminen se obtiene el informe.
+        
+        Body:
+        {
+            "date_from": "2024-01-01",
+            "date_to": "2024-06-30",
+            "type": "dispatch"  // dispatch | reception
+        }
+        """
+        date_from_str = request.data.get('date_from')
+        date_to_str = request.data.get('date_to')
+        
+        if not date_from_str or not date_to_str:
+            return Response(
+                {'detail': 'date_from y date_to son requeridos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        report_type = {
+            'dispatch': 'DAILY_DISPATCH',
+            'reception': 'DAILY_RECEPTION',
+        }.get(request.data.get('type', 'dispatch'))
+        if report_type is None:
+            return Response(
+                {'detail': 'type debe ser dispatch o reception'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            date_from = datetime.fromisoformat(date_from_str.replace('Z', '+00:00')).date()
+            date_to = datetime.fromisoformat(date_to_str.replace('Z', '+00:00')).date()
+            PeriodReportService.validate_range(date_from, date_to, report_type)
+            
+            # Muchos días por calcular: no se hacen dentro de la petición
+            pending = [day for day, _ in PeriodReportService.get_pending_days(report_type, date_from, date_to)]
+            if len(pending) > PeriodReportService.get_sync_max_days():
+                result = PeriodReportService.submit_pending_days(report_type, pending)
+                return Response(
+                    {
+                        'detail': 'Calculando los informes diarios del rango; repita la petición más tarde',
+                        'task_id': result.id,
+                        'pending_days': [str(day) for day in pending],
+                    },
+                    status=status.HTTP_202_ACCEPTED
+                )
+            
+            with ReportSingleFlight.request_wait():
+                result = PeriodReportService.get_range_data(date_from, date_to, report_type)
+            return Response(result, status=status.HTTP_200_OK)
+        
+        except ReportInProgress as e:
+            return Response(
+                {'detail': str(e)},
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValueError as e:
+            return Response(
+                {'detail': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f"Error generando informe de rango: {str(e)}")
+            return Response(
+                {'detail': f'Error generando informe: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
     @action(detail=False, methods=['get'])
     def chart_data(self, request):
         """
@@ -539,6 +693,8 @@ class ReportViewSet(viewsets.ModelViewSet):
         
         Body params:
             - report_date: Fecha del reporte (formato: YYYY-MM-DD)
+            - refresh: Si ya existe, sumar solo los cambios desde la última
+              corrida (útil para el reporte "de hoy hasta ahora")
         
         Returns:
             Report: Reporte generado
@@ -552,6 +708,7 @@ class ReportViewSet(viewsets.ModelViewSet):
                 )
             
             report_date = datetime.strptime(report_date_str, '%Y-%m-%d').date()
+            refresh = str(request.data.get('refresh', '')).lower() in ('true', '1', 'yes')
             
             # Verificar si ya existe
             existing = Report.objects.filter(
@@ -559,20 +716,36 @@ class ReportViewSet(viewsets.ModelViewSet):
                 report_date=report_date
             ).first()
             
-            if existing:
+            if existing and not refresh:
                 return Response({
                     'message': 'Ya existe un reporte de despachos para esta fecha',
                     'report': ReportSerializer(existing).data
                 }, status=status.HTTP_200_OK)
             
-            # Generar reporte
-            report = DailyReportService.generate_dispatch_report(
-                report_date,
-                user=request.user
-            )
+            # Generar (o actualizar) reporte; si ya se está generando en otra
+            # petición o tarea, se espera y se retorna ese mismo reporte
+            previous_update = existing.updated_at if existing else None
+            with ReportSingleFlight.request_wait():
+                report, attached = ReportSingleFlight.generate(
+                    'DAILY_DISPATCH',
+                    report_date,
+                    lambda: DailyReportService.generate_dispatch_report(
+                        report_date,
+                        user=request.user,
+                        incremental=refresh
+                    )
+                )
+            
+            # Generar archivos PDF y Excel en background (la generación a la
+            # que se unió esta petición ya los encoló)
+            if not attached and report.updated_at != previous_update:
+                generate_report_files.delay(str(report.id))
             
-            # Generar archivos PDF y Excel en background
-            generate_report_files.delay(str(report.id))
+            if existing or attached:
+                return Response({
+                    'message': 'Reporte de despachos actualizado',
+                    'report': ReportSerializer(report).data
+                }, status=status.HTTP_200_OK)
             
             logger.info(f"Reporte de despachos generado para {report_date} por {request.user}")
             
@@ -581,6 +754,11 @@ class ReportViewSet(viewsets.ModelViewSet):
                 'report': ReportSerializer(report).data
             }, status=status.HTTP_201_CREATED)
             
+        except ReportInProgress as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_409_CONFLICT
+            )
         except ValueError as e:
             return Response(
                 {'error': f'Formato de fecha inválido. Use YYYY-MM-DD'},
@@ -600,6 +778,8 @@ class ReportViewSet(viewsets.ModelViewSet):
         
         Body params:
             - report_date: Fecha del reporte (formato: YYYY-MM-DD)
+            - refresh: Si ya existe, sumar solo los cambios desde la última
+              corrida (útil para el reporte "de hoy hasta ahora")
         
         Returns:
             Report: Reporte generado
@@ -613,6 +793,7 @@ class ReportViewSet(viewsets.ModelViewSet):
                 )
             
             report_date = datetime.strptime(report_date_str, '%Y-%m-%d').date()
+            refresh = str(request.data.get('refresh', '')).lower() in ('true', '1', 'yes')
             
             # Verificar si ya existe
             existing = Report.objects.filter(
@@ -620,20 +801,36 @@ class ReportViewSet(viewsets.ModelViewSet):
                 report_date=report_date
             ).first()
             
-            if existing:
+            if existing and not refresh:
                 return Response({
                     'message': 'Ya existe un reporte de recepciones para esta fecha',
                     'report': ReportSerializer(existing).data
                 }, status=status.HTTP_200_OK)
             
-            # Generar reporte
-            report = DailyReportService.generate_reception_report(
-                report_date,
-                user=request.user
-            )
+            # Generar (o actualizar) reporte; si ya se está generando en otra
+            # petición o tarea, se espera y se retorna ese mismo reporte
+            previous_update = existing.updated_at if existing else None
+            with ReportSingleFlight.request_wait():
+                report, attached = ReportSingleFlight.generate(
+                    'DAILY_RECEPTION',
+                    report_date,
+                    lambda: DailyReportService.generate_reception_report(
+                        report_date,
+                        user=request.user,
+                        incremental=refresh
+                    )
+                )
+            
+            # Generar archivos PDF y Excel en background (la generación a la
+            # que se unió esta petición ya los encoló)
+            if not attached and report.updated_at != previous_update:
+                generate_report_files.delay(str(report.id))
             
-            # Generar archivos PDF y Excel en background
-            generate_report_files.delay(str(report.id))
+            if existing or attached:
+                return Response({
+                    'message': 'Reporte de recepciones actualizado',
+                    'report': ReportSerializer(report).data
+                }, status=status.HTTP_200_OK)
             
             logger.info(f"Reporte de recepciones generado para {report_date} por {request.user}")
             
@@ -642,6 +839,11 @@ class ReportViewSet(viewsets.ModelViewSet):
                 'report': ReportSerializer(report).data
             }, status=status.HTTP_201_CREATED)
             
+        except ReportInProgress as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_409_CONFLICT
+            )
         except ValueError as e:
             return Response(
                 {'error': f'Formato de fecha inválido. Use YYYY-MM-DD'},
@@ -73,92 +73,36 @@ class ReportScheduleViewSet(viewsets.ModelViewSet):
         
         POST /api/v1/report-schedules/{id}/run_now/
         
-        Genera el reporte según la configuración actual de la programación,
-        sin esperar al next_run.
+        Encola la generación del reporte según la configuración actual de la
+        programación (último período completo), sin esperar al next_run ni
+        modificarlo. El archivo queda en last_file al terminar.
         """
-        from apps.report.services import ReportGenerator
+        from apps.report.tasks import run_report_schedule_task
         from django.utils import timezone
         
         schedule = self.get_object()
         
+        if schedule.report_type not in ('packages', 'statistics', 'agencies', 'destinations'):
+            return Response(
+                {'error': 'Tipo de reporte no soportado'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
-            # Determinar el tipo de reporte a generar
-            report_type_map = {
-                'packages': 'packages_report',
-                'statistics': 'statistics_report',
-                'agencies': 'agencies_performance',
-                'destinations': 'destinations_report',
-            }
-            
-            report_method = report_type_map.get(schedule.report_type)
-            
-            if not report_method:
-                return Response(
-                    {'error': 'Tipo de reporte no soportado'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Obtener configuración (filtros, formato, etc.)
-            config = schedule.config or {}
-            
-            # Generar el reporte
-            from datetime import datetime, timedelta
-            
-            # Por defecto, reporte del día actual
-            end_date = timezone.now().date()
-            start_date = end_date
-            
-            if schedule.frequency == 'MONTHLY':
-                # Para mensuales, último mes completo
-                start_date = end_date.replace(day=1)
-                next_month = start_date + timedelta(days=32)
-                end_date = next_month.replace(day=1) - timedelta(days=1)
-            elif schedule.frequency == 'WEEKLY':
-                # Para semanales, últimos 7 días
-                start_date = end_date - timedelta(days=7)
-            
-            # Agregar fechas a la config
-            config['start_date'] = start_date.isoformat()
-            config['end_date'] = end_date.isoformat()
-            
-            # Generar reporte según tipo
-            generator = ReportGenerator()
-            
-            if report_method == 'packages_report':
-                result = generator.generate_packages_report(
-                    start_date=start_date,
-                    end_date=end_date,
-                    format='json',
-                    **config
-                )
-            elif report_method == 'statistics_report':
-                result = generator.generate_statistics_report(
-                    start_date=start_date,
-                    end_date=end_date,
-                    format='json'
-                )
-            elif report_method == 'agencies_performance':
-                result = generator.generate_agencies_performance(
-                    start_date=start_date,
-                    end_date=end_date,
-                    format='json'
-                )
-            elif report_method == 'destinations_report':
-                result = generator.generate_destinations_report(
-                    start_date=start_date,
-                    end_date=end_date,
-                    format='json'
-                )
+            task = run_report_schedule_task.delay(
+                str(schedule.id),
+                timezone.localdate().isoformat()
+            )
             
             # Actualizar last_run
             schedule.last_run = timezone.now()
             schedule.save(update_fields=['last_run'])
             
             return Response({
-                'message': 'Reporte generado exitosamente',
-                'data': result,
+                'message': 'Generación del reporte iniciada',
+                'task_id': task.id,
                 'schedule_updated': True
-            })
+            }, status=status.HTTP_202_ACCEPTED)
             
         except Exception as e:
             return Response(
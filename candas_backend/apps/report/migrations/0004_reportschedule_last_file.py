@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0003_alter_report_report_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportschedule',
+            name='last_error',
+            field=models.TextField(blank=True, verbose_name='Último Error'),
+        ),
+        migrations.AddField(
+            model_name='reportschedule',
+            name='last_file',
+            field=models.FileField(blank=True, help_text='Resultado de la última ejecución', null=True, upload_to='reports/schedules/%Y/%m/', verbose_name='Último Archivo'),
+        ),
+        migrations.AddIndex(
+            model_name='reportschedule',
+            index=models.Index(fields=['active', 'next_run'], name='report_repo_active_59a6b2_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:48
+
+import gzip
+import json
+
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+
+def move_json_to_files(apps, schema_editor):
+    """Comprime el json_data de cada informe existente en su json_file."""
+    Report = apps.get_model('report', 'Report')
+
+    for report in Report.objects.exclude(json_data__isnull=True).only(
+        'id', 'report_type', 'report_date', 'json_data'
+    ).iterator(chunk_size=100):
+        content = json.dumps(report.json_data, ensure_ascii=False, cls=DjangoJSONEncoder)
+        filename = f"{report.report_type.lower()}_{report.report_date.strftime('%Y%m%d')}.json.gz"
+        report.json_file.save(filename, ContentFile(gzip.compress(content.encode('utf-8'))), save=False)
+        Report.objects.filter(pk=report.pk).update(json_file=report.json_file.name)
+
+
+def move_files_to_json(apps, schema_editor):
+    """Vuelve a cargar los archivos en json_data."""
+    Report = apps.get_model('report', 'Report')
+
+    for report in Report.objects.exclude(json_file='').exclude(json_file__isnull=True).iterator(chunk_size=100):
+        with report.json_file.open('rb') as stored:
+            with gzip.GzipFile(fileobj=stored) as data:
+                Report.objects.filter(pk=report.pk).update(json_data=json.load(data))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0004_reportschedule_last_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='json_file',
+            field=models.FileField(blank=True, help_text='Datos estructurados del informe (JSON comprimido con gzip)', null=True, upload_to='reports/json/%Y/%m/', verbose_name='Datos JSON'),
+        ),
+        migrations.RunPython(move_json_to_files, move_files_to_json),
+        migrations.RemoveField(
+            model_name='report',
+            name='json_data',
+        ),
+    ]
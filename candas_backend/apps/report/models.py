@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+import gzip
+import json
 import uuid
 
 
@@ -52,6 +56,14 @@ class ReportSchedule(models.Model):
     last_run = models.DateTimeField(null=True, blank=True, verbose_name="Última Ejecución")
     next_run = models.DateTimeField(verbose_name="Próxima Ejecución")
     recipients = models.JSONField(default=list, verbose_name="Destinatarios", help_text="Lista de emails")
+    last_file = models.FileField(
+        upload_to='reports/schedules/%Y/%m/',
+        blank=True,
+        null=True,
+        verbose_name="Último Archivo",
+        help_text="Resultado de la última ejecución"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Último Error")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -59,6 +71,10 @@ class ReportSchedule(models.Model):
         ordering = ['next_run']
         verbose_name = 'Reporte Programado'
         verbose_name_plural = 'Reportes Programados'
+        indexes = [
+            # Búsqueda de programaciones vencidas del planificador
+            models.Index(fields=['active', 'next_run']),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.get_frequency_display()}"
@@ -112,11 +128,14 @@ class Report(models.Model):
         null=True,
         verbose_name='Archivo Excel'
     )
-    json_data = models.JSONField(
+    # Los datos estructurados (json_data) se guardan comprimidos en un
+    # archivo: los listados no cargan ni transfieren el JSON de cada informe
+    json_file = models.FileField(
+        upload_to='reports/json/%Y/%m/',
         blank=True,
         null=True,
         verbose_name='Datos JSON',
-        help_text='Datos estructurados del informe en formato JSON'
+        help_text='Datos estructurados del informe (JSON comprimido con gzip)'
     )
     
     # Resumen estadístico
@@ -200,7 +219,56 @@ class Report(models.Model):
     
     def has_json(self):
         """Retorna True si tiene datos JSON generados."""
-        return bool(self.json_data)
+        return bool(self.json_file)
+    
+    @property
+    def json_data(self):
+        """
+        Datos estructurados del informe.
+        
+        Se leen y descomprimen de json_file la primera vez que se usan en la
+        instancia. Al asignarlos, el archivo se reescribe en el próximo save().
+        """
+        if not hasattr(self, '_json_data'):
+            self._json_data = None
+            if self.json_file:
+                with self.json_file.open('rb') as stored:
+                    with gzip.GzipFile(fileobj=stored) as data:
+                        self._json_data = json.load(data)
+        return self._json_data
+    
+    @json_data.setter
+    def json_data(self, value):
+        self._json_data = value
+        self._json_data_changed = True
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop('_json_data', None)
+        self.__dict__.pop('_json_data_changed', None)
+    
+    def save(self, *args, **kwargs):
+        if getattr(self, '_json_data_changed', False):
+            self._write_json_file()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'json_file'}
+        super().save(*args, **kwargs)
+    
+    def _write_json_file(self):
+        """Comprime json_data en un archivo nuevo y borra el anterior al confirmar."""
+        previous = self.json_file.name if self.json_file else None
+        
+        if self._json_data is None:
+            self.json_file = None
+        else:
+            content = json.dumps(self._json_data, ensure_ascii=False, cls=DjangoJSONEncoder)
+            filename = f"{self.report_type.lower()}_{self.report_date.strftime('%Y%m%d')}.json.gz"
+            self.json_file.save(filename, ContentFile(gzip.compress(content.encode('utf-8'))), save=False)
+        self._json_data_changed = False
+        
+        if previous:
+            storage = self.json_file.storage
+            transaction.on_commit(lambda: storage.delete(previous))
 
 
 class ReportDetail(models.Model):
@@ -2,10 +2,17 @@ from .report_generator import ReportGenerator
 from .pdf_exporter import PDFExporter
 from .excel_exporter import ExcelExporter
 from .daily_report_service import DailyReportService
+from .period_report_service import PeriodReportService
+from .single_flight import ReportSingleFlight, ReportInProgress
+from .schedule_service import ScheduleService
 
 __all__ = [
     'ReportGenerator',
     'PDFExporter',
     'ExcelExporter',
     'DailyReportService',
+    'PeriodReportService',
+    'ReportSingleFlight',
+    'ReportInProgress',
+    'ScheduleService',
 ]
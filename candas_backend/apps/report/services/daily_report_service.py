@@ -1,9 +1,12 @@
 """
 Servicio especializado para reportes diarios
 """
-from django.db.models import Q, Count
-from datetime import datetime, time
-import json
+from django.db import transaction
+from django.db.models import Case, F, Max, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, time, timedelta
 
 from apps.packages.models import Package, PackageStatusHistory
 from apps.logistics.models import Pull, Batch
@@ -13,36 +16,88 @@ from apps.report.models import Report, ReportDetail
 class DailyReportService:
     """Servicio especializado para reportes diarios"""
     
+    # Cambio de estado (old_status, new_status) que define cada reporte
+    TRANSITIONS = {
+        'DAILY_DISPATCH': ('EN_BODEGA', 'EN_TRANSITO'),
+        'DAILY_RECEPTION': ('NO_RECEPTADO', 'EN_BODEGA'),
+    }
+    
+    # Margen hacia atrás de cada actualización incremental: cubre cambios de
+    # estado de transacciones que confirmaron después de la corrida anterior
+    INCREMENTAL_OVERLAP = timedelta(minutes=5)
+    
+    # Clave de by_agency para los paquetes sin agencia efectiva
+    NO_AGENCY_KEY = 'none'
+    
     @staticmethod
-    def get_dispatched_packages(report_date):
+    def get_day_bounds(report_date):
         """
-        Obtiene paquetes despachados: EN_BODEGA → EN_TRANSITO en la fecha
+        Inicio (incluido) y fin (excluido) del día en la zona horaria local.
+        
+        Args:
+            report_date (date): Fecha del reporte
+        
+        Returns:
+            tuple: (datetime inicio, datetime fin)
+        """
+        start = timezone.make_aware(datetime.combine(report_date, time.min))
+        end = timezone.make_aware(datetime.combine(report_date + timedelta(days=1), time.min))
+        return start, end
+    
+    @staticmethod
+    def get_status_changes(report_type, report_date, since=None):
+        """
+        Cambios de estado del día que definen un reporte diario
         
         Args:
+            report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
             report_date (date): Fecha del reporte
+            since (datetime): Solo cambios posteriores a este momento (opcional)
+        
+        Returns:
+            QuerySet: Cambios de estado (PackageStatusHistory)
+        """
+        old_status, new_status = DailyReportService.TRANSITIONS[report_type]
+        start, end = DailyReportService.get_day_bounds(report_date)
+        
+        changes = PackageStatusHistory.objects.filter(
+            old_status=old_status,
+            new_status=new_status,
+            changed_at__gte=start,
+            changed_at__lt=end
+        )
+        if since is not None:
+            changes = changes.filter(changed_at__gt=since)
+        return changes
+    
+    @staticmethod
+    def get_changed_packages(report_type, report_date, since=None):
+        """
+        Paquetes con cambios de estado del reporte, filtrados con una
+        subconsulta sobre el historial (sin traer los IDs a Python).
         
         Returns:
             QuerySet: Paquetes que cambiaron de estado
         """
-        start_datetime = datetime.combine(report_date, time.min)
-        end_datetime = datetime.combine(report_date, time.max)
+        changes = DailyReportService.get_status_changes(report_type, report_date, since)
+        return Package.objects.filter(id__in=changes.values('package_id'))
+    
+    @staticmethod
+    def get_dispatched_packages(report_date):
+        """
+        Obtiene paquetes despachados: EN_BODEGA → EN_TRANSITO en la fecha
         
-        # Buscar cambios de estado EN_BODEGA → EN_TRANSITO
-        status_changes = PackageStatusHistory.objects.filter(
-            old_status='EN_BODEGA',
-            new_status='EN_TRANSITO',
-            changed_at__gte=start_datetime,
-            changed_at__lte=end_datetime
-        ).select_related('package', 'package__pull', 'package__pull__batch')
+        Args:
+            report_date (date): Fecha del reporte
         
-        package_ids = [sc.package_id for sc in status_changes]
-        packages = Package.objects.filter(id__in=package_ids).select_related(
+        Returns:
+            QuerySet: Paquetes que cambiaron de estado
+        """
+        return DailyReportService.get_changed_packages('DAILY_DISPATCH', report_date).select_related(
             'transport_agency',
             'pull__transport_agency',
             'pull__batch__transport_agency'
         )
-        
-        return packages
     
     @staticmethod
     def get_received_packages(report_date):
@@ -55,22 +110,9 @@ class DailyReportService:
         Returns:
             QuerySet: Paquetes que cambiaron de estado
         """
-        start_datetime = datetime.combine(report_date, time.min)
-        end_datetime = datetime.combine(report_date, time.max)
-        
-        status_changes = PackageStatusHistory.objects.filter(
-            old_status='NO_RECEPTADO',
-            new_status='EN_BODEGA',
-            changed_at__gte=start_datetime,
-            changed_at__lte=end_datetime
-        ).select_related('package')
-        
-        package_ids = [sc.package_id for sc in status_changes]
-        packages = Package.objects.filter(id__in=package_ids).select_related(
+        return DailyReportService.get_changed_packages('DAILY_RECEPTION', report_date).select_related(
             'transport_agency'
         )
-        
-        return packages
     
     @staticmethod
     def get_pulls_from_packages(packages):
@@ -101,141 +143,268 @@ class DailyReportService:
         return Batch.objects.filter(id__in=batch_ids).select_related('transport_agency')
     
     @staticmethod
-    def generate_dispatch_report(report_date, user=None):
+    def get_package_entries(packages):
         """
-        Genera reporte de despachos del día
+        Filas del reporte para un QuerySet de paquetes, en una sola consulta.
+        
+        La agencia efectiva se resuelve en SQL con la misma prioridad que
+        Package.get_shipping_agency
+        (batch.transport_agency > pull.transport_agency > transport_agency).
         
         Args:
-            report_date (date): Fecha del reporte
-            user: Usuario que genera el reporte (None si es automático)
+            packages (QuerySet): QuerySet de paquetes
         
         Returns:
-            Report: Instancia del reporte generado
+            list: Diccionarios serializables a JSON (uno por paquete)
         """
-        packages = DailyReportService.get_dispatched_packages(report_date)
-        pulls = DailyReportService.get_pulls_from_packages(packages)
-        batches = DailyReportService.get_batches_from_pulls(pulls)
+        rows = packages.values(
+            'id', 'guide_number', 'name', 'city', 'pull_id',
+            pull_batch_id=F('pull__batch_id'),
+            agency_id=Case(
+                When(pull__isnull=False, then=Coalesce(
+                    'pull__batch__transport_agency', 'pull__transport_agency'
+                )),
+                default=F('transport_agency'),
+            ),
+            agency_name=Case(
+                When(pull__isnull=False, then=Coalesce(
+                    'pull__batch__transport_agency__name', 'pull__transport_agency__name'
+                )),
+                default=F('transport_agency__name'),
+            ),
+        )
         
-        # Contar paquetes individuales (sin pull)
-        individual_packages = packages.filter(pull__isnull=True).count()
+        return [
+            {
+                'id': str(row['id']),
+                'guide_number': row['guide_number'],
+                'name': row['name'],
+                'city': row['city'],
+                'agency': row['agency_name'],
+                'agency_id': str(row['agency_id']) if row['agency_id'] else None,
+                'pull_id': str(row['pull_id']) if row['pull_id'] else None,
+                'batch_id': str(row['pull_batch_id']) if row['pull_batch_id'] else None,
+            }
+            for row in rows.iterator(chunk_size=2000)
+        ]
+    
+    @staticmethod
+    def summarize(entries, include_hierarchy=True):
+        """
+        Totales y desglose por agencia de las filas de un reporte diario
         
-        # Crear JSON data
-        json_data = {
-            'report_date': str(report_date),
-            'type': 'dispatch',
-            'summary': {
-                'total_packages': packages.count(),
-                'total_pulls': pulls.count(),
-                'total_batches': batches.count(),
-                'individual_packages': individual_packages,
-            },
-            'packages': [
-                {
-                    'id': str(pkg.id),
-                    'guide_number': pkg.guide_number,
-                    'name': pkg.name,
-                    'city': pkg.city,
-                    'agency': pkg.get_shipping_agency().name if pkg.get_shipping_agency() else None
+        Args:
+            entries (list): Filas de get_package_entries
+            include_hierarchy (bool): Contar sacas y lotes (False en recepciones)
+        
+        Returns:
+            dict: total_packages, total_pulls, total_batches,
+                  individual_packages y by_agency
+                  ({agency_id: {name, packages_count, sacas_count, lotes_count}})
+        """
+        pulls = set()
+        batches = set()
+        individual = 0
+        agencies = {}
+        
+        for entry in entries:
+            agency = agencies.setdefault(entry.get('agency_id'), {
+                'name': entry.get('agency') or 'Sin Agencia',
+                'packages': 0,
+                'pulls': set(),
+                'batches': set(),
+            })
+            agency['packages'] += 1
+            
+            if not entry.get('pull_id'):
+                individual += 1
+            elif include_hierarchy:
+                pulls.add(entry['pull_id'])
+                agency['pulls'].add(entry['pull_id'])
+                if entry.get('batch_id'):
+                    batches.add(entry['batch_id'])
+                    agency['batches'].add(entry['batch_id'])
+        
+        return {
+            'total_packages': len(entries),
+            'total_pulls': len(pulls),
+            'total_batches': len(batches),
+            'individual_packages': individual if include_hierarchy else len(entries),
+            'by_agency': {
+                agency_id: {
+                    'name': agency['name'],
+                    'packages_count': agency['packages'],
+                    'sacas_count': len(agency['pulls']),
+                    'lotes_count': len(agency['batches']),
                 }
-                for pkg in packages
-            ]
+                for agency_id, agency in agencies.items()
+            },
         }
+    
+    @staticmethod
+    def agencies_json(agencies):
+        """
+        Desglose por agencia para json_data, indexado por ID de agencia
         
-        # Crear reporte
-        report = Report.objects.create(
-            report_type='DAILY_DISPATCH',
-            report_date=report_date,
-            status='COMPLETED',
-            total_packages=packages.count(),
-            total_sacas=pulls.count(),
-            total_lotes=batches.count(),
-            total_individual_packages=individual_packages,
-            json_data=json_data,
-            generated_by=user,
-            is_automatic=user is None
-        )
+        Dos agencias con el mismo nombre no se mezclan y un cambio de nombre
+        no parte la agencia en dos; el nombre viaja como campo.
         
-        # Crear detalles por agencia
-        DailyReportService._create_report_details(report, packages)
+        Args:
+            agencies: Iterable de {agency_id, name, packages_count,
+                sacas_count, lotes_count}
         
-        return report
+        Returns:
+            dict: {agency_id (o NO_AGENCY_KEY): {agency_id, name,
+                  packages_count, sacas_count, lotes_count}}
+        """
+        return {
+            str(agency['agency_id']) if agency['agency_id'] else DailyReportService.NO_AGENCY_KEY: {
+                'agency_id': str(agency['agency_id']) if agency['agency_id'] else None,
+                'name': agency['name'],
+                'packages_count': agency['packages_count'],
+                'sacas_count': agency['sacas_count'],
+                'lotes_count': agency['lotes_count'],
+            }
+            for agency in agencies
+        }
     
     @staticmethod
-    def generate_reception_report(report_date, user=None):
+    def build_report(report_type, report_date, user=None, incremental=False):
         """
-        Genera reporte de recepciones del día
+        Genera o actualiza un reporte diario de despachos o recepciones
+        
+        En modo incremental se reutiliza el reporte existente y solo se leen
+        los cambios de estado posteriores a su última corrida
+        (json_data['last_change_at'], menos INCREMENTAL_OVERLAP); los paquetes
+        que ya estaban en el reporte se descartan. Si no hay paquetes nuevos,
+        el reporte se retorna sin escribir nada. Sin reporte previo equivale
+        a una generación completa.
         
         Args:
+            report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
             report_date (date): Fecha del reporte
             user: Usuario que genera el reporte (None si es automático)
+            incremental (bool): Sumar solo los cambios desde la última corrida
         
         Returns:
-            Report: Instancia del reporte generado
+            Report: Instancia del reporte generado o actualizado
         """
-        packages = DailyReportService.get_received_packages(report_date)
+        report = Report.objects.filter(report_type=report_type, report_date=report_date).first()
+        
+        previous = report.json_data if report is not None and incremental else None
+        last_change_at = parse_datetime(previous['last_change_at']) if previous and previous.get('last_change_at') else None
+        since = None
+        entries = []
+        if last_change_at is not None:
+            since = last_change_at - DailyReportService.INCREMENTAL_OVERLAP
+            entries = list(previous.get('packages', []))
+        
+        # La marca de agua se lee antes que los paquetes: lo que llegue entre
+        # ambas consultas se vuelve a leer (y se descarta) en la próxima corrida
+        changes = DailyReportService.get_status_changes(report_type, report_date, since)
+        latest = changes.aggregate(latest=Max('changed_at'))['latest']
+        
+        known = {entry['id'] for entry in entries}
+        packages = DailyReportService.get_changed_packages(report_type, report_date, since)
+        new_entries = [
+            entry for entry in DailyReportService.get_package_entries(packages)
+            if entry['id'] not in known
+        ]
+        if since is not None and not new_entries:
+            return report
+        entries.extend(new_entries)
+        
+        if latest is not None and (last_change_at is None or latest > last_change_at):
+            last_change_at = latest
+        
+        is_dispatch = report_type == 'DAILY_DISPATCH'
+        summary = DailyReportService.summarize(entries, include_hierarchy=is_dispatch)
+        by_agency = summary.pop('by_agency')
         
-        # Crear JSON data
         json_data = {
             'report_date': str(report_date),
-            'type': 'reception',
-            'summary': {
-                'total_packages': packages.count(),
-            },
-            'packages': [
-                {
-                    'id': str(pkg.id),
-                    'guide_number': pkg.guide_number,
-                    'name': pkg.name,
-                    'city': pkg.city,
-                    'agency': pkg.get_shipping_agency().name if pkg.get_shipping_agency() else None
-                }
-                for pkg in packages
-            ]
+            'type': 'dispatch' if is_dispatch else 'reception',
+            'summary': summary if is_dispatch else {'total_packages': summary['total_packages']},
+            'by_agency': DailyReportService.agencies_json(
+                {'agency_id': agency_id, **metrics} for agency_id, metrics in by_agency.items()
+            ),
+            'packages': entries,
+            # Marca de día sin paquetes: el informe existe, así que los
+            # informes de período no vuelven a calcular este día
+            'empty': not entries,
+            'last_change_at': last_change_at.isoformat() if last_change_at else None,
         }
         
-        # Crear reporte (recepciones no incluyen pulls/batches)
-        report = Report.objects.create(
-            report_type='DAILY_RECEPTION',
-            report_date=report_date,
-            status='COMPLETED',
-            total_packages=packages.count(),
-            total_sacas=0,
-            total_lotes=0,
-            total_individual_packages=packages.count(),
-            json_data=json_data,
-            generated_by=user,
-            is_automatic=user is None
-        )
-        
-        DailyReportService._create_report_details(report, packages)
+        with transaction.atomic():
+            if report is None:
+                report = Report(report_type=report_type, report_date=report_date)
+            if report._state.adding or not incremental:
+                report.generated_by = user
+                report.is_automatic = user is None
+            
+            report.status = 'COMPLETED'
+            report.error_message = ''
+            report.total_packages = summary['total_packages']
+            report.total_sacas = summary['total_pulls']
+            report.total_lotes = summary['total_batches']
+            report.total_individual_packages = summary['individual_packages']
+            report.json_data = json_data
+            report.save()
+            
+            # Crear detalles por agencia
+            DailyReportService._create_report_details(report, by_agency)
         
         return report
     
     @staticmethod
-    def _create_report_details(report, packages):
+    def generate_dispatch_report(report_date, user=None, incremental=False):
         """
-        Crea los detalles del reporte agrupados por agencia
+        Genera reporte de despachos del día
         
         Args:
-            report (Report): Instancia del reporte
-            packages (QuerySet): QuerySet de paquetes
+            report_date (date): Fecha del reporte
+            user: Usuario que genera el reporte (None si es automático)
+            incremental (bool): Actualizar el reporte existente solo con los
+                despachos posteriores a su última corrida
+        
+        Returns:
+            Report: Instancia del reporte generado
+        """
+        return DailyReportService.build_report('DAILY_DISPATCH', report_date, user, incremental)
+    
+    @staticmethod
+    def generate_reception_report(report_date, user=None, incremental=False):
         """
-        # Agrupar por agencia de transporte
-        packages_by_agency = {}
+        Genera reporte de recepciones del día (no incluye sacas ni lotes)
         
-        for pkg in packages.select_related('transport_agency', 'pull__transport_agency', 'pull__batch__transport_agency'):
-            agency = pkg.get_shipping_agency()
-            agency_name = agency.name if agency else 'Sin Agencia'
-            
-            if agency_name not in packages_by_agency:
-                packages_by_agency[agency_name] = []
-            packages_by_agency[agency_name].append(pkg)
+        Args:
+            report_date (date): Fecha del reporte
+            user: Usuario que genera el reporte (None si es automático)
+            incremental (bool): Actualizar el reporte existente solo con las
+                recepciones posteriores a su última corrida
         
-        # Crear ReportDetail por cada agencia
-        for agency_name, pkgs in packages_by_agency.items():
-            ReportDetail.objects.create(
+        Returns:
+            Report: Instancia del reporte generado
+        """
+        return DailyReportService.build_report('DAILY_RECEPTION', report_date, user, incremental)
+    
+    @staticmethod
+    def _create_report_details(report, by_agency):
+        """
+        Reemplaza los detalles del reporte (uno por agencia) en un solo INSERT
+        
+        Args:
+            report (Report): Instancia del reporte
+            by_agency (dict): Desglose por agencia de summarize()
+        """
+        ReportDetail.objects.filter(report=report).delete()
+        ReportDetail.objects.bulk_create([
+            ReportDetail(
                 report=report,
-                transport_agency_name=agency_name,
-                package_count=len(pkgs),
-                package_list=json.dumps([str(p.id) for p in pkgs])
+                transport_agency_id=agency_id,
+                packages_count=metrics['packages_count'],
+                sacas_count=metrics['sacas_count'],
+                lotes_count=metrics['lotes_count'],
             )
+            for agency_id, metrics in by_agency.items()
+        ])
@@ -109,8 +109,9 @@ class ExcelExporter:
         if self.report.json_data and 'by_agency' in self.report.json_data:
             row = 4
             by_agency = self.report.json_data['by_agency']
-            for agency_name, metrics in sorted(by_agency.items()):
-                ws.cell(row=row, column=1, value=agency_name)
+            # Indexado por ID de agencia; los informes antiguos usaban el nombre como clave
+            for key, metrics in sorted(by_agency.items(), key=lambda item: item[1].get('name', item[0])):
+                ws.cell(row=row, column=1, value=metrics.get('name', key))
                 ws.cell(row=row, column=2, value=metrics['packages_count'])
                 ws.cell(row=row, column=3, value=metrics['sacas_count'])
                 ws.cell(row=row, column=4, value=metrics['lotes_count'])
@@ -170,9 +170,10 @@ class PDFExporter:
         data = [['Agencia', 'Paquetes', 'Sacas', 'Lotes']]
         
         by_agency = self.report.json_data.get('by_agency', {})
-        for agency_name, metrics in sorted(by_agency.items()):
+        # Indexado por ID de agencia; los informes antiguos usaban el nombre como clave
+        for key, metrics in sorted(by_agency.items(), key=lambda item: item[1].get('name', item[0])):
             data.append([
-                agency_name,
+                metrics.get('name', key),
                 str(metrics['packages_count']),
                 str(metrics['sacas_count']),
                 str(metrics['lotes_count']),
@@ -0,0 +1,311 @@
+"""
+Servicio para informes de períodos (mensuales o de rango arbitrario)
+compuestos a partir de los informes diarios ya guardados
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from datetime import date, timedelta
+import calendar
+
+from apps.report.models import Report, ReportDetail
+from apps.report.services.daily_report_service import DailyReportService
+from apps.report.services.single_flight import ReportSingleFlight
+
+
+class PeriodReportService:
+    """
+    Informes de períodos a partir de los informes diarios guardados.
+    
+    Un período se arma sumando los totales de los informes diarios y sus
+    ReportDetail por agencia, sin volver a recorrer paquetes ni historial.
+    Solo se recalculan los días sin informe o con un informe desactualizado.
+    Las sacas y lotes del período son la suma de los conteos diarios.
+    """
+    
+    # Un rango más largo recalcularía demasiados días en una sola petición
+    MAX_RANGE_DAYS = 366
+    
+    # Días faltantes que una petición recalcula en línea; con más, los días se
+    # encolan en Celery y la petición responde 202 (setting REPORT_RANGE_SYNC_MAX_DAYS)
+    DEFAULT_SYNC_MAX_DAYS = 7
+    
+    @staticmethod
+    def get_sync_max_days():
+        """Máximo de días a recalcular dentro de una petición."""
+        return getattr(settings, 'REPORT_RANGE_SYNC_MAX_DAYS', PeriodReportService.DEFAULT_SYNC_MAX_DAYS)
+    
+    @staticmethod
+    def get_month_range(year, month):
+        """
+        Primer y último día de un mes.
+        
+        Returns:
+            tuple: (date inicio, date fin)
+        """
+        last_day = calendar.monthrange(year, month)[1]
+        return date(year, month, 1), date(year, month, last_day)
+    
+    @staticmethod
+    def is_stale(report_date, updated_at):
+        """
+        True si el informe diario se guardó antes de que terminara su día
+        (p. ej. el reporte "de hoy hasta ahora"), por lo que puede faltarle
+        información.
+        
+        Args:
+            report_date (date): Fecha del informe diario
+            updated_at (datetime): Última actualización del informe
+        """
+        _, day_end = DailyReportService.get_day_bounds(report_date)
+        return updated_at < day_end + DailyReportService.INCREMENTAL_OVERLAP
+    
+    @staticmethod
+    def get_pending_days(report_type, date_from, date_to):
+        """
+        Días del rango sin informe diario o con uno desactualizado (los días
+        futuros se ignoran). Los días sin paquetes también tienen su informe
+        guardado (json_data['empty']), así que no vuelven a aparecer aquí.
+        
+        Args:
+            report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
+            date_from (date): Fecha inicial (incluida)
+            date_to (date): Fecha final (incluida)
+        
+        Returns:
+            list: Tuplas (fecha, True si ya existe un informe desactualizado)
+        """
+        date_to = min(date_to, timezone.localdate())
+        stored = dict(
+            Report.objects.filter(
+                report_type=report_type,
+                report_date__range=(date_from, date_to),
+                status='COMPLETED'
+            ).values_list('report_date', 'updated_at')
+        )
+        
+        pending = []
+        day = date_from
+        while day <= date_to:
+            updated_at = stored.get(day)
+            if updated_at is None or PeriodReportService.is_stale(day, updated_at):
+                pending.append((day, updated_at is not None))
+            day += timedelta(days=1)
+        return pending
+    
+    @staticmethod
+    def ensure_daily_reports(report_type, date_from, date_to):
+        """
+        Genera los informes diarios faltantes y actualiza los desactualizados
+        del rango (los días futuros se ignoran).
+        
+        Los desactualizados se completan en modo incremental, leyendo solo
+        los cambios posteriores a su última corrida.
+        
+        Args:
+            report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
+            date_from (date): Fecha inicial (incluida)
+            date_to (date): Fecha final (incluida)
+        
+        Returns:
+            list: Fechas de los días recalculados
+        """
+        recomputed = []
+        for day, stale in PeriodReportService.get_pending_days(report_type, date_from, date_to):
+            ReportSingleFlight.generate(
+                report_type,
+                day,
+                lambda: DailyReportService.build_report(report_type, day, incremental=stale)
+            )
+            recomputed.append(day)
+        return recomputed
+    
+    @staticmethod
+    def submit_pending_days(report_type, days):
+        """
+        Encola el cálculo de los informes diarios indicados, un subtask por
+        día en un grupo de Celery.
+        
+        Args:
+            report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
+            days (list): Fechas a calcular
+        
+        Returns:
+            GroupResult: Resultado del grupo
+        """
+        from celery import group
+        from apps.report.tasks import ensure_daily_report_task
+        
+        return group(ensure_daily_report_task.s(report_type, str(day)) for day in days).apply_async()
+    
+    @staticmethod
+    def merge_daily_reports(report_type, date_from, date_to):
+        """
+        Suma los informes diarios guardados de un rango (dos consultas).
+        
+        Args:
+            report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
+            date_from (date): Fecha inicial (incluida)
+            date_to (date): Fecha final (incluida)
+        
+        Returns:
+            dict: summary, by_day y agencies
+                  (lista de {agency_id, name, packages_count, sacas_count, lotes_count})
+        """
+        daily = Report.objects.filter(
+            report_type=report_type,
+            report_date__range=(date_from, date_to),
+            status='COMPLETED'
+        )
+        
+        by_day = [
+            {
+                'date': str(row['report_date']),
+                'total_packages': row['total_packages'],
+                'total_pulls': row['total_sacas'],
+                'total_batches': row['total_lotes'],
+                'individual_packages': row['total_individual_packages'],
+            }
+            for row in daily.order_by('report_date').values(
+                'report_date', 'total_packages', 'total_sacas',
+                'total_lotes', 'total_individual_packages'
+            )
+        ]
+        
+        agency_rows = ReportDetail.objects.filter(
+            report__in=daily.values('id')
+        ).order_by().values(
+            'transport_agency', 'transport_agency__name'
+        ).annotate(
+            packages=Sum('packages_count'),
+            sacas=Sum('sacas_count'),
+            lotes=Sum('lotes_count'),
+        )
+        agencies = sorted(
+            (
+                {
+                    'agency_id': row['transport_agency'],
+                    'name': row['transport_agency__name'] or 'Sin Agencia',
+                    'packages_count': row['packages'] or 0,
+                    'sacas_count': row['sacas'] or 0,
+                    'lotes_count': row['lotes'] or 0,
+                }
+                for row in agency_rows
+            ),
+            key=lambda item: item['packages_count'],
+            reverse=True
+        )
+        
+        summary = {
+            key: sum(day[key] for day in by_day)
+            for key in ('total_packages', 'total_pulls', 'total_batches', 'individual_packages')
+        }
+        summary['days'] = len(by_day)
+        
+        return {
+            'summary': summary,
+            'by_day': by_day,
+            'agencies': agencies,
+        }
+    
+    @staticmethod
+    def get_range_data(date_from, date_to, report_type='DAILY_DISPATCH'):
+        """
+        Datos de un rango arbitrario (p. ej. lo que va del año), sin guardar
+        un informe del período.
+        
+        Args:
+            date_from (date): Fecha inicial (incluida)
+            date_to (date): Fecha final (incluida)
+            report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
+        
+        Returns:
+            dict: Datos del período serializables a JSON
+        
+        Raises:
+            ValueError: Si el rango o el tipo no son válidos
+        """
+        data, _ = PeriodReportService._build_range(date_from, date_to, report_type)
+        return data
+    
+    @staticmethod
+    def validate_range(date_from, date_to, report_type):
+        """
+        Valida el tipo y el rango de un informe de período.
+        
+        Raises:
+            ValueError: Si el rango o el tipo no son válidos
+        """
+        if report_type not in DailyReportService.TRANSITIONS:
+            raise ValueError(f"Tipo de informe inválido: {report_type}")
+        if date_from > date_to:
+            raise ValueError('date_from debe ser anterior o igual a date_to')
+        if (date_to - date_from).days + 1 > PeriodReportService.MAX_RANGE_DAYS:
+            raise ValueError(f"El rango no puede superar {PeriodReportService.MAX_RANGE_DAYS} días")
+    
+    @staticmethod
+    def _build_range(date_from, date_to, report_type):
+        """Valida el rango, completa los días y retorna (datos, agencias)."""
+        PeriodReportService.validate_range(date_from, date_to, report_type)
+        
+        recomputed = PeriodReportService.ensure_daily_reports(report_type, date_from, date_to)
+        merged = PeriodReportService.merge_daily_reports(report_type, date_from, date_to)
+        
+        data = {
+            'period': {'from': str(date_from), 'to': str(date_to)},
+            'type': 'dispatch' if report_type == 'DAILY_DISPATCH' else 'reception',
+            'summary': merged['summary'],
+            'by_agency': DailyReportService.agencies_json(merged['agencies']),
+            'by_day': merged['by_day'],
+            'recomputed_days': [str(day) for day in recomputed],
+        }
+        return data, merged['agencies']
+    
+    @staticmethod
+    def generate_monthly_report(year, month, user=None):
+        """
+        Genera (o regenera) el informe mensual de despachos a partir de los
+        informes diarios de despachos del mes.
+        
+        Args:
+            year (int): Año
+            month (int): Mes (1-12)
+            user: Usuario que genera el informe (None si es automático)
+        
+        Returns:
+            Report: Informe mensual
+        """
+        date_from, date_to = PeriodReportService.get_month_range(year, month)
+        data, agencies = PeriodReportService._build_range(date_from, date_to, 'DAILY_DISPATCH')
+        summary = data['summary']
+        
+        with transaction.atomic():
+            report = Report.objects.filter(report_type='MONTHLY', report_date=date_from).first()
+            if report is None:
+                report = Report(report_type='MONTHLY', report_date=date_from)
+            
+            report.status = 'COMPLETED'
+            report.error_message = ''
+            report.total_packages = summary['total_packages']
+            report.total_sacas = summary['total_pulls']
+            report.total_lotes = summary['total_batches']
+            report.total_individual_packages = summary['individual_packages']
+            report.json_data = data
+            report.generated_by = user
+            report.is_automatic = user is None
+            report.save()
+            
+            ReportDetail.objects.filter(report=report).delete()
+            ReportDetail.objects.bulk_create([
+                ReportDetail(
+                    report=report,
+                    transport_agency_id=agency['agency_id'],
+                    packages_count=agency['packages_count'],
+                    sacas_count=agency['sacas_count'],
+                    lotes_count=agency['lotes_count'],
+                )
+                for agency in agencies
+            ])
+        
+        return report
@@ -1,8 +1,9 @@
 """
 Servicio para generación de reportes en diferentes formatos
 """
-from django.db.models import Count, Q, Sum
-from django.http import HttpResponse
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, NullIf
+from django.http import HttpResponse, StreamingHttpResponse
 from datetime import datetime, timedelta
 from io import BytesIO
 from openpyxl import Workbook
@@ -12,23 +13,42 @@ from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch, mm
+import base64
 import csv
+import json
+import uuid
+
+from apps.shared.services.metrics import Metrics
 
 
 class ReportGenerator:
     """Generador de reportes para diferentes entidades del sistema"""
     
+    # Reporte de paquetes JSON paginado por cursor
+    PACKAGES_PAGE_SIZE = 500
+    PACKAGES_MAX_PAGE_SIZE = 5000
+    
+    # Filas leídas por consulta al recorrer el reporte completo
+    PACKAGES_STREAM_CHUNK_SIZE = 2000
+    
+    # Igual que Package.get_shipment_type_display
+    SHIPMENT_TYPE_DISPLAY = {
+        'sin_asignar': 'Sin Asignar',
+        'individual': 'Envío Individual',
+        'saca': 'Envío en Saca',
+        'lote': 'Envío en Lote',
+    }
+    
     @staticmethod
-    def generate_packages_report(filters=None, format='json'):
+    def filter_packages(filters=None):
         """
-        Generar reporte de paquetes con filtros aplicados
+        Queryset de paquetes con los filtros del reporte aplicados
         
         Args:
             filters (dict): Filtros a aplicar (date_from, date_to, status, etc.)
-            format (str): Formato de salida ('json', 'excel', 'pdf', 'csv')
         
         Returns:
-            dict or HttpResponse: Datos del reporte o archivo descargable
+            QuerySet: Paquetes filtrados
         """
         from apps.packages.models import Package
         
@@ -88,49 +108,41 @@ class ReportGenerator:
                 elif shipment_type == 'lote':
                     queryset = queryset.filter(pull__isnull=False, pull__batch__isnull=False)
         
+        return queryset
+    
+    @staticmethod
+    def generate_packages_report(filters=None, format='json', cursor=None, page_size=None):
+        """
+        Generar reporte de paquetes con filtros aplicados
+        
+        Args:
+            filters (dict): Filtros a aplicar (date_from, date_to, status, etc.)
+            format (str): Formato de salida ('json', 'ndjson', 'excel', 'pdf', 'csv')
+            cursor (str): Cursor de la página a leer (solo 'json')
+            page_size (int): Paquetes por página (solo 'json'); con cursor o
+                page_size el JSON se pagina en lugar de incluir todos los paquetes
+        
+        Returns:
+            dict or HttpResponse: Datos del reporte o archivo descargable
+        
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        queryset = ReportGenerator.filter_packages(filters)
+        
         # Formato de salida
         if format == 'json':
-            # Evaluar queryset completamente antes de procesar para obtener conteo correcto
-            packages_list = list(queryset.select_related('transport_agency', 'pull', 'pull__batch'))
-            data = []
-            for package in packages_list:
-                agency = package.get_shipping_agency()
-                shipment_type = package.get_shipment_type()
-                shipment_info = {
-                    'type': shipment_type,
-                    'type_display': package.get_shipment_type_display(),
-                }
-                
-                # Agregar información de lote si aplica
-                if shipment_type == 'lote' and package.pull and package.pull.batch:
-                    shipment_info['batch'] = {
-                        'id': str(package.pull.batch.id),
-                        'destiny': package.pull.batch.destiny,
-                        'guide_number': package.pull.batch.guide_number or '',
-                    }
-                
-                # Agregar información de saca si aplica
-                if shipment_type in ['saca', 'lote'] and package.pull:
-                    shipment_info['pull'] = {
-                        'id': str(package.pull.id),
-                        'common_destiny': package.pull.get_effective_destiny(),
-                        'guide_number': package.pull.get_effective_guide_number() or '',
-                    }
-                
-                data.append({
-                    'guide_number': package.guide_number,
-                    'name': package.name,
-                    'city': package.city,
-                    'province': package.province,
-                    'status': package.get_status_display(),
-                    'shipment_type': package.get_shipment_type_display(),
-                    'shipment_info': shipment_info,
-                    'agency': agency.name if agency else 'Sin asignar',
-                    'created_at': package.created_at.isoformat(),
-                })
-            # Usar len(data) en lugar de queryset.count() para obtener el conteo correcto
+            if cursor or page_size:
+                return ReportGenerator.get_packages_page(queryset, cursor, page_size)
+            rows = ReportGenerator.get_packages_rows(queryset).iterator(
+                chunk_size=ReportGenerator.PACKAGES_STREAM_CHUNK_SIZE
+            )
+            data = [ReportGenerator.format_package_row(row) for row in rows]
             return {'data': data, 'count': len(data)}
         
+        elif format == 'ndjson':
+            return ReportGenerator.stream_packages_ndjson(queryset)
+        
         elif format == 'excel':
             # Asegurar que el queryset se evalúe completamente antes de exportar
             # Esto garantiza que todos los filtros se hayan aplicado
@@ -143,6 +155,177 @@ class ReportGenerator:
         elif format == 'csv':
             return ReportGenerator.export_packages_to_csv(queryset)
     
+    @staticmethod
+    def get_packages_rows(queryset):
+        """
+        Proyección (values) de los paquetes para el reporte JSON.
+        
+        La agencia, la saca y el lote efectivos se resuelven en la consulta
+        (misma prioridad que Package.get_shipping_agency y
+        Pull.get_effective_destiny / get_effective_guide_number), sin
+        instanciar modelos.
+        
+        Args:
+            queryset (QuerySet): Paquetes filtrados
+        
+        Returns:
+            QuerySet: Filas (dict) ordenadas por -created_at, -id
+        """
+        return queryset.annotate(
+            agency_name=Case(
+                When(
+                    pull__isnull=False,
+                    then=Coalesce('pull__batch__transport_agency__name', 'pull__transport_agency__name')
+                ),
+                default=F('transport_agency__name'),
+            ),
+            shipment_kind=Case(
+                When(pull__batch__isnull=False, then=Value('lote')),
+                When(pull__isnull=False, then=Value('saca')),
+                When(transport_agency__isnull=False, then=Value('individual')),
+                default=Value('sin_asignar'),
+                output_field=CharField(),
+            ),
+            pull_destiny=Case(
+                When(pull__batch__isnull=False, then=F('pull__batch__destiny')),
+                default=F('pull__common_destiny'),
+            ),
+            pull_guide_number=Coalesce(
+                NullIf('pull__batch__guide_number', Value('')),
+                'pull__guide_number'
+            ),
+        ).order_by('-created_at', '-id').values(
+            'id', 'guide_number', 'name', 'city', 'province', 'status', 'created_at',
+            'agency_name', 'shipment_kind', 'pull_id', 'pull_destiny', 'pull_guide_number',
+            'pull__batch_id', 'pull__batch__destiny', 'pull__batch__guide_number',
+        )
+    
+    @staticmethod
+    def format_package_row(row):
+        """Paquete del reporte JSON a partir de una fila de get_packages_rows"""
+        from apps.packages.models import Package
+        
+        shipment_type = row['shipment_kind']
+        type_display = ReportGenerator.SHIPMENT_TYPE_DISPLAY.get(shipment_type, 'Desconocido')
+        shipment_info = {
+            'type': shipment_type,
+            'type_display': type_display,
+        }
+        
+        # Agregar información de lote si aplica
+        if shipment_type == 'lote':
+            shipment_info['batch'] = {
+                'id': str(row['pull__batch_id']),
+                'destiny': row['pull__batch__destiny'],
+                'guide_number': row['pull__batch__guide_number'] or '',
+            }
+        
+        # Agregar información de saca si aplica
+        if shipment_type in ['saca', 'lote']:
+            shipment_info['pull'] = {
+                'id': str(row['pull_id']),
+                'common_destiny': row['pull_destiny'],
+                'guide_number': row['pull_guide_number'] or '',
+            }
+        
+        return {
+            'guide_number': row['guide_number'],
+            'name': row['name'],
+            'city': row['city'],
+            'province': row['province'],
+            'status': dict(Package.STATUS_CHOICES).get(row['status'], row['status']),
+            'shipment_type': type_display,
+            'shipment_info': shipment_info,
+            'agency': row['agency_name'] or 'Sin asignar',
+            'created_at': row['created_at'].isoformat(),
+        }
+    
+    @staticmethod
+    def encode_cursor(row):
+        """Cursor opaco con la posición (created_at, id) de la última fila"""
+        raw = json.dumps([row['created_at'].isoformat(), str(row['id'])])
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Posición (created_at, id) de un cursor
+        
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        try:
+            created_at, package_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return datetime.fromisoformat(created_at), uuid.UUID(package_id)
+        except (TypeError, ValueError, UnicodeError) as e:
+            raise ValueError('Cursor inválido') from e
+    
+    @staticmethod
+    def get_packages_page(queryset, cursor=None, page_size=None):
+        """
+        Página del reporte JSON por cursor (keyset sobre created_at, id).
+        
+        A diferencia de un offset, cada página cuesta lo mismo sin importar
+        cuántas se hayan leído antes, y no se repiten ni saltan paquetes si
+        se crean otros mientras se recorre el reporte.
+        
+        Args:
+            queryset (QuerySet): Paquetes filtrados
+            cursor (str): next_cursor de la página anterior (None para la primera)
+            page_size (int): Paquetes por página
+        
+        Returns:
+            dict: data, count (paquetes de la página) y next_cursor
+                  (None en la última página)
+        
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        page_size = min(
+            max(int(page_size or ReportGenerator.PACKAGES_PAGE_SIZE), 1),
+            ReportGenerator.PACKAGES_MAX_PAGE_SIZE
+        )
+        
+        if cursor:
+            created_at, package_id = ReportGenerator.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=package_id)
+            )
+        
+        # Una fila extra indica si hay página siguiente
+        rows = list(ReportGenerator.get_packages_rows(queryset)[:page_size + 1])
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = ReportGenerator.encode_cursor(rows[-1])
+        
+        data = [ReportGenerator.format_package_row(row) for row in rows]
+        return {'data': data, 'count': len(data), 'next_cursor': next_cursor}
+    
+    @staticmethod
+    def stream_packages_ndjson(queryset):
+        """
+        Reporte completo como NDJSON (un paquete JSON por línea), transmitido
+        a medida que se lee de la base de datos.
+        
+        Args:
+            queryset (QuerySet): Paquetes filtrados
+        
+        Returns:
+            StreamingHttpResponse: Archivo .ndjson
+        """
+        rows = ReportGenerator.get_packages_rows(queryset)
+        
+        def lines():
+            for row in rows.iterator(chunk_size=ReportGenerator.PACKAGES_STREAM_CHUNK_SIZE):
+                yield json.dumps(ReportGenerator.format_package_row(row), ensure_ascii=False) + '\n'
+        
+        response = StreamingHttpResponse(lines(), content_type='application/x-ndjson; charset=utf-8')
+        filename = f"reporte_paquetes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
     @staticmethod
     def generate_statistics_report(date_from, date_to):
         """
@@ -282,6 +465,7 @@ class ReportGenerator:
         }
     
     @staticmethod
+    @Metrics.timed_document('export', 'packages_report', 'xlsx')
     def export_packages_to_excel(queryset):
         """Exportar paquetes a Excel con formato"""
         wb = Workbook()
@@ -380,6 +564,7 @@ class ReportGenerator:
         return response
     
     @staticmethod
+    @Metrics.timed_document('export', 'packages_report', 'pdf')
     def export_packages_to_pdf(queryset):
         """Exportar paquetes a PDF usando formato de manifiestos"""
         from apps.shared.services.manifest_template import BaseManifestGenerator
@@ -400,9 +585,8 @@ class ReportGenerator:
         # Información del reporte (párrafos separados por saltos de línea)
         normal_style = BaseManifestGenerator.get_normal_style()
         
-        # Evaluar queryset completamente para obtener conteo correcto
-        packages_list = list(queryset.select_related('transport_agency', 'pull', 'pull__batch'))
-        total_packages = len(packages_list)
+        # Conteo en la base de datos; los paquetes se recorren por bloques más abajo
+        total_packages = queryset.count()
         
         info_lines = [
             f"Fecha de Generación: {BaseManifestGenerator.format_datetime_now()}",
@@ -420,13 +604,17 @@ class ReportGenerator:
         elements.append(Paragraph("LISTA DE PAQUETES", heading_style))
         elements.append(Spacer(1, 3*mm))
         
-        if packages_list:
+        if total_packages:
             # Headers de la tabla
             headers = ['#', 'Número de Guía', 'Nombre', 'Ciudad', 'Provincia', 'Estado', 'Tipo Envío', 'Lote/Saca', 'Agencia']
             
-            # Preparar datos
+            # Preparar datos: solo se guardan los textos de cada fila, no los
+            # modelos (iterator), y la jerarquía de agencias viene en la consulta
+            packages = queryset.select_related(
+                'transport_agency', 'pull__transport_agency', 'pull__batch__transport_agency'
+            ).iterator(chunk_size=2000)
             pkg_data = []
-            for idx, package in enumerate(packages_list, 1):
+            for idx, package in enumerate(packages, 1):
                 agency = package.get_shipping_agency()
                 shipment_type = package.get_shipment_type()
                 
@@ -455,7 +643,8 @@ class ReportGenerator:
                     agency.name if agency else 'Sin asignar',
                 ])
             
-            # Crear tabla usando el formato de manifiestos
+            # Crear tabla usando el formato de manifiestos (StreamingTable
+            # automáticamente si hay muchas filas)
             # Anchos de columnas ajustados para A4 horizontal con márgenes de 10mm
             available_width = BaseManifestGenerator.PAGE_SIZE[0] - (2 * BaseManifestGenerator.MARGIN)  # 297mm - 20mm = 277mm
             col_widths = [
@@ -492,6 +681,7 @@ class ReportGenerator:
         return response
     
     @staticmethod
+    @Metrics.timed_document('export', 'packages_report', 'csv')
     def export_packages_to_csv(queryset):
         """Exportar paquetes a CSV"""
         response = HttpResponse(content_type='text/csv; charset=utf-8')
@@ -0,0 +1,282 @@
+"""
+Servicio de ejecución de reportes programados (ReportSchedule)
+"""
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+import calendar
+import json
+
+from apps.report.models import ReportSchedule
+from apps.report.services.report_generator import ReportGenerator
+
+
+class ScheduleService:
+    """
+    Planificación y ejecución de reportes programados.
+    
+    El planificador (tarea de Celery Beat) reclama las programaciones vencidas
+    con select_for_update(skip_locked=True) y adelanta su next_run en la misma
+    transacción: dos planificadores nunca toman la misma programación, y una
+    ejecución que falla no se repite en bucle. Cada ejecución corre luego en
+    su propia tarea y deja el resultado en ReportSchedule.last_file.
+    """
+    
+    # Programaciones reclamadas por transacción
+    CLAIM_BATCH_SIZE = 100
+    
+    # Formatos del reporte de paquetes: formato -> extensión
+    PACKAGES_FORMATS = {
+        'excel': 'xlsx',
+        'pdf': 'pdf',
+        'csv': 'csv',
+        'json': 'json',
+    }
+    
+    # Claves enteras positivas de config que cada frecuencia requiere
+    REQUIRED_CONFIG_KEYS = {
+        'CUSTOM': ('interval_hours', 'period_days'),
+    }
+    INTEGER_CONFIG_KEYS = ('interval_hours', 'period_days')
+    
+    @staticmethod
+    def validate_config(frequency, config, report_type=None):
+        """
+        Valida la configuración de una programación.
+        
+        Args:
+            frequency (str): DAILY, WEEKLY, MONTHLY o CUSTOM
+            config (dict): Configuración a validar
+            report_type (str): Tipo de reporte; 'packages' valida config['format']
+        
+        Returns:
+            dict: Configuración con las claves enteras normalizadas a int
+        
+        Raises:
+            ValueError: Si config no es un objeto, falta una clave requerida
+                por la frecuencia o una clave entera no es un entero positivo
+        """
+        if config is None:
+            config = {}
+        if not isinstance(config, dict):
+            raise ValueError("La configuración debe ser un objeto JSON")
+        
+        config = dict(config)
+        missing = [
+            key for key in ScheduleService.REQUIRED_CONFIG_KEYS.get(frequency, ())
+            if key not in config
+        ]
+        if missing:
+            raise ValueError(f"La frecuencia {frequency} requiere: {', '.join(missing)}")
+        
+        for key in ScheduleService.INTEGER_CONFIG_KEYS:
+            if key not in config:
+                continue
+            value = config[key]
+            if isinstance(value, str) and value.strip().isdigit():
+                value = int(value)
+            # bool es subclase de int
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ValueError(f"{key} debe ser un entero positivo")
+            config[key] = value
+        
+        if report_type == 'packages' and config.get('format', 'excel') not in ScheduleService.PACKAGES_FORMATS:
+            raise ValueError(f"Formato inválido: {config.get('format')}")
+        
+        return config
+    
+    @staticmethod
+    def advance(run_at, frequency, config=None):
+        """
+        Siguiente ejecución después de run_at según la frecuencia.
+        
+        Args:
+            run_at (datetime): Ejecución de referencia
+            frequency (str): DAILY, WEEKLY, MONTHLY o CUSTOM
+            config (dict): Configuración; CUSTOM usa config['interval_hours'] (24 por defecto)
+        
+        Returns:
+            datetime: Siguiente ejecución
+        """
+        if frequency == 'WEEKLY':
+            return run_at + timedelta(weeks=1)
+        if frequency == 'MONTHLY':
+            # Mismo día del mes siguiente (o el último día si no existe)
+            local = timezone.localtime(run_at)
+            year = local.year + local.month // 12
+            month = local.month % 12 + 1
+            day = min(local.day, calendar.monthrange(year, month)[1])
+            return local.replace(year=year, month=month, day=day)
+        if frequency == 'CUSTOM':
+            hours = max(int((config or {}).get('interval_hours', 24)), 1)
+            return run_at + timedelta(hours=hours)
+        return run_at + timedelta(days=1)
+    
+    @staticmethod
+    def compute_next_run(schedule, now=None):
+        """
+        Próxima ejecución posterior a now. Las ejecuciones perdidas (p. ej.
+        con el planificador detenido) se saltan en lugar de acumularse.
+        
+        Args:
+            schedule (ReportSchedule): Programación
+            now (datetime): Momento actual (por defecto timezone.now())
+        
+        Returns:
+            datetime: Nuevo next_run
+        """
+        now = now or timezone.now()
+        next_run = schedule.next_run
+        while next_run <= now:
+            next_run = ScheduleService.advance(next_run, schedule.frequency, schedule.config)
+        return next_run
+    
+    @staticmethod
+    def get_period(frequency, reference_date, config=None):
+        """
+        Último período completo antes de reference_date.
+        
+        Args:
+            frequency (str): DAILY, WEEKLY, MONTHLY o CUSTOM
+            reference_date (date): Fecha de la ejecución
+            config (dict): Configuración; CUSTOM usa config['period_days'] (1 por defecto)
+        
+        Returns:
+            tuple: (date inicio, date fin), ambos incluidos
+        """
+        end_date = reference_date - timedelta(days=1)
+        if frequency == 'WEEKLY':
+            return end_date - timedelta(days=6), end_date
+        if frequency == 'MONTHLY':
+            month_end = reference_date.replace(day=1) - timedelta(days=1)
+            return month_end.replace(day=1), month_end
+        if frequency == 'CUSTOM':
+            days = max(int((config or {}).get('period_days', 1)), 1)
+            return end_date - timedelta(days=days - 1), end_date
+        return end_date, end_date
+    
+    @staticmethod
+    def claim_due(now=None, limit=None):
+        """
+        Reclama programaciones vencidas y adelanta su next_run.
+        
+        Las filas bloqueadas por otro planificador se saltan (skip_locked).
+        
+        Args:
+            now (datetime): Momento actual (por defecto timezone.now())
+            limit (int): Máximo de programaciones (por defecto CLAIM_BATCH_SIZE)
+        
+        Returns:
+            list: Tuplas (schedule_id, fecha de referencia) a ejecutar
+        """
+        now = now or timezone.now()
+        limit = limit or ScheduleService.CLAIM_BATCH_SIZE
+        
+        with transaction.atomic():
+            due = list(
+                ReportSchedule.objects.select_for_update(skip_locked=True).filter(
+                    active=True,
+                    next_run__lte=now
+                ).order_by('next_run')[:limit]
+            )
+            
+            claimed = []
+            for schedule in due:
+                try:
+                    ScheduleService.validate_config(schedule.frequency, schedule.config, schedule.report_type)
+                    next_run = ScheduleService.compute_next_run(schedule, now)
+                except Exception as e:
+                    # Una configuración inválida no bloquea al resto: se registra
+                    # el error, no se ejecuta y se reprograma con la configuración
+                    # por defecto para que no vuelva a reclamarse en cada ciclo
+                    schedule.last_error = f"Configuración inválida: {e}"
+                    while schedule.next_run <= now:
+                        schedule.next_run = ScheduleService.advance(schedule.next_run, schedule.frequency)
+                    continue
+                claimed.append((str(schedule.id), timezone.localtime(schedule.next_run).date()))
+                schedule.last_run = now
+                schedule.next_run = next_run
+            
+            ReportSchedule.objects.bulk_update(due, ['last_run', 'next_run', 'last_error'])
+        
+        return claimed
+    
+    @staticmethod
+    def render(schedule, start_date, end_date):
+        """
+        Genera el contenido del reporte de una programación.
+        
+        Args:
+            schedule (ReportSchedule): Programación
+            start_date (date): Inicio del período (incluido)
+            end_date (date): Fin del período (incluido)
+        
+        Returns:
+            tuple: (bytes contenido, extensión)
+        
+        Raises:
+            ValueError: Si el tipo de reporte o el formato no son válidos
+        """
+        config = dict(schedule.config or {})
+        date_from = timezone.make_aware(datetime.combine(start_date, time.min))
+        date_to = timezone.make_aware(datetime.combine(end_date, time.max))
+        
+        if schedule.report_type == 'packages':
+            output_format = config.pop('format', 'excel')
+            if output_format not in ScheduleService.PACKAGES_FORMATS:
+                raise ValueError(f"Formato inválido: {output_format}")
+            filters = {**config, 'date_from': date_from, 'date_to': date_to}
+            result = ReportGenerator.generate_packages_report(filters=filters, format=output_format)
+            extension = ScheduleService.PACKAGES_FORMATS[output_format]
+        elif schedule.report_type == 'statistics':
+            result = ReportGenerator.generate_statistics_report(date_from, date_to)
+            extension = 'json'
+        elif schedule.report_type == 'agencies':
+            result = ReportGenerator.generate_agencies_performance(date_from, date_to)
+            extension = 'json'
+        elif schedule.report_type == 'destinations':
+            result = ReportGenerator.generate_destinations_report(date_from, date_to)
+            extension = 'json'
+        else:
+            raise ValueError(f"Tipo de reporte no soportado: {schedule.report_type}")
+        
+        if isinstance(result, HttpResponse):
+            return result.content, extension
+        return json.dumps(result, ensure_ascii=False, default=str).encode('utf-8'), extension
+    
+    @staticmethod
+    def execute(schedule_id, reference_date):
+        """
+        Ejecuta una programación y guarda el resultado en last_file.
+        
+        Args:
+            schedule_id: UUID de la programación
+            reference_date (date): Fecha de la ejecución (define el período)
+        
+        Returns:
+            ReportSchedule: Programación con last_file o last_error actualizados
+        """
+        schedule = ReportSchedule.objects.get(id=schedule_id)
+        
+        try:
+            start_date, end_date = ScheduleService.get_period(schedule.frequency, reference_date, schedule.config)
+            content, extension = ScheduleService.render(schedule, start_date, end_date)
+        except Exception as e:
+            ReportSchedule.objects.filter(id=schedule_id).update(last_error=str(e))
+            schedule.last_error = str(e)
+            raise
+        
+        filename = f"{schedule.report_type}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.{extension}"
+        # Solo se conserva el último archivo de cada programación
+        if schedule.last_file:
+            schedule.last_file.delete(save=False)
+        schedule.last_file.save(filename, ContentFile(content), save=False)
+        schedule.last_error = ''
+        # Solo las columnas del resultado: el planificador actualiza next_run en paralelo
+        ReportSchedule.objects.filter(id=schedule_id).update(
+            last_file=schedule.last_file.name,
+            last_error=''
+        )
+        return schedule
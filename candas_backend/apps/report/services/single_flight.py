@@ -0,0 +1,173 @@
+"""
+Generación única (single-flight) de informes.
+
+Las generaciones de un mismo informe (tipo y fecha) se serializan con un
+advisory lock de PostgreSQL, compartido por los workers web y Celery. Quien
+llega mientras otra generación está en curso espera a que termine y recibe
+su resultado, en lugar de repetir el mismo trabajo.
+
+Las tareas de Celery esperan hasta REPORT_SINGLE_FLIGHT_TIMEOUT; las vistas
+usan request_wait() para esperar solo unos segundos y responder 409.
+"""
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+import hashlib
+import threading
+import time
+
+from apps.report.models import Report
+
+
+class ReportInProgress(Exception):
+    """La generación en curso no terminó dentro del tiempo de espera."""
+
+
+class ReportSingleFlight:
+    """Lock por clave (tipo de informe, fecha, ...) y espera de la generación en curso."""
+    
+    DEFAULT_TIMEOUT = 300
+    # Peticiones web: muy por debajo del timeout de los workers de gunicorn
+    DEFAULT_REQUEST_TIMEOUT = 5
+    POLL_INTERVAL = 0.5
+    
+    # Espera de request_wait() activa en este hilo
+    _local = threading.local()
+    
+    @staticmethod
+    def get_timeout():
+        """
+        Espera máxima en segundos: la de request_wait() si está activa, o
+        REPORT_SINGLE_FLIGHT_TIMEOUT (tareas de Celery).
+        """
+        timeout = getattr(ReportSingleFlight._local, 'timeout', None)
+        if timeout is not None:
+            return timeout
+        return getattr(settings, 'REPORT_SINGLE_FLIGHT_TIMEOUT', ReportSingleFlight.DEFAULT_TIMEOUT)
+    
+    @staticmethod
+    @contextmanager
+    def request_wait():
+        """
+        Espera corta (REPORT_SINGLE_FLIGHT_REQUEST_TIMEOUT) para las
+        generaciones dentro del bloque, también las anidadas (los días de un
+        informe mensual o de rango).
+        
+        Ejemplo:
+            with ReportSingleFlight.request_wait():
+                report, attached = ReportSingleFlight.generate(...)
+        """
+        previous = getattr(ReportSingleFlight._local, 'timeout', None)
+        ReportSingleFlight._local.timeout = getattr(
+            settings, 'REPORT_SINGLE_FLIGHT_REQUEST_TIMEOUT', ReportSingleFlight.DEFAULT_REQUEST_TIMEOUT
+        )
+        try:
+            yield
+        finally:
+            ReportSingleFlight._local.timeout = previous
+    
+    @staticmethod
+    def make_key(*parts):
+        """Clave de 64 bits con signo para pg_advisory_lock."""
+        raw = '|'.join(str(part) for part in parts)
+        digest = hashlib.sha1(raw.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big', signed=True)
+    
+    @staticmethod
+    def _try_lock(key):
+        # Fuera de PostgreSQL (p. ej. SQLite en pruebas locales) se usa la caché
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+                return cursor.fetchone()[0]
+        return cache.add(
+            f'report-single-flight:{key}', 1,
+            getattr(settings, 'REPORT_SINGLE_FLIGHT_TIMEOUT', ReportSingleFlight.DEFAULT_TIMEOUT)
+        )
+    
+    @staticmethod
+    def _unlock(key):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+        else:
+            cache.delete(f'report-single-flight:{key}')
+    
+    @staticmethod
+    def run(parts, compute, reuse=None, timeout=None):
+        """
+        Ejecuta compute() como única generación en curso para la clave.
+        
+        Si otra generación tiene el lock, se espera a que lo libere y se
+        llama a reuse(): si retorna un resultado, se usa ese en lugar de
+        volver a generar; si retorna None (p. ej. porque la otra generación
+        falló), se genera de todos modos.
+        
+        Args:
+            parts (tuple): Partes de la clave, p. ej. ('DAILY_DISPATCH', fecha)
+            compute (callable): Genera y retorna el resultado
+            reuse (callable): Resultado de la generación que terminó durante
+                la espera, o None para generar de todos modos
+            timeout (float): Espera máxima en segundos (por defecto get_timeout())
+        
+        Returns:
+            tuple: (resultado, attached), attached=True si se reutilizó el
+                   resultado de otra generación
+        
+        Raises:
+            ReportInProgress: Si la generación en curso no terminó a tiempo
+        """
+        key = ReportSingleFlight.make_key(*parts)
+        if timeout is None:
+            timeout = ReportSingleFlight.get_timeout()
+        deadline = time.monotonic() + timeout
+        
+        waited = False
+        while not ReportSingleFlight._try_lock(key):
+            waited = True
+            if time.monotonic() >= deadline:
+                raise ReportInProgress(
+                    f"Ya hay una generación en curso para {' '.join(str(part) for part in parts)}"
+                )
+            time.sleep(ReportSingleFlight.POLL_INTERVAL)
+        
+        try:
+            if waited and reuse is not None:
+                result = reuse()
+                if result is not None:
+                    return result, True
+            return compute(), False
+        finally:
+            ReportSingleFlight._unlock(key)
+    
+    @staticmethod
+    def generate(report_type, report_date, compute, timeout=None):
+        """
+        Genera un informe (tipo y fecha) una sola vez a la vez.
+        
+        Quien espera recibe el informe que la otra generación guardó; solo
+        si el informe no cambió durante la espera se vuelve a generar.
+        
+        Args:
+            report_type (str): Tipo de informe (Report.REPORT_TYPE_CHOICES)
+            report_date (date): Fecha del informe
+            compute (callable): Genera y retorna el Report
+            timeout (float): Espera máxima en segundos
+        
+        Returns:
+            tuple: (Report, attached)
+        
+        Raises:
+            ReportInProgress: Si la generación en curso no terminó a tiempo
+        """
+        reports = Report.objects.filter(report_type=report_type, report_date=report_date)
+        previous_update = reports.values_list('updated_at', flat=True).first()
+        
+        def reuse():
+            report = reports.first()
+            if report is not None and report.updated_at != previous_update:
+                return report
+            return None
+        
+        return ReportSingleFlight.run((report_type, report_date), compute, reuse, timeout)
@@ -2,8 +2,11 @@ from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
 import logging
+import time
 
-from apps.report.services import ReportGenerator
+from apps.shared.services.metrics import Metrics
+from apps.report.services import DailyReportService, PeriodReportService
+from apps.report.services.single_flight import ReportSingleFlight
 from apps.report.services.pdf_exporter import PDFExporter
 from apps.report.services.excel_exporter import ExcelExporter
 from django.core.files.base import ContentFile
@@ -22,12 +25,15 @@ def generate_daily_report_task():
     try:
         logger.info(f"Iniciando generación automática de informe diario para {yesterday}")
         
-        # Generar informe con el generador (sin usuario, es automático)
-        generator = ReportGenerator(user=None)
-        report = generator.generate_daily_report(yesterday)
+        # Informe diario de despachos (sin usuario, es automático)
+        report, attached = ReportSingleFlight.generate(
+            'DAILY_DISPATCH',
+            yesterday,
+            lambda: DailyReportService.generate_dispatch_report(yesterday)
+        )
         
         # Generar archivos PDF y Excel
-        if report.status == 'COMPLETED':
+        if report.status == 'COMPLETED' and not attached:
             generate_report_files.delay(str(report.id))
         
         logger.info(f"Informe diario para {yesterday} generado exitosamente: {report.id}")
@@ -51,6 +57,9 @@ def generate_monthly_report_task():
     """
     Tarea programada para generar automáticamente el informe mensual del mes anterior.
     Se ejecuta el primer día de cada mes a las 2:00 AM.
+    
+    El informe se compone con los informes diarios de despachos ya guardados;
+    solo se recalculan los días faltantes o desactualizados.
     """
     today = timezone.now().date()
     
@@ -65,12 +74,15 @@ def generate_monthly_report_task():
     try:
         logger.info(f"Iniciando generación automática de informe mensual para {month}/{year}")
         
-        # Generar informe con el generador (sin usuario, es automático)
-        generator = ReportGenerator(user=None)
-        report = generator.generate_monthly_report(year, month)
+        # Componer el informe con los informes diarios del mes (sin usuario, es automático)
+        report, attached = ReportSingleFlight.generate(
+            'MONTHLY',
+            PeriodReportService.get_month_range(year, month)[0],
+            lambda: PeriodReportService.generate_monthly_report(year, month)
+        )
         
         # Generar archivos PDF y Excel
-        if report.status == 'COMPLETED':
+        if report.status == 'COMPLETED' and not attached:
             generate_report_files.delay(str(report.id))
         
         logger.info(f"Informe mensual para {month}/{year} generado exitosamente: {report.id}")
@@ -91,65 +103,323 @@ def generate_monthly_report_task():
         }
 
 
+@shared_task(name='apps.report.tasks.refresh_today_reports_task')
+def refresh_today_reports_task():
+    """
+    Tarea programada que actualiza los reportes de despachos y recepciones
+    del día en curso ("hoy hasta ahora").
+    
+    Es incremental: solo lee los cambios de estado desde la corrida anterior,
+    y los archivos se regeneran únicamente si el reporte cambió.
+    """
+    from apps.report.models import Report
+    from apps.report.services import DailyReportService
+    
+    today = timezone.localdate()
+    refreshed = []
+    
+    for report_type in DailyReportService.TRANSITIONS:
+        try:
+            previous_update = Report.objects.filter(
+                report_type=report_type,
+                report_date=today
+            ).values_list('updated_at', flat=True).first()
+            
+            report, attached = ReportSingleFlight.generate(
+                report_type,
+                today,
+                lambda: DailyReportService.build_report(report_type, today, incremental=True)
+            )
+            if not attached and report.updated_at != previous_update:
+                generate_report_files.delay(str(report.id))
+                refreshed.append(str(report.id))
+        except Exception as e:
+            logger.error(f"Error actualizando reporte {report_type} del día {today}: {str(e)}")
+    
+    return {
+        'success': True,
+        'date': str(today),
+        'refreshed': refreshed
+    }
+
+
+@shared_task(name='apps.report.tasks.ensure_daily_report_task')
+def ensure_daily_report_task(report_type, report_date):
+    """
+    Calcula el informe diario de un día si falta o está desactualizado.
+    
+    Es idempotente: si otra tarea o petición ya lo dejó al día no hace nada,
+    por lo que repetir un informe de rango no duplica trabajo.
+    
+    Args:
+        report_type (str): 'DAILY_DISPATCH' o 'DAILY_RECEPTION'
+        report_date (str): Fecha en formato YYYY-MM-DD
+    """
+    from datetime import date
+    
+    day = date.fromisoformat(report_date)
+    recomputed = PeriodReportService.ensure_daily_reports(report_type, day, day)
+    return {
+        'success': True,
+        'date': report_date,
+        'recomputed': bool(recomputed)
+    }
+
+
+# Archivos de un informe: artefacto -> (exportador, campo del modelo, extensión)
+REPORT_ARTEFACTS = {
+    'pdf': (PDFExporter, 'pdf_file', 'pdf'),
+    'excel': (ExcelExporter, 'excel_file', 'xlsx'),
+}
+
+
 @shared_task(name='apps.report.tasks.generate_report_files')
 def generate_report_files(report_id):
     """
     Tarea asíncrona para generar los archivos PDF y Excel de un informe.
     
+    Cada archivo se genera en su propia subtarea (en paralelo y con
+    reintentos independientes); un chord ejecuta finalize_report_files
+    cuando terminan todas, de modo que el tiempo total es el del archivo
+    más lento.
+    
+    generate_report_artefact está enrutada a la cola 'render'
+    (config/celery.py): si ningún worker atiende esa cola
+    (celery -A config worker -Q render), los archivos no se generan y el
+    informe queda en GENERATING.
+    
     Args:
         report_id: UUID del informe
         
     Returns:
-        dict: Resultado de la generación
+        dict: Resultado del envío de las subtareas
     """
+    from celery import chord
     from apps.report.models import Report
     
+    if not Report.objects.filter(id=report_id).exists():
+        logger.error(f"Informe {report_id} no encontrado")
+        return {
+            'success': False,
+            'error': f"Informe {report_id} no encontrado"
+        }
+    
+    logger.info(f"Generando archivos para informe {report_id}")
+    result = chord(
+        generate_report_artefact.s(str(report_id), artefact)
+        for artefact in REPORT_ARTEFACTS
+    )(finalize_report_files.s(str(report_id)))
+    
+    return {
+        'success': True,
+        'report_id': str(report_id),
+        'artefacts': list(REPORT_ARTEFACTS),
+        'task_id': result.id
+    }
+
+
+@shared_task(
+    bind=True,
+    name='apps.report.tasks.generate_report_artefact',
+    max_retries=3,
+    default_retry_delay=30,
+)
+def generate_report_artefact(self, report_id, artefact):
+    """
+    Genera y guarda un archivo (PDF o Excel) de un informe.
+    
+    Un error se reintenta solo para este archivo; agotados los reintentos
+    se retorna el error en lugar de lanzarlo, para que el chord igual
+    ejecute finalize_report_files. Si el mismo archivo ya se está generando
+    (p. ej. dos regenerate_files seguidos), se espera y se usa ese archivo.
+    
+    Args:
+        report_id: UUID del informe
+        artefact (str): Clave de REPORT_ARTEFACTS ('pdf' o 'excel')
+    
+    Returns:
+        dict: artefact, success y error (si falló)
+    """
+    from apps.report.models import Report
+    
+    exporter_class, field_name, extension = REPORT_ARTEFACTS[artefact]
+    
     try:
         report = Report.objects.get(id=report_id)
-        logger.info(f"Generando archivos para informe {report_id}")
+        previous_name = getattr(report, field_name).name
         
-        # Generar PDF
-        try:
-            pdf_exporter = PDFExporter(report)
-            pdf_buffer = pdf_exporter.generate()
+        def render():
+            current = Report.objects.get(id=report_id)
+            start = time.perf_counter()
+            buffer = exporter_class(current).generate()
+            Metrics.observe_document(
+                'render', 'report', extension, time.perf_counter() - start, Metrics.document_size(buffer)
+            )
             
-            filename = f"{report.get_filename_base()}.pdf"
-            report.pdf_file.save(filename, ContentFile(pdf_buffer.read()), save=False)
-            logger.info(f"PDF generado para informe {report_id}")
-        except Exception as e:
-            logger.error(f"Error generando PDF para informe {report_id}: {str(e)}")
-        
-        # Generar Excel
-        try:
-            excel_exporter = ExcelExporter(report)
-            excel_buffer = excel_exporter.generate()
+            field_file = getattr(current, field_name)
+            field_file.save(f"{current.get_filename_base()}.{extension}", ContentFile(buffer.read()), save=False)
+            # Solo se actualiza la columna de este archivo: las demás subtareas
+            # escriben el mismo informe en paralelo
+            Report.objects.filter(id=report_id).update(**{field_name: field_file.name})
             
-            filename = f"{report.get_filename_base()}.xlsx"
-            report.excel_file.save(filename, ContentFile(excel_buffer.read()), save=False)
-            logger.info(f"Excel generado para informe {report_id}")
-        except Exception as e:
-            logger.error(f"Error generando Excel para informe {report_id}: {str(e)}")
+            logger.info(f"{artefact.upper()} generado para informe {report_id}")
+            return {'artefact': artefact, 'success': True}
         
-        # Guardar el informe con los archivos
-        report.save()
+        def reuse():
+            current_name = Report.objects.filter(id=report_id).values_list(field_name, flat=True).first()
+            if current_name != previous_name:
+                return {'artefact': artefact, 'success': True, 'attached': True}
+            return None
         
-        return {
-            'success': True,
-            'report_id': report_id,
-            'has_pdf': report.has_pdf(),
-            'has_excel': report.has_excel()
-        }
+        result, _ = ReportSingleFlight.run(('files', report_id, artefact), render, reuse)
+        return result
         
     except Report.DoesNotExist:
         logger.error(f"Informe {report_id} no encontrado")
+        return {'artefact': artefact, 'success': False, 'error': f"Informe {report_id} no encontrado"}
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            logger.warning(f"Error generando {artefact} para informe {report_id}, reintentando: {str(e)}")
+            raise self.retry(exc=e)
+        logger.error(f"Error generando {artefact} para informe {report_id}: {str(e)}")
+        return {'artefact': artefact, 'success': False, 'error': str(e)}
+
+
+@shared_task(name='apps.report.tasks.finalize_report_files')
+def finalize_report_files(results, report_id):
+    """
+    Cierre del chord de generate_report_files.
+    
+    Si se generó al menos un archivo el informe queda COMPLETED (con los
+    archivos fallidos en error_message); si no se generó ninguno queda
+    FAILED con los errores de cada archivo.
+    
+    Args:
+        results (list): Resultados de generate_report_artefact
+        report_id: UUID del informe
+    
+    Returns:
+        dict: Resultado de la generación
+    """
+    from apps.report.models import Report
+    
+    generated = [result['artefact'] for result in results if result.get('success')]
+    failed = [result for result in results if not result.get('success')]
+    errors = {result['artefact']: result.get('error', '') for result in failed}
+    error_message = '; '.join(f"{artefact}: {error}" for artefact, error in errors.items())
+    
+    report_status = 'COMPLETED' if generated else 'FAILED'
+    Report.objects.filter(id=report_id).update(status=report_status, error_message=error_message)
+    
+    if not generated:
+        logger.error(f"No se generó ningún archivo del informe {report_id}: {error_message}")
+    elif failed:
+        logger.error(f"Archivos con error en informe {report_id}: {error_message}")
+    else:
+        logger.info(f"Archivos generados para informe {report_id}")
+    
+    return {
+        'success': not failed,
+        'report_id': report_id,
+        'status': report_status,
+        'generated': generated,
+        'failed': list(errors),
+        'errors': errors
+    }
+
+
+@shared_task(name='apps.report.tasks.dispatch_due_schedules_task')
+def dispatch_due_schedules_task():
+    """
+    Tarea programada (cada minuto) que reclama los reportes programados
+    vencidos y los reparte entre los workers.
+    
+    Las programaciones se reclaman en lotes con select_for_update(skip_locked)
+    y su next_run se adelanta antes de encolarlas, así que varios
+    planificadores en paralelo nunca ejecutan dos veces la misma.
+    
+    Returns:
+        dict: Cantidad de programaciones encoladas
+    """
+    from celery import group
+    from apps.report.services import ScheduleService
+    
+    dispatched = 0
+    while True:
+        claimed = ScheduleService.claim_due()
+        if not claimed:
+            break
+        
+        group(
+            run_report_schedule_task.s(schedule_id, reference_date.isoformat())
+            for schedule_id, reference_date in claimed
+        ).apply_async()
+        dispatched += len(claimed)
+        
+        if len(claimed) < ScheduleService.CLAIM_BATCH_SIZE:
+            break
+    
+    if dispatched:
+        logger.info(f"{dispatched} reportes programados encolados")
+    
+    return {
+        'success': True,
+        'dispatched': dispatched
+    }
+
+
+@shared_task(
+    bind=True,
+    name='apps.report.tasks.run_report_schedule_task',
+    max_retries=2,
+    default_retry_delay=60,
+)
+def run_report_schedule_task(self, schedule_id, reference_date):
+    """
+    Ejecuta un reporte programado y guarda el archivo resultante en
+    ReportSchedule.last_file.
+    
+    Args:
+        schedule_id: UUID de la programación
+        reference_date (str): Fecha de la ejecución (YYYY-MM-DD)
+    
+    Returns:
+        dict: Resultado de la ejecución
+    """
+    from datetime import date
+    from apps.report.models import ReportSchedule
+    from apps.report.services import ScheduleService
+    
+    try:
+        schedule = ScheduleService.execute(schedule_id, date.fromisoformat(reference_date))
+        logger.info(f"Reporte programado {schedule_id} generado: {schedule.last_file.name}")
+        return {
+            'success': True,
+            'schedule_id': schedule_id,
+            'file': schedule.last_file.name
+        }
+    
+    except ReportSchedule.DoesNotExist:
+        logger.error(f"Reporte programado {schedule_id} no encontrado")
         return {
             'success': False,
-            'error': f"Informe {report_id} no encontrado"
+            'error': f"Reporte programado {schedule_id} no encontrado"
+        }
+    except ValueError as e:
+        # Configuración inválida: reintentar no sirve
+        logger.error(f"Reporte programado {schedule_id} inválido: {str(e)}")
+        return {
+            'success': False,
+            'schedule_id': schedule_id,
+            'error': str(e)
         }
     except Exception as e:
-        logger.error(f"Error generando archivos para informe {report_id}: {str(e)}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e)
+        logger.error(f"Error ejecutando reporte programado {schedule_id}: {str(e)}")
         return {
             'success': False,
+            'schedule_id': schedule_id,
             'error': str(e)
         }
 
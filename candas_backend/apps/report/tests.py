@@ -1,3 +1,825 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from io import BytesIO
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest.mock import PropertyMock, patch
 
-# Create your tests here.
+from celery.backends.cache import CacheBackend
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+from apps.catalog.models import TransportAgency
+from apps.logistics.models import Batch, Pull
+from apps.packages.models import Package, PackageStatusHistory
+from apps.shared.services.query_budget import assert_within_budget
+from config.celery import app as celery_app
+from .models import Report, ReportDetail, ReportSchedule
+from .services.daily_report_service import DailyReportService
+from .services.period_report_service import PeriodReportService
+from .services.schedule_service import ScheduleService
+from .services.excel_exporter import ExcelExporter
+from .services.pdf_exporter import PDFExporter
+from .services.single_flight import ReportInProgress, ReportSingleFlight
+from .tasks import (
+    ensure_daily_report_task, finalize_report_files, generate_daily_report_task, generate_report_files,
+)
+
+
+REPORT_DATE = date(2026, 3, 10)
+
+
+def create_package(guide_number, **kwargs):
+    """Crea un paquete con los campos obligatorios."""
+    data = {
+        'guide_number': guide_number,
+        'name': f'CLIENTE {guide_number}',
+        'address': 'AV. AMAZONAS',
+        'phone_number': '0999999999',
+        'city': 'QUITO',
+        'province': 'PICHINCHA',
+    }
+    data.update(kwargs)
+    return Package.objects.create(**data)
+
+
+def record_change(package, old_status, new_status, day=REPORT_DATE, hour=10):
+    """Registra un cambio de estado en la fecha y hora indicadas."""
+    change = PackageStatusHistory.objects.create(
+        package=package, old_status=old_status, new_status=new_status
+    )
+    changed_at = timezone.make_aware(datetime.combine(day, time(hour)))
+    PackageStatusHistory.objects.filter(pk=change.pk).update(changed_at=changed_at)
+    return change
+
+
+def dispatch(package, day=REPORT_DATE, hour=10):
+    return record_change(package, 'EN_BODEGA', 'EN_TRANSITO', day, hour)
+
+
+class MediaRootMixin:
+    """MEDIA_ROOT temporal para que los archivos generados no queden en disco."""
+    
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class DailyReportTests(MediaRootMixin, TestCase):
+    """Reportes diarios a partir del historial de estados."""
+    
+    def setUp(self):
+        super().setUp()
+        self.servientrega = TransportAgency.objects.create(name='SERVIENTREGA', phone_number='022222222')
+        self.tramaco = TransportAgency.objects.create(name='TRAMACO', phone_number='023333333')
+        self.batch = Batch.objects.create(destiny='QUITO', transport_agency=self.tramaco)
+        self.pull = Pull.objects.create(
+            common_destiny='QUITO', size='MEDIANO', batch=self.batch, transport_agency=self.servientrega
+        )
+        self.loose_pull = Pull.objects.create(common_destiny='QUITO', size='PEQUENO', transport_agency=self.servientrega)
+        self.in_batch = [create_package(f'LOTE{number}', pull=self.pull) for number in range(2)]
+        self.in_pull = create_package('SACA1', pull=self.loose_pull)
+        self.individual = create_package('IND1', transport_agency=self.servientrega)
+        self.no_agency = create_package('SIN1')
+        for package in self.in_batch + [self.in_pull, self.individual, self.no_agency]:
+            dispatch(package)
+    
+    def test_by_agency_is_keyed_by_agency_id(self):
+        report = DailyReportService.generate_dispatch_report(REPORT_DATE)
+        
+        by_agency = report.json_data['by_agency']
+        self.assertEqual(set(by_agency), {
+            str(self.tramaco.id), str(self.servientrega.id), DailyReportService.NO_AGENCY_KEY,
+        })
+        # La agencia del lote tiene prioridad sobre la de la saca
+        self.assertEqual(by_agency[str(self.tramaco.id)], {
+            'agency_id': str(self.tramaco.id),
+            'name': 'TRAMACO',
+            'packages_count': 2,
+            'sacas_count': 1,
+            'lotes_count': 1,
+        })
+        self.assertEqual(by_agency[str(self.servientrega.id)]['packages_count'], 2)
+        self.assertEqual(by_agency['none']['name'], 'Sin Agencia')
+        self.assertIsNone(by_agency['none']['agency_id'])
+        
+        self.assertEqual(report.total_packages, 5)
+        self.assertEqual(report.total_sacas, 2)
+        self.assertEqual(report.total_lotes, 1)
+        self.assertEqual(report.total_individual_packages, 2)
+        self.assertEqual(ReportDetail.objects.filter(report=report).count(), 3)
+    
+    def test_agency_named_like_placeholder_is_not_merged(self):
+        placeholder = TransportAgency.objects.create(name='Sin Agencia', phone_number='024444444')
+        dispatch(create_package('IND2', transport_agency=placeholder))
+        
+        by_agency = DailyReportService.generate_dispatch_report(REPORT_DATE).json_data['by_agency']
+        
+        self.assertEqual(by_agency[str(placeholder.id)]['packages_count'], 1)
+        self.assertEqual(by_agency['none']['packages_count'], 1)
+    
+    def test_renamed_agency_stays_one_entry(self):
+        DailyReportService.generate_dispatch_report(REPORT_DATE)
+        self.servientrega.name = 'SERVIENTREGA EXPRESS'
+        self.servientrega.save()
+        dispatch(create_package('IND2', transport_agency=self.servientrega), hour=12)
+        
+        report = DailyReportService.generate_dispatch_report(REPORT_DATE, incremental=True)
+        
+        by_agency = report.json_data['by_agency']
+        self.assertEqual(len(by_agency), 3)
+        self.assertEqual(by_agency[str(self.servientrega.id)]['packages_count'], 3)
+    
+    def test_incremental_reads_only_new_changes(self):
+        report = DailyReportService.generate_dispatch_report(REPORT_DATE)
+        updated_at = report.updated_at
+        
+        same = DailyReportService.generate_dispatch_report(REPORT_DATE, incremental=True)
+        self.assertEqual(same.updated_at, updated_at)
+        
+        dispatch(create_package('IND2'), hour=15)
+        # Un paquete que ya estaba en el reporte no se cuenta dos veces
+        dispatch(self.individual, hour=16)
+        report = DailyReportService.generate_dispatch_report(REPORT_DATE, incremental=True)
+        
+        self.assertEqual(report.total_packages, 6)
+        self.assertEqual(report.json_data['by_agency']['none']['packages_count'], 2)
+        self.assertEqual(Report.objects.filter(report_type='DAILY_DISPATCH').count(), 1)
+    
+    def test_other_days_and_transitions_are_ignored(self):
+        dispatch(create_package('AYER'), day=REPORT_DATE - timedelta(days=1))
+        record_change(create_package('RECIBIDO'), 'NO_RECEPTADO', 'EN_BODEGA')
+        
+        dispatch_report = DailyReportService.generate_dispatch_report(REPORT_DATE)
+        reception = DailyReportService.generate_reception_report(REPORT_DATE)
+        
+        self.assertEqual(dispatch_report.total_packages, 5)
+        self.assertEqual(reception.total_packages, 1)
+        self.assertEqual(reception.json_data['summary'], {'total_packages': 1})
+    
+    def test_exporters_use_agency_names(self):
+        report = DailyReportService.generate_dispatch_report(REPORT_DATE)
+        
+        workbook = load_workbook(BytesIO(ExcelExporter(report).generate().getvalue()))
+        sheet = workbook.worksheets[1]
+        names = [sheet.cell(row=row, column=1).value for row in range(4, 7)]
+        self.assertEqual(names, ['SERVIENTREGA', 'Sin Agencia', 'TRAMACO'])
+        self.assertTrue(PDFExporter(report).generate().getvalue().startswith(b'%PDF'))
+    
+    def test_exporters_read_reports_keyed_by_name(self):
+        report = Report.objects.create(
+            report_type='DAILY_DISPATCH', report_date=REPORT_DATE, status='COMPLETED',
+            json_data={'by_agency': {'TRAMACO': {'packages_count': 2, 'sacas_count': 1, 'lotes_count': 1}}},
+        )
+        
+        workbook = load_workbook(BytesIO(ExcelExporter(report).generate().getvalue()))
+        self.assertEqual(workbook.worksheets[1].cell(row=4, column=1).value, 'TRAMACO')
+        self.assertTrue(PDFExporter(report).generate().getvalue().startswith(b'%PDF'))
+
+
+class DailyReportEndpointTests(MediaRootMixin, TestCase):
+    """Endpoints generate-daily-dispatch y generate-daily-reception."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        dispatch(create_package('IND1'))
+    
+    def test_generate_then_refresh(self):
+        with patch('apps.report.api.views.generate_report_files.delay') as delay:
+            response = self.client.post('/api/v1/reports/generate-daily-dispatch/', {
+                'report_date': str(REPORT_DATE),
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['report']['total_packages'], 1)
+            
+            response = self.client.post('/api/v1/reports/generate-daily-dispatch/', {
+                'report_date': str(REPORT_DATE),
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            
+            dispatch(create_package('IND2'), hour=11)
+            response = self.client.post('/api/v1/reports/generate-daily-dispatch/', {
+                'report_date': str(REPORT_DATE), 'refresh': True,
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['report']['total_packages'], 2)
+        self.assertEqual(delay.call_count, 2)
+
+    def test_invalid_date(self):
+        response = self.client.post('/api/v1/reports/generate-daily-dispatch/', {
+            'report_date': '10/03/2026',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_generate_daily_builds_dispatch_report(self):
+        response = self.client.post('/api/v1/reports/generate_daily/', {
+            'report_date': str(REPORT_DATE), 'generate_files': False,
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 201)
+        report = Report.objects.get()
+        self.assertEqual(report.report_type, 'DAILY_DISPATCH')
+        self.assertEqual(report.total_packages, 1)
+    
+    def test_daily_task_builds_dispatch_report(self):
+        now = timezone.make_aware(datetime.combine(REPORT_DATE + timedelta(days=1), time(1)))
+        with patch('apps.report.tasks.timezone.now', return_value=now), \
+                patch('apps.report.tasks.generate_report_files.delay') as delay:
+            result = generate_daily_report_task()
+        
+        self.assertTrue(result['success'], result)
+        report = Report.objects.get(report_type='DAILY_DISPATCH', report_date=REPORT_DATE)
+        self.assertEqual(result['report_id'], str(report.id))
+        delay.assert_called_once_with(str(report.id))
+
+
+class PeriodReportTests(MediaRootMixin, TestCase):
+    """Informes de período compuestos con los informes diarios guardados."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.agency = TransportAgency.objects.create(name='SERVIENTREGA', phone_number='022222222')
+        self.first_day = date(2026, 3, 1)
+        dispatch(create_package('M1', transport_agency=self.agency), day=self.first_day)
+        dispatch(create_package('M2', transport_agency=self.agency), day=date(2026, 3, 15))
+        dispatch(create_package('M3'), day=date(2026, 3, 15))
+    
+    def post_range(self, date_from, date_to, **data):
+        return self.client.post('/api/v1/reports/range-report/', {
+            'date_from': str(date_from), 'date_to': str(date_to), **data,
+        }, format='json')
+    
+    def test_range_sums_daily_reports_by_agency_id(self):
+        data = PeriodReportService.get_range_data(date(2026, 3, 1), date(2026, 3, 31))
+        
+        self.assertEqual(data['summary']['total_packages'], 3)
+        self.assertEqual(data['summary']['days'], 31)
+        self.assertEqual(len(data['recomputed_days']), 31)
+        self.assertEqual(data['by_agency'][str(self.agency.id)]['packages_count'], 2)
+        self.assertEqual(data['by_agency'][str(self.agency.id)]['name'], 'SERVIENTREGA')
+        self.assertEqual(data['by_agency']['none']['packages_count'], 1)
+    
+    def test_empty_days_are_stored_once(self):
+        PeriodReportService.ensure_daily_reports('DAILY_DISPATCH', date(2026, 3, 1), date(2026, 3, 5))
+        
+        empty = Report.objects.get(report_type='DAILY_DISPATCH', report_date=date(2026, 3, 2))
+        self.assertTrue(empty.json_data['empty'])
+        self.assertEqual(empty.total_packages, 0)
+        full = Report.objects.get(report_type='DAILY_DISPATCH', report_date=self.first_day)
+        self.assertFalse(full.json_data['empty'])
+        
+        self.assertEqual(
+            PeriodReportService.ensure_daily_reports('DAILY_DISPATCH', date(2026, 3, 1), date(2026, 3, 5)),
+            []
+        )
+    
+    def test_stale_and_future_days_are_pending(self):
+        PeriodReportService.ensure_daily_reports('DAILY_DISPATCH', date(2026, 3, 1), date(2026, 3, 2))
+        # Guardado antes de que terminara su día: puede faltarle información
+        Report.objects.filter(report_date=date(2026, 3, 2)).update(
+            updated_at=timezone.make_aware(datetime(2026, 3, 2, 12))
+        )
+        today = timezone.localdate()
+        
+        pending = PeriodReportService.get_pending_days('DAILY_DISPATCH', date(2026, 3, 1), date(2026, 3, 3))
+        self.assertEqual(pending, [(date(2026, 3, 2), True), (date(2026, 3, 3), False)])
+        self.assertEqual(
+            PeriodReportService.get_pending_days('DAILY_DISPATCH', today + timedelta(days=1), today + timedelta(days=3)),
+            []
+        )
+    
+    @override_settings(REPORT_RANGE_SYNC_MAX_DAYS=7)
+    def test_short_range_is_computed_in_request(self):
+        response = self.post_range(date(2026, 3, 1), date(2026, 3, 7))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['recomputed_days']), 7)
+        self.assertEqual(response.data['summary']['total_packages'], 1)
+    
+    @override_settings(REPORT_RANGE_SYNC_MAX_DAYS=7)
+    def test_long_range_is_enqueued(self):
+        with patch.object(PeriodReportService, 'submit_pending_days') as submit:
+            submit.return_value.id = 'grupo-1'
+            response = self.post_range(date(2026, 3, 1), date(2026, 3, 31))
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['task_id'], 'grupo-1')
+        self.assertEqual(len(response.data['pending_days']), 31)
+        submit.assert_called_once()
+        self.assertEqual(Report.objects.filter(report_type='DAILY_DISPATCH').count(), 0)
+        
+        # Cuando los subtasks terminan, la misma petición retorna el informe
+        for day in response.data['pending_days']:
+            ensure_daily_report_task.apply(args=['DAILY_DISPATCH', day])
+        response = self.post_range(date(2026, 3, 1), date(2026, 3, 31))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['recomputed_days'], [])
+        self.assertEqual(response.data['summary']['total_packages'], 3)
+    
+    def test_ensure_daily_report_task_is_idempotent(self):
+        first = ensure_daily_report_task.apply(args=['DAILY_DISPATCH', '2026-03-15']).get()
+        second = ensure_daily_report_task.apply(args=['DAILY_DISPATCH', '2026-03-15']).get()
+        
+        self.assertTrue(first['recomputed'])
+        self.assertFalse(second['recomputed'])
+        self.assertEqual(Report.objects.get(report_date=date(2026, 3, 15)).total_packages, 2)
+    
+    def test_invalid_ranges(self):
+        self.assertEqual(self.post_range(date(2026, 3, 2), date(2026, 3, 1)).status_code, 400)
+        self.assertEqual(self.post_range(date(2024, 1, 1), date(2025, 6, 1)).status_code, 400)
+        self.assertEqual(self.post_range(date(2026, 3, 1), date(2026, 3, 2), type='otro').status_code, 400)
+    
+    def test_monthly_report(self):
+        report = PeriodReportService.generate_monthly_report(2026, 3)
+        
+        self.assertEqual(report.report_type, 'MONTHLY')
+        self.assertEqual(report.total_packages, 3)
+        self.assertEqual(report.json_data['by_agency'][str(self.agency.id)]['packages_count'], 2)
+        self.assertEqual(ReportDetail.objects.filter(report=report).count(), 2)
+
+
+class ReportFilesTests(MediaRootMixin, TestCase):
+    """Generación en paralelo de los archivos PDF y Excel de un informe."""
+    
+    def setUp(self):
+        super().setUp()
+        # El chord se congela contra el backend de resultados; en tests se usa uno en memoria
+        backend = patch.object(
+            type(celery_app), 'backend', new_callable=PropertyMock,
+            return_value=CacheBackend(app=celery_app, url='memory://'),
+        )
+        backend.start()
+        self.addCleanup(backend.stop)
+        # Las subtareas del chord se ejecutan en línea, sin broker
+        previous = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', previous)
+        
+        dispatch(create_package('IND1'))
+        self.report = DailyReportService.generate_dispatch_report(REPORT_DATE)
+        Report.objects.filter(pk=self.report.pk).update(status='GENERATING')
+    
+    def generate(self):
+        generate_report_files.apply(args=[str(self.report.id)])
+        return Report.objects.get(pk=self.report.pk)
+    
+    def test_both_files_are_generated(self):
+        report = self.generate()
+        
+        self.assertEqual(report.status, 'COMPLETED')
+        self.assertEqual(report.error_message, '')
+        self.assertTrue(report.pdf_file.name.endswith('.pdf'))
+        self.assertTrue(report.excel_file.name.endswith('.xlsx'))
+    
+    def test_partial_failure_keeps_report_completed(self):
+        with patch.object(ExcelExporter, 'generate', side_effect=RuntimeError('sin memoria')):
+            report = self.generate()
+        
+        self.assertEqual(report.status, 'COMPLETED')
+        self.assertEqual(report.error_message, 'excel: sin memoria')
+        self.assertTrue(report.pdf_file.name)
+        self.assertFalse(report.excel_file.name)
+    
+    def test_all_failed_marks_report_failed(self):
+        with patch.object(ExcelExporter, 'generate', side_effect=RuntimeError('excel roto')), \
+                patch.object(PDFExporter, 'generate', side_effect=RuntimeError('pdf roto')) as pdf:
+            report = self.generate()
+        
+        self.assertEqual(report.status, 'FAILED')
+        self.assertIn('pdf: pdf roto', report.error_message)
+        self.assertIn('excel: excel roto', report.error_message)
+        # Cada archivo se reintenta por separado antes de darse por fallido
+        self.assertEqual(pdf.call_count, 4)
+    
+    def test_finalize_surfaces_errors(self):
+        result = finalize_report_files([
+            {'artefact': 'pdf', 'success': False, 'error': 'pdf roto'},
+            {'artefact': 'excel', 'success': False, 'error': 'excel roto'},
+        ], str(self.report.id))
+        
+        self.assertEqual(result['status'], 'FAILED')
+        self.assertEqual(result['generated'], [])
+        self.assertEqual(result['errors'], {'pdf': 'pdf roto', 'excel': 'excel roto'})
+    
+    def test_missing_report(self):
+        result = generate_report_files.apply(args=['00000000-0000-0000-0000-000000000000']).get()
+        self.assertFalse(result['success'])
+
+
+class SingleFlightTests(TestCase):
+    """Una sola generación a la vez por informe (advisory lock de PostgreSQL)."""
+    
+    PARTS = ('DAILY_DISPATCH', REPORT_DATE)
+    
+    def setUp(self):
+        self.key = ReportSingleFlight.make_key(*self.PARTS)
+        poll = patch.object(ReportSingleFlight, 'POLL_INTERVAL', 0.05)
+        poll.start()
+        self.addCleanup(poll.stop)
+    
+    def hold_lock(self, seconds):
+        """Otro worker, con su propia conexión, mantiene el lock durante unos segundos."""
+        locked = threading.Event()
+        
+        def worker():
+            other = connections.create_connection('default')
+            try:
+                with other.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_lock(%s)', [self.key])
+                    locked.set()
+                    threading.Event().wait(seconds)
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [self.key])
+            finally:
+                other.close()
+        
+        thread = threading.Thread(target=worker)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.assertTrue(locked.wait(5))
+    
+    def assertUnlocked(self):
+        result, _ = ReportSingleFlight.run(self.PARTS, lambda: 'libre', timeout=0)
+        self.assertEqual(result, 'libre')
+    
+    def test_computes_and_releases_lock(self):
+        result, attached = ReportSingleFlight.run(self.PARTS, lambda: 'nuevo')
+        
+        self.assertEqual(result, 'nuevo')
+        self.assertFalse(attached)
+        self.assertUnlocked()
+    
+    def test_releases_lock_when_compute_fails(self):
+        def compute():
+            raise RuntimeError('error')
+        
+        with self.assertRaises(RuntimeError):
+            ReportSingleFlight.run(self.PARTS, compute)
+        self.assertUnlocked()
+    
+    def test_waiter_reuses_result(self):
+        self.hold_lock(0.2)
+        
+        result, attached = ReportSingleFlight.run(
+            self.PARTS, lambda: self.fail('no debe generar de nuevo'), lambda: 'en curso', timeout=5
+        )
+        
+        self.assertEqual(result, 'en curso')
+        self.assertTrue(attached)
+    
+    def test_waiter_computes_when_nothing_to_reuse(self):
+        self.hold_lock(0.2)
+        
+        result, attached = ReportSingleFlight.run(self.PARTS, lambda: 'nuevo', lambda: None, timeout=5)
+        
+        self.assertEqual(result, 'nuevo')
+        self.assertFalse(attached)
+    
+    def test_timeout_raises_in_progress(self):
+        self.hold_lock(0.5)
+        
+        with self.assertRaises(ReportInProgress):
+            ReportSingleFlight.run(self.PARTS, lambda: 'nuevo', timeout=0.1)
+    
+    def test_request_wait_uses_short_timeout(self):
+        with override_settings(REPORT_SINGLE_FLIGHT_TIMEOUT=300, REPORT_SINGLE_FLIGHT_REQUEST_TIMEOUT=2):
+            with ReportSingleFlight.request_wait():
+                self.assertEqual(ReportSingleFlight.get_timeout(), 2)
+            self.assertEqual(ReportSingleFlight.get_timeout(), 300)
+    
+    def test_endpoints_return_conflict_while_generating(self):
+        user = User.objects.create_user('operador', password='clave', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        self.hold_lock(0.5)
+        
+        # Las vistas no usan la espera larga de las tareas de Celery
+        with override_settings(REPORT_SINGLE_FLIGHT_TIMEOUT=300, REPORT_SINGLE_FLIGHT_REQUEST_TIMEOUT=0.1):
+            for url in ('/api/v1/reports/generate-daily-dispatch/', '/api/v1/reports/generate_daily/'):
+                with self.subTest(url=url):
+                    response = client.post(url, {'report_date': str(REPORT_DATE)}, format='json')
+                    self.assertEqual(response.status_code, 409)
+        
+        self.assertFalse(Report.objects.exists())
+
+
+class ReportScheduleTests(MediaRootMixin, TestCase):
+    """Validación de config, reclamo de programaciones vencidas y last_file."""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def create_schedule(self, **kwargs):
+        data = {
+            'user': self.user,
+            'name': 'Estadísticas',
+            'report_type': 'statistics',
+            'frequency': 'DAILY',
+            'next_run': timezone.now() - timedelta(minutes=1),
+        }
+        data.update(kwargs)
+        return ReportSchedule.objects.create(**data)
+    
+    def post_schedule(self, frequency, config):
+        return self.client.post('/api/v1/report-schedules/', {
+            'name': 'Paquetes',
+            'report_type': 'packages',
+            'frequency': frequency,
+            'config': config,
+            'recipients': ['ops@example.com'],
+        }, format='json')
+    
+    def test_custom_frequency_requires_interval_and_period(self):
+        response = self.post_schedule('CUSTOM', {'interval_hours': 12})
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('period_days', str(response.data['config']))
+    
+    def test_config_values_must_be_positive_integers(self):
+        for value in (0, -3, 'abc', 1.5, True):
+            with self.subTest(value=value):
+                response = self.post_schedule('CUSTOM', {'interval_hours': value, 'period_days': 1})
+                self.assertEqual(response.status_code, 400)
+        
+        response = self.post_schedule('DAILY', {'format': 'docx'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_valid_config_is_normalized(self):
+        response = self.post_schedule('CUSTOM', {'interval_hours': '12', 'period_days': 3, 'format': 'csv'})
+        
+        self.assertEqual(response.status_code, 201)
+        schedule = ReportSchedule.objects.get()
+        self.assertEqual(schedule.config, {'interval_hours': 12, 'period_days': 3, 'format': 'csv'})
+    
+    def test_partial_update_validates_against_stored_config(self):
+        schedule = self.create_schedule(config={})
+        
+        response = self.client.patch(f'/api/v1/report-schedules/{schedule.id}/', {
+            'frequency': 'CUSTOM',
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 400)
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.frequency, 'DAILY')
+    
+    def test_claim_due_skips_invalid_config(self):
+        now = timezone.now()
+        broken = self.create_schedule(frequency='CUSTOM', config={'interval_hours': 'nunca', 'period_days': 1})
+        valid = self.create_schedule(name='Destinos', report_type='destinations')
+        
+        claimed = ScheduleService.claim_due(now=now)
+        
+        self.assertEqual([schedule_id for schedule_id, _ in claimed], [str(valid.id)])
+        broken.refresh_from_db()
+        self.assertIn('interval_hours', broken.last_error)
+        self.assertIsNone(broken.last_run)
+        self.assertGreater(broken.next_run, now)
+        valid.refresh_from_db()
+        self.assertEqual(valid.last_run, now)
+        self.assertEqual(valid.last_error, '')
+    
+    def test_execute_replaces_previous_file(self):
+        schedule = self.create_schedule()
+        
+        with patch.object(ScheduleService, 'render', return_value=(b'{}', 'json')):
+            ScheduleService.execute(schedule.id, REPORT_DATE)
+            last_file = ScheduleService.execute(schedule.id, REPORT_DATE).last_file
+        
+        folder = os.path.dirname(last_file.path)
+        self.assertEqual(os.listdir(folder), [os.path.basename(last_file.name)])
+
+
+class PackagesReportTests(TestCase):
+    """Reporte de paquetes JSON: proyección, paginación por cursor y NDJSON."""
+    
+    URL = '/api/v1/reports/packages_report/'
+    
+    def setUp(self):
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        
+        servientrega = TransportAgency.objects.create(name='SERVIENTREGA', phone_number='022222222')
+        tramaco = TransportAgency.objects.create(name='TRAMACO', phone_number='023333333')
+        batch = Batch.objects.create(destiny='GUAYAQUIL', transport_agency=tramaco, guide_number='LOTE-1')
+        pull = Pull.objects.create(
+            common_destiny='QUITO', size='MEDIANO', batch=batch, transport_agency=servientrega,
+            guide_number='SACA-1',
+        )
+        loose_pull = Pull.objects.create(
+            common_destiny='CUENCA', size='PEQUENO', transport_agency=servientrega, guide_number='SACA-2'
+        )
+        self.packages = [
+            create_package('LOTE1', pull=pull),
+            create_package('SACA1', pull=loose_pull),
+            create_package('IND1', transport_agency=servientrega),
+            create_package('SIN1'),
+            create_package('SIN2'),
+        ]
+        # Mismo created_at en dos paquetes: el cursor desempata por id
+        same_time = self.packages[3].created_at
+        Package.objects.filter(pk=self.packages[4].pk).update(created_at=same_time)
+    
+    def expected(self, package):
+        """Paquete del reporte calculado con los métodos del modelo."""
+        package = Package.objects.select_related('pull__batch', 'transport_agency').get(pk=package.pk)
+        shipment_type = package.get_shipment_type()
+        shipment_info = {'type': shipment_type, 'type_display': package.get_shipment_type_display()}
+        if shipment_type == 'lote':
+            shipment_info['batch'] = {
+                'id': str(package.pull.batch.id),
+                'destiny': package.pull.batch.destiny,
+                'guide_number': package.pull.batch.guide_number or '',
+            }
+        if shipment_type in ['saca', 'lote']:
+            shipment_info['pull'] = {
+                'id': str(package.pull.id),
+                'common_destiny': package.pull.get_effective_destiny(),
+                'guide_number': package.pull.get_effective_guide_number() or '',
+            }
+        agency = package.get_shipping_agency()
+        return {
+            'guide_number': package.guide_number,
+            'name': package.name,
+            'city': package.city,
+            'province': package.province,
+            'status': package.get_status_display(),
+            'shipment_type': package.get_shipment_type_display(),
+            'shipment_info': shipment_info,
+            'agency': agency.name if agency else 'Sin asignar',
+            'created_at': package.created_at.isoformat(),
+        }
+    
+    def post(self, **data):
+        return self.client.post(self.URL, {'filters': {}, **data}, format='json')
+    
+    def test_json_matches_model_methods(self):
+        response = self.post(format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        rows = {row['guide_number']: row for row in response.data['data']}
+        for package in self.packages:
+            self.assertEqual(rows[package.guide_number], self.expected(package))
+    
+    def test_cursor_walks_every_package_once(self):
+        full = [row['guide_number'] for row in self.post(format='json').data['data']]
+        
+        seen, cursor = [], None
+        for _ in range(5):
+            response = self.post(format='json', page_size=2, cursor=cursor)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(response.data['count'], 2)
+            seen += [row['guide_number'] for row in response.data['data']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        
+        self.assertIsNone(cursor)
+        self.assertEqual(seen, full)
+    
+    def test_invalid_cursor_and_page_size(self):
+        self.assertEqual(self.post(format='json', cursor='no-es-un-cursor').status_code, 400)
+        self.assertEqual(self.post(format='json', page_size='diez').status_code, 400)
+    
+    def test_ndjson_streams_one_package_per_line(self):
+        response = self.post(format='ndjson')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(rows, self.post(format='json').data['data'])
+
+
+class ReportJsonFileTests(MediaRootMixin, TestCase):
+    """json_data guardado como archivo gzip (Report.json_file)."""
+    
+    DATA = {'date': '2026-03-10', 'total': 2, 'packages': [{'guide_number': 'IND1'}]}
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.report = Report(report_type='DAILY', report_date=REPORT_DATE, status='COMPLETED')
+        self.report.json_data = self.DATA
+        self.report.save()
+    
+    def test_json_data_is_stored_compressed(self):
+        report = Report.objects.get(pk=self.report.pk)
+        
+        self.assertTrue(report.has_json())
+        self.assertTrue(report.json_file.name.endswith('.json.gz'))
+        with report.json_file.open('rb') as stored:
+            self.assertEqual(json.loads(gzip.decompress(stored.read())), self.DATA)
+        self.assertEqual(report.json_data, self.DATA)
+    
+    def test_reassigning_deletes_previous_file_on_commit(self):
+        previous = self.report.json_file.name
+        storage = self.report.json_file.storage
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.report.json_data = {'total': 3}
+            self.report.save(update_fields=['status'])
+        
+        report = Report.objects.get(pk=self.report.pk)
+        self.assertNotEqual(report.json_file.name, previous)
+        self.assertFalse(storage.exists(previous))
+        self.assertEqual(report.json_data, {'total': 3})
+    
+    def test_clearing_json_data_removes_file(self):
+        previous = self.report.json_file.name
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.report.json_data = None
+            self.report.save()
+        
+        report = Report.objects.get(pk=self.report.pk)
+        self.assertFalse(report.has_json())
+        self.assertIsNone(report.json_data)
+        self.assertFalse(self.report.json_file.storage.exists(previous))
+    
+    def test_download_json_gzip_and_plain(self):
+        url = f'/api/v1/reports/{self.report.pk}/download_json/'
+        
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(b''.join(response.streaming_content))), self.DATA)
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), self.DATA)
+    
+    def test_download_json_without_data(self):
+        report = Report.objects.create(report_type='DAILY', report_date=date(2026, 3, 11))
+        
+        response = self.client.get(f'/api/v1/reports/{report.pk}/download_json/')
+        
+        self.assertEqual(response.status_code, 404)
+
+
+class ReportQueryBudgetTests(TestCase):
+    """ReportViewSet respeta su query_budget sin importar la cantidad de informes."""
+    
+    def setUp(self):
+        # Sesión real: el presupuesto incluye las consultas de la sesión
+        self.user = User.objects.create_user('operador', password='clave', is_staff=True)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+    
+    def add_reports(self, first_day, count):
+        agencies = [
+            TransportAgency.objects.create(name=f'AGENCIA {first_day}-{number}', phone_number='022222222')
+            for number in range(3)
+        ]
+        for day in range(first_day, first_day + count):
+            report = Report.objects.create(
+                report_type='DAILY', report_date=date(2026, 1, day), status='COMPLETED', generated_by=self.user
+            )
+            for agency in agencies:
+                ReportDetail.objects.create(report=report, transport_agency=agency, destination='QUITO')
+    
+    def get_within_budget(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.query_budget)
+        assert_within_budget(response)
+        return response.query_stats.count
+    
+    def test_list_does_not_grow_with_reports(self):
+        self.add_reports(1, 2)
+        queries = self.get_within_budget('/api/v1/reports/')
+        
+        self.add_reports(10, 6)
+        self.assertEqual(self.get_within_budget('/api/v1/reports/'), queries)
+    
+    def test_retrieve_within_budget(self):
+        self.add_reports(1, 1)
+        
+        self.get_within_budget(f'/api/v1/reports/{Report.objects.get().pk}/')
@@ -0,0 +1,124 @@
+"""
+Middlewares compartidos
+"""
+from django.conf import settings
+import time
+
+from apps.shared.services.metrics import Metrics
+from apps.shared.services.profiler import ProfilerService
+from apps.shared.services.query_budget import capture_queries, check_budget, get_view_budget
+
+
+class MetricsMiddleware:
+    """
+    Latencia y consultas SQL de cada petición para /metrics (ver Metrics).
+    
+    La vista se etiqueta como en QueryBudgetMiddleware (`Vista.acción`), no
+    con la ruta, para no crear una serie por cada id. Debe ir primero en
+    MIDDLEWARE: las consultas se leen de response.query_stats.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not Metrics.is_enabled():
+            return self.get_response(request)
+        
+        request.metrics_view = Metrics.UNMATCHED_VIEW
+        start = time.perf_counter()
+        response = self.get_response(request)
+        stats = getattr(response, 'query_stats', None)
+        Metrics.observe_request(
+            request.metrics_view,
+            request.method,
+            response.status_code,
+            time.perf_counter() - start,
+            stats.count if stats is not None else None,
+        )
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'metrics_view'):
+            request.metrics_view = get_view_budget(view_func, request.method)[0]
+
+
+class QueryBudgetMiddleware:
+    """
+    Registra las consultas SQL de cada petición.
+    
+    - Header Server-Timing con la cantidad de consultas, el tiempo en base de
+      datos y las consultas repetidas (visible en las DevTools del navegador).
+    - Una línea de log JSON por petición; WARNING si la vista supera su
+      query_budget.
+    - Con QUERY_BUDGET_RAISE (pruebas) superar el presupuesto es un error.
+    
+    Las estadísticas quedan en response.query_stats y response.query_budget
+    (ver assert_within_budget).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return self.get_response(request)
+        
+        request.query_budget_view = (request.path, None)
+        with capture_queries(request.path) as stats:
+            response = self.get_response(request)
+        
+        label, budget = request.query_budget_view
+        stats.label = label
+        response['Server-Timing'] = stats.server_timing()
+        response.query_stats = stats
+        response.query_budget = budget
+        stats.log(
+            budget=budget,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+        )
+        
+        if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+            check_budget(stats, budget)
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'query_budget_view'):
+            request.query_budget_view = get_view_budget(view_func, request.method)
+
+
+class ProfilerMiddleware:
+    """
+    Perfila la petición si la pide un usuario is_staff con el header
+    `X-Profile: 1` o `?_profile=1` (ver ProfilerService).
+    
+    La respuesta lleva X-Profile-Id; el resumen y la salida de cProfile se
+    descargan en /api/v1/profiles/{id}/. Para otros usuarios el flag se
+    ignora. En respuestas en streaming solo se mide hasta que la vista
+    retorna, no el envío del cuerpo.
+    
+    Debe ir después de AuthenticationMiddleware (usa request.user).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not ProfilerService.is_requested(request) or not ProfilerService.can_profile(getattr(request, 'user', None)):
+            return self.get_response(request)
+        
+        with ProfilerService.profile(
+            f'{request.method} {request.path}', 'request',
+            method=request.method,
+            path=request.get_full_path(),
+            user=request.user.get_username(),
+        ) as session:
+            response = self.get_response(request)
+            if session is not None:
+                session.meta['status'] = response.status_code
+        
+        if session is not None:
+            response['X-Profile-Id'] = session.id
+        return response
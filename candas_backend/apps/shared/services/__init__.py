@@ -1,8 +1,35 @@
 from .manifest_template import BaseManifestGenerator
+from .streaming_table import StreamingTable
 from .label_template import BaseLabelGenerator
+from .zpl_template import BaseZPLGenerator, ZPLRenderer
+from .render_cache import RenderCache
+from .render_service import RenderService
+from .print_job_service import PrintJobService
+from .query_budget import QueryStats, QueryBudgetExceeded, capture_queries, assert_max_queries
+from .benchmark import BenchmarkCase, BenchmarkRunner
+from .profiler import ProfilerService
+from .metrics import Metrics
+from .response_cache import ResponseCache
+from .etag_service import ETagService
 
 __all__ = [
     'BaseManifestGenerator',
+    'StreamingTable',
     'BaseLabelGenerator',
+    'BaseZPLGenerator',
+    'ZPLRenderer',
+    'RenderCache',
+    'RenderService',
+    'PrintJobService',
+    'QueryStats',
+    'QueryBudgetExceeded',
+    'capture_queries',
+    'assert_max_queries',
+    'BenchmarkCase',
+    'BenchmarkRunner',
+    'ProfilerService',
+    'Metrics',
+    'ResponseCache',
+    'ETagService',
 ]
 
@@ -0,0 +1,227 @@
+"""
+Benchmarks de rutas críticas y comparación contra líneas base.
+
+Cada caso se ejecuta `warmup` veces sin medir y luego `rounds` veces
+midiendo el tiempo de reloj y las consultas SQL (capture_queries). Los
+resultados se guardan como JSON (línea base) y compare() marca los casos
+cuya mediana empeora más que el umbral o que ejecutan más consultas.
+
+Los casos que escriben en la base de datos (rollback=True) corren dentro de
+una transacción que se revierte al terminar cada ronda, para que todas las
+rondas vean los mismos datos.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+import django
+import gc
+import json
+import platform
+import statistics
+import time
+
+from .query_budget import capture_queries
+
+
+class BenchmarkCase:
+    """Una ruta crítica a medir."""
+    
+    def __init__(self, name, func, rounds=None, rollback=False):
+        """
+        Args:
+            name (str): Identificador estable (clave en la línea base)
+            func (callable): Ejecuta la operación una vez
+            rounds (int): Rondas propias (p. ej. 1 para importaciones grandes)
+            rollback (bool): Revertir lo que escribe cada ronda
+        """
+        self.name = name
+        self.func = func
+        self.rounds = rounds
+        self.rollback = rollback
+
+
+class BenchmarkRunner:
+    """Ejecuta casos de benchmark y compara resultados."""
+    
+    FORMAT_VERSION = 1
+    
+    # Regresión: la mediana crece más del 20% y al menos 5 ms
+    DEFAULT_THRESHOLD = 0.20
+    DEFAULT_MIN_DELTA_MS = 5.0
+    
+    # Estados de compare()
+    REGRESSION = 'REGRESION'
+    IMPROVEMENT = 'MEJORA'
+    UNCHANGED = 'OK'
+    NEW = 'NUEVO'
+    MISSING = 'FALTANTE'
+    
+    def __init__(self, rounds=5, warmup=1, stdout=None):
+        self.rounds = rounds
+        self.warmup = warmup
+        self.stdout = stdout
+    
+    def _log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+    
+    @staticmethod
+    def _call(case):
+        if not case.rollback:
+            return case.func()
+        with transaction.atomic():
+            result = case.func()
+            transaction.set_rollback(True)
+        return result
+    
+    def run_case(self, case):
+        """
+        Mide un caso.
+        
+        Returns:
+            dict: Tiempos en milisegundos (min, mediana, media, p95, max,
+                desviación) y consultas SQL por ronda
+        """
+        rounds = case.rounds or self.rounds
+        # Los casos con rondas propias son pesados: sin calentamiento
+        for _ in range(self.warmup if case.rounds is None else 0):
+            self._call(case)
+        
+        timings = []
+        queries = []
+        for _ in range(rounds):
+            gc.collect()
+            with capture_queries(case.name) as stats:
+                start = time.perf_counter()
+                self._call(case)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(stats.count)
+        
+        timings.sort()
+        return {
+            'rounds': rounds,
+            'min_ms': round(timings[0], 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'p95_ms': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)], 2),
+            'max_ms': round(timings[-1], 2),
+            'stdev_ms': round(statistics.stdev(timings), 2) if len(timings) > 1 else 0.0,
+            'queries': max(queries),
+        }
+    
+    def run(self, cases, metadata=None):
+        """
+        Mide todos los casos.
+        
+        Args:
+            cases (list): Instancias de BenchmarkCase
+            metadata (dict): Datos adicionales del entorno (p. ej. volumen de datos)
+        
+        Returns:
+            dict: Resultados listos para save()
+        """
+        results = {}
+        for case in cases:
+            self._log(f'  {case.name}...')
+            results[case.name] = self.run_case(case)
+            self._log(
+                f"    mediana {results[case.name]['median_ms']} ms, "
+                f"p95 {results[case.name]['p95_ms']} ms, "
+                f"{results[case.name]['queries']} consultas"
+            )
+        
+        return {
+            'version': self.FORMAT_VERSION,
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'debug': settings.DEBUG,
+                'machine': platform.node(),
+                **(metadata or {}),
+            },
+            'benchmarks': results,
+        }
+    
+    @staticmethod
+    def save(results, path):
+        """Guarda los resultados como JSON."""
+        with open(path, 'w', encoding='utf-8') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2, sort_keys=True)
+            output.write('\n')
+    
+    @staticmethod
+    def load(path):
+        """
+        Carga resultados guardados con save().
+        
+        Raises:
+            ValueError: Si el archivo no es un resultado de benchmark válido
+        """
+        try:
+            with open(path, encoding='utf-8') as source:
+                results = json.load(source)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f'No se pudo leer {path}: {e}')
+        
+        if not isinstance(results, dict) or results.get('version') != BenchmarkRunner.FORMAT_VERSION:
+            raise ValueError(f'{path} no es un resultado de benchmark (versión {BenchmarkRunner.FORMAT_VERSION})')
+        return results
+    
+    @staticmethod
+    def compare(baseline, current, threshold=None, min_delta_ms=None, metric='median_ms'):
+        """
+        Compara dos resultados caso por caso.
+        
+        Un caso es REGRESION si la métrica crece más que threshold (relativo)
+        y que min_delta_ms (absoluto), o si ejecuta más consultas SQL; MEJORA
+        si baja en la misma medida.
+        
+        Args:
+            baseline (dict): Resultados de referencia
+            current (dict): Resultados nuevos
+            threshold (float): Cambio relativo tolerado (0.2 = 20%)
+            min_delta_ms (float): Cambio absoluto mínimo para marcar
+            metric (str): Métrica de tiempo a comparar
+        
+        Returns:
+            list: Un dict por caso (name, status, baseline, current, change,
+                baseline_queries, current_queries)
+        """
+        threshold = BenchmarkRunner.DEFAULT_THRESHOLD if threshold is None else threshold
+        min_delta_ms = BenchmarkRunner.DEFAULT_MIN_DELTA_MS if min_delta_ms is None else min_delta_ms
+        before_all = baseline['benchmarks']
+        after_all = current['benchmarks']
+        
+        rows = []
+        for name in sorted(set(before_all) | set(after_all)):
+            before = before_all.get(name)
+            after = after_all.get(name)
+            row = {
+                'name': name,
+                'baseline': before[metric] if before else None,
+                'current': after[metric] if after else None,
+                'change': None,
+                'baseline_queries': before['queries'] if before else None,
+                'current_queries': after['queries'] if after else None,
+            }
+            
+            if before is None:
+                row['status'] = BenchmarkRunner.NEW
+            elif after is None:
+                row['status'] = BenchmarkRunner.MISSING
+            else:
+                delta = after[metric] - before[metric]
+                row['change'] = delta / before[metric] if before[metric] else 0.0
+                if after['queries'] > before['queries'] or (
+                    row['change'] > threshold and delta > min_delta_ms
+                ):
+                    row['status'] = BenchmarkRunner.REGRESSION
+                elif row['change'] < -threshold and -delta > min_delta_ms:
+                    row['status'] = BenchmarkRunner.IMPROVEMENT
+                else:
+                    row['status'] = BenchmarkRunner.UNCHANGED
+            rows.append(row)
+        
+        return rows
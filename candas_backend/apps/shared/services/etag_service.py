@@ -0,0 +1,276 @@
+"""
+ETags débiles y GET condicional para los detalles y listados de paquetes,
+sacas y lotes.
+
+El ETag se calcula con una sola consulta a partir de los updated_at del
+objeto y de las relaciones que aparecen en su representación, más los
+contadores cacheados (packages_count, pulls_count) y los conteos de sus
+relaciones a muchos. Si coincide con If-None-Match se responde 304 antes de
+ejecutar el serializer.
+
+El ETag se calcula antes de serializar: si el objeto cambia entre ambos
+pasos la respuesta lleva el ETag anterior y la siguiente revalidación
+descarga de nuevo (nunca se responde 304 con datos viejos).
+
+Las escrituras en bloque (QuerySet.update) deben actualizar updated_at
+para que los ETags cambien.
+"""
+from functools import wraps
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+import hashlib
+
+
+class ETagService:
+    """ETags de recursos de la API calculados sin serializar."""
+    
+    # Subir este número al cambiar los serializers de estos recursos
+    API_VERSION = 1
+    
+    # Columnas (del objeto y sus relaciones) de las que depende cada listado
+    PACKAGE_LIST_FIELDS = (
+        'updated_at',
+        'pull__updated_at',
+        'pull__batch__updated_at',
+        'transport_agency__updated_at',
+    )
+    PULL_LIST_FIELDS = (
+        'updated_at',
+        'packages_count',
+        'transport_agency__updated_at',
+    )
+    BATCH_LIST_FIELDS = (
+        'updated_at',
+        'pulls_count',
+        'packages_count',
+        'transport_agency__updated_at',
+    )
+    
+    @staticmethod
+    def make_etag(*parts):
+        """ETag débil: la representación puede variar según el formato pedido."""
+        raw = '|'.join(str(part) for part in (ETagService.API_VERSION,) + parts)
+        return f'W/"{hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]}"'
+    
+    @staticmethod
+    def tag(response, etag):
+        """Agrega el ETag a la respuesta (el navegador revalida siempre)."""
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    @staticmethod
+    def not_modified(request, etag):
+        """
+        Returns:
+            HttpResponse: 304 si el cliente ya tiene la versión (If-None-Match),
+                o None si hay que generar la respuesta
+        """
+        if etag is None or request.method not in ('GET', 'HEAD'):
+            return None
+        response = get_conditional_response(request, etag=etag)
+        return ETagService.tag(response, etag) if response is not None else None
+    
+    @staticmethod
+    def _object_version(model, pk, fields, aggregates=None):
+        """
+        Valores de versión de un objeto en una consulta.
+        
+        Returns:
+            tuple: Valores de fields y aggregates, o None si el objeto no
+                existe o el id no es válido
+        """
+        aggregates = aggregates or {}
+        try:
+            queryset = model._default_manager.filter(pk=pk).annotate(**aggregates)
+            return queryset.values_list(*fields, *aggregates).first()
+        except (ValueError, ValidationError):
+            return None
+    
+    @staticmethod
+    def package_etag(pk):
+        """
+        ETag del detalle de un paquete: el paquete, su saca y lote, las
+        agencias de los tres niveles, la agencia de reparto, sus ancestros
+        (padre y paquete raíz) y la cantidad de hijos.
+        
+        Padre y abuelo van en la misma consulta; con más niveles se suma
+        la versión del resto de la cadena (_ancestors_version).
+        """
+        from apps.packages.models import Package
+        
+        fields = ETagService.PACKAGE_LIST_FIELDS + (
+            'delivery_agency__updated_at',
+            'pull__transport_agency__updated_at',
+            'pull__batch__transport_agency__updated_at',
+            'parent__updated_at',
+            'parent__parent__updated_at',
+            'parent__parent__parent',
+        )
+        version = ETagService._object_version(Package, pk, fields, {
+            'children_total': Count('children'),
+        })
+        if version is None:
+            return None
+        ancestor = version[fields.index('parent__parent__parent')]
+        if ancestor is not None:
+            version += ETagService._ancestors_version(ancestor)
+        return ETagService.make_etag('package', pk, *version)
+    
+    @staticmethod
+    def _ancestors_version(pk):
+        """
+        Versión de la cadena de ancestros desde el paquete pk hasta la raíz,
+        tres niveles por consulta.
+        
+        Reasignar un padre actualiza updated_at del hijo, así que el máximo
+        updated_at de la cadena y el id de la raíz cambian con cualquier
+        cambio de la cadena.
+        
+        Returns:
+            tuple: (id de la raíz, máximo updated_at de la cadena)
+        """
+        from apps.packages.models import Package
+        
+        root, latest = None, None
+        visited = set()
+        while pk is not None:
+            row = Package.objects.filter(pk=pk).values_list(
+                'pk', 'updated_at',
+                'parent', 'parent__updated_at',
+                'parent__parent', 'parent__parent__updated_at',
+                'parent__parent__parent',
+            ).first()
+            if row is None:
+                break
+            pk = row[6]
+            for ancestor_id, updated_at in (row[0:2], row[2:4], row[4:6]):
+                # Protección contra ciclos, como Package.get_root_parent()
+                if ancestor_id is None or ancestor_id in visited:
+                    pk = None
+                    break
+                visited.add(ancestor_id)
+                root = ancestor_id
+                latest = updated_at if latest is None else max(latest, updated_at)
+        return root, latest
+    
+    @staticmethod
+    def pull_etag(pk):
+        """
+        ETag del detalle de una saca: la saca, su lote y agencias, y sus
+        paquetes (membresía, updated_at y agencias).
+        """
+        from apps.logistics.models import Pull
+        
+        version = ETagService._object_version(Pull, pk, ETagService.PULL_LIST_FIELDS + (
+            'batch__updated_at',
+            'batch__pulls_count',
+            'batch__transport_agency__updated_at',
+        ), {
+            'packages_total': Count('packages'),
+            'packages_at': Max('packages__updated_at'),
+            'packages_agency_at': Max('packages__transport_agency__updated_at'),
+        })
+        if version is None:
+            return None
+        return ETagService.make_etag('pull', pk, *version)
+    
+    @staticmethod
+    def batch_etag(pk):
+        """
+        ETag del detalle de un lote: el lote, sus sacas y los paquetes de sus
+        sacas (estados).
+        
+        El detalle incluye los totales de la agencia de transporte, que
+        cambian con cualquier paquete: se agrega la generación PACKAGES de
+        ResponseCache. Sin ResponseCache (sin caché compartida) no hay
+        generación fiable y el detalle se sirve sin ETag.
+        """
+        from apps.logistics.models import Batch
+        from .response_cache import ResponseCache
+        
+        version = ETagService._object_version(Batch, pk, ETagService.BATCH_LIST_FIELDS, {
+            'pulls_total': Count('pulls', distinct=True),
+            'pulls_at': Max('pulls__updated_at'),
+            'pulls_agency_at': Max('pulls__transport_agency__updated_at'),
+            'packages_total': Count('pulls__packages', distinct=True),
+            'packages_at': Max('pulls__packages__updated_at'),
+        })
+        if version is None or not ResponseCache.is_enabled():
+            return None
+        try:
+            generation = ResponseCache.get_generations([ResponseCache.PACKAGES])[ResponseCache.PACKAGES]
+        except Exception:
+            return None
+        return ETagService.make_etag('batch', pk, generation, *version)
+    
+    @staticmethod
+    def page_etag(request, paginator, page, fields):
+        """
+        ETag de una página de un listado: URL (filtros y enlaces), total y,
+        en orden, los valores de versión de cada objeto (una consulta).
+        """
+        ids = [obj.pk for obj in page]
+        rows = {}
+        if ids:
+            model = page[0]._meta.model
+            rows = {
+                row[0]: row[1:]
+                for row in model._default_manager.filter(pk__in=ids).values_list('pk', *fields)
+            }
+        # PageNumberPagination guarda la página de Django (con el total)
+        page_paginator = getattr(getattr(paginator, 'page', None), 'paginator', None)
+        return ETagService.make_etag(
+            request.get_host(),
+            request.get_full_path(),
+            page_paginator.count if page_paginator is not None else len(ids),
+            *((pk, rows.get(pk)) for pk in ids)
+        )
+    
+    @staticmethod
+    def list_response(view, request, fields):
+        """
+        list() de un ModelViewSet con ETag de la página: si el cliente ya
+        tiene la versión se responde 304 sin serializar.
+        
+        Args:
+            view: ViewSet
+            request: Petición
+            fields (tuple): Columnas de versión de cada objeto
+        """
+        queryset = view.filter_queryset(view.get_queryset())
+        page = view.paginate_queryset(queryset)
+        # Sin paginación el ETag cubre el listado completo
+        objects = page if page is not None else list(queryset)
+        
+        etag = ETagService.page_etag(request, view.paginator, objects, fields)
+        if (not_modified := ETagService.not_modified(request, etag)) is not None:
+            return not_modified
+        serializer = view.get_serializer(objects, many=True)
+        if page is None:
+            return ETagService.tag(Response(serializer.data), etag)
+        return ETagService.tag(view.get_paginated_response(serializer.data), etag)
+    
+    @staticmethod
+    def conditional(etag_func):
+        """
+        Decorador de retrieve(): responde 304 antes de cargar y serializar
+        el objeto si el ETag coincide.
+        
+        Ejemplo:
+            @ETagService.conditional(ETagService.pull_etag)
+            def retrieve(self, request, *args, **kwargs):
+                return super().retrieve(request, *args, **kwargs)
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(view, request, *args, **kwargs):
+                etag = etag_func(kwargs[view.lookup_url_kwarg or view.lookup_field])
+                if (not_modified := ETagService.not_modified(request, etag)) is not None:
+                    return not_modified
+                return ETagService.tag(func(view, request, *args, **kwargs), etag)
+            return wrapper
+        return decorator
@@ -2,14 +2,95 @@
 Template base común para generación de etiquetas.
 Múltiples etiquetas por página A4, formato formal, sin colores.
 """
+from functools import lru_cache
 from io import BytesIO
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
+from reportlab.graphics.barcode.code128 import Code128
 import qrcode
-from PIL import Image
+from PIL import Image, ImageFont
+
+# Máximo de recursos (QR/códigos de barras) cacheados por proceso
+ASSET_CACHE_SIZE = 512
+
+
+QR_ERROR_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+@lru_cache(maxsize=ASSET_CACHE_SIZE)
+def _qr_runs(data, border, level):
+    """
+    Módulos oscuros de un QR agrupados en tramos horizontales.
+    
+    Returns:
+        Tupla (módulos por lado, ((fila, columna inicial, largo), ...))
+    """
+    qr = qrcode.QRCode(version=1, error_correction=QR_ERROR_LEVELS[level], border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    
+    runs = []
+    for row, modules in enumerate(matrix):
+        col = 0
+        while col < len(modules):
+            if modules[col]:
+                start = col
+                while col < len(modules) and modules[col]:
+                    col += 1
+                runs.append((row, start, col - start))
+            else:
+                col += 1
+    return len(matrix), tuple(runs)
+
+
+@lru_cache(maxsize=ASSET_CACHE_SIZE)
+def _qr_png(data, size_px, border, error_correction):
+    """PNG de un QR; solo para quien necesita una imagen (API, Excel)."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=error_correction,
+        box_size=10,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    if size_px:
+        qr_img = qr_img.resize(size_px, Image.Resampling.LANCZOS)
+    
+    buffer = BytesIO()
+    qr_img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=ASSET_CACHE_SIZE)
+def _code128_png(value):
+    """PNG de un Code128 generado con python-barcode (para imágenes guardadas)."""
+    import barcode
+    from barcode.writer import ImageWriter
+    
+    buffer = BytesIO()
+    barcode.get_barcode_class('code128')(value, writer=ImageWriter()).write(buffer)
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=32)
+def _pil_font(size):
+    """Fuente TrueType para PIL; se carga una sola vez por proceso y tamaño."""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
 
 
 class BaseLabelGenerator:
@@ -46,29 +127,108 @@ class BaseLabelGenerator:
         else:
             qr_string = str(data)
         
-        # Generar QR
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=2,
-        )
-        qr.add_data(qr_string)
-        qr.make(fit=True)
+        size_px = int(size_mm * 3.779527559)  # Convertir mm a pixels (96 DPI)
+        png = BaseLabelGenerator.get_qr_png(qr_string, size=(size_px, size_px), border=2)
+        return BytesIO(png)
+    
+    @staticmethod
+    def get_qr_png(data, size=None, border=2, error_correction=qrcode.constants.ERROR_CORRECT_L):
+        """
+        PNG de un código QR, cacheado (LRU acotado) por contenido y formato.
         
-        # Convertir a imagen
-        qr_img = qr.make_image(fill_color="black", back_color="white")
+        Args:
+            data: String con los datos del QR
+            size: Tupla (ancho, alto) en píxeles, o None para el tamaño natural
+            border: Módulos de margen
+            error_correction: Nivel de corrección de qrcode.constants
         
-        # Redimensionar si es necesario
-        size_px = int(size_mm * 3.779527559)  # Convertir mm a pixels (96 DPI)
-        qr_img = qr_img.resize((size_px, size_px), Image.Resampling.LANCZOS)
+        Returns:
+            bytes con la imagen PNG
+        """
+        return _qr_png(str(data), tuple(size) if size else None, border, error_correction)
+    
+    @staticmethod
+    def get_code128_png(value):
+        """
+        PNG de un código de barras Code128, cacheado (LRU acotado) por valor.
         
-        # Guardar en buffer
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format='PNG')
-        qr_buffer.seek(0)
+        Args:
+            value: Valor a codificar
+        
+        Returns:
+            bytes con la imagen PNG
+        """
+        return _code128_png(str(value))
+    
+    @staticmethod
+    def get_font(size):
+        """
+        Fuente TrueType de PIL (arial, o la de PIL por defecto si no existe),
+        cargada una sola vez por proceso.
+        """
+        return _pil_font(size)
+    
+    @staticmethod
+    def draw_qr_code(canvas_obj, data, x, y, size, border=1, level='L'):
+        """
+        Dibuja un código QR vectorial directamente en el canvas.
+        
+        No genera imágenes: los módulos oscuros se dibujan como rectángulos
+        (un tramo por fila contigua) en un solo path, lo que es más rápido
+        que codificar un PNG y nítido a cualquier resolución de impresión.
+        
+        Args:
+            canvas_obj: Objeto Canvas de ReportLab
+            data: Datos del QR
+            x, y: Esquina inferior izquierda
+            size: Lado del QR en puntos
+            border: Módulos de margen
+            level: Nivel de corrección de errores (L, M, Q, H)
+        """
+        count, runs = _qr_runs(str(data), border, level)
+        module = size / count
+        
+        path = canvas_obj.beginPath()
+        for row, col, length in runs:
+            path.rect(x + col * module, y + size - (row + 1) * module, length * module, module)
+        
+        canvas_obj.saveState()
+        canvas_obj.setFillColor(colors.black)
+        canvas_obj.drawPath(path, stroke=0, fill=1)
+        canvas_obj.restoreState()
+    
+    @staticmethod
+    def draw_code128(canvas_obj, value, x, y, max_width, bar_height, bar_width=0.35 * mm,
+                     human_readable=True, font_size=12):
+        """
+        Dibuja un código de barras Code128 vectorial centrado en max_width.
+        
+        Args:
+            canvas_obj: Objeto Canvas de ReportLab
+            value: Valor a codificar
+            x: Borde izquierdo del área disponible
+            y: Base de las barras (el texto legible queda por debajo)
+            max_width: Ancho máximo disponible
+            bar_height: Altura de las barras
+            bar_width: Ancho de la barra más fina (se reduce si no cabe)
+            human_readable: Si se imprime el valor bajo las barras
+            font_size: Tamaño del texto legible
+        
+        Returns:
+            Tupla (ancho, alto) ocupados en puntos, incluyendo el texto
+        """
+        kwargs = {
+            'barHeight': bar_height,
+            'humanReadable': human_readable,
+            'fontSize': font_size,
+        }
+        barcode = Code128(value, barWidth=bar_width, **kwargs)
+        if barcode.width > max_width:
+            barcode = Code128(value, barWidth=bar_width * max_width / barcode.width, **kwargs)
         
-        return qr_buffer
+        barcode.drawOn(canvas_obj, x + (max_width - barcode.width) / 2, y)
+        text_height = 1.3 * font_size if human_readable else 0
+        return barcode.width, barcode.height + text_height
     
     @staticmethod
     def calculate_label_position(label_index):
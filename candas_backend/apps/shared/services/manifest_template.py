@@ -10,6 +10,9 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from datetime import datetime
+from functools import lru_cache
+
+from .streaming_table import StreamingTable
 
 
 class BaseManifestGenerator:
@@ -19,6 +22,9 @@ class BaseManifestGenerator:
     PAGE_SIZE = landscape(A4)
     MARGIN = 10 * mm  # Márgenes estrechos
     
+    # A partir de esta cantidad de filas las tablas de datos usan StreamingTable
+    LARGE_TABLE_ROWS = 500
+    
     @staticmethod
     def create_document():
         """Crea un documento SimpleDocTemplate con configuración A4 horizontal."""
@@ -47,6 +53,7 @@ class BaseManifestGenerator:
         return Paragraph("MV SERVICES COURIER INC", company_style)
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_title_style():
         """Retorna el estilo para títulos de manifiestos."""
         styles = getSampleStyleSheet()
@@ -61,6 +68,7 @@ class BaseManifestGenerator:
         )
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_heading_style():
         """Retorna el estilo para encabezados de secciones."""
         styles = getSampleStyleSheet()
@@ -75,6 +83,7 @@ class BaseManifestGenerator:
         )
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_normal_style():
         """Retorna el estilo para texto normal."""
         styles = getSampleStyleSheet()
@@ -87,6 +96,7 @@ class BaseManifestGenerator:
         )
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_highlight_style():
         """Retorna el estilo para texto resaltado (notas importantes)."""
         styles = getSampleStyleSheet()
@@ -102,6 +112,27 @@ class BaseManifestGenerator:
             spaceAfter=5
         )
     
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_bold_style():
+        """Retorna el estilo para encabezados de tabla."""
+        return ParagraphStyle(
+            'FormalBold',
+            parent=BaseManifestGenerator.get_normal_style(),
+            fontName='Helvetica-Bold',
+            fontSize=8
+        )
+    
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_data_style():
+        """Retorna el estilo para celdas de datos."""
+        return ParagraphStyle(
+            'FormalData',
+            parent=BaseManifestGenerator.get_normal_style(),
+            fontSize=7
+        )
+    
     @staticmethod
     def _wrap_text(text, style):
         """
@@ -218,31 +249,40 @@ class BaseManifestGenerator:
         return table
     
     @staticmethod
-    def create_data_table(headers, data_rows, col_widths=None):
+    def create_data_table(headers, data_rows, col_widths=None, large=None):
         """
         Crea una tabla de datos formal con encabezados.
         
+        Con muchas filas (más de LARGE_TABLE_ROWS, o large=True) retorna una
+        StreamingTable: mismo formato, pero texto dibujado directo en el
+        canvas y división por páginas en tiempo lineal.
+        
         Args:
             headers: Lista de encabezados
             data_rows: Lista de listas con datos
             col_widths: Lista con anchos de columnas (opcional)
+            large: Forzar (True) o evitar (False) el modo de documento grande
         
         Returns:
-            Table con estilo formal
+            Table (o StreamingTable) con estilo formal
         """
-        # Estilos para headers y datos
-        normal_style = BaseManifestGenerator.get_normal_style()
-        bold_style = ParagraphStyle(
-            'FormalBold',
-            parent=normal_style,
-            fontName='Helvetica-Bold',
-            fontSize=8
-        )
-        data_style = ParagraphStyle(
-            'FormalData',
-            parent=normal_style,
-            fontSize=7
-        )
+        # Anchos por defecto si no se especifican
+        if col_widths is None:
+            # Distribuir equitativamente el ancho disponible
+            num_cols = len(headers)
+            available_width = 277 * mm  # A4 horizontal menos márgenes estrechos
+            col_width = available_width / num_cols
+            col_widths = [col_width] * num_cols
+        
+        if large is None:
+            large = len(data_rows) > BaseManifestGenerator.LARGE_TABLE_ROWS
+        if large:
+            rows = [[str(cell) if cell else '-' for cell in row] for row in data_rows]
+            return StreamingTable(headers, rows, col_widths)
+        
+        # Estilos para headers y datos (compartidos entre tablas)
+        bold_style = BaseManifestGenerator.get_bold_style()
+        data_style = BaseManifestGenerator.get_data_style()
         
         # Convertir headers a Paragraphs con word wrapping
         wrapped_headers = [BaseManifestGenerator._wrap_text(h, bold_style) for h in headers]
@@ -256,14 +296,6 @@ class BaseManifestGenerator:
         # Combinar encabezados y datos
         table_data = [wrapped_headers] + wrapped_data_rows
         
-        # Anchos por defecto si no se especifican
-        if col_widths is None:
-            # Distribuir equitativamente el ancho disponible
-            num_cols = len(headers)
-            available_width = 277 * mm  # A4 horizontal menos márgenes estrechos
-            col_width = available_width / num_cols
-            col_widths = [col_width] * num_cols
-        
         table = Table(table_data, colWidths=col_widths)
         
         # Estilo formal: encabezado en negrita, bordes negros, sin colores
@@ -0,0 +1,256 @@
+"""
+Métricas en formato Prometheus (endpoint /metrics).
+
+Series:
+    candas_http_request_duration_seconds   latencia por vista/acción, método y estado
+    candas_http_request_queries            consultas SQL por petición
+    candas_import_rows_total               filas importadas (result=success|failed)
+    candas_import_rows_per_second          velocidad de cada importación
+    candas_imports_total                   importaciones (status=completed|error)
+    candas_document_duration_seconds       exportaciones y renders (PDF, Excel, CSV)
+    candas_document_size_bytes             tamaño de los documentos generados
+    candas_celery_task_duration_seconds    duración de las tareas
+    candas_celery_task_queue_lag_seconds   espera en cola (publicación -> inicio)
+    candas_cache_requests_total            aciertos/fallos por caché (result=hit|miss)
+
+Multiproceso (gunicorn, workers de Celery): definir la variable de entorno
+PROMETHEUS_MULTIPROC_DIR (directorio vacío al arrancar, compartido por
+todos los procesos del host) antes de iniciar los procesos. Cada proceso
+escribe sus valores en ese directorio y /metrics los agrega. Con gunicorn,
+agregar en gunicorn.conf.py:
+    
+    def child_exit(server, worker):
+        from apps.shared.services.metrics import Metrics
+        Metrics.mark_process_dead(worker.pid)
+
+Si prometheus_client no está instalado las métricas se desactivan.
+"""
+from functools import wraps
+from io import BytesIO
+from django.conf import settings
+import os
+import time
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+except ImportError:
+    prometheus_client = None
+
+# Buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+THROUGHPUT_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIZE_BUCKETS = (10 ** 4, 10 ** 5, 5 * 10 ** 5, 10 ** 6, 5 * 10 ** 6, 10 ** 7, 5 * 10 ** 7, 10 ** 8)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+if prometheus_client is not None:
+    REQUEST_DURATION = Histogram(
+        'candas_http_request_duration_seconds', 'Latencia de las peticiones HTTP',
+        ['view', 'method', 'status'], buckets=LATENCY_BUCKETS
+    )
+    REQUEST_QUERIES = Histogram(
+        'candas_http_request_queries', 'Consultas SQL por petición',
+        ['view', 'method'], buckets=QUERY_BUCKETS
+    )
+    IMPORT_ROWS = Counter(
+        'candas_import_rows', 'Filas procesadas por PackageImporter', ['result']
+    )
+    IMPORT_THROUGHPUT = Histogram(
+        'candas_import_rows_per_second', 'Filas por segundo de cada importación',
+        buckets=THROUGHPUT_BUCKETS
+    )
+    IMPORTS = Counter(
+        'candas_imports', 'Importaciones de paquetes', ['status']
+    )
+    DOCUMENT_DURATION = Histogram(
+        'candas_document_duration_seconds', 'Duración de exportaciones y renders',
+        ['operation', 'kind', 'format'], buckets=LATENCY_BUCKETS
+    )
+    DOCUMENT_SIZE = Histogram(
+        'candas_document_size_bytes', 'Tamaño de los documentos generados',
+        ['operation', 'kind', 'format'], buckets=SIZE_BUCKETS
+    )
+    TASK_DURATION = Histogram(
+        'candas_celery_task_duration_seconds', 'Duración de las tareas de Celery',
+        ['task', 'state'], buckets=TASK_BUCKETS
+    )
+    TASK_QUEUE_LAG = Histogram(
+        'candas_celery_task_queue_lag_seconds', 'Espera en cola de las tareas de Celery',
+        ['task'], buckets=TASK_BUCKETS
+    )
+    CACHE_REQUESTS = Counter(
+        'candas_cache_requests', 'Consultas a cachés', ['cache', 'result']
+    )
+
+
+class Metrics:
+    """Registro de métricas (no hace nada si prometheus_client no está instalado)."""
+    
+    # Header del mensaje de Celery con el momento de publicación
+    TASK_PUBLISHED_HEADER = 'x_published_at'
+    
+    # Etiqueta de las peticiones que no llegan a una vista (404 del resolver)
+    UNMATCHED_VIEW = '<unmatched>'
+    
+    _task_starts = {}
+    
+    @staticmethod
+    def is_enabled():
+        return prometheus_client is not None and getattr(settings, 'METRICS_ENABLED', True)
+    
+    @staticmethod
+    def observe_request(view, method, status, duration, queries=None):
+        if not Metrics.is_enabled():
+            return
+        REQUEST_DURATION.labels(view, method, str(status)).observe(duration)
+        if queries is not None:
+            REQUEST_QUERIES.labels(view, method).observe(queries)
+    
+    @staticmethod
+    def observe_import(successful, failed, duration, completed=True):
+        """
+        Args:
+            successful (int): Filas importadas
+            failed (int): Filas con error
+            duration (float): Segundos de la importación
+            completed (bool): False si la importación terminó en error general
+        """
+        if not Metrics.is_enabled():
+            return
+        IMPORTS.labels('completed' if completed else 'error').inc()
+        IMPORT_ROWS.labels('success').inc(successful)
+        IMPORT_ROWS.labels('failed').inc(failed)
+        if duration > 0 and successful + failed:
+            IMPORT_THROUGHPUT.observe((successful + failed) / duration)
+    
+    @staticmethod
+    def timed_import(func):
+        """
+        Decorador de PackageImporter.import_packages: mide la importación a
+        partir del resumen que retorna (success, successful, failed).
+        """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            Metrics.observe_import(
+                result.get('successful', 0), result.get('failed', 0),
+                time.perf_counter() - start, result.get('success', False)
+            )
+            return result
+        return wrapper
+    
+    @staticmethod
+    def observe_document(operation, kind, extension, duration, size=None):
+        """
+        Args:
+            operation (str): 'export' o 'render'
+            kind (str): Documento (p. ej. 'packages', 'pull_manifest')
+            extension (str): Formato ('pdf', 'xlsx', 'csv')
+            duration (float): Segundos de la generación
+            size (int): Bytes del documento
+        """
+        if not Metrics.is_enabled():
+            return
+        DOCUMENT_DURATION.labels(operation, kind, extension).observe(duration)
+        if size is not None:
+            DOCUMENT_SIZE.labels(operation, kind, extension).observe(size)
+    
+    @staticmethod
+    def document_size(document):
+        """Bytes de un documento (HttpResponse, BytesIO o bytes); None si es streaming."""
+        if isinstance(document, (bytes, bytearray)):
+            return len(document)
+        if isinstance(document, BytesIO):
+            return document.getbuffer().nbytes
+        if getattr(document, 'streaming', True) is False:
+            return len(document.content)
+        return None
+    
+    @staticmethod
+    def timed_document(operation, kind, extension):
+        """
+        Decorador: mide la duración y el tamaño del documento que retorna la función.
+        
+        Ejemplo:
+            @staticmethod
+            @Metrics.timed_document('export', 'packages_report', 'pdf')
+            def export_packages_to_pdf(queryset): ...
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                document = func(*args, **kwargs)
+                Metrics.observe_document(
+                    operation, kind, extension,
+                    time.perf_counter() - start,
+                    Metrics.document_size(document)
+                )
+                return document
+            return wrapper
+        return decorator
+    
+    @staticmethod
+    def cache_access(cache, hit):
+        if not Metrics.is_enabled():
+            return
+        CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+    
+    # Tareas de Celery (señales before_task_publish / task_prerun / task_postrun, ver config/celery.py)
+    
+    @staticmethod
+    def tag_task_message(headers):
+        """Agrega al mensaje el momento de publicación (para la espera en cola)."""
+        if headers is not None and Metrics.is_enabled():
+            headers[Metrics.TASK_PUBLISHED_HEADER] = time.time()
+    
+    @staticmethod
+    def start_task(task_id, task):
+        if not Metrics.is_enabled():
+            return
+        Metrics._task_starts[task_id] = time.perf_counter()
+        published_at = getattr(task.request, Metrics.TASK_PUBLISHED_HEADER, None) or (
+            getattr(task.request, 'headers', None) or {}
+        ).get(Metrics.TASK_PUBLISHED_HEADER)
+        # Los reintentos conservan el header: la espera incluye el countdown
+        if published_at and not task.request.retries:
+            TASK_QUEUE_LAG.labels(task.name).observe(max(time.time() - float(published_at), 0))
+    
+    @staticmethod
+    def finish_task(task_id, task, state=None):
+        start = Metrics._task_starts.pop(task_id, None)
+        if start is None:
+            return
+        TASK_DURATION.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - start)
+    
+    # Exposición
+    
+    @staticmethod
+    def is_multiprocess():
+        return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+    
+    @staticmethod
+    def mark_process_dead(pid):
+        """Limpia los valores de un proceso terminado (modo multiproceso)."""
+        if prometheus_client is not None and Metrics.is_multiprocess():
+            multiprocess.mark_process_dead(pid)
+    
+    @staticmethod
+    def render():
+        """
+        Métricas en formato de texto de Prometheus.
+        
+        En modo multiproceso se agregan los valores de todos los procesos;
+        si no, los del proceso actual.
+        
+        Returns:
+            tuple: (bytes contenido, content type)
+        """
+        if Metrics.is_multiprocess():
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,393 @@
+"""
+Trabajos de impresión en bloque: etiquetas, guías o manifiestos de varios
+paquetes, sacas y lotes en un único documento.
+
+Todo se genera en una sola pasada (un canvas o un SimpleDocTemplate), de modo
+que plantillas, estilos, fuentes y QR cacheados se preparan una sola vez en
+lugar de una vez por petición. El resultado queda en RenderCache igual que
+los documentos individuales.
+"""
+import hashlib
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import Count, Max, Prefetch
+
+from .render_cache import RenderCache
+
+
+class PrintJobService:
+    """Generación de documentos combinados para muchos objetos."""
+    
+    KIND = 'print_job'
+    
+    # documento -> formatos admitidos
+    DOCUMENTS = {
+        'labels': ('pdf', 'zpl'),
+        'shipping_labels': ('pdf', 'zpl'),
+        'manifests': ('pdf',),
+    }
+    
+    DEFAULT_MAX_ITEMS = 2000
+    
+    @staticmethod
+    def get_max_items():
+        """Máximo de objetos por trabajo (setting PRINT_JOB_MAX_ITEMS)."""
+        return getattr(settings, 'PRINT_JOB_MAX_ITEMS', PrintJobService.DEFAULT_MAX_ITEMS)
+    
+    @staticmethod
+    def normalize_ids(ids):
+        """Convierte a lista de strings sin duplicados, conservando el orden."""
+        if not ids:
+            return []
+        if isinstance(ids, str):
+            ids = ids.split(',')
+        return list(dict.fromkeys(str(value).strip() for value in ids if str(value).strip()))
+    
+    @staticmethod
+    def validate(document, fmt, package_ids, pull_ids, batch_ids):
+        """
+        Valida los parámetros de un trabajo de impresión.
+        
+        Raises:
+            ValueError: Si el documento, el formato o la cantidad de objetos
+                no son válidos
+        """
+        if document not in PrintJobService.DOCUMENTS:
+            raise ValueError(
+                f"Documento inválido: {document}. Válidos: {', '.join(PrintJobService.DOCUMENTS)}"
+            )
+        if fmt not in PrintJobService.DOCUMENTS[document]:
+            raise ValueError(
+                f"Formato inválido para {document}: {fmt}. "
+                f"Válidos: {', '.join(PrintJobService.DOCUMENTS[document])}"
+            )
+        if document == 'shipping_labels' and (pull_ids or batch_ids):
+            raise ValueError("Las guías de envío solo aplican a paquetes (package_ids)")
+        
+        total = len(package_ids) + len(pull_ids) + len(batch_ids)
+        if total == 0:
+            raise ValueError("Debe indicar al menos un package_id, pull_id o batch_id")
+        if total > PrintJobService.get_max_items():
+            raise ValueError(f"Máximo {PrintJobService.get_max_items()} objetos por trabajo")
+        
+        for pk in package_ids + pull_ids + batch_ids:
+            try:
+                uuid.UUID(pk)
+            except ValueError:
+                raise ValueError(f"ID inválido: {pk}")
+    
+    @staticmethod
+    def get_key(document, fmt, package_ids, pull_ids, batch_ids):
+        """Identificador estable del trabajo (mismos objetos, mismo documento)."""
+        raw = '|'.join([
+            document, fmt,
+            ','.join(package_ids), ','.join(pull_ids), ','.join(batch_ids),
+        ])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+    
+    @staticmethod
+    def get_version(package_ids, pull_ids, batch_ids):
+        """
+        Versión de contenido del trabajo: una consulta por tipo de objeto,
+        con los mismos datos que RenderCache usa para cada documento.
+        """
+        from apps.logistics.models import Batch, Pull
+        from apps.packages.models import Package
+        
+        parts = ['print_job']
+        if package_ids:
+            data = Package.objects.filter(pk__in=package_ids).aggregate(
+                package_at=Max('updated_at'),
+                agency_at=Max('transport_agency__updated_at'),
+                pull_at=Max('pull__updated_at'),
+                pull_agency_at=Max('pull__transport_agency__updated_at'),
+                batch_at=Max('pull__batch__updated_at'),
+                batch_agency_at=Max('pull__batch__transport_agency__updated_at'),
+                packages_count=Count('id', distinct=True),
+            )
+            parts.extend(data[key] for key in sorted(data))
+        if pull_ids:
+            data = Pull.objects.filter(pk__in=pull_ids).aggregate(
+                pull_at=Max('updated_at'),
+                agency_at=Max('transport_agency__updated_at'),
+                batch_at=Max('batch__updated_at'),
+                batch_agency_at=Max('batch__transport_agency__updated_at'),
+                packages_at=Max('packages__updated_at'),
+                packages_count=Count('packages', distinct=True),
+            )
+            parts.extend(data[key] for key in sorted(data))
+        if batch_ids:
+            data = Batch.objects.filter(pk__in=batch_ids).aggregate(
+                batch_at=Max('updated_at'),
+                agency_at=Max('transport_agency__updated_at'),
+                pulls_at=Max('pulls__updated_at'),
+                pulls_agency_at=Max('pulls__transport_agency__updated_at'),
+                packages_at=Max('pulls__packages__updated_at'),
+                pulls_count=Count('pulls', distinct=True),
+                packages_count=Count('pulls__packages', distinct=True),
+            )
+            parts.extend(data[key] for key in sorted(data))
+        return RenderCache.make_version(*parts)
+    
+    @staticmethod
+    def describe(document, fmt, package_ids=None, pull_ids=None, batch_ids=None):
+        """
+        Normaliza y valida un trabajo y calcula dónde queda en la caché.
+        
+        Returns:
+            dict: document, format, package_ids, pull_ids, batch_ids, kind,
+                  object_id, version, extension y filename
+        
+        Raises:
+            ValueError: Si los parámetros no son válidos
+        """
+        package_ids = PrintJobService.normalize_ids(package_ids)
+        pull_ids = PrintJobService.normalize_ids(pull_ids)
+        batch_ids = PrintJobService.normalize_ids(batch_ids)
+        PrintJobService.validate(document, fmt, package_ids, pull_ids, batch_ids)
+        
+        # Forma canónica de los UUID para que el mismo trabajo tenga la misma clave
+        package_ids, pull_ids, batch_ids = (
+            list(dict.fromkeys(str(uuid.UUID(pk)) for pk in ids))
+            for ids in (package_ids, pull_ids, batch_ids)
+        )
+        
+        key = PrintJobService.get_key(document, fmt, package_ids, pull_ids, batch_ids)
+        return {
+            'document': document,
+            'format': fmt,
+            'package_ids': package_ids,
+            'pull_ids': pull_ids,
+            'batch_ids': batch_ids,
+            'kind': PrintJobService.KIND,
+            'object_id': key,
+            'version': PrintJobService.get_version(package_ids, pull_ids, batch_ids),
+            'extension': fmt,
+            'filename': f"impresion_{document}_{key[:8]}.{fmt}",
+        }
+    
+    @staticmethod
+    def load_targets(package_ids, pull_ids, batch_ids):
+        """
+        Carga los objetos del trabajo en el orden solicitado, con las
+        relaciones que usan etiquetas y manifiestos ya resueltas.
+        
+        Returns:
+            dict: {'batches': [...], 'pulls': [...], 'packages': [...]}
+        
+        Raises:
+            ValueError: Si algún ID no existe
+        """
+        from apps.logistics.models import Batch, Pull
+        from apps.packages.models import Package
+        
+        def ordered(queryset, ids, label):
+            found = {str(obj.pk): obj for obj in queryset.filter(pk__in=ids)}
+            missing = [pk for pk in ids if pk not in found]
+            if missing:
+                raise ValueError(f"{label} no encontrados: {', '.join(missing[:10])}")
+            return [found[pk] for pk in ids]
+        
+        batches = ordered(
+            Batch.objects.select_related('transport_agency').prefetch_related(
+                Prefetch(
+                    'pulls',
+                    queryset=Pull.objects.select_related('transport_agency').order_by('created_at'),
+                )
+            ),
+            batch_ids, 'Lotes'
+        ) if batch_ids else []
+        pulls = ordered(
+            Pull.objects.select_related('transport_agency', 'batch__transport_agency'),
+            pull_ids, 'Sacas'
+        ) if pull_ids else []
+        packages = ordered(
+            Package.objects.select_related(
+                'transport_agency', 'pull__transport_agency', 'pull__batch__transport_agency'
+            ),
+            package_ids, 'Paquetes'
+        ) if package_ids else []
+        
+        return {'batches': batches, 'pulls': pulls, 'packages': packages}
+    
+    @staticmethod
+    def render(document, fmt, package_ids=None, pull_ids=None, batch_ids=None, progress=None):
+        """
+        Genera el documento combinado (o lo toma de la caché) y lo deja en
+        RenderCache.
+        
+        Args:
+            document (str): 'labels', 'shipping_labels' o 'manifests'
+            fmt (str): 'pdf' o 'zpl'
+            package_ids, pull_ids, batch_ids (list): IDs a incluir
+            progress (callable): progress(actual, total), opcional
+        
+        Returns:
+            dict: kind, object_id, version, extension y filename, igual que
+                  RenderService.render
+        """
+        job = PrintJobService.describe(document, fmt, package_ids, pull_ids, batch_ids)
+        
+        def generate():
+            targets = PrintJobService.load_targets(
+                job['package_ids'], job['pull_ids'], job['batch_ids']
+            )
+            generator = getattr(PrintJobService, f"_{document}_{fmt}")
+            content = generator(targets, progress or (lambda current, total: None))
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            return BytesIO(content)
+        
+        RenderCache.get_or_render(job['kind'], job['object_id'], job['version'], generate, job['extension'])
+        return {key: job[key] for key in ('kind', 'object_id', 'version', 'extension', 'filename')}
+    
+    @staticmethod
+    def submit(document, fmt, package_ids=None, pull_ids=None, batch_ids=None):
+        """
+        Encola el trabajo en la cola 'render'.
+        
+        Returns:
+            AsyncResult: Trabajo de Celery (estado PROGRESS con current/total)
+        """
+        from apps.core.tasks import print_job_task
+        from .render_service import RenderService
+        
+        return print_job_task.apply_async(
+            (document, fmt, package_ids or [], pull_ids or [], batch_ids or []),
+            queue=RenderService.QUEUE,
+        )
+    
+    @staticmethod
+    def _label_items(targets):
+        """Etiquetas de saca/paquete a dibujar, en orden: lotes, sacas, paquetes."""
+        items = []
+        for batch in targets['batches']:
+            pulls = list(batch.pulls.all())
+            for idx, pull in enumerate(pulls, 1):
+                items.append(('batch_pull', pull, idx, len(pulls), batch))
+        for pull in targets['pulls']:
+            items.append(('pull', pull, 1, 1, None))
+        for package in targets['packages']:
+            items.append(('package', package, 1, 1, None))
+        return items
+    
+    @staticmethod
+    def _labels_pdf(targets, progress):
+        """Todas las etiquetas en un solo canvas, 4 por página (2x2)."""
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+        from apps.logistics.services import PDFService, BatchLabelsGenerator
+        from apps.packages.services import PackageLabelsGenerator
+        
+        layout = PackageLabelsGenerator
+        items = PrintJobService._label_items(targets)
+        total = len(items)
+        
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=letter)
+        _, page_height = letter
+        
+        for idx, (item_type, obj, number, count, batch) in enumerate(items):
+            position_on_page = idx % layout.LABELS_PER_PAGE
+            if position_on_page == 0 and idx > 0:
+                c.showPage()
+            
+            row = position_on_page // layout.LABELS_PER_ROW
+            col = position_on_page % layout.LABELS_PER_ROW
+            x = layout.MARGIN_X + col * layout.LABEL_WIDTH
+            y = page_height - layout.MARGIN_Y - (row + 1) * layout.LABEL_HEIGHT
+            
+            if item_type == 'batch_pull':
+                BatchLabelsGenerator._draw_label(c, obj, number, count, x, y, batch)
+            elif item_type == 'pull':
+                PDFService._draw_pull_label(c, obj, x, y, layout.LABEL_WIDTH, layout.LABEL_HEIGHT)
+            else:
+                layout._draw_label(c, obj, number, count, x, y)
+            
+            progress(idx + 1, total)
+        
+        c.showPage()
+        c.save()
+        return buffer.getvalue()
+    
+    @staticmethod
+    def _labels_zpl(targets, progress):
+        """Todas las etiquetas en un solo stream ZPL."""
+        from apps.logistics.services import PDFService, BatchLabelsGenerator
+        from apps.packages.services import PackageLabelsGenerator
+        
+        labels = []
+        total = len(targets['batches']) + len(targets['pulls']) + len(targets['packages'])
+        
+        for batch in targets['batches']:
+            labels.append(BatchLabelsGenerator.generate_zpl(batch))
+            progress(len(labels), total)
+        for pull in targets['pulls']:
+            labels.append(PDFService.generate_pull_label_zpl(pull))
+            progress(len(labels), total)
+        for package in targets['packages']:
+            labels.append(PackageLabelsGenerator.generate_zpl(package))
+            progress(len(labels), total)
+        
+        return ''.join(labels)
+    
+    @staticmethod
+    def _shipping_labels_pdf(targets, progress):
+        """Guías de envío de todos los paquetes, una por página A4."""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+        from apps.packages.services import PackageLabelsGenerator
+        
+        packages = targets['packages']
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        
+        for idx, package in enumerate(packages, 1):
+            PackageLabelsGenerator._draw_shipping_label(c, package)
+            c.showPage()
+            progress(idx, len(packages))
+        
+        c.save()
+        return buffer.getvalue()
+    
+    @staticmethod
+    def _shipping_labels_zpl(targets, progress):
+        """Guías de envío de todos los paquetes en un solo stream ZPL."""
+        from apps.packages.services import PackageLabelsGenerator
+        
+        packages = targets['packages']
+        labels = []
+        for idx, package in enumerate(packages, 1):
+            labels.append(PackageLabelsGenerator.generate_shipping_label_zpl(package))
+            progress(idx, len(packages))
+        return ''.join(labels)
+    
+    @staticmethod
+    def _manifests_pdf(targets, progress):
+        """
+        Manifiestos de lotes, sacas y paquetes en un solo documento, cada
+        uno a partir de una página nueva.
+        """
+        from reportlab.platypus import PageBreak
+        from apps.logistics.services import PDFService, BatchManifestGenerator
+        from apps.packages.services import PackageManifestGenerator
+        from .manifest_template import BaseManifestGenerator
+        
+        builders = (
+            [(BatchManifestGenerator.build_elements, batch) for batch in targets['batches']]
+            + [(PDFService.build_pull_manifest_elements, pull) for pull in targets['pulls']]
+            + [(PackageManifestGenerator.build_elements, package) for package in targets['packages']]
+        )
+        
+        elements = []
+        for idx, (build, obj) in enumerate(builders, 1):
+            if elements:
+                elements.append(PageBreak())
+            elements.extend(build(obj))
+            progress(idx, len(builders))
+        
+        doc, buffer = BaseManifestGenerator.create_document()
+        doc.build(elements)
+        return buffer.getvalue()
@@ -0,0 +1,387 @@
+"""
+Profiler bajo demanda para peticiones y tareas de Celery.
+
+Un usuario is_staff activa el profiler en una petición con el header
+`X-Profile: 1` o el parámetro `?_profile=1` (ProfilerMiddleware). Las tareas
+listadas en PROFILER_TASKS se perfilan cuando las encola una petición
+perfilada o cuando se las arma con arm_task() (p. ej. las que lanza Beat).
+
+Cada perfil guarda en MEDIA_ROOT/profiles:
+    <id>.prof   salida de cProfile (pstats, snakeviz, etc.)
+    <id>.json   resumen: duración, pico de memoria (tracemalloc) y las
+                funciones con más tiempo acumulado
+"""
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils import timezone
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileSession:
+    """Un perfil en curso (cProfile + tracemalloc)."""
+    
+    def __init__(self, label, kind, **meta):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.kind = kind
+        self.meta = meta
+        self.summary = None
+        self._profiler = cProfile.Profile()
+        self._started_at = None
+        self._was_tracing = False
+    
+    def start(self):
+        # Si tracemalloc ya estaba activo (PYTHONTRACEMALLOC) solo se reinicia el pico
+        self._was_tracing = tracemalloc.is_tracing()
+        if self._was_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        self._started_at = time.perf_counter()
+        self._profiler.enable()
+    
+    def stop(self, **meta):
+        """
+        Detiene el perfil y lo guarda.
+        
+        Returns:
+            dict: Resumen guardado
+        """
+        self._profiler.disable()
+        duration = time.perf_counter() - self._started_at
+        _, peak = tracemalloc.get_traced_memory()
+        if not self._was_tracing:
+            tracemalloc.stop()
+        
+        self.meta.update(meta)
+        self.summary = ProfilerService.save(self, duration, peak)
+        return self.summary
+
+
+class ProfilerService:
+    """Perfiles bajo demanda: activación, almacenamiento y consulta."""
+    
+    DIRECTORY = 'profiles'
+    
+    # Activación en peticiones
+    HEADER = 'HTTP_X_PROFILE'
+    QUERY_PARAM = '_profile'
+    TRUE_VALUES = ('1', 'true', 'yes')
+    
+    # Header del mensaje de Celery con el id del perfil que encoló la tarea
+    TASK_HEADER = 'x_profile'
+    
+    # Funciones del resumen (por tiempo acumulado)
+    TOP_FUNCTIONS = 30
+    
+    DEFAULT_MAX_PROFILES = 200
+    
+    _ID_RE = re.compile(r'^[0-9a-f]{32}$')
+    _TASK_NAME_RE = re.compile(r'^[\w.]+$')
+    
+    # cProfile y tracemalloc son globales del proceso: un perfil a la vez
+    _lock = threading.Lock()
+    _current = threading.local()
+    
+    @staticmethod
+    def directory():
+        return os.path.join(settings.MEDIA_ROOT, ProfilerService.DIRECTORY)
+    
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'PROFILER_ENABLED', True)
+    
+    @staticmethod
+    def is_requested(request):
+        """La petición pide ser perfilada (header X-Profile o ?_profile)."""
+        value = request.META.get(ProfilerService.HEADER) or request.GET.get(ProfilerService.QUERY_PARAM, '')
+        return value.lower() in ProfilerService.TRUE_VALUES
+    
+    @staticmethod
+    def can_profile(user):
+        return ProfilerService.is_enabled() and user is not None and user.is_authenticated and user.is_staff
+    
+    @staticmethod
+    def current_id():
+        """Id del perfil en curso en este hilo (o None)."""
+        session = getattr(ProfilerService._current, 'session', None)
+        return session.id if session else None
+    
+    @staticmethod
+    def start(label, kind, **meta):
+        """
+        Empieza un perfil.
+        
+        Returns:
+            ProfileSession: Sesión iniciada, o None si ya hay otro perfil en
+                curso en el proceso (la ejecución sigue sin perfilar)
+        """
+        if not ProfilerService._lock.acquire(blocking=False):
+            logger.warning(f"Profiler ocupado, se omite el perfil de {label}")
+            return None
+        try:
+            session = ProfileSession(label, kind, **meta)
+            session.start()
+        except Exception:
+            ProfilerService._lock.release()
+            raise
+        ProfilerService._current.session = session
+        return session
+    
+    @staticmethod
+    def stop(session, **meta):
+        """
+        Termina y guarda un perfil iniciado con start().
+        
+        Returns:
+            dict: Resumen del perfil
+        """
+        try:
+            return session.stop(**meta)
+        finally:
+            ProfilerService._current.session = None
+            ProfilerService._lock.release()
+    
+    @staticmethod
+    @contextmanager
+    def profile(label, kind='block', **meta):
+        """
+        Perfila el bloque.
+        
+        Yields:
+            ProfileSession: Sesión (None si el profiler estaba ocupado);
+                session.summary queda disponible al salir
+        """
+        session = ProfilerService.start(label, kind, **meta)
+        try:
+            yield session
+        finally:
+            if session is not None:
+                ProfilerService.stop(session)
+    
+    @staticmethod
+    def save(session, duration, peak_memory):
+        """
+        Guarda la salida de cProfile y el resumen del perfil.
+        
+        Returns:
+            dict: Resumen guardado
+        """
+        directory = ProfilerService.directory()
+        os.makedirs(directory, exist_ok=True)
+        session._profiler.dump_stats(os.path.join(directory, f'{session.id}.prof'))
+        
+        stats = pstats.Stats(session._profiler)
+        functions = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True
+        )[:ProfilerService.TOP_FUNCTIONS]:
+            functions.append({
+                'function': function,
+                'file': filename,
+                'line': line,
+                'calls': calls,
+                'total_ms': round(total * 1000, 2),
+                'cumulative_ms': round(cumulative * 1000, 2),
+            })
+        
+        summary = {
+            'id': session.id,
+            'label': session.label,
+            'kind': session.kind,
+            'created_at': timezone.now().isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'peak_memory_bytes': peak_memory,
+            'total_calls': stats.total_calls,
+            **session.meta,
+            'functions': functions,
+        }
+        with open(os.path.join(directory, f'{session.id}.json'), 'w', encoding='utf-8') as output:
+            json.dump(summary, output, ensure_ascii=False, default=str)
+        
+        logger.info(
+            f"Perfil {session.id} ({session.label}): {summary['duration_ms']} ms, "
+            f"pico de memoria {peak_memory / 1024 / 1024:.1f} MB"
+        )
+        ProfilerService.prune()
+        return summary
+    
+    @staticmethod
+    def prune():
+        """Borra los perfiles más antiguos por encima de PROFILER_MAX_PROFILES."""
+        limit = getattr(settings, 'PROFILER_MAX_PROFILES', ProfilerService.DEFAULT_MAX_PROFILES)
+        directory = ProfilerService.directory()
+        summaries = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in summaries[limit:]:
+            profile_id = entry.name[:-len('.json')]
+            for path in (entry.path, ProfilerService.profile_path(profile_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+    
+    @staticmethod
+    def profile_path(profile_id):
+        """Ruta del archivo .prof, o None si el id no es válido."""
+        if not ProfilerService._ID_RE.match(profile_id or ''):
+            return None
+        return os.path.join(ProfilerService.directory(), f'{profile_id}.prof')
+    
+    @staticmethod
+    def get_summary(profile_id):
+        """
+        Returns:
+            dict: Resumen del perfil, o None si no existe
+        """
+        if not ProfilerService._ID_RE.match(profile_id or ''):
+            return None
+        try:
+            with open(os.path.join(ProfilerService.directory(), f'{profile_id}.json'), encoding='utf-8') as source:
+                return json.load(source)
+        except FileNotFoundError:
+            return None
+    
+    @staticmethod
+    def list_summaries(limit=50):
+        """
+        Returns:
+            list: Resúmenes más recientes primero, sin el detalle de funciones
+        """
+        directory = ProfilerService.directory()
+        if not os.path.isdir(directory):
+            return []
+        entries = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )[:limit]
+        
+        summaries = []
+        for entry in entries:
+            summary = ProfilerService.get_summary(entry.name[:-len('.json')])
+            if summary:
+                summary.pop('functions', None)
+                summaries.append(summary)
+        return summaries
+    
+    @staticmethod
+    def render_text(profile_id, sort='cumulative', limit=80):
+        """
+        Salida de pstats en texto (para leer sin herramientas).
+        
+        Returns:
+            str: Reporte, o None si el perfil no existe
+        """
+        path = ProfilerService.profile_path(profile_id)
+        if path is None or not os.path.exists(path):
+            return None
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+    
+    # Tareas de Celery
+    
+    @staticmethod
+    def profiled_tasks():
+        return set(getattr(settings, 'PROFILER_TASKS', []))
+    
+    @staticmethod
+    def _armed_path(task_name):
+        return os.path.join(ProfilerService.directory(), 'armed', task_name)
+    
+    @staticmethod
+    def arm_task(task_name, runs=1):
+        """
+        Perfila las próximas `runs` ejecuciones de una tarea (en cualquier worker).
+        
+        El contador vive en MEDIA_ROOT, compartido entre web y workers como
+        RenderCache.
+        
+        Raises:
+            ValueError: Si la tarea no está en PROFILER_TASKS
+        """
+        if task_name not in ProfilerService.profiled_tasks() or not ProfilerService._TASK_NAME_RE.match(task_name):
+            raise ValueError(f'La tarea {task_name} no está en PROFILER_TASKS')
+        path = ProfilerService._armed_path(task_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as output:
+            output.write(str(max(int(runs), 1)))
+    
+    @staticmethod
+    def consume_armed(task_name):
+        """
+        Toma una ejecución armada de la tarea.
+        
+        El archivo se reclama con os.replace (atómico): si dos workers
+        empiezan a la vez, solo uno perfila.
+        
+        Returns:
+            bool: True si esta ejecución debe perfilarse
+        """
+        path = ProfilerService._armed_path(task_name)
+        claimed = f'{path}.{uuid.uuid4().hex}'
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            return False
+        try:
+            with open(claimed) as source:
+                remaining = int(source.read() or 1) - 1
+        except ValueError:
+            remaining = 0
+        if remaining > 0:
+            with open(claimed, 'w') as output:
+                output.write(str(remaining))
+            os.replace(claimed, path)
+        else:
+            os.remove(claimed)
+        return True
+
+
+# Tareas de Celery (señales before_task_publish / task_prerun / task_postrun, ver config/celery.py)
+_task_sessions = {}
+
+
+def tag_task_message(task_name, headers):
+    """Marca el mensaje si lo encola una petición perfilada."""
+    profile_id = ProfilerService.current_id()
+    if profile_id and headers is not None and task_name in ProfilerService.profiled_tasks():
+        headers[ProfilerService.TASK_HEADER] = profile_id
+
+
+def start_task_profile(task_id, task):
+    """Empieza el perfil de la tarea si fue pedido."""
+    if not ProfilerService.is_enabled() or task.name not in ProfilerService.profiled_tasks():
+        return
+    parent = getattr(task.request, ProfilerService.TASK_HEADER, None) or (
+        getattr(task.request, 'headers', None) or {}
+    ).get(ProfilerService.TASK_HEADER)
+    if not parent and not ProfilerService.consume_armed(task.name):
+        return
+    session = ProfilerService.start(task.name, 'task', task_id=task_id, parent=parent)
+    if session is not None:
+        _task_sessions[task_id] = session
+
+
+def finish_task_profile(task_id, state=None):
+    """Termina y guarda el perfil de la tarea."""
+    session = _task_sessions.pop(task_id, None)
+    if session is not None:
+        ProfilerService.stop(session, state=state)
@@ -0,0 +1,243 @@
+"""
+Instrumentación de consultas SQL por petición o tarea.
+
+Registra la cantidad de consultas, el tiempo total en base de datos, las
+sentencias más lentas y las huellas (SQL normalizado) que se repiten, que
+suelen delatar un N+1. Lo usan QueryBudgetMiddleware (peticiones), las
+señales de Celery (tareas) y las pruebas (assert_max_queries).
+
+Los ViewSets declaran su presupuesto de consultas por acción:
+    
+    class PackageViewSet(viewsets.ModelViewSet):
+        query_budget = {'list': 9, 'retrieve': 9}
+
+El presupuesto cuenta toda la petición, incluidas las 5 consultas de la
+sesión (lectura de la sesión y del usuario, y el guardado de la sesión por
+SESSION_SAVE_EVERY_REQUEST dentro de un savepoint).
+"""
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+import heapq
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Se ejecutaron más consultas que las permitidas por el presupuesto."""
+
+
+class QueryStats:
+    """Consultas ejecutadas dentro de una petición, tarea o bloque."""
+    
+    # Normalización del SQL: literales y listas de parámetros
+    _STRING_RE = re.compile(r"'(?:[^']|'')*'")
+    _NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+    _IN_LIST_RE = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+    _SPACES_RE = re.compile(r'\s+')
+    
+    # Largo máximo del SQL guardado en el log
+    MAX_SQL_LENGTH = 300
+    
+    def __init__(self, label, slowest=None):
+        self.label = label
+        self.count = 0
+        self.db_time = 0.0
+        self.fingerprints = {}
+        self.slowest_size = slowest or getattr(settings, 'QUERY_BUDGET_SLOWEST', 5)
+        self._slowest = []
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+    
+    @classmethod
+    def fingerprint(cls, sql):
+        """SQL sin literales ni largo de listas IN, para agrupar consultas iguales."""
+        sql = cls._STRING_RE.sub('?', sql)
+        sql = cls._NUMBER_RE.sub('?', sql)
+        sql = cls._IN_LIST_RE.sub('(...)', sql)
+        return cls._SPACES_RE.sub(' ', sql).strip()
+    
+    def __call__(self, execute, sql, params, many, context):
+        """Wrapper de connection.execute_wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.db_time += duration
+            key = self.fingerprint(sql)
+            self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+            entry = (duration, self.count, sql)
+            if len(self._slowest) < self.slowest_size:
+                heapq.heappush(self._slowest, entry)
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+    
+    def finish(self):
+        self.finished_at = time.perf_counter()
+    
+    @property
+    def total_time(self):
+        """Duración del bloque en segundos."""
+        return (self.finished_at or time.perf_counter()) - self.started_at
+    
+    @property
+    def duplicates(self):
+        """Huellas ejecutadas más de una vez, de la más repetida a la menos."""
+        return sorted(
+            ((sql, count) for sql, count in self.fingerprints.items() if count > 1),
+            key=lambda item: item[1],
+            reverse=True
+        )
+    
+    @property
+    def slowest(self):
+        """Sentencias más lentas: lista de (segundos, sql)."""
+        return [(duration, sql) for duration, _, sql in sorted(self._slowest, reverse=True)]
+    
+    def server_timing(self):
+        """Valor del header Server-Timing."""
+        repeated = sum(count - 1 for _, count in self.duplicates)
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.count} queries"',
+            f'db-dup;desc="{repeated} repeated"',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+    
+    def as_dict(self, **extra):
+        """Resumen serializable para el log estructurado."""
+        return {
+            'label': self.label,
+            'queries': self.count,
+            'db_ms': round(self.db_time * 1000, 1),
+            'total_ms': round(self.total_time * 1000, 1),
+            'duplicates': [
+                {'sql': sql[:self.MAX_SQL_LENGTH], 'count': count}
+                for sql, count in self.duplicates[:self.slowest_size]
+            ],
+            'slowest': [
+                {'sql': sql[:self.MAX_SQL_LENGTH], 'ms': round(duration * 1000, 1)}
+                for duration, sql in self.slowest
+            ],
+            **extra,
+        }
+    
+    def log(self, budget=None, **extra):
+        """
+        Registra el resumen como una línea JSON: INFO si está dentro del
+        presupuesto, WARNING si lo supera.
+        """
+        over_budget = budget is not None and self.count > budget
+        data = self.as_dict(budget=budget, over_budget=over_budget, **extra)
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(data, default=str))
+        return data
+
+
+@contextmanager
+def capture_queries(label=''):
+    """
+    Registra las consultas de todas las conexiones dentro del bloque.
+    
+    Args:
+        label (str): Nombre de la petición o tarea
+    
+    Yields:
+        QueryStats: Estadísticas (completas al salir del bloque)
+    """
+    stats = QueryStats(label)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        try:
+            yield stats
+        finally:
+            stats.finish()
+
+
+@contextmanager
+def assert_max_queries(budget, label=''):
+    """
+    Falla si el bloque ejecuta más de budget consultas (para pruebas).
+    
+    Raises:
+        QueryBudgetExceeded: Con el resumen de las consultas repetidas
+    """
+    with capture_queries(label) as stats:
+        yield stats
+    check_budget(stats, budget)
+
+
+def check_budget(stats, budget):
+    """
+    Raises:
+        QueryBudgetExceeded: Si stats supera el presupuesto
+    """
+    if budget is not None and stats.count > budget:
+        repeated = '\n'.join(f'  {count}x {sql}' for sql, count in stats.duplicates[:5])
+        raise QueryBudgetExceeded(
+            f"{stats.label or 'Bloque'}: {stats.count} consultas (presupuesto {budget})"
+            + (f"\nRepetidas:\n{repeated}" if repeated else '')
+        )
+
+
+def get_view_budget(view_func, method):
+    """
+    Presupuesto declarado por la vista para el método HTTP.
+    
+    Los ViewSets declaran query_budget = {acción: máximo}; las acciones sin
+    entrada (ni 'default') no tienen presupuesto.
+    
+    Returns:
+        tuple: (etiqueta de la vista, presupuesto o None)
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__qualname__', str(view_func)), None
+    
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    label = f'{view_class.__name__}.{action}'
+    budgets = getattr(view_class, 'query_budget', None) or {}
+    return label, budgets.get(action, budgets.get('default'))
+
+
+def assert_within_budget(response):
+    """
+    Falla si la respuesta (del cliente de pruebas) superó el presupuesto de
+    su vista. QueryBudgetMiddleware deja las estadísticas en la respuesta.
+    
+    Raises:
+        QueryBudgetExceeded: Si se superó el presupuesto
+    """
+    stats = getattr(response, 'query_stats', None)
+    if stats is None:
+        raise AssertionError('La respuesta no pasó por QueryBudgetMiddleware')
+    check_budget(stats, response.query_budget)
+
+
+# Tareas de Celery (señales task_prerun / task_postrun, ver config/celery.py)
+_task_captures = {}
+
+
+def start_task_capture(task_id, task_name):
+    """Empieza a registrar las consultas de una tarea."""
+    if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+        return
+    stack = ExitStack()
+    stats = stack.enter_context(capture_queries(task_name))
+    _task_captures[task_id] = (stack, stats)
+
+
+def finish_task_capture(task_id, state=None):
+    """Termina el registro de una tarea y escribe su resumen en el log."""
+    capture = _task_captures.pop(task_id, None)
+    if capture is None:
+        return
+    stack, stats = capture
+    stack.close()
+    stats.log(task_id=task_id, state=state)
@@ -0,0 +1,299 @@
+"""
+Caché en disco de documentos generados (manifiestos y etiquetas).
+
+Cada documento se identifica por su tipo, el ID del objeto y una versión de
+contenido derivada de los updated_at (y conteos) de todo lo que aparece en
+él. Mientras nada cambie, las reimpresiones se sirven desde disco y los
+clientes pueden revalidar con ETag / If-None-Match (304).
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+from .metrics import Metrics
+
+
+class RenderCache:
+    """Caché LRU en MEDIA_ROOT/render_cache para documentos PDF/Excel."""
+    
+    # Subir este número al cambiar el diseño de los documentos para invalidar todo
+    RENDER_VERSION = 2
+    DIRECTORY = 'render_cache'
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+    
+    CONTENT_TYPES = {
+        'pdf': 'application/pdf',
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'zpl': 'application/x-zpl; charset=utf-8',
+    }
+    
+    @staticmethod
+    def get_root():
+        """Directorio raíz de la caché."""
+        return os.path.join(settings.MEDIA_ROOT, RenderCache.DIRECTORY)
+    
+    @staticmethod
+    def get_max_bytes():
+        """Tamaño máximo de la caché (setting RENDER_CACHE_MAX_BYTES)."""
+        return getattr(settings, 'RENDER_CACHE_MAX_BYTES', RenderCache.DEFAULT_MAX_BYTES)
+    
+    @staticmethod
+    def make_version(*parts):
+        """Resume las partes que determinan el contenido en una versión corta."""
+        raw = '|'.join(str(part) for part in (RenderCache.RENDER_VERSION,) + parts)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+    
+    @staticmethod
+    def pull_version(pull):
+        """
+        Versión de contenido de una saca: la saca, su lote, las agencias
+        involucradas y sus paquetes (una sola consulta).
+        """
+        from apps.logistics.models import Pull
+        
+        data = Pull.objects.filter(pk=pull.pk).aggregate(
+            pull_at=Max('updated_at'),
+            agency_at=Max('transport_agency__updated_at'),
+            batch_at=Max('batch__updated_at'),
+            batch_agency_at=Max('batch__transport_agency__updated_at'),
+            packages_at=Max('packages__updated_at'),
+            packages_count=Count('packages'),
+        )
+        return RenderCache.make_version('pull', *(data[key] for key in sorted(data)))
+    
+    @staticmethod
+    def batch_version(batch):
+        """
+        Versión de contenido de un lote: el lote, su agencia, sus sacas y los
+        paquetes de sus sacas (una sola consulta).
+        """
+        from apps.logistics.models import Batch
+        
+        data = Batch.objects.filter(pk=batch.pk).aggregate(
+            batch_at=Max('updated_at'),
+            agency_at=Max('transport_agency__updated_at'),
+            pulls_at=Max('pulls__updated_at'),
+            pulls_agency_at=Max('pulls__transport_agency__updated_at'),
+            packages_at=Max('pulls__packages__updated_at'),
+            pulls_count=Count('pulls', distinct=True),
+            packages_count=Count('pulls__packages', distinct=True),
+        )
+        return RenderCache.make_version('batch', *(data[key] for key in sorted(data)))
+    
+    @staticmethod
+    def package_version(package):
+        """
+        Versión de contenido de un paquete: el paquete y la jerarquía de la
+        que toma agencia y guía efectivas (una sola consulta).
+        """
+        from apps.packages.models import Package
+        
+        data = Package.objects.filter(pk=package.pk).aggregate(
+            package_at=Max('updated_at'),
+            agency_at=Max('transport_agency__updated_at'),
+            pull_at=Max('pull__updated_at'),
+            pull_agency_at=Max('pull__transport_agency__updated_at'),
+            batch_at=Max('pull__batch__updated_at'),
+            batch_agency_at=Max('pull__batch__transport_agency__updated_at'),
+        )
+        return RenderCache.make_version('package', *(data[key] for key in sorted(data)))
+    
+    @staticmethod
+    def report_version(report):
+        """Versión de contenido de un informe: cambia al regenerarse sus datos."""
+        return RenderCache.make_version('report', report.updated_at)
+    
+    @staticmethod
+    def _path(kind, object_id, version, extension):
+        return os.path.join(RenderCache.get_root(), kind, f"{object_id}-{version}.{extension}")
+    
+    @staticmethod
+    def get(kind, object_id, version, extension):
+        """
+        Retorna el documento cacheado, o None si no está en la caché.
+        
+        Args:
+            kind (str): Tipo de documento (p. ej. 'pull_manifest')
+            object_id: ID del objeto del documento
+            version (str): Versión de contenido
+            extension (str): 'pdf' o 'xlsx'
+        
+        Returns:
+            bytes: Contenido del documento o None
+        """
+        path = RenderCache._path(kind, object_id, version, extension)
+        
+        try:
+            with open(path, 'rb') as cached:
+                content = cached.read()
+            # Marcar como usado recientemente para la expulsión LRU
+            os.utime(path)
+            return content
+        except OSError:
+            return None
+    
+    @staticmethod
+    def put(kind, object_id, version, extension, content):
+        """
+        Guarda un documento en la caché, reemplazando sus versiones anteriores.
+        
+        Args:
+            kind (str): Tipo de documento
+            object_id: ID del objeto del documento
+            version (str): Versión de contenido
+            extension (str): 'pdf' o 'xlsx'
+            content (bytes): Contenido del documento
+        """
+        path = RenderCache._path(kind, object_id, version, extension)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        
+        # Las versiones anteriores del mismo documento ya no se pueden servir
+        prefix = f"{object_id}-"
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(f".{extension}"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        
+        # Escritura atómica: otro worker nunca lee un archivo a medio escribir
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.replace(tmp_path, path)
+        
+        RenderCache.evict()
+    
+    @staticmethod
+    def get_or_render(kind, object_id, version, render, extension):
+        """
+        Retorna el documento cacheado o lo genera y lo guarda.
+        
+        Args:
+            kind (str): Tipo de documento (p. ej. 'pull_manifest')
+            object_id: ID del objeto del documento
+            version (str): Versión de contenido
+            render (callable): Genera el documento; retorna un BytesIO
+            extension (str): 'pdf' o 'xlsx'
+        
+        Returns:
+            bytes: Contenido del documento
+        """
+        content = RenderCache.get(kind, object_id, version, extension)
+        Metrics.cache_access('render', content is not None)
+        if content is None:
+            start = time.perf_counter()
+            content = render().getvalue()
+            Metrics.observe_document('render', kind, extension, time.perf_counter() - start, len(content))
+            RenderCache.put(kind, object_id, version, extension, content)
+        return content
+    
+    @staticmethod
+    def evict(max_bytes=None):
+        """
+        Elimina los documentos menos usados recientemente hasta que la caché
+        quede por debajo del 90% de su tamaño máximo.
+        
+        Args:
+            max_bytes (int): Tamaño máximo (por defecto, get_max_bytes())
+        
+        Returns:
+            int: Cantidad de archivos eliminados
+        """
+        if max_bytes is None:
+            max_bytes = RenderCache.get_max_bytes()
+        
+        entries = []
+        total = 0
+        for directory, _, names in os.walk(RenderCache.get_root()):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        
+        if total <= max_bytes:
+            return 0
+        
+        removed = 0
+        target = max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+    
+    @staticmethod
+    def response(request, kind, object_id, version, render, extension, filename):
+        """
+        Respuesta HTTP para descargar un documento cacheado.
+        
+        Responde 304 si el cliente ya tiene esta versión (If-None-Match);
+        en caso contrario sirve el documento desde la caché o lo genera.
+        
+        Args:
+            request: Request entrante
+            kind (str): Tipo de documento
+            object_id: ID del objeto del documento
+            version (str): Versión de contenido
+            render (callable): Genera el documento; retorna un BytesIO
+            extension (str): 'pdf' o 'xlsx'
+            filename (str): Nombre de archivo para Content-Disposition
+        
+        Returns:
+            HttpResponse: Documento o 304 Not Modified
+        """
+        etag = RenderCache.make_etag(kind, version)
+        
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            if '*' in etags or etag in etags:
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+        
+        content = RenderCache.get_or_render(kind, object_id, version, render, extension)
+        return RenderCache.file_response(content, extension, filename, etag)
+    
+    @staticmethod
+    def make_etag(kind, version):
+        """ETag fuerte de un documento: mismo tipo y versión, mismos bytes."""
+        return quote_etag(f"{kind}-{version}")
+    
+    @staticmethod
+    def file_response(content, extension, filename, etag=None):
+        """
+        Respuesta HTTP de descarga para un documento ya generado.
+        
+        Args:
+            content (bytes): Contenido del documento
+            extension (str): 'pdf' o 'xlsx'
+            filename (str): Nombre de archivo para Content-Disposition
+            etag (str): ETag del documento (opcional)
+        
+        Returns:
+            HttpResponse: Documento como adjunto
+        """
+        response = HttpResponse(content, content_type=RenderCache.CONTENT_TYPES[extension])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        if etag:
+            response['ETag'] = etag
+            # El cliente debe revalidar siempre: la versión cambia con los datos
+            response['Cache-Control'] = 'private, no-cache'
+        return response
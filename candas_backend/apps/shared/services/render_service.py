@@ -0,0 +1,189 @@
+"""
+Generación de documentos (manifiestos, etiquetas e informes) fuera de los
+workers web.
+
+Los renders se encolan en la cola Celery 'render', atendida por workers
+dedicados con límite de tiempo y de memoria por trabajo. El resultado queda
+en RenderCache, de modo que el worker web solo sirve bytes desde disco.
+"""
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .render_cache import RenderCache
+
+logger = logging.getLogger(__name__)
+
+
+class RenderService:
+    """Registro de documentos y envío de renders a la cola 'render'."""
+    
+    QUEUE = 'render'
+    
+    @staticmethod
+    def get_documents():
+        """
+        Documentos que se pueden generar en segundo plano.
+        
+        Returns:
+            dict: kind -> (modelo, generador(obj) -> BytesIO, extensión,
+                  función de versión, prefijo del nombre de archivo)
+        """
+        from apps.logistics.models import Batch, Pull
+        from apps.logistics.services import PDFService, BatchManifestGenerator, BatchLabelsGenerator
+        from apps.packages.models import Package
+        from apps.packages.services import PackageManifestGenerator, PackageLabelsGenerator
+        from apps.report.models import Report
+        from apps.report.services.pdf_exporter import PDFExporter
+        from apps.report.services.excel_exporter import ExcelExporter
+        
+        return {
+            'pull_manifest': (Pull, PDFService.generate_pull_manifest, 'pdf', RenderCache.pull_version, 'manifiesto_saca'),
+            'pull_manifest_excel': (Pull, PDFService.generate_pull_manifest_excel, 'xlsx', RenderCache.pull_version, 'manifiesto_saca'),
+            'pull_label': (Pull, PDFService.generate_pull_label, 'pdf', RenderCache.pull_version, 'etiqueta_saca'),
+            'batch_manifest': (Batch, BatchManifestGenerator.generate_pdf, 'pdf', RenderCache.batch_version, 'manifiesto_lote'),
+            'batch_manifest_excel': (Batch, BatchManifestGenerator.generate_excel, 'xlsx', RenderCache.batch_version, 'manifiesto_lote'),
+            'batch_labels': (Batch, BatchLabelsGenerator.generate_pdf, 'pdf', RenderCache.batch_version, 'etiquetas_lote'),
+            'package_manifest': (Package, PackageManifestGenerator.generate_pdf, 'pdf', RenderCache.package_version, 'manifiesto_paquete'),
+            'package_manifest_excel': (Package, PackageManifestGenerator.generate_excel, 'xlsx', RenderCache.package_version, 'manifiesto_paquete'),
+            'package_label': (Package, PackageLabelsGenerator.generate_pdf, 'pdf', RenderCache.package_version, 'etiqueta_paquete'),
+            'package_shipping_label': (Package, PackageLabelsGenerator.generate_shipping_label_pdf, 'pdf', RenderCache.package_version, 'guia'),
+            'report_pdf': (Report, lambda report: PDFExporter(report).generate(), 'pdf', RenderCache.report_version, 'informe'),
+            'report_excel': (Report, lambda report: ExcelExporter(report).generate(), 'xlsx', RenderCache.report_version, 'informe'),
+        }
+    
+    @staticmethod
+    def resolve(kind, object_id):
+        """
+        Obtiene el objeto y los datos necesarios para generar un documento.
+        
+        Args:
+            kind (str): Tipo de documento (ver get_documents)
+            object_id: ID del objeto
+        
+        Returns:
+            dict: obj, generator, extension, version y filename
+        
+        Raises:
+            ValueError: Si el tipo de documento no es válido
+            ObjectDoesNotExist: Si el objeto no existe
+        """
+        documents = RenderService.get_documents()
+        if kind not in documents:
+            raise ValueError(f"Tipo de documento inválido: {kind}. Válidos: {', '.join(documents)}")
+        
+        model, generator, extension, version_for, prefix = documents[kind]
+        obj = model.objects.get(pk=object_id)
+        return {
+            'obj': obj,
+            'generator': generator,
+            'extension': extension,
+            'version': version_for(obj),
+            'filename': f"{prefix}_{obj.pk}.{extension}",
+        }
+    
+    @staticmethod
+    def render(kind, object_id):
+        """
+        Genera un documento (o lo toma de la caché) y lo deja en RenderCache.
+        
+        Args:
+            kind (str): Tipo de documento
+            object_id: ID del objeto
+        
+        Returns:
+            dict: Datos para recuperar el documento de la caché
+                  (kind, object_id, version, extension, filename)
+        """
+        document = RenderService.resolve(kind, object_id)
+        obj = document['obj']
+        
+        RenderCache.get_or_render(
+            kind, obj.pk, document['version'],
+            lambda: document['generator'](obj), document['extension']
+        )
+        return {
+            'kind': kind,
+            'object_id': str(obj.pk),
+            'version': document['version'],
+            'extension': document['extension'],
+            'filename': document['filename'],
+        }
+    
+    @staticmethod
+    def submit(kind, object_id):
+        """
+        Encola la generación de un documento en la cola 'render'.
+        
+        Returns:
+            AsyncResult: Trabajo de Celery
+        """
+        from apps.core.tasks import render_document_task
+        
+        return render_document_task.apply_async((kind, str(object_id)), queue=RenderService.QUEUE)
+    
+    @staticmethod
+    def wait(result, timeout=None):
+        """
+        Espera el resultado de un trabajo como máximo `timeout` segundos.
+        
+        Args:
+            result (AsyncResult): Trabajo de Celery
+            timeout (float): Segundos de espera (por defecto RENDER_SYNC_TIMEOUT)
+        
+        Returns:
+            dict: Resultado de render(), o None si aún no terminó
+        
+        Raises:
+            Exception: La excepción del trabajo si falló
+        """
+        from celery.exceptions import TimeoutError
+        
+        if timeout is None:
+            timeout = getattr(settings, 'RENDER_SYNC_TIMEOUT', 30)
+        try:
+            return result.get(timeout=timeout)
+        except TimeoutError:
+            return None
+    
+    @staticmethod
+    @contextmanager
+    def memory_limit():
+        """
+        Limita la memoria del proceso (RLIMIT_AS) mientras dura un render.
+        
+        Un render que excede el límite falla con MemoryError; al salir se
+        restaura el límite anterior, así el proceso worker puede seguir
+        atendiendo otras tareas sin heredar el tope. Solo disponible en
+        sistemas con el módulo resource (Linux/macOS).
+        """
+        limit_mb = getattr(settings, 'RENDER_MEMORY_LIMIT_MB', None)
+        try:
+            import resource
+        except ImportError:
+            resource = None
+        
+        if not limit_mb or resource is None:
+            yield
+            return
+        
+        previous = resource.getrlimit(resource.RLIMIT_AS)
+        soft, hard = previous
+        limit = limit_mb * 1024 * 1024
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        if soft != resource.RLIM_INFINITY:
+            limit = min(limit, soft)
+        
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        except (ValueError, OSError) as e:
+            logger.warning(f"No se pudo aplicar el límite de memoria de render: {str(e)}")
+            yield
+            return
+        
+        try:
+            yield
+        finally:
+            resource.setrlimit(resource.RLIMIT_AS, previous)
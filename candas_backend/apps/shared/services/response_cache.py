@@ -0,0 +1,212 @@
+"""
+Caché de respuestas de la API invalidada por señales.
+
+Para endpoints que se leen en casi todas las páginas y cambian poco
+(catálogos, estadísticas de paquetes). Cada respuesta depende de uno o más
+grupos; cada grupo tiene una generación (el momento de su última
+invalidación) que forma parte de la clave. Las señales de los modelos y las
+escrituras en bloque llaman a invalidate() y las entradas anteriores dejan
+de leerse (expiran solas por RESPONSE_CACHE_TIMEOUT).
+
+Las respuestas llevan ETag (débil, del contenido) y Last-Modified (la
+generación): el frontend revalida con If-None-Match / If-Modified-Since y
+recibe 304 sin cuerpo mientras nada cambie.
+
+Backend: caché 'responses' de settings.CACHES, compartida por todos los
+procesos (Redis, CACHE_REDIS_URL). Sin Redis, RESPONSE_CACHE_ENABLED queda en
+False: con una caché por proceso, un worker seguiría sirviendo respuestas
+invalidadas en otro. Si el backend falla, las respuestas se sirven sin caché.
+"""
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Caché de respuestas por grupo de datos, vista, alcance del usuario y parámetros."""
+    
+    # Grupos de invalidación
+    CATALOG = 'catalog'     # Location, TransportAgency, DeliveryAgency
+    PACKAGES = 'packages'   # Package, Pull, Batch (estados, asignaciones y conteos)
+    
+    CACHE_ALIAS = 'responses'
+    KEY_PREFIX = 'response-cache'
+    DEFAULT_TIMEOUT = 600
+    
+    # Grupos invalidados en este hilo pendientes del commit
+    _pending = threading.local()
+    
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'RESPONSE_CACHE_ENABLED', True)
+    
+    @staticmethod
+    def get_cache():
+        return caches[ResponseCache.CACHE_ALIAS]
+    
+    @staticmethod
+    def get_timeout():
+        return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', ResponseCache.DEFAULT_TIMEOUT)
+    
+    @staticmethod
+    def _generation_key(group):
+        return f'{ResponseCache.KEY_PREFIX}:generation:{group}'
+    
+    @staticmethod
+    def get_generations(groups):
+        """
+        Generación actual de cada grupo (se crea al primer uso).
+        
+        Returns:
+            dict: {grupo: timestamp de la última invalidación}
+        """
+        cache = ResponseCache.get_cache()
+        keys = {ResponseCache._generation_key(group): group for group in groups}
+        stored = cache.get_many(list(keys))
+        generations = {}
+        for key, group in keys.items():
+            if key not in stored:
+                cache.add(key, time.time(), timeout=None)
+                stored[key] = cache.get(key, time.time())
+            generations[group] = stored[key]
+        return generations
+    
+    @staticmethod
+    def invalidate(*groups):
+        """
+        Invalida los grupos cuando se confirme la transacción en curso (o
+        de inmediato fuera de una transacción).
+        
+        Se espera al commit para que una lectura concurrente no vuelva a
+        cachear los datos anteriores con la generación nueva. Las llamadas
+        repetidas dentro de una transacción (p. ej. un save() por paquete)
+        se agrupan en una sola escritura.
+        """
+        pending = getattr(ResponseCache._pending, 'groups', None)
+        if pending is None:
+            pending = ResponseCache._pending.groups = set()
+        pending.update(groups)
+        transaction.on_commit(ResponseCache._flush)
+    
+    @staticmethod
+    def _flush():
+        pending = getattr(ResponseCache._pending, 'groups', None)
+        if not pending:
+            return
+        groups = list(pending)
+        pending.clear()
+        now = time.time()
+        try:
+            ResponseCache.get_cache().set_many(
+                {ResponseCache._generation_key(group): now for group in groups}, timeout=None
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo invalidar la caché de respuestas {groups}: {e}")
+    
+    @staticmethod
+    def get_scope(user):
+        """Alcance del usuario en la clave: los datos no varían entre usuarios del mismo nivel."""
+        return 'staff' if user.is_staff else 'user'
+    
+    @staticmethod
+    def make_key(view, request, kwargs, generations):
+        """Clave de la respuesta: generaciones, vista, alcance y parámetros."""
+        parts = [
+            request.get_host(),
+            ResponseCache.get_scope(request.user),
+            sorted(kwargs.items()),
+            sorted(request.query_params.lists()),
+        ]
+        digest = hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+        generation = '-'.join(f'{generations[group]:.6f}' for group in sorted(generations))
+        return f'{ResponseCache.KEY_PREFIX}:{view.__class__.__name__}.{view.action}:{generation}:{digest}'
+    
+    @staticmethod
+    def make_etag(data):
+        """ETag débil del contenido (el render puede variar según el formato pedido)."""
+        content = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+        return f'W/{quote_etag(hashlib.md5(content.encode("utf-8")).hexdigest())}'
+    
+    @staticmethod
+    def conditional(request, response, etag, last_modified=None):
+        """
+        Agrega ETag / Last-Modified y responde 304 si el cliente ya tiene la versión.
+        
+        Args:
+            request: Petición
+            response (Response): Respuesta completa
+            etag (str): ETag de la respuesta
+            last_modified (float): Timestamp de la última modificación
+        
+        Returns:
+            HttpResponse: 304 sin cuerpo o la respuesta recibida
+        """
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(int(last_modified))
+        # El navegador guarda la respuesta pero revalida siempre
+        response['Cache-Control'] = 'private, no-cache'
+        return get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified) if last_modified is not None else None,
+            response=response,
+        )
+    
+    @staticmethod
+    def cached(*groups):
+        """
+        Decorador de acciones GET de un ViewSet.
+        
+        Se aplica después de la autenticación y los permisos de DRF; solo se
+        guardan respuestas 200.
+        
+        Ejemplo:
+            @ResponseCache.cached(ResponseCache.CATALOG)
+            def list(self, request, *args, **kwargs):
+                return super().list(request, *args, **kwargs)
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(view, request, *args, **kwargs):
+                if not ResponseCache.is_enabled() or request.method not in ('GET', 'HEAD'):
+                    return func(view, request, *args, **kwargs)
+                
+                try:
+                    cache = ResponseCache.get_cache()
+                    generations = ResponseCache.get_generations(groups)
+                    key = ResponseCache.make_key(view, request, kwargs, generations)
+                    entry = cache.get(key)
+                except Exception as e:
+                    logger.warning(f"Caché de respuestas no disponible: {e}")
+                    return func(view, request, *args, **kwargs)
+                
+                Metrics.cache_access('response', entry is not None)
+                if entry is None:
+                    response = func(view, request, *args, **kwargs)
+                    if response.status_code != 200 or getattr(response, 'data', None) is None:
+                        return response
+                    entry = {'data': response.data, 'etag': ResponseCache.make_etag(response.data)}
+                    try:
+                        cache.set(key, entry, ResponseCache.get_timeout())
+                    except Exception as e:
+                        logger.warning(f"No se pudo guardar en la caché de respuestas: {e}")
+                else:
+                    response = Response(entry['data'])
+                
+                return ResponseCache.conditional(request, response, entry['etag'], max(generations.values()))
+            return wrapper
+        return decorator
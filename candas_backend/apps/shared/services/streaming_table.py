@@ -0,0 +1,223 @@
+"""
+Tabla para documentos grandes (miles de filas).
+
+Alternativa a platypus.Table para tablas de texto plano:
+- Las celdas se dibujan directamente en el canvas (drawString). Solo las
+  que no caben en su columna se dividen en líneas, sin crear Paragraphs.
+- Las alturas de fila se calculan una sola vez y se guardan como sumas
+  acumuladas. Cada salto de página toma solo las filas que caben, y la tabla
+  restante comparte los mismos datos (sin copias). El costo total es lineal
+  en la cantidad de filas.
+- El encabezado se repite en cada página.
+"""
+from bisect import bisect_right
+
+from reportlab.lib import colors
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus.flowables import Flowable
+
+
+class _TableData:
+    """Datos compartidos por todos los trozos de una misma tabla."""
+    
+    def __init__(self, headers, rows, col_widths, style):
+        self.headers = [str(h) for h in headers]
+        self.rows = rows
+        self.col_widths = list(col_widths)
+        self.style = style
+        self.header_lines = None
+        self.header_height = 0
+        self.row_lines = None
+        self.offsets = None
+    
+    def _cell_lines(self, text, width, font_name, font_size):
+        """None si el texto cabe en una línea; si no, la lista de líneas."""
+        available = width - self.style['left_padding'] - self.style['right_padding']
+        if stringWidth(text, font_name, font_size) <= available:
+            return None
+        return simpleSplit(text, font_name, font_size, available) or ['']
+    
+    def _row_height(self, lines, leading):
+        count = max((len(cell) if cell else 1) for cell in lines) if lines else 1
+        return count * leading + self.style['top_padding'] + self.style['bottom_padding']
+    
+    def measure(self):
+        """Calcula una sola vez las líneas y alturas de todas las filas."""
+        if self.offsets is not None:
+            return
+        
+        style = self.style
+        self.header_lines = [
+            self._cell_lines(header, width, style['header_font_name'], style['header_font_size'])
+            for header, width in zip(self.headers, self.col_widths)
+        ]
+        self.header_height = self._row_height(self.header_lines, style['header_leading'])
+        
+        # Solo se guardan las líneas de las filas que necesitan dividirse
+        self.row_lines = {}
+        offsets = [0]
+        total = 0
+        font_name, font_size, leading = style['font_name'], style['font_size'], style['leading']
+        single_height = leading + style['top_padding'] + style['bottom_padding']
+        for idx, row in enumerate(self.rows):
+            lines = [
+                self._cell_lines(cell, width, font_name, font_size)
+                for cell, width in zip(row, self.col_widths)
+            ]
+            if any(lines):
+                self.row_lines[idx] = lines
+                total += self._row_height(lines, leading)
+            else:
+                total += single_height
+            offsets.append(total)
+        self.offsets = offsets
+
+
+class StreamingTable(Flowable):
+    """
+    Tabla de texto plano que se divide por páginas en tiempo lineal.
+    
+    Args:
+        headers (list): Encabezados
+        rows (list): Filas; cada una es una lista de strings
+        col_widths (list): Anchos de columna
+        **style: Opciones de estilo (ver DEFAULT_STYLE)
+    """
+    
+    DEFAULT_STYLE = {
+        'font_name': 'Helvetica',
+        'font_size': 7,
+        'leading': 12,
+        'header_font_name': 'Helvetica-Bold',
+        'header_font_size': 8,
+        'header_leading': 12,
+        'header_align': 'LEFT',
+        'header_background': None,
+        'header_text_color': colors.black,
+        'header_line_width': 1.5,
+        'text_color': colors.black,
+        'grid_color': colors.black,
+        'grid_width': 0.5,
+        'row_backgrounds': None,
+        'left_padding': 6,
+        'right_padding': 6,
+        'top_padding': 5,
+        'bottom_padding': 5,
+    }
+    
+    def __init__(self, headers, rows, col_widths, _data=None, _start=0, _end=None, **style):
+        super().__init__()
+        if _data is None:
+            _data = _TableData(headers, rows, col_widths, {**self.DEFAULT_STYLE, **style})
+        self._data = _data
+        self._start = _start
+        self._end = len(_data.rows) if _end is None else _end
+    
+    def _chunk(self, start, end):
+        return StreamingTable(None, None, None, _data=self._data, _start=start, _end=end)
+    
+    def wrap(self, availWidth, availHeight):
+        data = self._data
+        data.measure()
+        self.width = sum(data.col_widths)
+        self.height = data.header_height + data.offsets[self._end] - data.offsets[self._start]
+        return self.width, self.height
+    
+    def split(self, availWidth, availHeight):
+        data = self._data
+        data.measure()
+        
+        # Última fila que cabe debajo del encabezado (búsqueda binaria)
+        limit = data.offsets[self._start] + availHeight - data.header_height
+        end = min(bisect_right(data.offsets, limit) - 1, self._end)
+        if end <= self._start:
+            return []
+        if end >= self._end:
+            return [self]
+        return [self._chunk(self._start, end), self._chunk(end, self._end)]
+    
+    def _draw_row(self, cells, lines, top, height, font_name, font_size, leading, align='LEFT'):
+        """Dibuja el texto de una fila centrado verticalmente."""
+        canv = self.canv
+        style = self._data.style
+        canv.setFont(font_name, font_size, leading)
+        x = 0
+        for col, (text, width) in enumerate(zip(cells, self._data.col_widths)):
+            cell_lines = lines[col] if lines and lines[col] else [text]
+            block_top = top - (height - len(cell_lines) * leading) / 2
+            baseline = block_top - (leading - font_size) / 2 - font_size * 0.8
+            for line in cell_lines:
+                if align == 'CENTER':
+                    canv.drawCentredString(x + width / 2, baseline, line)
+                else:
+                    canv.drawString(x + style['left_padding'], baseline, line)
+                baseline -= leading
+            x += width
+    
+    def draw(self):
+        canv = self.canv
+        data = self._data
+        style = data.style
+        width = self.width
+        top = self.height
+        
+        canv.saveState()
+        
+        # Fondos: encabezado y filas alternadas
+        header_bottom = top - data.header_height
+        if style['header_background'] is not None:
+            canv.setFillColor(style['header_background'])
+            canv.rect(0, header_bottom, width, data.header_height, stroke=0, fill=1)
+        backgrounds = style['row_backgrounds']
+        if backgrounds:
+            y = header_bottom
+            for idx in range(self._start, self._end):
+                height = data.offsets[idx + 1] - data.offsets[idx]
+                background = backgrounds[idx % len(backgrounds)]
+                if background is not None and background != colors.white:
+                    canv.setFillColor(background)
+                    canv.rect(0, y - height, width, height, stroke=0, fill=1)
+                y -= height
+        
+        # Texto
+        canv.setFillColor(style['header_text_color'])
+        self._draw_row(
+            data.headers, data.header_lines, top, data.header_height,
+            style['header_font_name'], style['header_font_size'], style['header_leading'],
+            style['header_align'],
+        )
+        canv.setFillColor(style['text_color'])
+        y = header_bottom
+        for idx in range(self._start, self._end):
+            height = data.offsets[idx + 1] - data.offsets[idx]
+            self._draw_row(
+                data.rows[idx], data.row_lines.get(idx), y, height,
+                style['font_name'], style['font_size'], style['leading'],
+            )
+            y -= height
+        
+        # Cuadrícula en un solo path
+        canv.setStrokeColor(style['grid_color'])
+        canv.setLineWidth(style['grid_width'])
+        path = canv.beginPath()
+        y = header_bottom
+        for idx in range(self._start, self._end):
+            y -= data.offsets[idx + 1] - data.offsets[idx]
+            path.moveTo(0, y)
+            path.lineTo(width, y)
+        path.moveTo(0, top)
+        path.lineTo(width, top)
+        x = 0
+        for col_width in [0] + data.col_widths:
+            x += col_width
+            path.moveTo(x, top)
+            path.lineTo(x, 0)
+        canv.drawPath(path, stroke=1, fill=0)
+        
+        # Línea gruesa bajo el encabezado
+        if style['header_line_width']:
+            canv.setLineWidth(style['header_line_width'])
+            canv.line(0, header_bottom, width, header_bottom)
+        
+        canv.restoreState()
@@ -0,0 +1,161 @@
+"""
+Template base común para etiquetas en ZPL (impresoras térmicas Zebra).
+Mismo contenido que las etiquetas PDF, pero con comandos nativos de texto,
+código de barras y QR: unos cientos de bytes por etiqueta, sin rasterizar.
+"""
+import json
+
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+
+
+class BaseZPLGenerator:
+    """Primitivas ZPL y formato estándar de etiqueta (4 x 5 pulgadas)."""
+    
+    # Resolución de las impresoras (8 dots/mm)
+    DPI = 203
+    LABEL_WIDTH = 4 * DPI  # 812 dots
+    LABEL_HEIGHT = 5 * DPI  # 1015 dots
+    PADDING = 40
+    
+    CONTENT_TYPE = 'application/x-zpl; charset=utf-8'
+    
+    @staticmethod
+    def escape(text):
+        """
+        Escapa un texto para ^FD usando ^FH (indicador '_').
+        
+        Los caracteres de control de ZPL (^ y ~) y el propio indicador se
+        envían en hexadecimal; el resto viaja en UTF-8 gracias a ^CI28.
+        """
+        return (
+            str(text)
+            .replace('_', '_5F')
+            .replace('^', '_5E')
+            .replace('~', '_7E')
+            .replace('\n', ' ')
+        )
+    
+    @staticmethod
+    def text(x, y, value, height, width=None):
+        """Campo de texto con la fuente escalable 0."""
+        return f"^FO{x},{y}^A0N,{height},{width or height}^FH^FD{BaseZPLGenerator.escape(value)}^FS"
+    
+    @staticmethod
+    def centered_text(y, value, height, x=0, width=None):
+        """Campo de texto centrado en el ancho indicado (por defecto, la etiqueta)."""
+        width = width or BaseZPLGenerator.LABEL_WIDTH - x
+        return (
+            f"^FO{x},{y}^A0N,{height},{height}^FB{width},1,0,C,0"
+            f"^FH^FD{BaseZPLGenerator.escape(value)}^FS"
+        )
+    
+    @staticmethod
+    def box(x, y, width, height, thickness=2):
+        """Rectángulo (o línea si width/height es igual al grosor)."""
+        return f"^FO{x},{y}^GB{width},{height},{thickness}^FS"
+    
+    @staticmethod
+    def qr_code(x, y, data, magnification=6):
+        """Código QR nativo (modelo 2, corrección L)."""
+        return f"^FO{x},{y}^BQN,2,{magnification}^FDLA,{data}^FS"
+    
+    @staticmethod
+    def code128(x, y, data, height, module_width=3):
+        """Código de barras Code128 nativo con texto legible debajo."""
+        return (
+            f"^BY{module_width}^FO{x},{y}^BCN,{height},Y,N,N"
+            f"^FH^FD{BaseZPLGenerator.escape(data)}^FS"
+        )
+    
+    @staticmethod
+    def label(commands, width=None, height=None):
+        """Envuelve los comandos en una etiqueta ^XA ... ^XZ (UTF-8)."""
+        width = width or BaseZPLGenerator.LABEL_WIDTH
+        height = height or BaseZPLGenerator.LABEL_HEIGHT
+        return f"^XA^CI28^PW{width}^LL{height}" + "".join(commands) + "^XZ\n"
+    
+    @staticmethod
+    def standard_label(numeration, destiny, agency, guide, qr_data,
+                       packages_count=None, size=None, manifest_notice=False):
+        """
+        Etiqueta estándar de paquete/saca, equivalente a la versión PDF:
+        numeración, destino, agencia, guía, (paquetes y tamaño) y QR con el ID.
+        
+        Args:
+            numeration (str): Numeración, p. ej. "2/5"
+            destiny (str): Destino efectivo
+            agency (str): Nombre de la agencia efectiva
+            guide (str): Número de guía efectivo
+            qr_data (str): ID codificado en el QR
+            packages_count (int): Cantidad de paquetes (solo sacas)
+            size (str): Tamaño de la saca (solo sacas)
+            manifest_notice (bool): Aviso de manifiesto (última saca del lote)
+        
+        Returns:
+            str: Etiqueta ZPL
+        """
+        zpl = BaseZPLGenerator
+        pad = zpl.PADDING
+        width = zpl.LABEL_WIDTH
+        
+        commands = [
+            zpl.box(0, 0, width, zpl.LABEL_HEIGHT, 4),
+            zpl.centered_text(pad, numeration, 90),
+            zpl.box(pad, 160, width - 2 * pad, 2, 2),
+        ]
+        
+        y = 190
+        commands.append(zpl.text(pad, y, "DESTINO:", 28))
+        commands.append(zpl.text(pad, y + 34, (destiny or '')[:35], 36))
+        y += 90
+        commands.append(zpl.text(pad, y, "AGENCIA:", 26))
+        commands.append(zpl.text(pad, y + 30, (agency or 'Sin asignar')[:30], 28))
+        y += 75
+        commands.append(zpl.text(pad, y, "GUÍA:", 26))
+        commands.append(zpl.text(pad, y + 30, (guide or 'Sin guía')[:30], 28))
+        y += 75
+        
+        if packages_count is not None:
+            commands.append(zpl.text(pad, y, "PAQUETES:", 26))
+            commands.append(zpl.text(pad + 170, y - 6, str(packages_count), 40))
+            y += 55
+        if size:
+            commands.append(zpl.text(pad, y, "TAMAÑO:", 24))
+            commands.append(zpl.text(pad + 130, y, size, 26))
+        
+        if manifest_notice:
+            commands.append(zpl.box(width - pad - 150, 190, 150, 390, 6))
+            commands.append(f"^FO{width - pad - 115},215^A0R,36,36^FDMANIFIESTO^FS")
+            commands.append(f"^FO{width - pad - 70},215^A0R,30,30^FDEN ESTA SACA^FS")
+        
+        # QR centrado en la parte inferior: un UUID ocupa 29 módulos, que con
+        # magnificación 9 son ~260 dots (~1.3", igual que en el PDF)
+        commands.append(zpl.qr_code(width // 2 - 130, 680, qr_data, magnification=9))
+        commands.append(zpl.centered_text(zpl.LABEL_HEIGHT - 50, f"ID: {str(qr_data)[:8].upper()}", 22))
+        
+        return zpl.label(commands)
+    
+    @staticmethod
+    def response(content, filename):
+        """Respuesta HTTP de descarga para un stream ZPL."""
+        response = HttpResponse(content.encode('utf-8'), content_type=BaseZPLGenerator.CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ZPLRenderer(BaseRenderer):
+    """
+    Permite ?format=zpl en las acciones de etiquetas: DRF usa el parámetro
+    format para elegir renderer, así que debe existir uno para 'zpl'.
+    Las vistas retornan el ZPL directamente; este renderer solo formatea
+    las respuestas de error.
+    """
+    media_type = 'application/x-zpl'
+    format = 'zpl'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
 
 # Configurar el módulo de configuración de Django para Celery
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -31,6 +32,17 @@ app.conf.update(
     # Configuración de tareas
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutos
+    # Los renders de PDF/Excel van a workers dedicados para no ocupar los workers web:
+    #   celery -A config worker -Q render --concurrency=2 --max-memory-per-child=1048576
+    # Sin un worker en la cola 'render' no se generan documentos en segundo plano,
+    # trabajos de impresión, los PDFs del cierre de despacho ni los archivos PDF/Excel
+    # de los informes.
+    task_routes={
+        'apps.core.tasks.render_document_task': {'queue': 'render'},
+        'apps.core.tasks.print_job_task': {'queue': 'render'},
+        'apps.logistics.tasks.render_dispatch_document': {'queue': 'render'},
+        'apps.report.tasks.generate_report_artefact': {'queue': 'render'},
+    },
 )
 
 # Configuración de tareas periódicas (Celery Beat)
@@ -51,9 +63,82 @@ app.conf.beat_schedule = {
             'description': 'Genera el informe mensual del mes anterior'
         }
     },
+    # Despachos y recepciones de hoy - Cada 10 minutos (incremental)
+    'refresh-today-reports': {
+        'task': 'apps.report.tasks.refresh_today_reports_task',
+        'schedule': crontab(minute='*/10'),
+        'options': {
+            'description': 'Actualiza los reportes de despachos y recepciones del día en curso'
+        }
+    },
+    # Reportes programados por los usuarios - Cada minuto se encolan los vencidos
+    'dispatch-due-schedules': {
+        'task': 'apps.report.tasks.dispatch_due_schedules_task',
+        'schedule': crontab(),
+        'options': {
+            'description': 'Reparte entre los workers los reportes programados vencidos'
+        }
+    },
 }
 
 
+# Consultas SQL por tarea (mismo log JSON que QueryBudgetMiddleware)
+@task_prerun.connect
+def start_task_query_stats(task_id=None, task=None, **kwargs):
+    from apps.shared.services.query_budget import start_task_capture
+    start_task_capture(task_id, task.name)
+
+
+@task_postrun.connect
+def finish_task_query_stats(task_id=None, state=None, **kwargs):
+    from apps.shared.services.query_budget import finish_task_capture
+    finish_task_capture(task_id, state)
+
+
+# Profiler bajo demanda de las tareas en PROFILER_TASKS
+@before_task_publish.connect
+def tag_profiled_task(sender=None, headers=None, **kwargs):
+    from apps.shared.services.profiler import tag_task_message
+    tag_task_message(sender, headers)
+
+
+@task_prerun.connect
+def start_profiled_task(task_id=None, task=None, **kwargs):
+    from apps.shared.services.profiler import start_task_profile
+    start_task_profile(task_id, task)
+
+
+@task_postrun.connect
+def finish_profiled_task(task_id=None, state=None, **kwargs):
+    from apps.shared.services.profiler import finish_task_profile
+    finish_task_profile(task_id, state)
+
+
+# Métricas Prometheus: duración y espera en cola de todas las tareas
+@before_task_publish.connect
+def tag_task_metrics(headers=None, **kwargs):
+    from apps.shared.services.metrics import Metrics
+    Metrics.tag_task_message(headers)
+
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, task=None, **kwargs):
+    from apps.shared.services.metrics import Metrics
+    Metrics.start_task(task_id, task)
+
+
+@task_postrun.connect
+def finish_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    from apps.shared.services.metrics import Metrics
+    Metrics.finish_task(task_id, task, state)
+
+
+@worker_process_shutdown.connect
+def clear_process_metrics(pid=None, **kwargs):
+    from apps.shared.services.metrics import Metrics
+    Metrics.mark_process_dead(pid or os.getpid())
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     """Tarea de prueba para verificar que Celery está funcionando."""
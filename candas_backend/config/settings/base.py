@@ -31,12 +31,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.shared.middleware.MetricsMiddleware',  # Primero: latencia total y consultas (/metrics)
+    'apps.shared.middleware.QueryBudgetMiddleware',  # Mide las consultas de toda la petición
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS debe ir antes de CommonMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.shared.middleware.ProfilerMiddleware',  # Usa request.user (X-Profile, solo is_staff)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -103,6 +106,79 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Caché en disco de manifiestos y etiquetas (MEDIA_ROOT/render_cache), expulsión LRU
+RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Workers de render (cola Celery 'render'): límites por trabajo y espera del modo sync
+RENDER_SOFT_TIME_LIMIT = 120
+RENDER_TIME_LIMIT = 150
+RENDER_MEMORY_LIMIT_MB = 1024
+RENDER_SYNC_TIMEOUT = 30
+
+# Trabajos de impresión en bloque (también en la cola 'render')
+PRINT_JOB_MAX_ITEMS = 2000
+PRINT_JOB_SOFT_TIME_LIMIT = 600
+PRINT_JOB_TIME_LIMIT = 660
+
+# Espera máxima (segundos) por una generación de informe en curso del mismo tipo y fecha
+# (tareas de Celery); las peticiones web esperan REPORT_SINGLE_FLIGHT_REQUEST_TIMEOUT y responden 409
+REPORT_SINGLE_FLIGHT_TIMEOUT = 300
+REPORT_SINGLE_FLIGHT_REQUEST_TIMEOUT = 5
+
+# Días faltantes que /reports/range-report/ calcula en línea; con más, se encolan y responde 202
+REPORT_RANGE_SYNC_MAX_DAYS = 7
+
+# Consultas SQL por petición/tarea (Server-Timing y log JSON); query_budget en los ViewSets
+QUERY_BUDGET_ENABLED = True
+QUERY_BUDGET_SLOWEST = 5
+# En pruebas: superar el query_budget de una vista lanza QueryBudgetExceeded
+QUERY_BUDGET_RAISE = False
+
+# Profiler bajo demanda (X-Profile: 1 o ?_profile=1, solo is_staff); perfiles en MEDIA_ROOT/profiles
+PROFILER_ENABLED = True
+PROFILER_MAX_PROFILES = 200
+# Tareas de Celery que se pueden perfilar (encoladas por una petición perfilada o armadas)
+PROFILER_TASKS = [
+    'apps.report.tasks.generate_report_files',
+    'apps.report.tasks.generate_report_artefact',
+    'apps.report.tasks.generate_daily_report_task',
+    'apps.report.tasks.generate_monthly_report_task',
+    'apps.report.tasks.run_report_schedule_task',
+    'apps.core.tasks.render_document_task',
+    'apps.core.tasks.print_job_task',
+    'apps.logistics.tasks.close_dispatch_task',
+]
+
+# Métricas Prometheus en /metrics (requiere prometheus-client)
+# Con varios procesos (gunicorn, Celery) definir PROMETHEUS_MULTIPROC_DIR (ver apps/shared/services/metrics.py)
+METRICS_ENABLED = True
+# /metrics exige el header Authorization: Bearer <token> o una sesión is_staff
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# True solo si /metrics queda detrás de una red privada: lo abre sin autenticación
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', '').lower() == 'true'
+
+# Cachés: 'responses' guarda las respuestas de catálogos y estadísticas (ResponseCache).
+# Con CACHE_REDIS_URL (p. ej. redis://localhost:6379/1) se comparte entre procesos;
+# sin Redis la caché de respuestas queda desactivada: una LocMemCache por proceso
+# no vería las invalidaciones hechas en otros workers o en Celery
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'candas',
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
+}
+RESPONSE_CACHE_ENABLED = bool(CACHE_REDIS_URL)
+# Segundos de vida de cada respuesta (la invalidación por señales es inmediata)
+RESPONSE_CACHE_TIMEOUT = 600
+
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -154,6 +230,12 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-profile',
+]
+
+# Headers legibles desde el frontend
+CORS_EXPOSE_HEADERS = [
+    'x-profile-id',
 ]
 
 # Session Configuration para desarrollo
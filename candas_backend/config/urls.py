@@ -21,6 +21,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from apps.core.api.views import metrics_view
 
 # Schema para documentación Swagger
 schema_view = get_schema_view(
@@ -46,6 +47,9 @@ urlpatterns = [
     path('api/v1/', include('apps.catalog.api.urls')),
     path('api/v1/', include('apps.report.api.urls')),
     
+    # Métricas Prometheus
+    path('metrics', metrics_view, name='metrics'),
+    
     # Documentación API
     path('api/docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('api/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
@@ -69,8 +69,10 @@ const ReportsView = () => {
   const byStatusData = report.json_data?.by_status || {}
 
   // Preparar datos para gráficos
-  const agencyChartData = Object.entries(byAgencyData).map(([name, data]) => ({
-    name: name.substring(0, 20),
+  // by_agency está indexado por ID de agencia; el nombre viene en data.name
+  // (los informes antiguos usaban el nombre como clave)
+  const agencyChartData = Object.entries(byAgencyData).map(([key, data]) => ({
+    name: (data.name || key).substring(0, 20),
     value: data.packages_count || 0
   })).slice(0, 10)
 
@@ -230,9 +232,9 @@ const ReportsView = () => {
                         </tr>
                       </thead>
                       <tbody className="bg-white dark:bg-gray-900 divide-y divide-gray-200 dark:divide-gray-700">
-                        {Object.entries(byAgencyData).map(([agency, data]) => (
-                          <tr key={agency} className="hover:bg-gray-50 dark:hover:bg-gray-800">
-                            <td className="px-4 py-3 text-sm font-medium text-gray-900 dark:text-white">{agency}</td>
+                        {Object.entries(byAgencyData).map(([key, data]) => (
+                          <tr key={key} className="hover:bg-gray-50 dark:hover:bg-gray-800">
+                            <td className="px-4 py-3 text-sm font-medium text-gray-900 dark:text-white">{data.name || key}</td>
                             <td className="px-4 py-3 text-sm text-center text-gray-900 dark:text-white">{data.packages_count || 0}</td>
                             <td className="px-4 py-3 text-sm text-center text-gray-900 dark:text-white">{data.sacas_count || 0}</td>
                             <td className="px-4 py-3 text-sm text-center text-gray-900 dark:text-white">{data.lotes_count || 0}</td>